@@ -8,6 +8,7 @@ from scipy.ndimage.morphology import binary_fill_holes
 from skimage.color import rgb2gray, rgb2lab
 from tqdm import tqdm
 import os
+from collections.abc import Mapping
 
 
 
@@ -25,7 +26,7 @@ class Analysis:
         self.__verbose = verbose
         self.__tileDictionaryReference = tileDictionaryReference
         try:
-            if isinstance(tileDictionaryReference, dict):
+            if isinstance(tileDictionaryReference, Mapping):
                 self.tileDictionary = self.__tileDictionaryReference
             elif os.path.isfile(tileDictionaryReference):
                 if self.__verbose:
@@ -1,29 +1,253 @@
-import pyvips as pv
-import xml.etree.ElementTree as ET
+import hashlib
+import json
+import os
+from xml.parsers import expat
+import numpy as np
+import shapely
+
+# Parsed annotation files are cached in an .npz file next to them, holding the
+# flat coordinate arrays below and the key of the file they were parsed from:
+# its modification time and size, and the SHA-256 hash of its contents. The
+# hash is only recomputed when the modification time or size has changed, so
+# an annotation file that was touched but not edited still hits the cache.
+annotationCacheVersion = 1
+annotationCacheSuffix = '.pmlcache.npz'
+
 
 class Annotation:
+    """The annotations of an ASAP xml file or a QuPath GeoJSON file, parsed
+    into flat arrays: the coordinates of every ring of every annotation are
+    stored one after the other in one float array, with offset arrays marking
+    where each ring and each annotation starts. ASAP xml files are streamed
+    through expat without building an element tree and their coordinates are
+    converted to floats in bulk, and the
+    polygons are built with the vectorized Shapely constructors, so files with
+    millions of vertices load without a Python loop over the vertices.
+
+    Args:
+        annotationFilePath (str, optional): the path to the annotation file to load with :meth:`Annotation.loadAnnotationFile() <pathml.annotation.Annotation.loadAnnotationFile>`. Default is to create an empty Annotation.
+        fileType (str, optional): 'asap' or 'qupath'. Default is to identify the type from the contents of the file.
+        cache (Bool, optional): whether to read and write the parsed annotations from and to a cache file next to the annotation file. Default is True.
+        verbose (Bool, optional): whether to print what is being loaded. Default is False.
+
+    Attributes:
+        classNames (np.ndarray of str): the class of each annotation (the ASAP group or the QuPath classification)
+        coordinates (np.ndarray): the (number of vertices, 2) array of x, y coordinates of all rings, in the pixel coordinates of the file
+        ringOffsets (np.ndarray): ring i is coordinates[ringOffsets[i]:ringOffsets[i+1]]
+        annotationRingOffsets (np.ndarray): the rings of annotation j are ringOffsets[annotationRingOffsets[j]:annotationRingOffsets[j+1]]
+        multiPolygon (np.ndarray of Bool): whether each annotation was stored as a multipolygon (QuPath only)
 
-    def __init__(self, parentSlide, maskingMode='inverse', verbose=False):
-        # maskingMode: 'inverse' sets all areas to zero / ''
+    Example:
+        annotations = Annotation('/path/to/annotations.xml')
+        polygons = annotations.polygons()
+    """
+
+    def __init__(self, annotationFilePath=None, fileType=None, cache=True, verbose=False):
         self.__verbose = verbose
-        self.__parentSlide = parentSlide
-        pass
+        self.fileType = None
+        self.classNames = np.array([], dtype=str)
+        self.coordinates = np.zeros((0, 2))
+        self.ringOffsets = np.zeros(1, dtype=np.int64)
+        self.annotationRingOffsets = np.zeros(1, dtype=np.int64)
+        self.multiPolygon = np.zeros(0, dtype=bool)
+        if annotationFilePath is not None:
+            self.loadAnnotationFile(annotationFilePath, fileType=fileType, cache=cache)
+
+    def __len__(self):
+        return len(self.classNames)
+
+    def loadAnnotationFile(self, annotationFilePath, fileType=None, cache=True):
+        """A function to load the annotations of an ASAP xml or QuPath GeoJSON
+        file, replacing any loaded before. QuPath files may hold either a list
+        of features or a FeatureCollection.
+
+        Args:
+            annotationFilePath (str): the path to the annotation file
+            fileType (str, optional): 'asap' or 'qupath'. Default is to identify the type from the contents of the file.
+            cache (Bool, optional): whether to read and write the parsed annotations from and to a cache file next to the annotation file. Default is True.
+        """
+
+        if not os.path.isfile(annotationFilePath):
+            raise FileNotFoundError('Annotation file could not be loaded')
+        if fileType is None:
+            with open(annotationFilePath) as unknownFile:
+                fileType = 'asap' if unknownFile.read(1) == '<' else 'qupath'
+        if fileType not in ['asap', 'qupath']:
+            raise ValueError("fileType must be 'asap' or 'qupath'")
+
+        cacheFilePath = annotationFilePath + annotationCacheSuffix
+        fileKey = self.__fileKey(annotationFilePath)
+        if cache and self.__loadCache(cacheFilePath, annotationFilePath, fileKey, fileType):
+            if self.__verbose: print('Loaded ' + str(len(self)) + ' annotation(s) from cache ' + cacheFilePath)
+            return
 
-    def loadAnnotationFile(self, annotationFile, fileType):
         if fileType == 'asap':
-            tree = ET.parse(annotationFile)  # Open .xml file
-            root = tree.getroot()  # Get root of .xml tree
-            if root.tag == "ASAP_Annotations":  # Check whether we actually deal with an ASAP .xml file
-                if self.__verbose: print('.xml file identified as ASAP annotation collection')  # Display number of found annotations
-            else:
-                raise Warning('Not an ASAP .xml file')
-            self.annotations = root.find('Annotations')  # Find all annotations for this slide
-            if self.__verbose: print('XML file valid - ' + str(len(allHeAnnotations)) + ' annotations found.') # Display number of found annotations
-        elif fileType == 'qupath':
-            pass
+            self.__parseAsap(annotationFilePath)
         else:
-            raise ValueError('Annotation file type was not specifiedd')
+            self.__parseQupath(annotationFilePath)
+        self.fileType = fileType
+        if self.__verbose: print('Parsed ' + str(len(self)) + ' annotation(s) from ' + annotationFilePath)
+
+        if cache:
+            if 'hash' not in fileKey:
+                fileKey['hash'] = self.__fileHash(annotationFilePath)
+            self.__writeCache(cacheFilePath, fileKey)
+
+    def __parseAsap(self, annotationFilePath):
+        # Stream the file through expat (the parser underneath ElementTree's
+        # iterparse) without building an element tree, collecting the
+        # coordinate strings of all annotations to convert them in bulk
+        classNames, xs, ys, ringOffsets = [], [], [], [0]
+        state = {'root': None, 'class': None}
+
+        def startElement(tag, attrib):
+            if state['root'] is None:
+                state['root'] = tag
+                if not tag == "ASAP_Annotations": # Check whether we actually deal with an ASAP .xml file
+                    raise ImportError('Annotation file is not an ASAP xml file')
+            elif tag == 'Annotation':
+                state['class'] = attrib['PartOfGroup']
+            elif tag == 'Coordinate' and state['class'] is not None:
+                xs.append(attrib['X'])
+                ys.append(attrib['Y'])
+
+        def endElement(tag):
+            if tag == 'Annotation':
+                classNames.append(state['class'])
+                ringOffsets.append(len(xs))
+                state['class'] = None
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = startElement
+        parser.EndElementHandler = endElement
+        try:
+            with open(annotationFilePath, 'rb') as f:
+                parser.ParseFile(f)
+        except expat.ExpatError:
+            raise ImportError('Annotation file is not an xml file')
+
+        self.classNames = np.array(classNames, dtype=str)
+        self.coordinates = np.column_stack((np.array(xs, dtype=object).astype(np.float64), np.array(ys, dtype=object).astype(np.float64))).reshape(-1, 2)
+        self.ringOffsets = np.array(ringOffsets, dtype=np.int64)
+        self.annotationRingOffsets = np.arange(len(classNames) + 1, dtype=np.int64)
+        self.multiPolygon = np.zeros(len(classNames), dtype=bool)
+
+    def __parseQupath(self, annotationFilePath):
+        with open(annotationFilePath) as f:
+            allAnnotations = json.load(f)
+        if isinstance(allAnnotations, dict) and allAnnotations.get('type') == 'FeatureCollection':
+            allAnnotations = allAnnotations['features']
+        if not isinstance(allAnnotations, list):
+            raise Warning('GeoJSON file does not have an outer list structure')
+
+        classNames, rings, multiPolygon, ringOffsets, annotationRingOffsets = [], [], [], [0], [0]
+        for annotation in allAnnotations:
+            try:
+                classNames.append(annotation['properties']['classification']['name'])
+            except:
+                raise ValueError('Found QuPath annotation without a class; all annotations must be assigned to a class')
+            geometryType = annotation['geometry']['type']
+            polygons = annotation['geometry']['coordinates'] if geometryType == 'MultiPolygon' else [annotation['geometry']['coordinates']]
+            for polygon in polygons:
+                for ring in polygon:
+                    ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+                    rings.append(ring)
+                    ringOffsets.append(ringOffsets[-1] + len(ring))
+            annotationRingOffsets.append(len(rings))
+            multiPolygon.append(geometryType != 'Polygon')
+
+        self.classNames = np.array(classNames, dtype=str)
+        self.coordinates = np.concatenate(rings) if len(rings) > 0 else np.zeros((0, 2))
+        self.ringOffsets = np.array(ringOffsets, dtype=np.int64)
+        self.annotationRingOffsets = np.array(annotationRingOffsets, dtype=np.int64)
+        self.multiPolygon = np.array(multiPolygon, dtype=bool)
+
+    def polygons(self, scalingFactor=1, slideHeight=None):
+        """A function to build one Shapely Polygon per ring of the annotations,
+        with the vectorized Shapely constructors. Every polygon is buffered by 0
+        to repair it, so a self-intersecting ring can become a MultiPolygon.
+
+        Args:
+            scalingFactor (float, optional): the factor to multiply the coordinates by. Default is 1.
+            slideHeight (int, optional): if defined, flip the y axis so that it points up from the bottom of a slide of this height, as Slide.addAnnotations() does. Default is not to flip.
+
+        Returns:
+            np.ndarray of Shapely geometries: the polygon of each ring, in the order of ringOffsets, or None for rings of fewer than 3 points
+        """
+
+        numRings = len(self.ringOffsets) - 1
+        polygons = np.full(numRings, None, dtype=object)
+        ringLengths = np.diff(self.ringOffsets)
+        valid = ringLengths >= 3
+        if not valid.any():
+            return polygons
+        coordinates = self.coordinates * scalingFactor
+        if slideHeight is not None:
+            coordinates[:, 1] = slideHeight - coordinates[:, 1]
+        validCoordinates = np.repeat(valid, ringLengths)
+        rings = shapely.linearrings(coordinates[validCoordinates], indices=np.repeat(np.arange(valid.sum()), ringLengths[valid]))
+        polygons[valid] = shapely.buffer(shapely.polygons(rings), 0)
+        return polygons
+
+    def annotationRings(self, annotationIndex):
+        """A function that returns the indices of the rings of an annotation,
+        which index the output of :meth:`Annotation.polygons() <pathml.annotation.Annotation.polygons>`.
+
+        Args:
+            annotationIndex (int): the index of the annotation
+
+        Returns:
+            range: the ring indices
+        """
+
+        return range(self.annotationRingOffsets[annotationIndex], self.annotationRingOffsets[annotationIndex+1])
+
+    @staticmethod
+    def __fileKey(annotationFilePath):
+        fileStat = os.stat(annotationFilePath)
+        return {'mtime': fileStat.st_mtime_ns, 'size': fileStat.st_size}
+
+    @staticmethod
+    def __fileHash(annotationFilePath):
+        fileHash = hashlib.sha256()
+        with open(annotationFilePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                fileHash.update(chunk)
+        return fileHash.hexdigest()
 
-        pass
+    def __loadCache(self, cacheFilePath, annotationFilePath, fileKey, fileType):
+        if not os.path.isfile(cacheFilePath):
+            return False
+        try:
+            with np.load(cacheFilePath, allow_pickle=False) as cached:
+                cachedKey = json.loads(str(cached['key']))
+                if (cachedKey.get('version') != annotationCacheVersion) or (cachedKey.get('fileType') != fileType):
+                    return False
+                if (cachedKey['mtime'] != fileKey['mtime']) or (cachedKey['size'] != fileKey['size']):
+                    fileKey['hash'] = self.__fileHash(annotationFilePath)
+                    if cachedKey['hash'] != fileKey['hash']:
+                        return False
+                self.classNames = cached['classNames']
+                self.coordinates = cached['coordinates']
+                self.ringOffsets = cached['ringOffsets']
+                self.annotationRingOffsets = cached['annotationRingOffsets']
+                self.multiPolygon = cached['multiPolygon']
+        except (OSError, ValueError, KeyError):
+            return False # an unreadable cache is parsed again and overwritten
+        self.fileType = fileType
+        if (cachedKey['mtime'] != fileKey['mtime']) or (cachedKey['size'] != fileKey['size']):
+            self.__writeCache(cacheFilePath, fileKey) # the file was touched but not edited
+        return True
 
-    # packing mode / and other modes for tiling
+    def __writeCache(self, cacheFilePath, fileKey):
+        key = dict(fileKey, version=annotationCacheVersion, fileType=self.fileType)
+        temporaryPath = cacheFilePath + '.tmp'
+        try:
+            with open(temporaryPath, 'wb') as f:
+                np.savez(f, key=np.array(json.dumps(key)), classNames=self.classNames, coordinates=self.coordinates,
+                         ringOffsets=self.ringOffsets, annotationRingOffsets=self.annotationRingOffsets, multiPolygon=self.multiPolygon)
+            os.replace(temporaryPath, cacheFilePath)
+        except OSError:
+            # the cache is only an optimization, so a read-only annotation folder is not an error
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
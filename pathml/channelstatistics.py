@@ -0,0 +1,135 @@
+import threading
+import numpy as np
+
+
+class ChannelStatistics:
+    """A running accumulator of the per-channel statistics of 8-bit tiles,
+    used to compute the mean and standard deviation for normalizing a training
+    set. The accumulator keeps one exact integer histogram of the 256 pixel
+    values per channel, from which the 0-1 normalized channel sums and sums of
+    squares are derived, so results do not depend on the order tiles are added
+    in and accumulators filled by different threads, workers or slides can be
+    merged without loss of precision. update() can be called from several
+    threads at once.
+
+    Args:
+        numChannels (int, optional): the number of channels to accumulate; further channels of the tiles (such as transparency) are ignored. Default is 3.
+
+    Example:
+        channelStatistics = ChannelStatistics()
+        channelStatistics.update(pathml_slide.getTiles(tileAddresses))
+        mean, std = channelStatistics.mean(), channelStatistics.std()
+    """
+
+    def __init__(self, numChannels=3):
+        if (type(numChannels) != int) or (numChannels <= 0):
+            raise ValueError('numChannels must be an integer greater than 0')
+        self.numChannels = numChannels
+        self.histogram = np.zeros((numChannels, 256), dtype=np.int64)
+        self.numTiles = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'numChannels': self.numChannels, 'histogram': self.histogram, 'numTiles': self.numTiles}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __add__(self, other):
+        combined = ChannelStatistics(self.numChannels)
+        combined.merge(self)
+        combined.merge(other)
+        return combined
+
+    def update(self, tiles):
+        """A function to add one tile or a batch of tiles to the statistics.
+
+        Args:
+            tiles (np.ndarray): a uint8 array of shape (height, width, channels) holding one tile, or (number of tiles, height, width, channels) holding several
+        """
+
+        tiles = np.asarray(tiles)
+        if tiles.dtype != np.uint8:
+            raise ValueError('tiles must be 8-bit (uint8) arrays')
+        if tiles.ndim not in [3, 4] or tiles.shape[-1] < self.numChannels:
+            raise ValueError('tiles must have the shape (height, width, channels) or (number of tiles, height, width, channels) with at least '+str(self.numChannels)+' channels')
+        numTiles = 1 if tiles.ndim == 3 else tiles.shape[0]
+
+        # One bincount over all channels, with each channel's values offset into its own block of 256 bins
+        pixels = tiles[..., :self.numChannels].reshape(-1, self.numChannels)
+        offsets = np.arange(self.numChannels, dtype=np.intp) * 256
+        histogram = np.bincount((pixels + offsets).ravel(), minlength=256 * self.numChannels).reshape(self.numChannels, 256)
+
+        with self._lock:
+            self.histogram += histogram
+            self.numTiles = self.numTiles + numTiles
+
+    def merge(self, other):
+        """A function to add the statistics of another accumulator to this one,
+        e.g. to combine the statistics of several slides.
+
+        Args:
+            other (ChannelStatistics): the statistics to add
+
+        Returns:
+            ChannelStatistics: this accumulator
+        """
+
+        if other.numChannels != self.numChannels:
+            raise ValueError('Cannot merge statistics of '+str(other.numChannels)+' channels into statistics of '+str(self.numChannels)+' channels')
+        with self._lock:
+            self.histogram += other.histogram
+            self.numTiles = self.numTiles + other.numTiles
+        return self
+
+    def numPixels(self):
+        """A function that returns the number of pixels added per channel.
+
+        Returns:
+            int: the number of pixels
+        """
+
+        return int(self.histogram[0].sum())
+
+    def channelSums(self):
+        """A function that returns the sum of the 0-1 normalized values of each
+        channel.
+
+        Returns:
+            np.ndarray: the sum of each channel
+        """
+
+        return (self.histogram @ np.arange(256, dtype=np.int64)) / 255
+
+    def channelSquaredSums(self):
+        """A function that returns the sum of the squares of the 0-1 normalized
+        values of each channel.
+
+        Returns:
+            np.ndarray: the sum of squares of each channel
+        """
+
+        return (self.histogram @ np.arange(256, dtype=np.int64)**2) / 255**2
+
+    def mean(self):
+        """A function that returns the mean 0-1 normalized value of each
+        channel.
+
+        Returns:
+            np.ndarray: the mean of each channel
+        """
+
+        return self.channelSums() / max(self.numPixels(), 1)
+
+    def std(self):
+        """A function that returns the standard deviation of the 0-1 normalized
+        values of each channel.
+
+        Returns:
+            np.ndarray: the standard deviation of each channel
+        """
+
+        numPixels = max(self.numPixels(), 1)
+        mean = self.channelSums() / numPixels
+        return np.sqrt(np.maximum(self.channelSquaredSums() / numPixels - mean**2, 0))
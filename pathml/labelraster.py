@@ -0,0 +1,237 @@
+import collections
+import os
+import threading
+import zlib
+import numpy as np
+import shapely
+
+
+def rasterizePolygons(polygons, left, top, width, height):
+    """A function to draw polygons into the Boolean mask of an area, with the
+    pixel convention shared by :class:`LabelRaster` and
+    :meth:`Slide.getAnnotationTileMask() <pathml.slide.Slide.getAnnotationTileMask>`:
+    pixel (column i, row j) of the area is set if its center
+    (left+i+0.5, top+j+0.5) lies in or on the boundary of a polygon, so
+    polygon holes are left out. Since the pixel centers are tested against the
+    whole polygons, a pixel gets the same value whichever area it is drawn in.
+
+    Args:
+        polygons (list of shapely.Polygon): the polygons, in pixel coordinates with the y axis pointing down
+        left (int): the x coordinate of the top left corner of the area
+        top (int): the y coordinate of the top left corner of the area
+        width (int): the width of the area in pixels
+        height (int): the height of the area in pixels
+
+    Returns:
+        np.ndarray: the (height, width) Boolean mask
+    """
+
+    mask = np.zeros((height, width), dtype=bool)
+    centerXs = left + np.arange(width) + 0.5
+    centerYs = top + np.arange(height) + 0.5
+    for polygon in polygons:
+        if polygon.is_empty:
+            continue
+        # only test the pixel centers within the bounds of the polygon
+        minx, miny, maxx, maxy = polygon.bounds
+        firstColumn, lastColumn = np.searchsorted(centerXs, minx, side='left'), np.searchsorted(centerXs, maxx, side='right')
+        firstRow, lastRow = np.searchsorted(centerYs, miny, side='left'), np.searchsorted(centerYs, maxy, side='right')
+        if (firstColumn >= lastColumn) or (firstRow >= lastRow):
+            continue
+        shapely.prepare(polygon)
+        xs, ys = np.meshgrid(centerXs[firstColumn:lastColumn], centerYs[firstRow:lastRow])
+        mask[firstRow:lastRow, firstColumn:lastColumn] |= shapely.intersects_xy(polygon, xs, ys)
+    return mask
+
+
+class LabelRaster:
+    """A rasterized map of annotation classes over a whole slide, stored as
+    compressed square blocks. Pixel values are 0 for unannotated pixels and
+    i+1 for pixels of the i-th class of classNames. Blocks that no annotation
+    touches are not stored at all, blocks lying entirely within one class are
+    stored as that single label, and every other block is stored as a
+    zlib-compressed array, in memory or in a folder on disk. Tile masks are
+    then array slices of the raster rather than geometry operations.
+
+    Args:
+        width (int): the width of the raster in pixels
+        height (int): the height of the raster in pixels
+        classNames (list of str): the names of the classes, in label order
+        downsample (float, optional): the factor by which the raster is smaller than the Slide it belongs to. Default is 1.
+        blockSize (int, optional): the edge length of the blocks in pixels. Default is 512.
+        folder (str, optional): the directory to store the compressed blocks in. Default is to keep them in memory.
+        cacheSize (int, optional): the number of decompressed blocks to keep in memory for reuse. Default is 64.
+
+    Example:
+        labelRaster = LabelRaster.fromMultiPolygons(pathml_slide.annotationClassMultiPolygons, pathml_slide.slide.width, pathml_slide.slide.height)
+        tumorMask = labelRaster.classMask(0, 0, 224, 224, ['tumor'])
+    """
+
+    def __init__(self, width, height, classNames, downsample=1, blockSize=512, folder=None, cacheSize=64):
+        if (type(blockSize) != int) or (blockSize <= 0):
+            raise ValueError('blockSize must be an integer greater than 0')
+        self.width = int(width)
+        self.height = int(height)
+        self.classNames = list(classNames)
+        self.downsample = downsample
+        self.blockSize = blockSize
+        self.folder = folder
+        self.dtype = np.uint8 if len(self.classNames) < 255 else np.uint16
+        self.cacheSize = cacheSize
+        self._blocks = {} # (blockX, blockY) -> constant label (int) or compressed block (bytes, or file name if folder is set)
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @classmethod
+    def fromMultiPolygons(cls, classMultiPolygons, width, height, downsample=1, blockSize=512, folder=None):
+        """A function to rasterize the class MultiPolygons made by
+        :meth:`Slide.addAnnotations() <pathml.slide.Slide.addAnnotations>`.
+        Only the blocks that overlap an annotation are drawn; each of them is
+        drawn from the component polygons that an STRtree query finds in it
+        with :func:`rasterizePolygons`, so polygon holes are left unlabelled.
+
+        Args:
+            classMultiPolygons (dict): the Shapely (Multi)Polygon of each class, in the annotation coordinates of addAnnotations (y axis pointing up from the bottom of the slide)
+            width (int): the width of the Slide in pixels
+            height (int): the height of the Slide in pixels
+            downsample (float, optional): the factor by which to shrink the raster relative to the Slide. Default is 1.
+            blockSize (int, optional): the edge length of the blocks in pixels. Default is 512.
+            folder (str, optional): the directory to store the compressed blocks in. Default is to keep them in memory.
+
+        Returns:
+            LabelRaster: the rasterized annotations
+        """
+
+        labelRaster = cls(int(np.ceil(width / downsample)), int(np.ceil(height / downsample)), list(classMultiPolygons.keys()),
+                          downsample=downsample, blockSize=blockSize, folder=folder)
+
+        # Move the polygons to raster pixel coordinates (y axis pointing down), matching Slide.getAnnotationTileMask()
+        parts, labels = [], []
+        for label, classMultiPolygon in enumerate(classMultiPolygons.values(), start=1):
+            classParts = shapely.get_parts(classMultiPolygon)
+            classParts = classParts[~shapely.is_empty(classParts)]
+            parts.extend(shapely.transform(classParts, lambda coords: np.column_stack((coords[:, 0], height - coords[:, 1])) / downsample))
+            labels.extend([label] * len(classParts))
+        if len(parts) == 0:
+            return labelRaster
+        parts = np.array(parts, dtype=object)
+        labels = np.array(labels)
+        tree = shapely.STRtree(parts)
+        shapely.prepare(parts)
+
+        blocksInX = (labelRaster.width + blockSize - 1) // blockSize
+        blocksInY = (labelRaster.height + blockSize - 1) // blockSize
+        blockXs, blockYs = np.meshgrid(np.arange(blocksInX), np.arange(blocksInY))
+        blockXs, blockYs = blockXs.ravel(), blockYs.ravel()
+        blockBoxes = shapely.box(blockXs * blockSize, blockYs * blockSize, (blockXs + 1) * blockSize, (blockYs + 1) * blockSize)
+        blockIndices, partIndices = tree.query(blockBoxes, predicate='intersects')
+
+        for blockIndex in np.unique(blockIndices):
+            blockParts = partIndices[blockIndices == blockIndex]
+            blockBox = blockBoxes[blockIndex]
+            containing = blockParts[shapely.contains(parts[blockParts], blockBox)]
+            if len(containing) > 0:
+                labelRaster._blocks[(int(blockXs[blockIndex]), int(blockYs[blockIndex]))] = int(labels[containing[0]])
+                continue
+
+            left, top = int(blockXs[blockIndex]) * blockSize, int(blockYs[blockIndex]) * blockSize
+            block = np.zeros((blockSize, blockSize), dtype=labelRaster.dtype)
+            for partIndex in blockParts:
+                block[rasterizePolygons([parts[partIndex]], left, top, blockSize, blockSize)] = labels[partIndex]
+            labelRaster._storeBlock(int(blockXs[blockIndex]), int(blockYs[blockIndex]), block)
+
+        return labelRaster
+
+    def _storeBlock(self, blockX, blockY, block):
+        if block.min() == block.max():
+            if block[0, 0] != 0:
+                self._blocks[(blockX, blockY)] = int(block[0, 0])
+            return
+        compressed = zlib.compress(block.tobytes(), 1)
+        if self.folder:
+            fileName = str(blockX)+'_'+str(blockY)+'.blk'
+            with open(os.path.join(self.folder, fileName), 'wb') as f:
+                f.write(compressed)
+            self._blocks[(blockX, blockY)] = fileName
+        else:
+            self._blocks[(blockX, blockY)] = compressed
+
+    def _getBlock(self, blockX, blockY):
+        stored = self._blocks.get((blockX, blockY), 0)
+        if isinstance(stored, int):
+            return stored
+        with self._lock:
+            if (blockX, blockY) in self._cache:
+                self._cache.move_to_end((blockX, blockY))
+                return self._cache[(blockX, blockY)]
+        if self.folder:
+            with open(os.path.join(self.folder, stored), 'rb') as f:
+                stored = f.read()
+        block = np.frombuffer(zlib.decompress(stored), dtype=self.dtype).reshape(self.blockSize, self.blockSize)
+        with self._lock:
+            self._cache[(blockX, blockY)] = block
+            if len(self._cache) > self.cacheSize:
+                self._cache.popitem(last=False)
+        return block
+
+    def read(self, left, top, width, height):
+        """A function to read the labels of an area of the raster. Pixels
+        outside of the raster are 0.
+
+        Args:
+            left (int): the x coordinate of the top left corner of the area
+            top (int): the y coordinate of the top left corner of the area
+            width (int): the width of the area in pixels
+            height (int): the height of the area in pixels
+
+        Returns:
+            np.ndarray: the (height, width) array of labels
+        """
+
+        labels = np.zeros((height, width), dtype=self.dtype)
+        right, bottom = min(left + width, self.width), min(top + height, self.height)
+        for blockY in range(max(top, 0) // self.blockSize, (bottom - 1) // self.blockSize + 1 if bottom > 0 else 0):
+            for blockX in range(max(left, 0) // self.blockSize, (right - 1) // self.blockSize + 1 if right > 0 else 0):
+                block = self._getBlock(blockX, blockY)
+                if isinstance(block, int) and block == 0:
+                    continue
+                x1, y1 = max(left, blockX * self.blockSize), max(top, blockY * self.blockSize)
+                x2, y2 = min(right, (blockX + 1) * self.blockSize), min(bottom, (blockY + 1) * self.blockSize)
+                if isinstance(block, int):
+                    labels[y1-top:y2-top, x1-left:x2-left] = block
+                else:
+                    labels[y1-top:y2-top, x1-left:x2-left] = block[y1-blockY*self.blockSize:y2-blockY*self.blockSize, x1-blockX*self.blockSize:x2-blockX*self.blockSize]
+        return labels
+
+    def classMask(self, left, top, width, height, classNames):
+        """A function to read the mask of one or more classes in an area of the
+        raster.
+
+        Args:
+            left (int): the x coordinate of the top left corner of the area
+            top (int): the y coordinate of the top left corner of the area
+            width (int): the width of the area in pixels
+            height (int): the height of the area in pixels
+            classNames (str or list of str): the class or classes to include in the mask
+
+        Returns:
+            np.ndarray: the (height, width) Boolean mask
+        """
+
+        if type(classNames) == str:
+            classNames = [classNames]
+        classLabels = [self.classNames.index(className) + 1 for className in classNames if className in self.classNames]
+        return np.isin(self.read(left, top, width, height), classLabels)
+
+    def nbytes(self):
+        """A function that returns the number of bytes used by the stored blocks.
+
+        Returns:
+            int: the size of the compressed blocks in bytes, in memory or on disk
+        """
+
+        if self.folder:
+            return sum(os.path.getsize(os.path.join(self.folder, stored)) for stored in self._blocks.values() if not isinstance(stored, int))
+        return sum(len(stored) for stored in self._blocks.values() if not isinstance(stored, int))
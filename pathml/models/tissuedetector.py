@@ -1,10 +1,80 @@
+import copy
+import os
+import threading
 import torch
 import torch.nn as nn
 from torchvision import transforms, models
 
+# Process-level registry of loaded tissue detectors, so that processing many
+# slides (e.g. in a long-running worker) loads each state dict only once.
+# Keys are (architecture, state dict path, modification time, size, optimize).
+_tissueDetectors = {}
+_tissueDetectorsLock = threading.Lock()
 
 
-def tissueDetector(modelStateDictPath='../pathml/pathml/models/deep-tissue-detector_densenet_state-dict.pt', architecture='densenet'):
+def tissueDetector(modelStateDictPath='../pathml/pathml/models/deep-tissue-detector_densenet_state-dict.pt', architecture='densenet', cache=True, optimize=False):
+    """A function that returns the device, model and transforms of a deep
+    tissue detector. Models are kept in a process-level registry, so each
+    (architecture, state dict) pair is built and loaded from disk once per
+    process, until the state dict file changes or
+    :func:`clearTissueDetectorCache` is called. Every call returns its own copy
+    of the registered model, so moving, training or modifying the returned
+    model does not affect later calls.
+
+    Args:
+        modelStateDictPath (str, optional): the path to the state dictionary of the tissue detector. Default is the path to the state dict of the deep tissue detector built into PathML.
+        architecture (str, optional): the name of the architecture that the state dict belongs to. Default is 'densenet'.
+        cache (Bool, optional): whether to take the model from and keep it in the registry. Default is True.
+        optimize (Bool, optional): whether to return a variant optimized for CPU inference: in channels_last memory format, traced and frozen with TorchScript (which folds batch normalization into preceding convolutions) and run in inference mode. Ignored when inferring on GPU. Optimized models cannot be quantized. Default is False.
+
+    Returns:
+        tuple: the torch.device the model is on, the model in eval mode, and the torchvision transforms to apply to tiles
+
+    Example:
+        device, model, data_transforms = tissueDetector(optimize=True)
+    """
+
+    if not cache:
+        return _buildTissueDetector(modelStateDictPath, architecture, optimize)
+    fileStat = os.stat(modelStateDictPath)
+    key = (architecture, os.path.realpath(modelStateDictPath), fileStat.st_mtime_ns, fileStat.st_size, bool(optimize))
+    with _tissueDetectorsLock:
+        if key not in _tissueDetectors:
+            for oldKey in [k for k in _tissueDetectors if k[:2] == key[:2] and k[4] == key[4]]:
+                del _tissueDetectors[oldKey] # the state dict file has changed
+            _tissueDetectors[key] = _buildTissueDetector(modelStateDictPath, architecture, optimize)
+        device, model, data_transforms = _tissueDetectors[key]
+        return device, copy.deepcopy(model), data_transforms
+
+
+def clearTissueDetectorCache():
+    """A function to remove every tissue detector from the process-level
+    registry, releasing their memory."""
+
+    with _tissueDetectorsLock:
+        _tissueDetectors.clear()
+
+
+class _InferenceModeModel(nn.Module):
+    # Runs a model in torch.inference_mode(), which skips more autograd bookkeeping than torch.no_grad()
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        with torch.inference_mode():
+            return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def _optimizeForCpu(model, patch_size):
+    model = model.to(memory_format=torch.channels_last)
+    example = torch.zeros(1, 3, patch_size, patch_size).contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example, check_trace=False)
+    return _InferenceModeModel(torch.jit.freeze(traced))
+
+
+def _buildTissueDetector(modelStateDictPath, architecture, optimize):
 
     if architecture == 'inceptionv3':
         patch_size = 299
@@ -61,5 +131,7 @@ def tissueDetector(modelStateDictPath='../pathml/pathml/models/deep-tissue-detec
     if torch.cuda.device_count() > 1:
         model_ft = torch.nn.DataParallel(model_ft)
     model_ft.to(device).eval()
+    if optimize and device.type == 'cpu':
+        model_ft = _optimizeForCpu(model_ft, patch_size).eval()
 
     return device, model_ft, data_transforms
@@ -0,0 +1,99 @@
+import numpy as np
+
+metricNames = ['dice_coeff', 'iou', 'precision', 'recall']
+
+
+class PixelThresholdSweep:
+    """A streaming evaluator of pixel-wise segmentation predictions at several
+    probability thresholds at once (a pixel is predicted positive when its
+    probability is above the threshold). Each tile is read once: its
+    predictions are split by ground truth label and counted into a histogram
+    (0-255 integer predictions) or sorted (0-1 float predictions), so that
+    its true positive, false positive and false negative pixel counts at
+    every threshold come from cumulative sums. Only running sums of the
+    per-tile metrics and of the pooled pixel counts are kept, so memory does
+    not grow with the number of tiles.
+
+    Per-tile metrics are smoothed by eps as in
+    :func:`pathml.utils.torch.dice_loss.dice_coeff`, so that a tile with
+    neither predicted nor ground truth positive pixels scores 1.
+
+    Args:
+        thresholds (float or list of floats): the 0-1 probability thresholds
+        eps (float, optional): the smoothing term of the per-tile metrics. Default is 0.0001.
+
+    Example:
+        sweep = PixelThresholdSweep([0.5, 0.75, 0.9])
+        for prediction, ground_truth in tiles:
+            sweep.add(prediction, ground_truth)
+        mean_dice_scores = sweep.metric('dice_coeff')
+    """
+
+    def __init__(self, thresholds, eps=0.0001):
+        self.thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+        self.eps = eps
+        self.numTiles = 0
+        self.tileMetricSums = {metric: np.zeros(len(self.thresholds)) for metric in metricNames}
+        self.counts = {key: np.zeros(len(self.thresholds), dtype=np.int64) for key in ['tp', 'fp', 'fn', 'tn']}
+        # the smallest 0-255 prediction above each threshold, with the comparison made on 0-1 probabilities
+        self._integerCutoffs = np.searchsorted(np.arange(256) / 255, self.thresholds, side='right')
+
+    def add(self, prediction, groundTruth):
+        """A function to add the pixels of one tile.
+
+        Args:
+            prediction (np.ndarray): the tile's predictions, as 0-255 integers or 0-1 floats
+            groundTruth (np.ndarray): the tile's ground truth mask of the same shape, positive where nonzero or True
+        """
+
+        prediction, groundTruth = np.asarray(prediction), np.asarray(groundTruth) > 0
+        if prediction.shape != groundTruth.shape:
+            raise ValueError('prediction and groundTruth must have the same shape')
+        positives = int(groundTruth.sum())
+        negatives = groundTruth.size - positives
+        tp = self._countAbove(prediction[groundTruth])
+        fp = self._countAbove(prediction[~groundTruth])
+        fn = positives - tp
+
+        self.tileMetricSums['dice_coeff'] += (2 * tp + self.eps) / (2 * tp + fp + fn + self.eps)
+        self.tileMetricSums['iou'] += (tp + self.eps) / (tp + fp + fn + self.eps)
+        self.tileMetricSums['precision'] += (tp + self.eps) / (tp + fp + self.eps)
+        self.tileMetricSums['recall'] += (tp + self.eps) / (positives + self.eps)
+        self.counts['tp'] += tp
+        self.counts['fp'] += fp
+        self.counts['fn'] += fn
+        self.counts['tn'] += negatives - fp
+        self.numTiles = self.numTiles + 1
+
+    def _countAbove(self, values):
+        # the number of values above each threshold
+        if np.issubdtype(values.dtype, np.integer):
+            histogram = np.bincount(values.ravel().astype(np.intp), minlength=256)
+            atOrAbove = np.concatenate([np.cumsum(histogram[::-1])[::-1], [0]])
+            return atOrAbove[np.minimum(self._integerCutoffs, len(histogram))]
+        values = np.sort(values.ravel())
+        return len(values) - np.searchsorted(values, self.thresholds, side='right')
+
+    def metric(self, metric='dice_coeff', pooled=False):
+        """A function that returns a metric at each threshold.
+
+        Args:
+            metric (str, optional): 'dice_coeff', 'iou', 'precision', or 'recall'. Default is 'dice_coeff'.
+            pooled (Bool, optional): whether to compute the metric from the pixel counts of all tiles pooled together, rather than as the mean of the per-tile metrics. Default is False.
+
+        Returns:
+            np.ndarray: the metric at each threshold
+        """
+
+        if metric not in metricNames:
+            raise ValueError("metric must be one of: 'dice_coeff', 'iou', 'precision', or 'recall'")
+        if self.numTiles == 0:
+            raise ValueError('No tiles have been added')
+        if not pooled:
+            return self.tileMetricSums[metric] / self.numTiles
+        tp, fp, fn = [self.counts[key].astype(np.float64) for key in ['tp', 'fp', 'fn']]
+        numerator, denominator = {'dice_coeff': (2 * tp, 2 * tp + fp + fn),
+                                  'iou': (tp, tp + fp + fn),
+                                  'precision': (tp, tp + fp),
+                                  'recall': (tp, tp + fn)}[metric]
+        return np.divide(numerator, denominator, out=np.ones_like(numerator), where=denominator > 0)
@@ -0,0 +1,323 @@
+import functools
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from shapely import wkb
+from pathml.predictionstore import PredictionStore
+from pathml.tiledictionary import DeferredValues, TileDictionary
+
+# The .pml container is a directory holding a manifest.json and one file per
+# array: .npy files for the numeric columns of the tile dictionary and for the
+# raw tissue detection map (so they can be memory-mapped on load), pickles for
+# object columns, WKB files for the annotation polygons, and a .store directory
+# for the prediction store of segmentation predictions. Files are numbered
+# in the order they are written and never overwritten, so a Slide that has
+# memory-mapped a .pml can safely be saved back to it. Incremental saves only
+# append the files of the keys that changed and point the manifest at them;
+# the files they supersede stay on disk until the .pml is compacted.
+pmlFormatVersion = 1
+manifestFileName = 'manifest.json'
+
+
+def isPmlDirectory(path):
+    """A function that returns whether a path is a .pml container directory
+    written by :func:`savePml()`.
+
+    Args:
+        path (str): the path to check
+
+    Returns:
+        Bool: whether path holds a .pml manifest
+    """
+
+    return os.path.isfile(os.path.join(path, manifestFileName))
+
+
+def readManifest(path):
+    """A function to read the manifest of a .pml container directory.
+
+    Args:
+        path (str): the path to the .pml directory
+
+    Returns:
+        dict: the manifest
+    """
+
+    with open(os.path.join(path, manifestFileName), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != 'pathml':
+        raise ValueError(path+' is not a PathML .pml directory')
+    if manifest['formatVersion'] > pmlFormatVersion:
+        raise ValueError(path+' was written with .pml format version '+str(manifest['formatVersion'])+' but this version of PathML only reads up to version '+str(pmlFormatVersion)+'; please upgrade PathML')
+    return manifest
+
+
+def savePml(path, contents, columns=None):
+    """A function to write the contents of a Slide to a .pml container
+    directory, replacing the .pml stored there before. An older pickled .pml
+    file of the same name is only replaced once the new directory has been
+    written in full.
+
+    Args:
+        path (str): the path to the .pml directory
+        contents (dict): the 'slideFilePath', 'level', 'tileSize', 'tileOverlap' and 'tileDictionary' of the Slide, and optionally its 'rawTissueDetectionMap', 'annotationClassMultiPolygons' and 'segmenterPredictionStore' (a :class:`PredictionStore <pathml.predictionstore.PredictionStore>`, copied into path unless it is already there)
+        columns (list of str, optional): if defined, save incrementally: only these tile dictionary keys are written, as new files next to the existing ones, and every other key still present in the tile dictionary is kept as last saved in path. Superseded files are kept until :func:`compactPml()` is called. Default is to write every key and remove all older files.
+    """
+
+    if not os.path.isfile(path):
+        _writePml(path, contents, columns)
+        return
+    # an older pickled .pml file is only replaced once the directory replacing it is complete
+    temporaryPath = tempfile.mkdtemp(prefix=os.path.basename(path)+'.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        _writePml(temporaryPath, contents, None)
+        os.remove(path)
+        os.replace(temporaryPath, path)
+    except BaseException:
+        shutil.rmtree(temporaryPath, ignore_errors=True)
+        raise
+
+
+def _writePml(path, contents, columns):
+    os.makedirs(path, exist_ok=True)
+    previousManifest = readManifest(path) if isPmlDirectory(path) else None
+    nextFile = previousManifest['nextFile'] if previousManifest else 0
+    if columns is not None and previousManifest is None:
+        columns = None # nothing to save incrementally onto
+
+    def newFile(extension):
+        nonlocal nextFile
+        fileName = str(nextFile)+extension
+        nextFile = nextFile + 1
+        return fileName
+
+    def saveArray(array):
+        fileName = newFile('.npy')
+        np.save(os.path.join(path, fileName), np.ascontiguousarray(array))
+        return fileName
+
+    tileDictionary = contents['tileDictionary']
+    manifest = {'format': 'pathml',
+                'formatVersion': pmlFormatVersion,
+                'slideFilePath': contents['slideFilePath'],
+                'level': int(contents['level']),
+                'numTilesInX': tileDictionary.numTilesInX,
+                'numTilesInY': tileDictionary.numTilesInY,
+                'tileSize': int(contents['tileSize']),
+                'tileOverlap': int(contents['tileOverlap']),
+                'columns': {}}
+
+    for key in tileDictionary.columns():
+        if columns is not None and key not in columns and key in previousManifest['columns']:
+            manifest['columns'][key] = previousManifest['columns'][key]
+        else:
+            manifest['columns'][key] = _saveColumn(tileDictionary.exportColumn(key), saveArray, newFile, path)
+
+    if 'rawTissueDetectionMap' in contents:
+        rawTissueDetectionMap = contents['rawTissueDetectionMap']
+        previousFile = previousManifest['rawTissueDetectionMap']['map'] if columns is not None and 'rawTissueDetectionMap' in previousManifest else None
+        if previousFile is not None and _fileHasArray(os.path.join(path, previousFile), rawTissueDetectionMap['map']):
+            mapFile = previousFile # unchanged since the last save
+        else:
+            mapFile = saveArray(rawTissueDetectionMap['map'])
+        manifest['rawTissueDetectionMap'] = {'map': mapFile,
+                                             'level': np.asarray(rawTissueDetectionMap['level']).item(),
+                                             'tileSize': np.asarray(rawTissueDetectionMap['tileSize']).item(),
+                                             'tileOverlap': np.asarray(rawTissueDetectionMap['tileOverlap']).item()}
+
+    if 'annotationClassMultiPolygons' in contents:
+        manifest['annotationClassMultiPolygons'] = {}
+        previousFiles = previousManifest.get('annotationClassMultiPolygons', {}) if columns is not None else {}
+        for className, multiPolygon in contents['annotationClassMultiPolygons'].items():
+            annotationBytes = wkb.dumps(multiPolygon)
+            if className in previousFiles and _fileHasBytes(os.path.join(path, previousFiles[className]), annotationBytes):
+                manifest['annotationClassMultiPolygons'][className] = previousFiles[className] # unchanged since the last save
+                continue
+            fileName = newFile('.wkb')
+            with open(os.path.join(path, fileName), 'wb') as f:
+                f.write(annotationBytes)
+            manifest['annotationClassMultiPolygons'][className] = fileName
+
+    if 'segmenterPredictionStore' in contents:
+        store = contents['segmenterPredictionStore']
+        if os.path.dirname(store.path) == os.path.abspath(path):
+            store.flush() # already in the .pml, e.g. when saving back to the .pml the Slide was loaded from
+            manifest['segmenterPredictionStore'] = os.path.basename(store.path)
+        else:
+            manifest['segmenterPredictionStore'] = newFile('.store')
+            store.copyTo(os.path.join(path, manifest['segmenterPredictionStore']))
+
+    manifest['nextFile'] = nextFile
+    _writeManifest(path, manifest)
+    if columns is None and previousManifest is not None:
+        # only clean up after earlier saves, never files of a directory that was not a .pml
+        _removeUnreferencedFiles(path, manifest)
+
+
+def compactPml(path):
+    """A function to remove the files of a .pml container directory that were
+    superseded by incremental saves, leaving one file per array of the current
+    contents.
+
+    Args:
+        path (str): the path to the .pml directory
+
+    Returns:
+        int: the number of bytes freed
+
+    Example:
+        pathml.pmlfile.compactPml('/path/to/pathml_slide.pml')
+    """
+
+    if not isPmlDirectory(path):
+        raise ValueError(path+' is not a .pml directory')
+    return _removeUnreferencedFiles(path, readManifest(path))
+
+
+def loadPml(path, mmap=True):
+    """A function to read the contents of a Slide from a .pml file, either a
+    container directory written by :func:`savePml()` or a pickle written by
+    older versions of PathML.
+
+    Args:
+        path (str): the path to the .pml file or directory
+        mmap (Bool, optional): whether to memory-map the numeric columns of the tile dictionary (copy-on-write, so the file on disk is never modified) instead of reading them into memory. Only applies to .pml directories. Default is True.
+
+    Returns:
+        dict: the 'slideFilePath', 'level' and 'tileDictionary' of the Slide, and if they were saved its 'rawTissueDetectionMap', 'annotationClassMultiPolygons', 'segmenterPredictionStore', 'tileSize' and 'tileOverlap'
+    """
+
+    if not isPmlDirectory(path):
+        with open(path, 'rb') as f:
+            contents = pickle.load(f)
+        contents['tileDictionary'] = TileDictionary.fromDict(contents['tileDictionary'])
+        return contents
+
+    manifest = readManifest(path)
+
+    def loadArray(fileName):
+        return _loadArray(os.path.join(path, fileName), mmap)
+
+    tileDictionary = TileDictionary(manifest['numTilesInX'], manifest['numTilesInY'])
+    for key, column in manifest['columns'].items():
+        tileDictionary.importColumn(key, _loadColumn(column, loadArray, path))
+
+    contents = {'slideFilePath': manifest['slideFilePath'],
+                'level': manifest['level'],
+                'tileSize': manifest['tileSize'],
+                'tileOverlap': manifest['tileOverlap'],
+                'tileDictionary': tileDictionary}
+
+    if 'rawTissueDetectionMap' in manifest:
+        rawTissueDetectionMap = dict(manifest['rawTissueDetectionMap'])
+        rawTissueDetectionMap['map'] = np.load(os.path.join(path, rawTissueDetectionMap['map']))
+        contents['rawTissueDetectionMap'] = rawTissueDetectionMap
+
+    if 'annotationClassMultiPolygons' in manifest:
+        contents['annotationClassMultiPolygons'] = {}
+        for className, fileName in manifest['annotationClassMultiPolygons'].items():
+            with open(os.path.join(path, fileName), 'rb') as f:
+                contents['annotationClassMultiPolygons'][className] = wkb.loads(f.read())
+
+    if 'segmenterPredictionStore' in manifest:
+        contents['segmenterPredictionStore'] = PredictionStore(os.path.join(path, manifest['segmenterPredictionStore']))
+
+    return contents
+
+
+def _saveColumn(column, saveArray, newFile, path):
+    entry = {'kind': column['kind'], 'mask': saveArray(column['mask'])}
+    if column['kind'] == 'record':
+        entry['values'] = {subkey: saveArray(values) for subkey, values in column['values'].items()}
+        entry['subMasks'] = {subkey: saveArray(subMask) for subkey, subMask in column['subMasks'].items()}
+    elif column['kind'] == 'object':
+        entry['values'] = newFile('.pkl')
+        with open(os.path.join(path, entry['values']), 'wb') as f:
+            pickle.dump(column['values'], f)
+    else:
+        entry['values'] = saveArray(column['values'])
+    return entry
+
+
+def _loadColumn(entry, loadArray, path):
+    column = {'kind': entry['kind'], 'mask': loadArray(entry['mask'])}
+    if entry['kind'] == 'record':
+        column['values'] = {subkey: loadArray(fileName) for subkey, fileName in entry['values'].items()}
+        column['subMasks'] = {subkey: loadArray(fileName) for subkey, fileName in entry['subMasks'].items()}
+    elif entry['kind'] == 'object':
+        column['values'] = DeferredValues(functools.partial(_loadPickle, os.path.join(path, entry['values'])))
+    else:
+        column['values'] = loadArray(entry['values'])
+    return column
+
+
+def _loadArray(filePath, mmap):
+    if mmap:
+        try:
+            # copy-on-write, returned as a plain ndarray view of the memory map
+            return np.load(filePath, mmap_mode='c').view(np.ndarray)
+        except ValueError: # empty arrays cannot be memory-mapped
+            pass
+    return np.load(filePath)
+
+
+def _fileHasBytes(filePath, data):
+    if os.path.getsize(filePath) != len(data):
+        return False
+    with open(filePath, 'rb') as f:
+        return f.read() == data
+
+
+def _fileHasArray(filePath, array):
+    array = np.asarray(array)
+    saved = _loadArray(filePath, True)
+    return saved.dtype == array.dtype and saved.shape == array.shape and np.array_equal(saved, array)
+
+
+def _loadPickle(filePath):
+    with open(filePath, 'rb') as f:
+        return pickle.load(f)
+
+
+def _writeManifest(path, manifest):
+    # Write the manifest atomically, so an interrupted save leaves the previous one intact
+    temporaryPath = os.path.join(path, manifestFileName+'.tmp')
+    with open(temporaryPath, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporaryPath, os.path.join(path, manifestFileName))
+
+
+def _referencedFiles(manifest):
+    fileNames = set()
+    for entry in manifest['columns'].values():
+        fileNames.add(entry['mask'])
+        if entry['kind'] == 'record':
+            fileNames.update(entry['values'].values())
+            fileNames.update(entry['subMasks'].values())
+        else:
+            fileNames.add(entry['values'])
+    if 'rawTissueDetectionMap' in manifest:
+        fileNames.add(manifest['rawTissueDetectionMap']['map'])
+    fileNames.update(manifest.get('annotationClassMultiPolygons', {}).values())
+    if 'segmenterPredictionStore' in manifest:
+        fileNames.add(manifest['segmenterPredictionStore'])
+    return fileNames
+
+
+def _removeUnreferencedFiles(path, manifest):
+    referenced = _referencedFiles(manifest)
+    freed = 0
+    for fileName in os.listdir(path):
+        if fileName == manifestFileName or fileName in referenced:
+            continue
+        filePath = os.path.join(path, fileName)
+        if os.path.splitext(fileName)[1] in ['.npy', '.pkl', '.wkb']:
+            freed = freed + os.path.getsize(filePath)
+            os.remove(filePath)
+        elif os.path.splitext(fileName)[1] == '.store' and os.path.isdir(filePath):
+            freed = freed + sum(os.path.getsize(os.path.join(filePath, storeFileName)) for storeFileName in os.listdir(filePath))
+            shutil.rmtree(filePath)
+    return freed
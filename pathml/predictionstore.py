@@ -0,0 +1,174 @@
+import collections
+import json
+import os
+import shutil
+import threading
+import numpy as np
+
+# A prediction store is a directory holding an index.json and the chunks of
+# tile predictions written so far, each a compressed .npz file holding the
+# (number of tiles, number of classes, tile height, tile width) array of up to
+# tilesPerChunk consecutively written tiles. Tiles are referred to by the order
+# they were written in; chunks are never rewritten once finished.
+indexFileName = 'index.json'
+
+
+class PredictionStore:
+    """A chunked, compressed on-disk store of per-tile segmentation
+    predictions, so that the pixel-wise predictions of a whole slide do not
+    have to be held in memory (or pickled into a .pml file). Tiles are written
+    in batches and buffered until a chunk of tilesPerChunk tiles is complete;
+    reads decompress one chunk at a time and keep the cacheChunks most recently
+    read chunks in memory, so reading tiles in the order they were written
+    decompresses every chunk once. write() and read() can be called from
+    several threads at once.
+
+    Args:
+        path (str): the directory of the store; an existing store is opened, otherwise a new one is created
+        classNames (list of str, optional): the classes of the predictions, in channel order. Required to create a store.
+        tileShape (Tuple[int, int], optional): the (height, width) of the tile predictions. Required to create a store.
+        dtype (str, optional): the numpy dtype the predictions are stored as, e.g. 'uint8' for 0-255 probabilities or 'float32' for 0-1 probabilities. Default is 'uint8'.
+        tilesPerChunk (int, optional): the number of tiles per chunk. Default is 64.
+        cacheChunks (int, optional): the number of decompressed chunks kept in memory for reading. Default is 4.
+
+    Example:
+        store = PredictionStore('/path/to/predictions.store', classNames=['tumor'], tileShape=(512, 512))
+        indices = store.write(batch_predictions)
+        store.flush()
+        tumor_probabilities = store.read(indices[0])[0]
+    """
+
+    def __init__(self, path, classNames=None, tileShape=None, dtype='uint8', tilesPerChunk=64, cacheChunks=4):
+        if (type(tilesPerChunk) != int) or (tilesPerChunk <= 0):
+            raise ValueError('tilesPerChunk must be an integer greater than 0')
+        self.path = os.path.abspath(path)
+        self.cacheChunks = cacheChunks
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        self._buffer = []
+        if os.path.isfile(os.path.join(self.path, indexFileName)):
+            with open(os.path.join(self.path, indexFileName), 'r') as f:
+                index = json.load(f)
+            self.classNames = index['classNames']
+            self.tileShape = tuple(index['tileShape'])
+            self.dtype = np.dtype(index['dtype'])
+            self.tilesPerChunk = index['tilesPerChunk']
+            self.chunks = index['chunks']
+        else:
+            if (classNames is None) or (tileShape is None):
+                raise ValueError('classNames and tileShape must be defined to create a prediction store')
+            os.makedirs(self.path, exist_ok=True)
+            self.classNames = list(classNames)
+            self.tileShape = tuple(int(s) for s in tileShape)
+            self.dtype = np.dtype(dtype)
+            self.tilesPerChunk = tilesPerChunk
+            self.chunks = []
+            self._writeIndex()
+        self._chunkStarts = [chunk['start'] for chunk in self.chunks]
+        self.numTiles = self.chunks[-1]['start'] + self.chunks[-1]['numTiles'] if self.chunks else 0
+
+    def __len__(self):
+        return self.numTiles
+
+    def __getstate__(self):
+        self.flush()
+        return {'path': self.path, 'cacheChunks': self.cacheChunks}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], cacheChunks=state['cacheChunks'])
+
+    def write(self, predictions):
+        """A function to append the predictions of a batch of tiles.
+
+        Args:
+            predictions (np.ndarray): an array of shape (number of tiles, number of classes, tile height, tile width), converted to the dtype of the store
+
+        Returns:
+            np.ndarray: the indices the tiles are stored at, to be passed to read()
+        """
+
+        predictions = np.asarray(predictions)
+        if predictions.shape[1:] != (len(self.classNames),)+self.tileShape:
+            raise ValueError('predictions must have the shape (number of tiles, '+str(len(self.classNames))+', '+str(self.tileShape[0])+', '+str(self.tileShape[1])+')')
+        predictions = predictions.astype(self.dtype, copy=False)
+        with self._lock:
+            indices = np.arange(self.numTiles, self.numTiles + len(predictions))
+            self.numTiles = self.numTiles + len(predictions)
+            for prediction in predictions:
+                self._buffer.append(prediction)
+                if len(self._buffer) == self.tilesPerChunk:
+                    self._writeChunk()
+        return indices
+
+    def flush(self):
+        """A function to write the tiles still buffered as a (possibly smaller)
+        chunk, making every tile written so far readable from disk."""
+
+        with self._lock:
+            if len(self._buffer) > 0:
+                self._writeChunk()
+
+    def read(self, index):
+        """A function that returns the predictions of one tile.
+
+        Args:
+            index (int): the index returned by write() for the tile
+
+        Returns:
+            np.ndarray: the (number of classes, tile height, tile width) predictions of the tile
+        """
+
+        index = int(index)
+        if (index < 0) or (index >= self.numTiles):
+            raise IndexError('Tile index '+str(index)+' is not in the prediction store')
+        with self._lock:
+            chunkIndex = int(np.searchsorted(self._chunkStarts, index, side='right')) - 1
+            if (chunkIndex < 0) or (index >= self.chunks[chunkIndex]['start'] + self.chunks[chunkIndex]['numTiles']):
+                # the tile is still in the write buffer
+                return self._buffer[index - (self.numTiles - len(self._buffer))].copy()
+            if chunkIndex in self._cache:
+                self._cache.move_to_end(chunkIndex)
+                chunk = self._cache[chunkIndex]
+            else:
+                with np.load(os.path.join(self.path, self.chunks[chunkIndex]['file'])) as npz:
+                    chunk = npz['predictions']
+                self._cache[chunkIndex] = chunk
+                while len(self._cache) > self.cacheChunks:
+                    self._cache.popitem(last=False)
+            return chunk[index - self.chunks[chunkIndex]['start']].copy()
+
+    def copyTo(self, path):
+        """A function to copy the store to another directory, e.g. into a .pml
+        directory when a Slide is saved.
+
+        Args:
+            path (str): the directory to copy the store to
+
+        Returns:
+            PredictionStore: the store at path
+        """
+
+        self.flush()
+        shutil.copytree(self.path, path)
+        return PredictionStore(path, cacheChunks=self.cacheChunks)
+
+    def _writeChunk(self):
+        fileName = str(len(self.chunks)).zfill(6)+'.npz'
+        start = self.chunks[-1]['start'] + self.chunks[-1]['numTiles'] if self.chunks else 0
+        np.savez_compressed(os.path.join(self.path, fileName), predictions=np.stack(self._buffer))
+        self.chunks.append({'file': fileName, 'start': start, 'numTiles': len(self._buffer)})
+        self._chunkStarts.append(start)
+        self._buffer = []
+        self._writeIndex()
+
+    def _writeIndex(self):
+        index = {'format': 'pathml-predictions',
+                 'classNames': self.classNames,
+                 'tileShape': list(self.tileShape),
+                 'dtype': self.dtype.str,
+                 'tilesPerChunk': self.tilesPerChunk,
+                 'chunks': self.chunks}
+        temporaryPath = os.path.join(self.path, indexFileName+'.tmp')
+        with open(temporaryPath, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(temporaryPath, os.path.join(self.path, indexFileName))
@@ -3,7 +3,8 @@ from tqdm import tqdm
 import os
 import torch
 import pickle
-from .utils.torch.WholeSlideImageDataset import WholeSlideImageDataset
+from .utils.torch.StreamingInferenceEngine import StreamingInferenceEngine
+from .utils.torch.quantization import quantizeForSlide
 
 class Processor:
 
@@ -13,29 +14,33 @@ class Processor:
         self.__verbose = verbose
         self.__slideObject = slideObject
 
-    def applyModel(self, modelZip, batch_size, predictionKey = 'prediction', numWorkers=16, tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, maskLevelThreshold=False):
+    def applyModel(self, modelZip, batch_size, predictionKey = 'prediction', numWorkers=16, tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, maskLevelThreshold=False, quantize=False, numCalibrationTiles=32):
+        # quantize: False, or 'static'/'dynamic' (True means 'static') to infer an int8 copy of the model on CPU,
+        # calibrated on numCalibrationTiles tiles of the slide; its agreement with the float32 model is kept in self.quantizationAgreement
         device, model, data_transforms = modelZip
-        pathSlideDataset = WholeSlideImageDataset(self.__slideObject, transform=data_transforms, tissueLevelThreshold=tissueLevelThreshold, foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold)
-        pathSlideDataloader = torch.utils.data.DataLoader(pathSlideDataset, batch_size=batch_size, shuffle=False, num_workers=numWorkers)
-        print(f"Processing {len(self.__slideObject.suitableTileAddresses(tissueLevelThreshold=tissueLevelThreshold, foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold))} of {len(self.__slideObject.suitableTileAddresses())} tiles...")
-        for inputs in tqdm(pathSlideDataloader):
-            inputTile = inputs['image'].to(device)
-            output = model(inputTile).to(device)
-
+        inferenceEngine = StreamingInferenceEngine(self.__slideObject, transform=data_transforms, batchSize=batch_size, numWorkers=numWorkers, tissueLevelThreshold=tissueLevelThreshold, foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold)
+        print(f"Processing {len(inferenceEngine.suitableTileAddresses)} of {len(self.__slideObject.tileDictionary)} tiles...")
+        if quantize and len(inferenceEngine.suitableTileAddresses) > 0:
+            model, self.quantizationAgreement = quantizeForSlide(model, inferenceEngine, mode='static' if quantize is True else quantize,
+                numCalibrationTiles=numCalibrationTiles, numValidationTiles=numCalibrationTiles, device=device)
+            device = torch.device('cpu')
+        predictions = None
+        predictionMask = np.zeros(self.__slideObject.tileDictionary.shape, dtype=bool)
+        for tileAddresses, output in tqdm(inferenceEngine.infer(model, device), total=len(inferenceEngine)):
             batch_prediction = torch.nn.functional.softmax(
-                output, dim=1).cpu().data.numpy()
+                output, dim=1).cpu().numpy()
 
-            # Reshape it is a Todo - instead of for looping
-            for index in range(len(inputTile)):
-                tileAddress = (inputs['tileAddress'][0][index].item(),
-                               inputs['tileAddress'][1][index].item())
-                self.__slideObject.appendTag(tileAddress, predictionKey, batch_prediction[index, ...])
+            if predictions is None:
+                predictions = np.zeros(self.__slideObject.tileDictionary.shape+batch_prediction.shape[1:], dtype=batch_prediction.dtype)
+            xs, ys = np.array(tileAddresses).T
+            predictions[ys, xs] = batch_prediction
+            predictionMask[ys, xs] = True
+        if predictions is not None:
+            self.__slideObject.tileDictionary.setColumn(predictionKey, predictions, mask=predictionMask)
         return self.__slideObject
 
     def adoptKeyFromTileDictionary(self, upsampleFactor=1):
-        for orphanTileAddress in self.__slideObject.iterateTiles():
-            self.__slideObject.tileDictionary[orphanTileAddress].update({'x': self.__slideObject.tileDictionary[orphanTileAddress]['x']*upsampleFactor,
-                                                            'y': self.__slideObject.tileDictionary[orphanTileAddress]['y']*upsampleFactor,
-                                                            'width': self.__slideObject.tileDictionary[orphanTileAddress]['width']*upsampleFactor,
-                                                            'height': self.__slideObject.tileDictionary[orphanTileAddress]['height']*upsampleFactor,})
+        tileDictionary = self.__slideObject.tileDictionary
+        for key in ['x', 'y', 'width', 'height']:
+            tileDictionary.setColumn(key, tileDictionary.getColumn(key)*upsampleFactor)
         return self.__slideObject
@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+import time
+import pyvips as pv
+
+
+class RegionPool:
+    """A pool of pyvips Regions over one image, so that tiles can be fetched
+    concurrently from several threads or DataLoader worker processes. A pyvips
+    Region holds a pixel buffer and must not be used by two readers at once;
+    the pool hands each concurrent read its own Region, creating Regions lazily
+    the first time they are needed and reusing them afterwards. The pool is
+    rebuilt automatically in a forked child process, so Regions are never
+    shared across processes.
+
+    Args:
+        image (pyvips.Image): the image to fetch regions from
+        maxReaders (int, optional): the maximum number of Regions (and so of concurrent reads). Further reads wait for a Region to become free. Default is to create one Region per concurrent reader without limit.
+
+    Example:
+        pool = RegionPool(pathml_slide.slide, maxReaders=8)
+        tile_bytes = pool.fetch(0, 0, 224, 224)
+    """
+
+    def __init__(self, image, maxReaders=None):
+        if maxReaders is not None and ((type(maxReaders) != int) or (maxReaders <= 0)):
+            raise ValueError('maxReaders must be an integer greater than 0')
+        self.image = image
+        self.maxReaders = maxReaders
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._numRegions = 0
+        self._statistics = []
+
+    def __getstate__(self):
+        return {'image': self.image, 'maxReaders': self.maxReaders}
+
+    def __setstate__(self, state):
+        self.image = state['image']
+        self.maxReaders = state['maxReaders']
+        self._reset()
+
+    def _acquire(self):
+        if os.getpid() != self._pid:
+            self._reset()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if (self.maxReaders is None) or (self._numRegions < self.maxReaders):
+                reader = self._numRegions
+                self._numRegions = self._numRegions + 1
+                self._statistics.append({'reads': 0, 'seconds': 0.0})
+                return reader, pv.Region.new(self.image)
+        return self._idle.get()
+
+    def fetch(self, left, top, width, height):
+        """A function to read an area of the image with a Region from the pool.
+
+        Args:
+            left (int): the x coordinate of the top left corner of the area
+            top (int): the y coordinate of the top left corner of the area
+            width (int): the width of the area in pixels
+            height (int): the height of the area in pixels
+
+        Returns:
+            bytes: the pixels of the area, in the band-interleaved row-major layout of pyvips.Region.fetch()
+        """
+
+        reader, region = self._acquire()
+        try:
+            start = time.perf_counter()
+            pixels = region.fetch(left, top, width, height)
+            self._statistics[reader]['reads'] += 1
+            self._statistics[reader]['seconds'] += time.perf_counter() - start
+        finally:
+            self._idle.put((reader, region))
+        return pixels
+
+    def numReaders(self):
+        """A function that returns the number of Regions created by the pool in
+        the current process so far.
+
+        Returns:
+            int: the number of readers
+        """
+
+        return self._numRegions
+
+    def statistics(self):
+        """A function that returns the read throughput of each reader of the
+        pool in the current process.
+
+        Returns:
+            list of dict: one dict per reader with its number of reads, the seconds spent reading and the resulting reads per second
+
+        Example:
+            for reader in pathml_slide.regionPool.statistics(): print(reader['readsPerSecond'])
+        """
+
+        return [{'reader': reader,
+                 'reads': stats['reads'],
+                 'seconds': stats['seconds'],
+                 'readsPerSecond': stats['reads'] / stats['seconds'] if stats['seconds'] > 0 else 0.0}
+                for reader, stats in enumerate(list(self._statistics))]
@@ -2,38 +2,50 @@
 # capabilities
 
 import torch
-from torchvision import transforms
 import torch.nn.functional as F
 import numpy as np
 import pyvips as pv
 import pandas as pd
-from PIL import Image, ImageDraw
+from PIL import Image
 from joblib import Parallel, delayed
-from sklearn.metrics import accuracy_score, balanced_accuracy_score, f1_score, precision_score, recall_score
 from skimage.transform import downscale_local_mean
-from skimage.filters import threshold_triangle, threshold_otsu
+from skimage.filters import threshold_otsu
 from skimage.morphology import binary_dilation, remove_small_objects
 from scipy.ndimage.morphology import binary_fill_holes
-import scipy.sparse as sps
 from skimage.color import rgb2gray, rgb2lab
 from skimage.transform import resize, resize_local_mean
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 from pathlib import Path
 import contextlib
+import functools
+import io
 from pathml.processor import Processor
+from pathml.tiledictionary import TileDictionary
+from pathml.pmlfile import isPmlDirectory, loadPml, readManifest, savePml
+from pathml.regionpool import RegionPool
+from pathml.labelraster import LabelRaster, rasterizePolygons
+from pathml.stitcher import SegmentationStitcher
+from pathml.thresholdsweep import ThresholdSweep
+from pathml.pixelthresholdsweep import PixelThresholdSweep
+from pathml.predictionstore import PredictionStore
+from pathml.annotation import Annotation
+from pathml.tilewriter import TileWriter
+from pathml.channelstatistics import ChannelStatistics
 from pathml.models.tissuedetector import tissueDetector
-from pathml.utils.torch.WholeSlideImageDataset import WholeSlideImageDataset
+from pathml.utils.torch.StreamingInferenceEngine import StreamingInferenceEngine
+from pathml.utils.torch.quantization import quantizeForSlide
 from pathml.utils.torch.dice_loss import dice_coeff
-import xml.etree.ElementTree as ET
+import shapely
 from shapely import geometry
 from shapely.ops import unary_union
 from tqdm import tqdm
 import random
-import json
 import os
 import sys
 import pickle
+import shutil
+import tempfile
 import openslide
 pv.cache_set_max(0)
 
@@ -53,6 +65,8 @@ class Slide:
         newSlideFilePath (str, optional): if loading a .pml file and the location of the WSI has changed, the new path to WSI can be inputted here
         level (int, optional): the level of the WSI pyramid at which to operate on; 0 is the highest resolution and default and how many levels are present above that depends on the WSI
         verbose (Bool, optional): whether to output a verbose output. Default is false.
+        numReaders (int, optional): the maximum number of pyvips regions used to fetch tiles concurrently (see :class:`RegionPool <pathml.regionpool.RegionPool>`). Default is one region per concurrent reader, without limit.
+        mmap (Bool, optional): if loading a .pml file, whether to memory-map the tile dictionary so that keys are only read from disk when used. Changes to the Slide are never written back to the .pml file until it is saved. Default is True.
     """
 
     __format_to_dtype = {
@@ -85,73 +99,97 @@ class Slide:
 
     # If slideFilePath can be a path to a WSI (to make from scratch),
     # or a path to a .pml file (to make from a pre-existing pathml Slide saved with save())
-    def __init__(self, slideFilePath, level=0, newSlideFilePath=False, verbose=False):
+    def __init__(self, slideFilePath, level=0, newSlideFilePath=False, verbose=False, numReaders=False, mmap=True):
         """Constructor method
         """
-        self.__verbose = verbose
-
-        if slideFilePath[-4:] == '.pml': # initing from .pml file
-            contents = pickle.load(open(slideFilePath, 'rb'))
-            if newSlideFilePath:
-                self.slideFilePath = newSlideFilePath
-            else:
-                self.slideFilePath = contents['slideFilePath']
-            self.level = contents['level']
-            self.tileDictionary = contents['tileDictionary']
-            if "rawTissueDetectionMap" in contents:
-                self.rawTissueDetectionMap = contents['rawTissueDetectionMap']
-            if 'annotationClassMultiPolygons' in contents:
-                self.annotationClassMultiPolygons = contents['annotationClassMultiPolygons']
+        contents = None
+        slideFilePath = slideFilePath.rstrip('/'+os.sep)
+        if slideFilePath[-4:] == '.pml': # initing from .pml file or directory
+            contents = loadPml(slideFilePath, mmap=mmap)
+            wsiFilePath = newSlideFilePath if newSlideFilePath else contents['slideFilePath']
+            level = contents['level']
         else: # initing from WSI file (from scratch)
-            self.slideFilePath = slideFilePath
-            self.level = level
-        self.slideFileName = Path(self.slideFilePath).name
-        self.slideFileId = Path(Path(self.slideFilePath).stem).stem
-        self.foreground = False
+            wsiFilePath = slideFilePath
+
         try:                                                                                                       # !!!
-            if self.__verbose:
-                print(self.__verbosePrefix + "Loading " + self.slideFilePath)
-            self.level_count = openslide.OpenSlide(self.slideFilePath).level_count
-            self.levels = [pv.Image.openslideload(self.slideFilePath, level=l) for l in range(self.level_count)]
-            self.slide = self.levels[self.level]
+            if verbose:
+                print(self.__verbosePrefix + "Loading " + wsiFilePath)
+            level_count = openslide.OpenSlide(wsiFilePath).level_count
+            levels = [pv.Image.openslideload(wsiFilePath, level=l) for l in range(level_count)]
+            slide = levels[level]
         except:
             raise FileNotFoundError('Whole-slide image could not be loaded')
         else:
-            if self.__verbose:
+            if verbose:
                 print(self.__verbosePrefix + "Successfully loaded")
 
         try:
-            self.slideProperties = {x: self.slide.get(
-                x) for x in self.slide.get_fields()}
+            slideProperties = {x: slide.get(
+                x) for x in slide.get_fields()}
         except:
             raise ImportError(
                 'Whole-slide image properties could not be imported')
         else:
-            if 'vips-loader' not in self.slideProperties:
+            if 'vips-loader' not in slideProperties:
                 print("Warning: 'vips-loader' not present in slide properties; verify independently that slide has loaded properly.")
             else:
-                if self.slideProperties['vips-loader'] != 'openslideload':
+                if slideProperties['vips-loader'] != 'openslideload':
                     raise TypeError(
                         'This image is not compatible. Please refer to the documentation for proper installation of openslide and libvips')
-            if self.__verbose:
+            if verbose:
                 print(
-                    self.__verbosePrefix + str(len(self.slideProperties)) + " properties were successfully imported")
-
-        if slideFilePath[-4:] == '.pml': # setTileProperties if starting from .pml file
-            self.regionWorker = pv.Region.new(self.slide)
-            self.tileSize = self.tileDictionary[list(self.tileDictionary.keys())[0]]['height']
-            xs = set()
-            ys = set()
-            for adrs in self.iterateTiles():
-                xs.add(self.tileDictionary[adrs]['x'])
-                ys.add(self.tileDictionary[adrs]['y'])
-            
-            self.numTilesInX = len(xs)
-            self.numTilesInY = len(ys)
+                    self.__verbosePrefix + str(len(slideProperties)) + " properties were successfully imported")
 
-            xs = sorted(list(xs))
-            tileSize_minus_tileOverlap = xs[1]-xs[0]
-            self.tileOverlap = self.tileSize - tileSize_minus_tileOverlap
+        self._initialize(wsiFilePath, levels, level, slideProperties, verbose=verbose, numReaders=numReaders)
+
+        if contents is not None: # setTileProperties if starting from .pml file
+            if isPmlDirectory(slideFilePath):
+                self.__savedPml = self.__pmlState(slideFilePath, contents['tileDictionary'])
+            self.tileDictionary = contents['tileDictionary']
+            if "rawTissueDetectionMap" in contents:
+                self.rawTissueDetectionMap = contents['rawTissueDetectionMap']
+            if 'annotationClassMultiPolygons' in contents:
+                self.annotationClassMultiPolygons = contents['annotationClassMultiPolygons']
+            if 'segmenterPredictionStore' in contents:
+                self.segmenterPredictionStore = contents['segmenterPredictionStore']
+            self.regionPool = RegionPool(self.slide, maxReaders=self.numReaders if self.numReaders else None)
+            self.numTilesInX = self.tileDictionary.numTilesInX
+            self.numTilesInY = self.tileDictionary.numTilesInY
+            if 'tileSize' in contents:
+                self.tileSize = contents['tileSize']
+                self.tileOverlap = contents['tileOverlap']
+            else: # pickled .pml files do not store the tile properties
+                self.tileSize = self.tileDictionary[(0, 0)]['height']
+                xs = self.tileDictionary.getColumn('x')
+                tileSize_minus_tileOverlap = int(xs[0, 1]-xs[0, 0]) if self.numTilesInX > 1 else self.tileSize
+                self.tileOverlap = self.tileSize - tileSize_minus_tileOverlap
+
+    def _initialize(self, slideFilePath, levels, level, slideProperties, verbose=False, numReaders=False):
+        # The state of a Slide over the already opened levels of a WSI pyramid, shared by
+        # __init__(), tilingView() and _fromPyramid(); the tile dictionary is set up separately
+        self.__verbose = verbose
+        self.numReaders = numReaders
+        self.__savedPml = None # the .pml directory and the key versions last saved to it, for incremental saves
+        self.__temporaryPredictionStore = None # the temporary directory inferSegmenter() created the prediction store in, if it did
+        self.slideFilePath = slideFilePath
+        self.slideFileName = Path(self.slideFilePath).name
+        self.slideFileId = Path(Path(self.slideFilePath).stem).stem
+        self.foreground = False
+        self.level_count = len(levels)
+        self.levels = levels
+        self.level = level
+        self.slide = self.levels[self.level]
+        self.slideProperties = slideProperties
+
+    @classmethod
+    def _fromPyramid(cls, slideFilePath, levels, level=0, slideProperties=None, verbose=False, numReaders=False):
+        # A Slide over pyvips images standing in for the levels of a WSI pyramid, without opening a WSI file
+        slide = cls.__new__(cls)
+        if slideProperties is None:
+            slideProperties = {'width': levels[level].width, 'height': levels[level].height}
+            slideProperties.update({'openslide.level['+str(l)+'].downsample': str(levels[0].width / levels[l].width) for l in range(len(levels))})
+        slide._initialize(slideFilePath, levels, level, slideProperties, verbose=verbose, numReaders=numReaders)
+        return slide
 
     def square_int(self, i):
         return self.getTile((0,0),writeToNumpy=True)
@@ -192,10 +230,9 @@ class Slide:
             Warning("tileDictionary already exists")
             return
 
-        self.regionWorker = pv.Region.new(self.slide)
+        self.regionPool = RegionPool(self.slide, maxReaders=self.numReaders if self.numReaders else None)
         self.tileOverlap = round(tileOverlap * tileSize)
         self.tileSize = tileSize
-        self.tileDictionary = {}
         # Create tile adresses and coordinates
         self.numTilesInX = self.slide.width // (
             self.tileSize - self.tileOverlap)
@@ -204,13 +241,35 @@ class Slide:
             self.tileSize - self.tileOverlap)
         if self.numTilesInY * self.tileSize > self.slide.height: self.numTilesInY -= 1
 
-        for y in range(self.numTilesInY):
-            for x in range(self.numTilesInX):
-                self.tileDictionary[(x, y)] = {'x': x * (self.tileSize - self.tileOverlap),
-                                             'y': y * (self.tileSize - self.tileOverlap), 'width': self.tileSize,
-                                             'height': self.tileSize}
+        self.tileDictionary = TileDictionary.fromGrid(self.numTilesInX, self.numTilesInY, self.tileSize, self.tileOverlap)
         return self
 
+    def tilingView(self, level, tileSize, tileOverlap=0):
+        """A function that returns a lightweight Slide tiling another level of
+        the WSI pyramid, such as the level tissue detection is performed at.
+        The view shares the pyramid levels and properties this Slide already
+        opened instead of reopening the WSI, and its tile dictionary only holds
+        the tile grid, which is computed arithmetically; annotations and the
+        keys of this Slide's tile dictionary are not carried over.
+
+        Args:
+            level (int): the level of the WSI pyramid to tile
+            tileSize (int): the edge length of each square tile in pixels
+            tileOverlap (float, optional): the fraction of a tile's edge length that overlaps the left, right, above, and below tiles. Default is 0.
+
+        Returns:
+            pathml.slide.Slide: A Slide of the same WSI tiled at level
+
+        Example:
+            tissue_detection_view = pathml_slide.tilingView(1, 512)
+        """
+
+        if (type(level) != int) or (level < 0) or (level >= self.level_count):
+            raise ValueError('level must be an integer from 0 to '+str(self.level_count-1))
+        view = Slide._fromPyramid(self.slideFilePath, self.levels, level=level, verbose=self.__verbose, numReaders=self.numReaders,
+                                  slideProperties=dict(self.slideProperties, width=self.levels[level].width, height=self.levels[level].height))
+        return view.setTileProperties(tileSize=tileSize, tileOverlap=tileOverlap)
+
     def getTile(self, tileAddress, writeToNumpy=False, useFetch=False):
         """A function to return a desired tile in the tile dictionary in the
         form of a pyvips Image.
@@ -218,7 +277,7 @@ class Slide:
         Args:
             tileAddress (Tuple[int, int]): the (x, y) coordinate touple of the desired tile to extract.
             writeToNumpy (Bool, optional): whether to return a numpy array of the tile (otherwise a pyvips Image object will be returbed). Default is False.
-            useFetch (Bool, optional): whether to use pyvip's fetchTile() function to extract the tile, which is purported to be faster than extractArea(). Default is False.
+            useFetch (Bool, optional): whether to use pyvip's fetchTile() function to extract the tile, which is purported to be faster than extractArea(). Fetches go through the Slide's RegionPool and can be made concurrently from several threads or DataLoader workers. Default is False.
 
         Returns:
             pyvips.Image: Tile image from the specified address; if writeToNumpy is set to True, a np.ndarray will be returned instead
@@ -252,7 +311,72 @@ class Slide:
                     'Tile address (' + str(tileAddress[0]) + ', ' + str(tileAddress[1]) + ') is out of bounds')
 
     def fetchTile(self, patchWidth, patchHeight, patchX, patchY):
-        return self.regionWorker.fetch(patchX, patchY, patchWidth, patchHeight)
+        return self.regionPool.fetch(patchX, patchY, patchWidth, patchHeight)
+
+    def getTiles(self, tileAddresses, maxTilesPerRead=16):
+        """A function to return several tiles in the tile dictionary at once as
+        one numpy array. Tiles lying next to each other in the same row of the
+        tile grid are read together in a single region fetch and then sliced
+        apart, so neighbouring tiles share decoding work instead of each tile
+        being fetched separately. All requested tiles must have the same width
+        and height.
+
+        Args:
+            tileAddresses (list of Tuple[int, int]): the (x, y) coordinate touples of the desired tiles.
+            maxTilesPerRead (int, optional): the maximum number of neighbouring tiles to read in one region fetch. Default is 16.
+
+        Returns:
+            np.ndarray: An array of shape (number of tiles, tile height, tile width, number of bands) holding the tiles in the order of tileAddresses
+
+        Example:
+            tiles = pathml_slide.getTiles([(15,20), (16,20), (17,20)])
+        """
+
+        if not self.hasTileDictionary():
+            raise PermissionError(
+                'setTileProperties must be called before accessing tiles')
+        if (type(maxTilesPerRead) != int) or (maxTilesPerRead <= 0):
+            raise ValueError('maxTilesPerRead must be an integer greater than 0')
+
+        tileAddresses = list(tileAddresses)
+        for tileAddress in tileAddresses:
+            if tileAddress not in self.tileDictionary:
+                raise ValueError('Tile address ' + str(tileAddress) + ' is out of bounds')
+        dtype = self.__format_to_dtype[self.slide.format]
+        if len(tileAddresses) == 0:
+            return np.zeros((0, self.tileSize, self.tileSize, self.slide.bands), dtype=dtype)
+
+        addressArray = np.array(tileAddresses, dtype=np.int64).reshape(-1, 2)
+        xs = self.tileDictionary.getColumn('x')[addressArray[:, 1], addressArray[:, 0]]
+        ys = self.tileDictionary.getColumn('y')[addressArray[:, 1], addressArray[:, 0]]
+        widths = self.tileDictionary.getColumn('width')[addressArray[:, 1], addressArray[:, 0]]
+        heights = self.tileDictionary.getColumn('height')[addressArray[:, 1], addressArray[:, 0]]
+        if np.any(widths != widths[0]) or np.any(heights != heights[0]):
+            raise ValueError('All tiles must have the same width and height to be read with getTiles()')
+        width = int(widths[0])
+        height = int(heights[0])
+        bands = self.slide.bands
+
+        tiles = np.empty((len(tileAddresses), height, width, bands), dtype=dtype)
+
+        # Group tiles into runs of touching or overlapping tiles along each row, then read each run in one fetch
+        order = np.lexsort((xs, ys))
+        start = 0
+        while start < len(order):
+            end = start + 1
+            while (end < len(order)) and (end - start < maxTilesPerRead) and (ys[order[end]] == ys[order[start]]) and \
+                    (0 <= xs[order[end]] - xs[order[end-1]] <= width):
+                end = end + 1
+            left = int(xs[order[start]])
+            top = int(ys[order[start]])
+            regionWidth = int(xs[order[end-1]]) + width - left
+            region = np.ndarray(buffer=self.fetchTile(regionWidth, height, left, top), dtype=dtype, shape=[height, regionWidth, bands])
+            for index in order[start:end]:
+                offset = int(xs[index]) - left
+                tiles[index] = region[:, offset:offset+width]
+            start = end
+
+        return tiles
 
 
     def saveTile(self, tileAddress, fileName, folder=os.getcwd()):
@@ -288,7 +412,7 @@ class Slide:
         instead.
 
         Args:
-            fileName (str, optional): the name of the file where the pickled tile dictionary (a dict) will be stored, excluding an extension. Default is the slideFileName attribute.
+            fileName (str, optional): the name of the file where the pickled tile dictionary (a plain dict of per-tile dicts, as returned by TileDictionary.toDict()) will be stored, excluding an extension. Default is the slideFileName attribute.
             folder (str, optional): the path to the directory where the pickled tile dictionary will be saved. Default is the current working directory.
 
         Example:
@@ -304,16 +428,27 @@ class Slide:
         else:
             id = self.slideFileId
 
-        pickle.dump(self.tileDictionary, open(os.path.join(folder, id)+'.pml', 'wb'))
+        pickle.dump(self.tileDictionary.toDict(), open(os.path.join(folder, id)+'.pml', 'wb'))
 
-    def save(self, fileName=False, folder=os.getcwd()):
-        """A function to save a pickled PathML Slide object to a .pml file for re-use later
+    def save(self, fileName=False, folder=os.getcwd(), incremental=False):
+        """A function to save a PathML Slide object to a .pml file for re-use later
         (re-loading is performed by providing the path to the .pml file when initializing a Slide object).
         This function should be re-run after each major step in an analysis on a Slide.
+        The .pml file is a directory holding one NumPy .npy file per tile dictionary
+        key, so that it can be memory-mapped when it is reloaded (see :func:`pathml.pmlfile.savePml`),
+        and a copy of the prediction store of :meth:`Slide.inferSegmenter() <pathml.slide.Slide.inferSegmenter>`, if any.
+        An older pickled .pml file of the same name is replaced.
+
+        With incremental=True, only the tile dictionary keys that were added or
+        changed since the Slide was loaded from or last saved to the same .pml
+        are written, as new files next to the existing ones; the files they
+        supersede are kept until :func:`pathml.pmlfile.compactPml` is called
+        or the Slide is saved without incremental.
 
         Args:
-            fileName (str, optional): the name of the file where the pickled Slide will be stored, excluding an extension. Default is the slideFileName attribute.
-            folder (str, optional): the path to the directory where the pickled Slide will be saved. Default is the current working directory.
+            fileName (str, optional): the name of the .pml file where the Slide will be stored, excluding an extension. Default is the slideFileName attribute.
+            folder (str, optional): the path to the directory where the .pml file will be saved. Default is the current working directory.
+            incremental (Bool, optional): whether to only write the keys that changed since the last save to the same .pml. Default is False, which rewrites the whole .pml.
 
         Example:
             pathml_slide.save("pathml_slide" folder="/path/to/pathml_slides")
@@ -331,15 +466,34 @@ class Slide:
         else:
             id = self.slideFileId
 
-        outputDict = {'slideFilePath': self.slideFilePath, 'level':self.level, 'tileDictionary': self.tileDictionary}
+        outputDict = {'slideFilePath': self.slideFilePath, 'level':self.level, 'tileSize': self.tileSize, 'tileOverlap': self.tileOverlap, 'tileDictionary': self.tileDictionary}
 
         if hasattr(self, 'rawTissueDetectionMap'):
             outputDict.update({'rawTissueDetectionMap': self.rawTissueDetectionMap})
         if self.hasAnnotations():
             outputDict.update({'annotationClassMultiPolygons': self.annotationClassMultiPolygons})
-        
-        with open(os.path.join(folder, id)+'.pml', 'wb') as f:
-            pickle.dump(outputDict, f)
+        if hasattr(self, 'segmenterPredictionStore'):
+            outputDict.update({'segmenterPredictionStore': self.segmenterPredictionStore})
+
+        path = os.path.join(folder, id)+'.pml'
+        columns = None
+        if incremental and self.__savedPml and self.__savedPml['path'] == os.path.abspath(path) and self.__savedPml['tileDictionary'] is self.tileDictionary and isPmlDirectory(path):
+            columns = [key for key in self.tileDictionary.columns() if self.tileDictionary.getVersion(key) != self.__savedPml['versions'].get(key)]
+        savePml(path, outputDict, columns=columns)
+        self.__savedPml = self.__pmlState(path, self.tileDictionary)
+        if hasattr(self, 'segmenterPredictionStore'):
+            # read from the copy in the .pml from now on, so that later saves to it need not copy the store again
+            self.segmenterPredictionStore = PredictionStore(os.path.join(path, readManifest(path)['segmenterPredictionStore']))
+            self.__removeTemporaryPredictionStore()
+
+    def __removeTemporaryPredictionStore(self):
+        if self.__temporaryPredictionStore:
+            shutil.rmtree(self.__temporaryPredictionStore, ignore_errors=True)
+            self.__temporaryPredictionStore = None
+
+    @staticmethod
+    def __pmlState(path, tileDictionary):
+        return {'path': os.path.abspath(path), 'tileDictionary': tileDictionary, 'versions': {key: tileDictionary.getVersion(key) for key in tileDictionary.columns()}}
 
     def appendTag(self, tileAddress, key, val):
         """A function to add key-value pair of data to a certain tile in the tile dictionary.
@@ -412,11 +566,22 @@ class Slide:
         """
 
         tileDictionaryIterable = self.tileDictionary if not tileDictionary else tileDictionary
-        for key, value in tileDictionaryIterable.items():
-            if includeImage:
-                yield key, self.getTile(key,writeToNumpy=writeToNumpy)
-            else:
-                yield key
+        if includeImage and writeToNumpy:
+            # read a row of the tile grid at a time with getTiles() rather than fetching each tile separately
+            rowAddresses = []
+            for key in tileDictionaryIterable:
+                rowAddresses.append(key)
+                if len(rowAddresses) == self.numTilesInX:
+                    yield from zip(rowAddresses, self.getTiles(rowAddresses))
+                    rowAddresses = []
+            if len(rowAddresses) > 0:
+                yield from zip(rowAddresses, self.getTiles(rowAddresses))
+        else:
+            for key in tileDictionaryIterable:
+                if includeImage:
+                    yield key, self.getTile(key,writeToNumpy=writeToNumpy)
+                else:
+                    yield key
 
     def suitableTileAddresses(self, tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, maskLevelThreshold=False):
         """A function that returns a list of the tile address tuples that meet
@@ -426,6 +591,9 @@ class Slide:
         Args:
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only includes the tile address of tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only includes Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (int or float, optional): if defined, only includes the tile addresses of tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
+            otsuLevelThreshold (int or float, optional): if defined, only includes the tile addresses of tiles with an otsuLevel greater than or equal to the set value. Default is False.
+            triangleLevelThreshold (int or float, optional): if defined, only includes the tile addresses of tiles with a triangleLevel greater than or equal to the set value. Default is False.
+            maskLevelThreshold (str or int or float, optional): if defined as a number, only includes the tile addresses of tiles with a maskLevel from readMask() greater than or equal to the set value. Only includes tiles overlapping the mask at all if set to 'mask'. Default is False.
 
         Returns:
             list: List of tile addresses (tuples of integers) meeting the specified conditions
@@ -434,53 +602,86 @@ class Slide:
             suitable_tile_addresses = pathml_slide.suitableTileAddresses(tissueLevelThreshold=0.995, foregroundLevelThreshold=88)
         """
 
+        return list(self._suitableTiles(tissueLevelThreshold=tissueLevelThreshold, foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold)[1])
+
+    # Returns the Boolean tile grid mask and the list of addresses of the tiles meeting the thresholds.
+    # Results are memoized per threshold combination until one of the keys they depend on is rewritten.
+    def _suitableTiles(self, tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, maskLevelThreshold=False):
         if not self.hasTileDictionary():
             raise PermissionError(
                 'setTileProperties must be called before tile counting')
         if foregroundLevelThreshold:
-            if 'foregroundLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
-                raise PermissionError('Foreground detection must be performed with detectForeground() before foregroundLevelThreshold can be defined.')
-            if (foregroundLevelThreshold not in ['otsu', 'triangle']) and (type(foregroundLevelThreshold) not in [int, float]):
+            if foregroundLevelThreshold in ['otsu', 'triangle']:
+                if not self.tileDictionary.hasColumn(foregroundLevelThreshold+'Level'):
+                    raise PermissionError('Foreground detection must be performed with detectForeground() in '+foregroundLevelThreshold+' mode before foregroundLevelThreshold can be set to '+foregroundLevelThreshold)
+            elif type(foregroundLevelThreshold) not in [int, float]:
                 raise ValueError("foregroundLevelThreshold must be an int, a float, 'otsu', or 'triangle'")
+            elif not self.tileDictionary.hasColumn('foregroundLevel'):
+                raise PermissionError('Foreground detection must be performed with detectForeground() before foregroundLevelThreshold can be defined.')
         if tissueLevelThreshold:
-            if 'tissueLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
-                raise PermissionError('Tissue detection must be performed with detectTissue() before tissueLevelThreshold can be defined.')
             if type(tissueLevelThreshold) not in [int, float]:
                 raise ValueError("tissueLevelThreshold must be an int or float")
-        if type(maskLevelThreshold)==int or maskLevelThreshold:
-            if 'maskLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+            if not self.tileDictionary.hasColumn('tissueLevel'):
+                raise PermissionError('Tissue detection must be performed with detectTissue() before tissueLevelThreshold can be defined.')
+        if otsuLevelThreshold:
+            if type(otsuLevelThreshold) not in [int, float]:
+                raise ValueError("otsuLevelThreshold must be an int or float")
+            if not self.tileDictionary.hasColumn('otsuLevel'):
+                raise PermissionError('Foreground detection must be performed with detectForeground() in otsu mode before otsuLevelThreshold can be defined.')
+        if triangleLevelThreshold:
+            if type(triangleLevelThreshold) not in [int, float]:
+                raise ValueError("triangleLevelThreshold must be an int or float")
+            if not self.tileDictionary.hasColumn('triangleLevel'):
+                raise PermissionError('Foreground detection must be performed with detectForeground() in triangle mode before triangleLevelThreshold can be defined.')
+        if maskLevelThreshold:
+            if (maskLevelThreshold != 'mask') and (type(maskLevelThreshold) not in [int, float]):
+                raise ValueError("maskLevelThreshold must be an int, a float, or 'mask'")
+            if not self.tileDictionary.hasColumn('maskLevel'):
                 raise PermissionError('Mask must be defined with readMask() before maskLevelThreshold can be defined')
-            if (maskLevelThreshold not in ['mask'] and type(tissueLevelThreshold) not in [float]):
-                raise ValueError("maskLevelThreshold must be an float")        
-
-        suitableTileAddresses = []
-        for tA in self.iterateTiles():
-            suitable=True
-
-            if tissueLevelThreshold:
-                if (self.tileDictionary[tA]['tissueLevel'] < tissueLevelThreshold):
-                    suitable=False
-            if foregroundLevelThreshold:
-                if (self.tileDictionary[tA]['foregroundLevel'] >= foregroundLevelThreshold):
-                    suitable=False
-            if otsuLevelThreshold:
-                if (self.tileDictionary[tA]['otsuLevel'] < otsuLevelThreshold):
-                    suitable=False
-            if triangleLevelThreshold:
-                if (self.tileDictionary[tA]['triangleLevel'] < triangleLevelThreshold):
-                    suitable=False
-            if maskLevelThreshold:
-                if maskLevelThreshold == 'mask':
-                    if not self.tileDictionary[tA]['mask']:
-                        suitable=False
-                else:
-                    if (self.tileDictionary[tA]['maskLevel'] < maskLevelThreshold):
-                        suitable=False
 
-            if suitable:
-                suitableTileAddresses.append(tA)
+        # (key, threshold, whether tiles must be at or above the threshold rather than below it);
+        # a threshold of None keeps the tiles whose value is nonzero
+        filters = []
+        if tissueLevelThreshold:
+            filters.append(('tissueLevel', tissueLevelThreshold, True))
+        if foregroundLevelThreshold:
+            if foregroundLevelThreshold in ['otsu', 'triangle']:
+                filters.append((foregroundLevelThreshold+'Level', None, True))
+            else:
+                filters.append(('foregroundLevel', foregroundLevelThreshold, False))
+        if otsuLevelThreshold:
+            filters.append(('otsuLevel', otsuLevelThreshold, True))
+        if triangleLevelThreshold:
+            filters.append(('triangleLevel', triangleLevelThreshold, True))
+        if maskLevelThreshold:
+            if maskLevelThreshold == 'mask':
+                # any overlap with the mask read by readMask()
+                filters.append(('maskLevel', None, True))
+            else:
+                filters.append(('maskLevel', maskLevelThreshold, True))
+
+        cacheKey = tuple((key, threshold) for key, threshold, _ in filters)
+        versions = tuple(self.tileDictionary.getVersion(key) for key, _, _ in filters)
+        if not hasattr(self, '_suitableTilesCache') or self._suitableTilesCache[0] is not self.tileDictionary:
+            self._suitableTilesCache = (self.tileDictionary, {})
+        cached = self._suitableTilesCache[1].get(cacheKey)
+        if cached is not None and cached[0] == versions:
+            return cached[1], cached[2]
+
+        suitable = np.ones(self.tileDictionary.shape, dtype=bool)
+        for key, threshold, atOrAbove in filters:
+            values = self.tileDictionary.getColumn(key)
+            suitable &= self.tileDictionary.getMask(key)
+            if threshold is None:
+                suitable &= values.astype(bool)
+            elif atOrAbove:
+                suitable &= values >= threshold
+            else:
+                suitable &= values < threshold
 
-        return suitableTileAddresses
+        suitableTileAddresses = self.tileDictionary.addresses(suitable)
+        self._suitableTilesCache[1][cacheKey] = (versions, suitable, suitableTileAddresses)
+        return suitable, suitableTileAddresses
 
     def getTileCount(self, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False):
         """A function that returns the number of tiles in the tile dictionary.
@@ -498,10 +699,10 @@ class Slide:
             pathml_slide.getTileCount()
         """
 
-        return len(self.suitableTileAddresses(foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, tissueLevelThreshold=tissueLevelThreshold))
+        return int(self._suitableTiles(foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, tissueLevelThreshold=tissueLevelThreshold)[0].sum())
 
     def addAnnotations(self, annotationFilePath, classesToAdd=False, negativeClass=False, level=0,
-        overwriteExistingAnnotations=False, mergeOverlappingAnnotationsOfSameClass=True, acceptMultiPolygonAnnotations=True):
+        overwriteExistingAnnotations=False, mergeOverlappingAnnotationsOfSameClass=True, acceptMultiPolygonAnnotations=True, rasterize=False, rasterDownsamples=[1], rasterFolder=False, cacheAnnotations=True):
         """A function that adds the overlap between all (desired) classes present in an annotation file and each tile in the tile dictionary
         Annotations within groups in ASAP are taken to be within one class, where the name of the ASAP group is the name of the class; similarly,
         annotations within classes in QuPath are taken to be within one class, where the name of the QuPath class is the name of the class.
@@ -519,6 +720,10 @@ class Slide:
             overwriteExistingAnnotations (Bool, optional): whether to overwrite any preexisting annotations in the tile dictionary. Default is False.
             mergeOverlappingAnnotationsOfSameClass (Bool, optional): whether to automatically merge annotations of the same class that overlap into one polygon. Default is True.
             acceptMultiPolygonAnnotations (Bool, optional): whether or not to accept annotations that parse into MultiPolygons using Shapely. Multipolygons tend to arise when there are small self-overlapping regions like loops in annotations. If this argument is True, then the polygon with the largest area among those constituting the multipolygon created from one annotation will be retained, and the others will not be used. Default is True.
+            rasterize (Bool, optional): whether to also rasterize the annotations with :meth:`Slide.rasterizeAnnotations() <pathml.slide.Slide.rasterizeAnnotations>`, which makes extracting annotation tile masks much faster. Default is False.
+            rasterDownsamples (list of float, optional): if rasterize is True, the downsample factors relative to the Slide at which to rasterize the annotations. Default is [1].
+            rasterFolder (str, optional): if rasterize is True, the directory to store the compressed raster blocks in. Default is to keep them in memory.
+            cacheAnnotations (Bool, optional): whether to cache the parsed annotation file next to it (see :class:`Annotation <pathml.annotation.Annotation>`), so that adding the same annotations again skips parsing. Default is True.
 
         Example:
             pathml_slide.addAnnotations("/path/to/annotations.xml", negativeClass="negative")
@@ -529,16 +734,15 @@ class Slide:
                 'setTileProperties must be called before adding annotations')
 
         foundOverlap = False
-        for k in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+        for k in self.tileDictionary[next(iter(self.tileDictionary))]:
             if 'Overlap' in k:
                 foundOverlap = True
                 if not overwriteExistingAnnotations:
                     raise Warning('Annotations have already been added to the tile dictionary. Use overwriteExistingAnnotations if you wish to write over them')
         if foundOverlap:
-            for address in self.iterateTiles():
-                for key in self.tileDictionary[address].copy():
-                    if 'Overlap' in key:
-                        del self.tileDictionary[address][key]
+            for key in self.tileDictionary.columns():
+                if 'Overlap' in key:
+                    self.tileDictionary.removeColumn(key)
 
         if (not type(level) == int) or (level < 0):
             raise ValueError('level must be an integer 0 or greater')
@@ -549,14 +753,6 @@ class Slide:
         if not os.path.isfile(annotationFilePath):
             raise FileNotFoundError('Annotation file could not be loaded')
 
-        # Check if annotationFilePath points to an ASAP xml file or a QuPath GeoJSON file
-        with open(annotationFilePath) as unknownFile:
-            c = unknownFile.read(1)
-            if c == '<':
-                fileType = 'asap_xml'
-            else:
-                fileType = 'qupath_geojson'
-
         slideHeight = int(self.slideProperties['height'])
         annotationScalingFactor = float(self.slideProperties['openslide.level[0].downsample'])/float(self.slideProperties['openslide.level['+str(level)+'].downsample'])
         print("Scale: "+str(annotationScalingFactor))
@@ -565,56 +761,50 @@ class Slide:
         classPolys = {}
         negativePolys = []
 
-        # Turn ASAP xml annotations into a dict of multipolygons, with one multipolygon for each class
-        if fileType == 'asap_xml':
-            try:
-                tree = ET.parse(annotationFilePath)
-            except:
-                raise ImportError('Annotation file is not an xml file')
-            root = tree.getroot() # Get root of .xml tree
-            if not root.tag == "ASAP_Annotations": # Check whether we actually deal with an ASAP .xml file
-                raise ImportError('Annotation file is not an ASAP xml file')
-
-            allAnnotations = root.find('Annotations') # Find all annotations for this slide
-            print('xml file valid - ' + str(len(allAnnotations)) + ' annotation(s) found.') # Display number of found annotations
-
-            # Iterate over all annotations to collect annotations in the same class
-            for annotation in allAnnotations:
-                annotationClass = annotation.attrib['PartOfGroup']
-
-                if (classesToAdd) and (annotationClass not in classesToAdd):
-                    if (negativeClass):
-                        if (annotationClass != negativeClass):
-                            print("Skipping an annotation which doesn't appear in classesToAdd or in negativeClass")
-                            continue
-                    else:
-                        print("Skipping an annotation which doesn't appear in classesToAdd")
+        # Parse the ASAP xml or QuPath GeoJSON file into flat coordinate arrays, and build one polygon per ring
+        annotations = Annotation(annotationFilePath, cache=cacheAnnotations)
+        if annotations.fileType == 'asap':
+            print('xml file valid - ' + str(len(annotations)) + ' annotation(s) found.') # Display number of found annotations
+        else:
+            print('JSON file valid - ' + str(len(annotations)) + ' annotation(s) found.')
+        ringPolys = annotations.polygons(scalingFactor=annotationScalingFactor, slideHeight=slideHeight)
+
+        # Iterate over all annotations to collect annotations in the same class into a dict of polygon lists
+        for annotationIndex, annotationClass in enumerate(annotations.classNames.tolist()):
+            rings = annotations.annotationRings(annotationIndex)
+
+            if (annotations.fileType == 'qupath') and (annotations.multiPolygon[annotationIndex]) and (not acceptMultiPolygonAnnotations):
+                initialPoint = annotations.coordinates[annotations.ringOffsets[rings[0]]]
+                raise ValueError('Found annotation with initial point ('+str(initialPoint[0])+','+str(initialPoint[1])+') in '+annotationClass+
+                    ' class that was not a polygon in JSON file '+annotationFilePath)
+
+            if (classesToAdd) and (annotationClass not in classesToAdd):
+                if (negativeClass):
+                    if (annotationClass != negativeClass):
+                        print("Skipping an annotation which doesn't appear in classesToAdd or in negativeClass")
                         continue
+                else:
+                    print("Skipping an annotation which doesn't appear in classesToAdd")
+                    continue
 
-                if annotationClass not in classPolys:
-                    if negativeClass:
-                        if (annotationClass != negativeClass):
-                            classPolys[annotationClass] = []
-                    else:
+            if annotationClass not in classPolys:
+                if negativeClass:
+                    if (annotationClass != negativeClass):
                         classPolys[annotationClass] = []
+                else:
+                    classPolys[annotationClass] = []
 
-                annotationTree = annotation.find('Coordinates')
-                polygon = []
-                for coordinate in annotationTree:
-                    info = coordinate.attrib
-                    polygon.append((float(info['X'])*annotationScalingFactor, float(info['Y'])*annotationScalingFactor))
-                polygonNp = np.asarray(polygon)
-                polygonNp[:,1] = slideHeight-polygonNp[:,1]
-                try:
-                    poly = geometry.Polygon(polygonNp).buffer(0)
-                except:
-                    raise ValueError('Annotation cannot be made into polygon(s)')
+            if any(ringPolys[ring] is None for ring in rings):
+                raise ValueError('Annotation cannot be made into polygon(s)')
+
+            if annotations.fileType == 'asap':
+                poly = ringPolys[rings[0]]
 
                 # Make sure the annotation produced a polygon
                 if poly.geom_type != 'Polygon':
                     if poly.geom_type == 'MultiPolygon':
                         if not acceptMultiPolygonAnnotations:
-                            for i, compPoly in enumerate(list(poly)):
+                            for i, compPoly in enumerate(poly.geoms):
                                 print('Component polygon '+str(i+1)+' centroid / area: ('+str(compPoly.centroid.x)+', '+str(slideHeight-compPoly.centroid.y)+') / '+str(compPoly.area))
                             raise ValueError('Annotation with centroid ('+str(poly.centroid.x)+', '+str(slideHeight-poly.centroid.y)+
                                 ') produces a Shapely '+poly.geom_type+' instead of a polygon; check to see if it self-intersects. See above for the centroids of the component Polygons of the MultiPolygon.')
@@ -626,95 +816,27 @@ class Slide:
                     negativePolys.append(poly)
                 else:
                     if poly.geom_type == 'MultiPolygon':
-                        for componentPoly in list(poly):
+                        for componentPoly in poly.geoms:
                             classPolys[annotationClass].append(componentPoly)
                     else:
                         classPolys[annotationClass].append(poly)
 
-        # Turn QuPath GeoJSON annotations into a dict of multipolygons, with one multipolygon for each class
-        else:
-            with open(annotationFilePath) as f:
-                allAnnotations = json.load(f)
-            if not isinstance(allAnnotations, list):
-                raise Warning('GeoJSON file does not have an outer list structure')
             else:
-                print('JSON file valid - ' + str(len(allAnnotations)) + ' annotation(s) found.')
-
-            for annotation in allAnnotations:
-                if annotation['geometry']['type'] != 'Polygon':
-                    if not acceptMultiPolygonAnnotations:
-                        raise ValueError('Found annotation with initial point ('+
-                            str(annotation['geometry']['coordinates'][0][0][0][0])+
-                            ','+str(annotation['geometry']['coordinates'][0][0][0][1])+
-                            ') in '+annotationClass+
-                            ' class that was not a polygon in JSON file '+annotationFilePath)
-
-                try:
-                    annotationClass = annotation['properties']['classification']['name']
-                except:
-                    raise ValueError('Found QuPath annotation without a class; all annotations must be assigned to a class')
-
-                if (classesToAdd) and (annotationClass not in classesToAdd):
-                    if (negativeClass):
-                        if (annotationClass != negativeClass):
-                            print("Skipping an annotation which doesn't appear in classesToAdd or in negativeClass")
-                            continue
-                    else:
-                        print("Skipping an annotation which doesn't appear in classesToAdd")
-                        continue
-
-                if annotationClass not in classPolys:
-                    if negativeClass:
-                        if (annotationClass != negativeClass):
-                            classPolys[annotationClass] = []
-                    else:
-                        classPolys[annotationClass] = []
-
-                if len(annotation['geometry']['coordinates']) > 1:
+                if len(rings) > 1:
                     if not acceptMultiPolygonAnnotations:
                         raise ValueError('Multiple sets of coordinates found for an annotation')
-
-                polys = []
-                for annotationCoordinates in annotation['geometry']['coordinates']:
-                    if isinstance(annotationCoordinates[0][0], list):
+                    if annotations.multiPolygon[annotationIndex]:
                         print('Warning: annotation parses into a multipolygon; this likely means that a small loop is present. Set acceptMultiPolygonAnnotations to False to throw an error. Identifying largest component polygon and discarding the rest...')
-                        for subPolyCoordinates in annotationCoordinates:
-                            polygon = []
-                            for coordinate in subPolyCoordinates:
-                                x_coord = coordinate[0]
-                                y_coord = coordinate[1]
-                                polygon.append((float(x_coord)*annotationScalingFactor, float(y_coord)*annotationScalingFactor))
-                            polygonNp = np.asarray(polygon)
-                            polygonNp[:,1] = slideHeight-polygonNp[:,1]
-                            try:
-                                poly = geometry.Polygon(polygonNp).buffer(0)
-                            except:
-                                raise ValueError('Annotation cannot be made into a polygon')
-                            polys.append(poly)
-                    else:
-                        polygon = []
-                        for coordinate in annotationCoordinates:
-                            x_coord = coordinate[0]
-                            y_coord = coordinate[1]
-                            polygon.append((float(x_coord)*annotationScalingFactor, float(y_coord)*annotationScalingFactor))
-                        polygonNp = np.asarray(polygon)
-                        polygonNp[:,1] = slideHeight-polygonNp[:,1]
-                        try:
-                            poly = geometry.Polygon(polygonNp).buffer(0)
-                        except:
-                            raise ValueError('Annotation cannot be made into a polygon')
-                        polys.append(poly)
-
 
+                # Keep the largest of the polygons made from one annotation
+                polys = ringPolys[rings.start:rings.stop]
                 poly = polys[0]
                 if len(polys) > 1:
                     print(str(len(polys))+' polygons made from one annotation')
-                    max_poly_area = 0
-                    for single_poly in polys:
-                        print('Area of single subpolygon: '+str(single_poly.area))
-                        if single_poly.area > max_poly_area:
-                            max_poly_area = single_poly.area
-                            poly = single_poly
+                    polyAreas = shapely.area(polys)
+                    for polyArea in polyAreas:
+                        print('Area of single subpolygon: '+str(polyArea))
+                    poly = polys[np.argmax(polyAreas)]
 
                 if (negativeClass) and (annotationClass == negativeClass):
                     negativePolys.append(poly)
@@ -744,27 +866,113 @@ class Slide:
                 if ancl1 != ancl2:
                     if ancl1multipoly.overlaps(ancl2multipoly):
                         clsIntersection = ancl1multipoly.intersection(ancl2multipoly)
-                        raise ValueError('Annotation classes '+ancl1multipoly+' and '+ancl2multipoly+' overlap near ('+str(clsIntersection.centroid.x)+', '+str(slideHeight-clsIntersection.centroid.y)+')')
+                        raise ValueError('Annotation classes '+ancl1+' and '+ancl2+' overlap near ('+str(clsIntersection.centroid.x)+', '+str(slideHeight-clsIntersection.centroid.y)+')')
                 else:
                     continue
 
-        # Iterate over all tiles in tile dictionary, marking the overlap of each class MultiPolygon with each tile
-        for address in self.iterateTiles():
-            x = self.tileDictionary[address]['x']
-            y = self.tileDictionary[address]['y']
-            height = self.tileDictionary[address]['height']
-            tile = geometry.box(x, (slideHeight-y)-height, x+height, slideHeight-y)
-
-            for class_name, class_multipoly in classMultiPolys.items():
-                tile_class_overlap = tile.intersection(class_multipoly).area/(height**2)
-                self.tileDictionary[address].update({class_name+'Overlap': tile_class_overlap})
+        # Mark the overlap of each class MultiPolygon with each tile
+        for class_name, class_multipoly in classMultiPolys.items():
+            self.tileDictionary.setColumn(class_name+'Overlap', self.__annotationOverlap(class_multipoly, slideHeight))
 
         self.annotationClassMultiPolygons = classMultiPolys
+        if hasattr(self, 'annotationLabelRasters'):
+            del self.annotationLabelRasters
+        if rasterize:
+            self.rasterizeAnnotations(downsamples=rasterDownsamples, folder=rasterFolder)
+
+    def rasterizeAnnotations(self, downsamples=[1], blockSize=512, folder=False):
+        """A function to rasterize all annotation classes added with
+        :meth:`Slide.addAnnotations() <pathml.slide.Slide.addAnnotations>` into
+        one compressed label raster (see :class:`LabelRaster <pathml.labelraster.LabelRaster>`)
+        per downsample factor, stored in the annotationLabelRasters attribute.
+        Once the Slide-resolution raster (downsample 1) exists,
+        :meth:`Slide.getAnnotationTileMask() <pathml.slide.Slide.getAnnotationTileMask>`
+        and the functions using it read tile masks from the raster instead of
+        drawing the annotation polygons for each tile; both give the same masks
+        (see :func:`rasterizePolygons() <pathml.labelraster.rasterizePolygons>`).
+
+        Args:
+            downsamples (list of float, optional): the factors by which each raster is smaller than the Slide. Default is [1].
+            blockSize (int, optional): the edge length of the compressed blocks in pixels. Default is 512.
+            folder (str, optional): the directory to store the compressed blocks in, in one subdirectory per downsample factor. Default is to keep them in memory.
+
+        Example:
+            pathml_slide.rasterizeAnnotations(downsamples=[1, 16])
+        """
+
+        if not self.hasAnnotations():
+            raise PermissionError('addAnnotations must be called before rasterizing annotations')
+
+        self.annotationLabelRasters = {}
+        for downsample in downsamples:
+            self.annotationLabelRasters[downsample] = LabelRaster.fromMultiPolygons(self.annotationClassMultiPolygons,
+                self.slide.width, self.slide.height, downsample=downsample, blockSize=blockSize,
+                folder=os.path.join(folder, 'downsample'+str(downsample)) if folder else None)
+
+    def __annotationOverlap(self, classMultiPolygon, slideHeight):
+        # Returns the fraction of every tile covered by classMultiPolygon (in
+        # annotation coordinates, with y flipped). Candidate tiles are found from
+        # the bounding boxes of the component polygons on the tile grid, so tiles
+        # away from the annotations get 0 without building a geometry; candidates
+        # fully inside the annotation get 1, and only the boundary tiles are
+        # intersected, with the component polygons found through an STRtree.
+        # Component polygons may overlap each other (when annotations of the
+        # same class are not merged), so the pieces of a tile that meets
+        # several of them are unioned before their area is taken.
+
+        x = self.tileDictionary.getColumn('x')
+        y = self.tileDictionary.getColumn('y')
+        height = self.tileDictionary.getColumn('height')
+        overlap = np.zeros(self.tileDictionary.shape)
+        parts = shapely.get_parts(classMultiPolygon)
+        parts = parts[~shapely.is_empty(parts)]
+        if len(parts) == 0:
+            return overlap
+
+        candidates = np.zeros(self.tileDictionary.shape, dtype=bool)
+        partBounds = shapely.bounds(parts)
+        isGrid = (x == x[:1, :]).all() and (y == y[:, :1]).all() and (height == height[0, 0]).all() and (np.diff(x[0]) > 0).all() and (np.diff(y[:, 0]) > 0).all()
+        if isGrid:
+            columnStarts, rowStarts, tileSize = x[0], y[:, 0], height[0, 0]
+            for minx, miny, maxx, maxy in partBounds:
+                # tiles span [x, x+tileSize] and [slideHeight-y-tileSize, slideHeight-y]
+                firstColumn = np.searchsorted(columnStarts, minx - tileSize, side='right')
+                lastColumn = np.searchsorted(columnStarts, maxx, side='left')
+                firstRow = np.searchsorted(rowStarts, slideHeight - maxy - tileSize, side='right')
+                lastRow = np.searchsorted(rowStarts, slideHeight - miny, side='left')
+                candidates[firstRow:lastRow, firstColumn:lastColumn] = True
+        else:
+            minx, miny, maxx, maxy = shapely.total_bounds(parts)
+            candidates = (x < maxx) & (x + height > minx) & (slideHeight - y - height < maxy) & (slideHeight - y > miny)
+
+        candidateYs, candidateXs = np.nonzero(candidates)
+        cx, cy, ch = x[candidates], y[candidates], height[candidates]
+        tiles = shapely.box(cx, (slideHeight - cy) - ch, cx + ch, slideHeight - cy)
+
+        shapely.prepare(classMultiPolygon)
+        contained = shapely.contains(classMultiPolygon, tiles)
+        overlap[candidateYs[contained], candidateXs[contained]] = 1.0
+
+        boundary = np.flatnonzero(~contained)
+        tileIndices, partIndices = shapely.STRtree(parts).query(tiles[boundary], predicate='intersects')
+        pieces = shapely.intersection(tiles[boundary][tileIndices], parts[partIndices])
+        areas = np.bincount(tileIndices, weights=shapely.area(pieces), minlength=len(boundary))
+        order = np.argsort(tileIndices, kind='stable')
+        pieceCounts = np.bincount(tileIndices, minlength=len(boundary))
+        pieceStarts = np.cumsum(pieceCounts) - pieceCounts
+        for tileIndex in np.flatnonzero(pieceCounts > 1):
+            areas[tileIndex] = shapely.area(shapely.union_all(pieces[order[pieceStarts[tileIndex]:pieceStarts[tileIndex]+pieceCounts[tileIndex]]]))
+        boundaryOverlap = areas / ch[boundary]**2
+        overlap[candidateYs[boundary], candidateXs[boundary]] = boundaryOverlap
+        return overlap
 
     def getAnnotationTileMask(self, tileAddress, maskClass, writeToNumpy=False, verbose=False, acceptTilesWithoutClass=False):
         """A function that returns the PIL Image of the binary mask of a
         tile-annotation class overlap. Note that the output values are 0 (white)
-        to 255 (black).
+        to 255 (black). Masks are drawn with the pixel convention of
+        :func:`rasterizePolygons() <pathml.labelraster.rasterizePolygons>`, so
+        holes in annotations (such as those left by negativeClass) are left out,
+        and they are the same whether or not the annotations were rasterized.
 
         Args:
             tileAddress (Tuple[int, int]): the (x, y) coordinate touple of the desired tile to get the annotation mask for.
@@ -806,76 +1014,101 @@ class Slide:
                 else:
                     raise ValueError(maskClass+' not in annotationClassMultiPolygons')
 
-        slideHeight = int(self.slideProperties['height'])
         x = self.tileDictionary[tileAddress]['x']
         y = self.tileDictionary[tileAddress]['y']
-        tileBox = geometry.box(x, (slideHeight-y)-height, x+height, slideHeight-y)
-
-        mask = Image.new('1', (height, height), 0)
-
-        if verbose: print(self.tileDictionary[tileAddress]['x'], self.tileDictionary[tileAddress]['y'])
+        if hasattr(self, 'annotationLabelRasters') and 1 in self.annotationLabelRasters:
+            mask = self.annotationLabelRasters[1].classMask(x, y, height, height, maskClass)
+            if writeToNumpy:
+                return mask
+            else:
+                return Image.fromarray(mask)
 
-        if self.annotationClassMultiPolygons[maskClass].geom_type == 'Polygon':
-            mask = self._getTileMask(tileBox, self.annotationClassMultiPolygons[maskClass], mask)
-        elif self.annotationClassMultiPolygons[maskClass].geom_type == 'MultiPolygon':
-            plygns = list(self.annotationClassMultiPolygons[maskClass])
-            for plygn in plygns:
-                mask = self._getTileMask(tileBox, plygn, mask)
-        else:
+        # Draw the component polygons that meet the tile, moved to slide pixel coordinates (y axis pointing
+        # down), with the same pixel convention as the LabelRaster path above
+        slideHeight = int(self.slideProperties['height'])
+        classMultiPolygon = self.annotationClassMultiPolygons[maskClass]
+        if classMultiPolygon.geom_type not in ['Polygon', 'MultiPolygon']:
             raise Warning('The value at key '+maskClass+' in annotationClassMultiPolygons must be Shapely Polygon or MultiPolygon')
+        if verbose: print(x, y)
+        parts = shapely.get_parts(classMultiPolygon)
+        parts = parts[shapely.intersects(parts, geometry.box(x, (slideHeight-y)-height, x+height, slideHeight-y))]
+        parts = shapely.transform(parts, lambda coords: np.column_stack((coords[:, 0], slideHeight - coords[:, 1])))
+        mask = rasterizePolygons(parts, x, y, height, height)
 
         if writeToNumpy:
-            return np.array(mask.transpose(Image.FLIP_TOP_BOTTOM))
+            return mask
         else:
-            return mask.transpose(Image.FLIP_TOP_BOTTOM)
-
-    # Adds overlap from one annotation to existing mask
-    def _getTileMask(self, tile_box, single_annotation, mask, fillPixelValue=1, verbose=False):
-
-        if verbose: print("- - - - - - - Checking overlap with annotation", list(single_annotation.exterior.coords), "- - - - - - - -")
-        box_coords = list(tile_box.exterior.coords)
-        bottom_left_point_of_tile = box_coords[3] # this point is always the bottom left corners
-
-        intersection = tile_box.intersection(single_annotation)
-
-        if intersection.area > 0:
-            if verbose: print("intersection area: ", intersection.area)
-
-            # Single polygon intersection
-            if intersection.geom_type == 'Polygon':
-                if verbose: print("number of polygons comprising intersection: 1")
-                mask_polygon = []
-                for point in list(intersection.exterior.coords):
-                    mask_polygon.append((point[0]-bottom_left_point_of_tile[0], point[1]-bottom_left_point_of_tile[1]))
-                if verbose: print("mask polygon: ", mask_polygon)
-                ImageDraw.Draw(mask).polygon(mask_polygon, outline=fillPixelValue, fill=fillPixelValue)
-
-            # Multi-polygon intersection
-            elif intersection.geom_type in ['MultiPolygon', 'GeometryCollection']:
-                intersecs = list(intersection)
-                if verbose: print("number of geometry elements comprising intersection: ", len(intersecs))
-                for intersec in intersecs:
-                    if intersec.geom_type == 'Polygon':
-                        mask_polygon = []
-                        for point in list(intersec.exterior.coords):
-                            mask_polygon.append((point[0]-bottom_left_point_of_tile[0], point[1]-bottom_left_point_of_tile[1]))
-                        if verbose: print("mask polygon: ", mask_polygon)
-                        ImageDraw.Draw(mask).polygon(mask_polygon, outline=fillPixelValue, fill=fillPixelValue)
-                    else:
-                        if verbose:
-                            print(intersec.geom_type+' intersection found. Skipping it...')
-                        else:
-                            pass
+            return Image.fromarray(mask)
 
+    def __extractionFileName(self, id, tileAddress, className, tissueLevelThreshold, foregroundLevelThreshold, suffix):
+        # The file name of an extracted tile or mask, as used by the extract*Tiles() functions
+        tile = self.tileDictionary[tileAddress]
+        fileName = id+'_'+(className+'_' if className else '')+str(tile['x'])+'x_'+str(tile['y'])+'y'+'_'+str(tile['height'])+'tilesize'
+        if tissueLevelThreshold:
+            fileName = fileName+'_'+str(int(round(tile['tissueLevel']*1000)))+'tissueLevel'
+        if foregroundLevelThreshold:
+            fileName = fileName+'_'+str(int(round(tile['foregroundLevel'])))+'foregroundLevel'
+        return fileName+suffix
+
+    def __extractTile(self, tileAddress, tilePath, channelStatistics=None, maskPath=False, getMask=None, shardWriter=None, metadata=None):
+        # One TileWriter job of the extract*Tiles() functions: decodes the tile
+        # once and passes the same pixels to the JPEG encoder and, if given, to
+        # channelStatistics; then makes the mask with getMask() if maskPath is
+        # given (PIL Images are saved as images, arrays with np.save). The tile
+        # and mask are written to tilePath and maskPath, or if shardWriter is
+        # given, encoded in memory and added to it under the name of tilePath
+        area = self.getTile(tileAddress)
+        pixels = area.write_to_memory()
+        image = pv.Image.new_from_memory(pixels, area.width, area.height, area.bands, area.format).copy(interpretation=area.interpretation)
+        if shardWriter:
+            entries = {'jpg': image.jpegsave_buffer(Q=100)}
+        else:
+            image.write_to_file(tilePath, Q=100)
+        if channelStatistics is not None:
+            channelStatistics.update(np.ndarray(buffer=pixels, dtype=self.__format_to_dtype[area.format], shape=[area.height, area.width, area.bands]))
+
+        if maskPath:
+            mask = getMask()
+            if shardWriter:
+                maskBuffer = io.BytesIO()
+                if isinstance(mask, np.ndarray):
+                    np.save(maskBuffer, mask)
+                    entries['mask.npy'] = maskBuffer.getvalue()
+                else:
+                    maskExtension = os.path.splitext(maskPath)[1]
+                    mask.save(maskBuffer, format=Image.registered_extensions()[maskExtension])
+                    entries['mask'+maskExtension] = maskBuffer.getvalue()
+            elif isinstance(mask, np.ndarray):
+                np.save(maskPath, mask)
             else:
-                raise Warning('Intersection type unknown: '+intersection.geom_type)
-
-        if verbose: print("\n")
-        return mask
+                mask.save(maskPath)
+
+        if shardWriter:
+            shardWriter.write(os.path.splitext(os.path.basename(tilePath))[0].replace('.', '_'), entries, metadata)
+
+    def __extractionMetadata(self, id, tileAddress, className, maskClassNames=False):
+        # The metadata stored with each tile in shards written by the extract*Tiles() functions
+        tile = self.tileDictionary[tileAddress]
+        metadata = {'slide': id, 'x': int(tile['x']), 'y': int(tile['y']), 'tileSize': int(tile['height'])}
+        if className:
+            metadata['class'] = className
+        if maskClassNames:
+            metadata['maskClasses'] = maskClassNames
+        for key in ['foregroundLevel', 'otsuLevel', 'triangleLevel', 'tissueLevel']:
+            if key in tile:
+                metadata[key] = float(tile[key])
+        return metadata
+
+    def __annotationMaskStack(self, tileAddress, classNames):
+        # Stack class masks into a 3D numpy ndarray (dimensions are: num. classes, tile pixel height, tile pixel width)
+        all_class_masks = []
+        for ec in classNames:
+            all_class_masks.append(self.getAnnotationTileMask(tileAddress, ec, writeToNumpy=True, acceptTilesWithoutClass=True)) # allow blank masks to returned
+        return np.stack(all_class_masks, axis=0)
 
     def extractAnnotationTiles(self, outputDir, slideName=False, numTilesToExtractPerClass='all', classesToExtract=False, otherClassNames=False,
         extractSegmentationMasks=False, tileAnnotationOverlapThreshold=0.5, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False,
-        returnTileStats=True, returnOnlyNumTilesFromThisClass=False, seed=False):
+        returnTileStats=True, returnOnlyNumTilesFromThisClass=False, seed=False, numWorkers=4, shardWriter=False):
         """A function to extract tiles that overlap with annotations into
         directory structure amenable to torch.utils.data.ConcatDataset.
 
@@ -889,9 +1122,11 @@ class Slide:
             tileAnnotationOverlapThreshold (float, optional): a number greater than 0 and less than or equal to 1, or a dictionary of such values, with a key for each class to extract. The numbers specify the minimum fraction of a tile's area that overlaps a given class's annotations for it to be extracted. Default is 0.5.
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only extracts tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only includes Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (Bool, optional): if defined, only extracts tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
-            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation. Default is True.
+            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation, along with the :class:`ChannelStatistics <pathml.channelstatistics.ChannelStatistics>` they were computed with (which can be merged across slides). Default is True.
             returnOnlyNumTilesFromThisClass (str, optional): causes only the number of suitable tiles for the specified class in the slide; no tile images are created if a string is provided. Default is False.
             seed (int, optional): the random seed to use for reproducible anayses. Default is not to use a seed when randomly selecting tiles.
+            numWorkers (int, optional): the number of threads reading, encoding and writing tiles concurrently (see :class:`TileWriter <pathml.tilewriter.TileWriter>`). Default is 4.
+            shardWriter (pathml.tileshards.ShardWriter, optional): if defined, the tiles, masks and their metadata (slide, position, size, class and foreground and tissue levels) are packed into the tar shards of this ShardWriter under the file names they would otherwise have, instead of being written to outputDir. See :class:`TileShardDataset <pathml.utils.torch.TileShardDataset.TileShardDataset>` for training on them. Default is to write one file per tile and mask.
 
         Returns:
             dict: A dictionary containing the Slide's name, 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation; if returnTileStats is set to False, True will be returned
@@ -924,7 +1159,7 @@ class Slide:
         if otherClassNames == 'discernFromClassesToExtract':
             extraClasses = []
         if not classesToExtract:
-            for key, value in self.tileDictionary[list(self.tileDictionary.keys())[0]].items():
+            for key, value in self.tileDictionary[next(iter(self.tileDictionary))].items():
                 if 'Overlap' in key:
                     extractionClasses.append(key)
         elif (type(classesToExtract) == list) or (type(classesToExtract) == str):
@@ -932,7 +1167,7 @@ class Slide:
                 classesToExtract = [classesToExtract]
             for classToExtract in classesToExtract:
                 extractionClass = classToExtract+'Overlap'
-                if extractionClass not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+                if extractionClass not in self.tileDictionary[next(iter(self.tileDictionary))]:
                     if otherClassNames == 'discernFromClassesToExtract':
                         extraClasses.append(extractionClass)
                     else:
@@ -1025,7 +1260,7 @@ class Slide:
             raise ValueError("numTilesToExtractPerClass must be a positive integer, a dictionary, or 'all'")
 
         # Create empty class tile directories for extractionClasses with at least one suitable tile
-        if not returnOnlyNumTilesFromThisClass:
+        if (not returnOnlyNumTilesFromThisClass) and (not shardWriter):
             for extractionClass,tte in annotatedTilesToExtract.items():
                 if len(tte) > 0:
                     try:
@@ -1088,61 +1323,31 @@ class Slide:
                             else:
                                 raise ValueError('otherClassNames must be a string or list of strings')
 
-        channel_sums = np.zeros(3)
-        channel_squared_sums = np.zeros(3)
+        channelStatistics = ChannelStatistics() if returnTileStats else None
         tileCounter = 0
-        normalize_to_1max = transforms.Compose([transforms.ToTensor()])
 
-        # Extract tiles
-        for ec,tte in annotatedTilesToExtract.items():
-            if returnOnlyNumTilesFromThisClass and ec == returnOnlyNumTilesFromThisClass:
-                return(len(annotatedTileAddresses[ec]))
+        # Extract tiles, reading, encoding and writing them concurrently
+        with TileWriter(numWorkers=numWorkers) as writer:
+            for ec,tte in annotatedTilesToExtract.items():
+                if returnOnlyNumTilesFromThisClass and ec == returnOnlyNumTilesFromThisClass:
+                    return(len(annotatedTileAddresses[ec]))
 
-            if len(tte) > 0:
-                if extractSegmentationMasks:
-                    print("Extracting "+str(len(tte))+" of "+str(len(annotatedTileAddresses[ec]))+" "+ec+" tiles and segmentation masks...")
-                else:
-                    print("Extracting "+str(len(tte))+" of "+str(len(annotatedTileAddresses[ec]))+" "+ec+" tiles...")
-
-            for tl in tte:
-                area = self.getTile(tl)
-                if (tissueLevelThreshold) and (foregroundLevelThreshold):
-                    area.write_to_file(os.path.join(outputDir, 'tiles', id, ec,
-                        id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel.jpg'), Q=100)
-                elif (tissueLevelThreshold) and (not foregroundLevelThreshold):
-                    area.write_to_file(os.path.join(outputDir, 'tiles', id, ec,
-                        id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel.jpg'), Q=100)
-                elif (not tissueLevelThreshold) and (foregroundLevelThreshold):
-                    area.write_to_file(os.path.join(outputDir, 'tiles', id, ec,
-                        id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel.jpg'), Q=100)
-                else:
-                    area.write_to_file(os.path.join(outputDir, 'tiles', id, ec,
-                        id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize.jpg'), Q=100)
-
-                tileCounter = tileCounter + 1
-                if returnTileStats:
-                    nparea = self.getTile(tl, writeToNumpy=True)[...,:3] # remove transparency channel
-                    nparea = normalize_to_1max(nparea).numpy() # normalize values from 0-255 to 0-1
-                    local_channel_sums = np.sum(nparea, axis=(1,2))
-                    local_channel_squared_sums = np.sum(np.square(nparea), axis=(1,2))
-                    channel_sums = np.add(channel_sums, local_channel_sums)
-                    channel_squared_sums = np.add(channel_squared_sums, local_channel_squared_sums)
-
-                # Extract segmentation masks
-                if extractSegmentationMasks:
-                    mask = self.getAnnotationTileMask(tl, ec)
-                    if (tissueLevelThreshold) and (foregroundLevelThreshold):
-                        mask.save(os.path.join(outputDir, 'masks', id, ec,
-                            id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel_mask.gif'))
-                    elif (tissueLevelThreshold) and (not foregroundLevelThreshold):
-                        mask.save(os.path.join(outputDir, 'masks', id, ec,
-                            id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_mask.gif'))
-                    elif (not tissueLevelThreshold) and (foregroundLevelThreshold):
-                        mask.save(os.path.join(outputDir, 'masks', id, ec,
-                            id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel_mask.gif'))
+                if len(tte) > 0:
+                    if extractSegmentationMasks:
+                        print("Extracting "+str(len(tte))+" of "+str(len(annotatedTileAddresses[ec]))+" "+ec+" tiles and segmentation masks...")
                     else:
-                        mask.save(os.path.join(outputDir, 'masks', id, ec,
-                            id+'_'+ec+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_mask.gif'))
+                        print("Extracting "+str(len(tte))+" of "+str(len(annotatedTileAddresses[ec]))+" "+ec+" tiles...")
+
+                for tl in tte:
+                    tilePath = os.path.join(outputDir, 'tiles', id, ec, self.__extractionFileName(id, tl, ec, tissueLevelThreshold, foregroundLevelThreshold, '.jpg'))
+                    maskPath, getMask = False, None
+                    if extractSegmentationMasks:
+                        maskPath = os.path.join(outputDir, 'masks', id, ec, self.__extractionFileName(id, tl, ec, tissueLevelThreshold, foregroundLevelThreshold, '_mask.gif'))
+                        getMask = functools.partial(self.getAnnotationTileMask, tl, ec)
+                    writer.submit(self.__extractTile, tl, tilePath, channelStatistics, maskPath, getMask,
+                                  shardWriter, self.__extractionMetadata(id, tl, ec) if shardWriter else None)
+                    tileCounter = tileCounter + 1
+
 
         if returnOnlyNumTilesFromThisClass:
             raise Warning(returnOnlyNumTilesFromThisClass+' not found in tile dictionary')
@@ -1153,20 +1358,22 @@ class Slide:
         if returnTileStats:
             if slideName:
                 return {'slide': slideName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
             else:
                 return {'slide': self.slideFileName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
         else:
             return True
 
 
     def extractAnnotationTilesMultiClassSegmentation(self, outputDir, slideName=False, numTilesToExtract=100, classesToExtract=False,
-        tileAnnotationOverlapThreshold=0.5, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, returnTileStats=True, seed=False):
+        tileAnnotationOverlapThreshold=0.5, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, returnTileStats=True, seed=False, numWorkers=4, shardWriter=False):
         """A function to extract tiles that overlap with annotations and their
         corresponding segmentation masks, where annotation masks are returned as
         .npy files containing ndarray stacks (each array in the stack being one
@@ -1180,8 +1387,10 @@ class Slide:
             tileAnnotationOverlapThreshold (float, optional): a number greater than 0 and less than or equal to 1, or a dictionary of such values, with a key for each class to extract. The numbers specify the minimum fraction of a tile's area that overlaps the annotations of the classesToExtract for that tile to be extracted. The overlaps with all classesToExtract classes are summed together and if this sum is greater or equal to tileAnnotationOverlapThreshold, then the tile is extracted. Default is 0.5.
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only extracts tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only includes Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (Bool, optional): if defined, only extracts tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
-            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation. Default is True.
+            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation, along with the :class:`ChannelStatistics <pathml.channelstatistics.ChannelStatistics>` they were computed with (which can be merged across slides). Default is True.
             seed (int, optional): the random seed to use for reproducible anayses. Default is not to use a seed when randomly selecting tiles.
+            numWorkers (int, optional): the number of threads reading, encoding and writing tiles concurrently (see :class:`TileWriter <pathml.tilewriter.TileWriter>`). Default is 4.
+            shardWriter (pathml.tileshards.ShardWriter, optional): if defined, the tiles, masks and their metadata (slide, position, size, class and foreground and tissue levels) are packed into the tar shards of this ShardWriter under the file names they would otherwise have, instead of being written to outputDir. See :class:`TileShardDataset <pathml.utils.torch.TileShardDataset.TileShardDataset>` for training on them. Default is to write one file per tile and mask.
 
         Returns:
             dict: A dictionary containing the class order that the class masks appear in ndarray mask stacks, the Slide's name, 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation; if returnTileStats is set to False, only the class mask order will be returned (a list of strings)
@@ -1212,7 +1421,7 @@ class Slide:
         # get classes to extract
         extractionClasses = []
         if not classesToExtract:
-            for key, value in self.tileDictionary[list(self.tileDictionary.keys())[0]].items():
+            for key, value in self.tileDictionary[next(iter(self.tileDictionary))].items():
                 if 'Overlap' in key:
                     extractionClasses.append(key)
         elif (type(classesToExtract) == list) or (type(classesToExtract) == str):
@@ -1220,7 +1429,7 @@ class Slide:
                 classesToExtract = [classesToExtract]
             for classToExtract in classesToExtract:
                 extractionClass = classToExtract+'Overlap'
-                if extractionClass not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+                if extractionClass not in self.tileDictionary[next(iter(self.tileDictionary))]:
                     raise ValueError(extractionClass+' not found in tile dictionary')
                 else:
                     extractionClasses.append(extractionClass)
@@ -1277,72 +1486,29 @@ class Slide:
             raise ValueError("numTilesToExtract must be a positive integer or 'all'")
 
         # Create empty class tile and mask directories
-        try:
-            os.makedirs(os.path.join(outputDir, 'tiles', id), exist_ok=True)
-        except:
-            raise ValueError(os.path.join(outputDir, 'tiles', id)+' is not a valid path')
-        try:
-            os.makedirs(os.path.join(outputDir, 'masks', id), exist_ok=True)
-        except:
-            raise ValueError(os.path.join(outputDir, 'masks', id)+' is not a valid path')
+        if not shardWriter:
+            try:
+                os.makedirs(os.path.join(outputDir, 'tiles', id), exist_ok=True)
+            except:
+                raise ValueError(os.path.join(outputDir, 'tiles', id)+' is not a valid path')
+            try:
+                os.makedirs(os.path.join(outputDir, 'masks', id), exist_ok=True)
+            except:
+                raise ValueError(os.path.join(outputDir, 'masks', id)+' is not a valid path')
 
-        channel_sums = np.zeros(3)
-        channel_squared_sums = np.zeros(3)
+        channelStatistics = ChannelStatistics() if returnTileStats else None
         tileCounter = 0
-        normalize_to_1max = transforms.Compose([transforms.ToTensor()])
 
-        # Extract tiles
+        # Extract tiles and multi-class segmentation masks, reading, encoding and writing them concurrently
         print("Extracting "+str(len(annotatedTilesToExtract))+" tiles and segmentation masks...")
-        for tl in annotatedTilesToExtract:
-            #for tl in tte:
-            area = self.getTile(tl)
-            if (tissueLevelThreshold) and (foregroundLevelThreshold):
-                area.write_to_file(os.path.join(outputDir, 'tiles', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel.jpg'), Q=100)
-            elif (tissueLevelThreshold) and (not foregroundLevelThreshold):
-                area.write_to_file(os.path.join(outputDir, 'tiles', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel.jpg'), Q=100)
-            elif (not tissueLevelThreshold) and (foregroundLevelThreshold):
-                area.write_to_file(os.path.join(outputDir, 'tiles', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel.jpg'), Q=100)
-            else:
-                area.write_to_file(os.path.join(outputDir, 'tiles', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize.jpg'), Q=100)
-
-            tileCounter = tileCounter + 1
-            if returnTileStats:
-                nparea = self.getTile(tl, writeToNumpy=True)[...,:3] # remove transparency channel
-                nparea = normalize_to_1max(nparea).numpy() # normalize values from 0-255 to 0-1
-                local_channel_sums = np.sum(nparea, axis=(1,2))
-                local_channel_squared_sums = np.sum(np.square(nparea), axis=(1,2))
-                channel_sums = np.add(channel_sums, local_channel_sums)
-                channel_squared_sums = np.add(channel_squared_sums, local_channel_squared_sums)
-
-            # Extract multi-class segmentation masks
-            all_class_masks = []
-            for ec in extractionClasses:
-                all_class_masks.append(self.getAnnotationTileMask(tl, ec, writeToNumpy=True, acceptTilesWithoutClass=True)) # allow blank masks to returned
-
-            # Stack class masks into a 3D numpy ndarray (dimensions are: num. classes, tile pixel height, tile pixel width)
-            mask_stack = np.stack(all_class_masks, axis=0)
-
-            # Save mask stack as .npy file
-            if (tissueLevelThreshold) and (foregroundLevelThreshold):
-                np.save(os.path.join(outputDir, 'masks', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel_mask.gif'),
-                    mask_stack)
-            elif (tissueLevelThreshold) and (not foregroundLevelThreshold):
-                np.save(os.path.join(outputDir, 'masks', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_mask.gif'),
-                    mask_stack)
-            elif (not tissueLevelThreshold) and (foregroundLevelThreshold):
-                np.save(os.path.join(outputDir, 'masks', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel_mask.gif'),
-                    mask_stack)
-            else:
-                np.save(os.path.join(outputDir, 'masks', id,
-                    id+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_mask.gif'),
-                    mask_stack)
+        with TileWriter(numWorkers=numWorkers) as writer:
+            for tl in annotatedTilesToExtract:
+                tilePath = os.path.join(outputDir, 'tiles', id, self.__extractionFileName(id, tl, False, tissueLevelThreshold, foregroundLevelThreshold, '.jpg'))
+                maskPath = os.path.join(outputDir, 'masks', id, self.__extractionFileName(id, tl, False, tissueLevelThreshold, foregroundLevelThreshold, '_mask.gif'))
+                writer.submit(self.__extractTile, tl, tilePath, channelStatistics, maskPath, functools.partial(self.__annotationMaskStack, tl, extractionClasses),
+                              shardWriter, self.__extractionMetadata(id, tl, False, extractionClasses) if shardWriter else None)
+                tileCounter = tileCounter + 1
+
 
         if tileCounter == 0:
             print('Warning: 0 suitable annotated tiles found across all classes; making no tile directories and returning zeroes')
@@ -1351,20 +1517,22 @@ class Slide:
             if slideName:
                 return {'class_order_in_mask_stack': extractionClasses,
                         'slide': slideName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
             else:
                 return {'class_order_in_mask_stack': extractionClasses,
                         'slide': self.slideFileName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
         else:
             return extractionClasses
 
     def extractRandomUnannotatedTiles(self, outputDir, slideName=False, numTilesToExtract=100, unannotatedClassName='unannotated', otherClassNames=False,
-        extractSegmentationMasks=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, returnTileStats=True, seed=False):
+        extractSegmentationMasks=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, returnTileStats=True, seed=False, numWorkers=4, shardWriter=False):
         """A function to extract randomly selected tiles that don't overlap any
         annotations into directory structure amenable to torch.utils.data.ConcatDataset
 
@@ -1377,8 +1545,10 @@ class Slide:
             extractSegmentationMasks (Bool, optional): whether to extract a 'masks' directory that is exactly parallel to the 'tiles' directory, and contains binary segmentation mask tiles for each class desired (these tiles will of course all be entirely black, pixel values of 0). Default is False.
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only extracts tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only includes Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (Bool, optional): if defined, only extracts tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
-            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation. Default is True.
+            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation, along with the :class:`ChannelStatistics <pathml.channelstatistics.ChannelStatistics>` they were computed with (which can be merged across slides). Default is True.
             seed (int, optional): the random seed to use for reproducible anayses. Default is not to use a seed when randomly selecting tiles.
+            numWorkers (int, optional): the number of threads reading, encoding and writing tiles concurrently (see :class:`TileWriter <pathml.tilewriter.TileWriter>`). Default is 4.
+            shardWriter (pathml.tileshards.ShardWriter, optional): if defined, the tiles, masks and their metadata (slide, position, size, class and foreground and tissue levels) are packed into the tar shards of this ShardWriter under the file names they would otherwise have, instead of being written to outputDir. See :class:`TileShardDataset <pathml.utils.torch.TileShardDataset.TileShardDataset>` for training on them. Default is to write one file per tile and mask.
 
         Returns:
             dict: A dictionary containing the Slide's name, 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation; if returnTileStats is set to False, True will be returned
@@ -1413,7 +1583,7 @@ class Slide:
 
         # get classes to NOT extract
         annotationClasses = []
-        for key, value in self.tileDictionary[list(self.tileDictionary.keys())[0]].items():
+        for key, value in self.tileDictionary[next(iter(self.tileDictionary))].items():
             if 'Overlap' in key:
                 annotationClasses.append(key)
         if len(annotationClasses) == 0:
@@ -1442,7 +1612,7 @@ class Slide:
             unannotatedTilesToExtract = random.sample(unannotatedTileAddresses, numTilesToExtract)
 
         # Create empty class tile directories
-        if len(unannotatedTileAddresses) > 0:
+        if (len(unannotatedTileAddresses) > 0) and (not shardWriter):
             try:
                 os.makedirs(os.path.join(outputDir, 'tiles', id, unannotatedClassName), exist_ok=True)
             except:
@@ -1487,76 +1657,48 @@ class Slide:
                     else:
                         raise ValueError('otherClassNames must be a string or list of strings')
 
+        if len(unannotatedTileAddresses) > 0:
             if extractSegmentationMasks:
                 print("Extracting "+str(len(unannotatedTilesToExtract))+" of "+str(len(unannotatedTileAddresses))+" "+unannotatedClassName+" tiles and segmentation masks...")
             else:
                 print("Extracting "+str(len(unannotatedTilesToExtract))+" of "+str(len(unannotatedTileAddresses))+" "+unannotatedClassName+" tiles...")
 
-        # Extract the desired number of unannotated tiles
-        channel_sums = np.zeros(3)
-        channel_squared_sums = np.zeros(3)
+        # Extract the desired number of unannotated tiles, reading, encoding and writing them concurrently
+        channelStatistics = ChannelStatistics() if returnTileStats else None
         tileCounter = 0
-        normalize_to_1max = transforms.Compose([transforms.ToTensor()])
-
-        #print("Tiles to extract:", unannotatedTilesToExtract)
-        for tl in unannotatedTilesToExtract:
-            area = self.getTile(tl)
-            if (tissueLevelThreshold) and (foregroundLevelThreshold):
-                area.write_to_file(os.path.join(outputDir, 'tiles', id, unannotatedClassName,
-                    id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel.jpg'), Q=100)
-            elif (tissueLevelThreshold) and (not foregroundLevelThreshold):
-                area.write_to_file(os.path.join(outputDir, 'tiles', id, unannotatedClassName,
-                    id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel.jpg'), Q=100)
-            elif (not tissueLevelThreshold) and (foregroundLevelThreshold):
-                area.write_to_file(os.path.join(outputDir, 'tiles', id, unannotatedClassName,
-                    id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel.jpg'), Q=100)
-            else:
-                area.write_to_file(os.path.join(outputDir, 'tiles', id, unannotatedClassName,
-                    id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize.jpg'), Q=100)
-
-            tileCounter = tileCounter + 1
-            if returnTileStats:
-                nparea = self.getTile(tl, writeToNumpy=True)[...,:3] # remove transparency channel
-                nparea = normalize_to_1max(nparea).numpy() # normalize values from 0-255 to 0-1
-                local_channel_sums = np.sum(nparea, axis=(1,2))
-                local_channel_squared_sums = np.sum(np.square(nparea), axis=(1,2))
 
-                channel_sums = np.add(channel_sums, local_channel_sums)
-                channel_squared_sums = np.add(channel_squared_sums, local_channel_squared_sums)
+        with TileWriter(numWorkers=numWorkers) as writer:
+            for tl in unannotatedTilesToExtract:
+                tilePath = os.path.join(outputDir, 'tiles', id, unannotatedClassName, self.__extractionFileName(id, tl, unannotatedClassName, tissueLevelThreshold, foregroundLevelThreshold, '.jpg'))
+                maskPath, getMask = False, None
+                if extractSegmentationMasks:
+                    maskSuffix = '_mask.gif' if (tissueLevelThreshold or foregroundLevelThreshold) else '_mask.jpg'
+                    maskPath = os.path.join(outputDir, 'masks', id, unannotatedClassName, self.__extractionFileName(id, tl, unannotatedClassName, tissueLevelThreshold, foregroundLevelThreshold, maskSuffix))
+                    height = self.tileDictionary[tl]['height']
+                    getMask = functools.partial(Image.new, '1', (height, height), 0) # blank mask
+                writer.submit(self.__extractTile, tl, tilePath, channelStatistics, maskPath, getMask,
+                              shardWriter, self.__extractionMetadata(id, tl, unannotatedClassName) if shardWriter else None)
+                tileCounter = tileCounter + 1
 
-            if extractSegmentationMasks:
-                height = self.tileDictionary[tl]['height']
-                mask = Image.new('1', (height, height), 0) # blank mask
-
-                if (tissueLevelThreshold) and (foregroundLevelThreshold):
-                    mask.save(os.path.join(outputDir, 'masks', id, unannotatedClassName,
-                        id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel_mask.gif'))
-                elif (tissueLevelThreshold) and (not foregroundLevelThreshold):
-                    mask.save(os.path.join(outputDir, 'masks', id, unannotatedClassName,
-                        id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['tissueLevel']*1000)))+'tissueLevel_mask.gif'))
-                elif (not tissueLevelThreshold) and (foregroundLevelThreshold):
-                    mask.save(os.path.join(outputDir, 'masks', id, unannotatedClassName,
-                        id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_'+str(int(round(self.tileDictionary[tl]['foregroundLevel'])))+'foregroundLevel_mask.gif'))
-                else:
-                    mask.save(os.path.join(outputDir, 'masks', id, unannotatedClassName,
-                        id+'_'+unannotatedClassName+'_'+str(self.tileDictionary[tl]['x'])+'x_'+str(self.tileDictionary[tl]['y'])+'y'+'_'+str(self.tileDictionary[tl]['height'])+'tilesize_mask.jpg'))
 
         if returnTileStats:
             if slideName:
                 return {'slide': slideName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
             else:
                 return {'slide': self.slideFileName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
         else:
             return True
 
     def extractRandomTissueTiles(self, outputDir, slideName=False, numTilesToExtract=100, className='unannotated',
-        foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, returnTileStats=True, seed=False, extractNonTissue=False):
+        foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, returnTileStats=True, seed=False, extractNonTissue=False, numWorkers=4, shardWriter=False):
         """A function to extract randomly selected tiles that don't overlap any
         annotations into directory structure amenable to torch.utils.data.ConcatDataset
 
@@ -1567,8 +1709,10 @@ class Slide:
             className (str, optional): the name that the "class" directory should be called. Default is "unannotated".
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only extracts tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only includes Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (Bool, optional): if defined, only extracts tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
-            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation. Default is True.
+            returnTileStats (Bool, optional): whether to return the 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation, along with the :class:`ChannelStatistics <pathml.channelstatistics.ChannelStatistics>` they were computed with (which can be merged across slides). Default is True.
             seed (int, optional): the random seed to use for reproducible anayses. Default is not to use a seed when randomly selecting tiles.
+            numWorkers (int, optional): the number of threads reading, encoding and writing tiles concurrently (see :class:`TileWriter <pathml.tilewriter.TileWriter>`). Default is 4.
+            shardWriter (pathml.tileshards.ShardWriter, optional): if defined, the tiles, masks and their metadata (slide, position, size, class and foreground and tissue levels) are packed into the tar shards of this ShardWriter under the file names they would otherwise have, instead of being written to outputDir. See :class:`TileShardDataset <pathml.utils.torch.TileShardDataset.TileShardDataset>` for training on them. Only one outputDir can be defined with a shardWriter. Default is to write one file per tile and mask.
 
         Returns:
             dict: A dictionary containing the Slide's name, 0-1 normalized sum of channel values, the sum of the squares of channel values, and the number of tiles extracted for use in global mean and variance computation; if returnTileStats is set to False, True will be returned
@@ -1612,6 +1756,8 @@ class Slide:
             raise ValueError('numTilesToExtract must be a integer greater than 0')
         if not len(outputDir)==len(numTilesToExtract):
             raise ValueError('outputDir and numTilesToExtract must have the same number of elements')
+        if shardWriter and len(outputDir) > 1:
+            raise ValueError('A shardWriter packs all tiles into the same shards, so it cannot split them between several outputDirs; extract each split with its own ShardWriter')
 
         if len(tissueTileAddresses) == 0:
             print('Warning: 0 tissue tiles found; making no tile directories and returning zeroes')
@@ -1621,66 +1767,55 @@ class Slide:
         else:
             tissueTilesToExtract = random.sample(tissueTileAddresses, sum(numTilesToExtract))
 
-        channel_sums = np.zeros(3)
-        channel_squared_sums = np.zeros(3)
+        channelStatistics = ChannelStatistics() if returnTileStats else None
         tileCounter = 0
-        normalize_to_1max = transforms.Compose([transforms.ToTensor()])
-
-        for dir, num in zip(outputDir, numTilesToExtract):
-            # Create empty class tile directories
-            if len(tissueTileAddresses) > 0:
-                try:
-                    os.makedirs(os.path.join(dir, className, id), exist_ok=True)
-                except:
-                    raise ValueError(os.path.join(dir, className, id)+' is not a valid path')
 
-            # Extract the desired number of unannotated tiles
-
-
-            #print("Tiles to extract:", tissueTilesToExtract)
-            for tl in tissueTilesToExtract[tileCounter:tileCounter+num]:
-                area = self.getTile(tl)
-
-                name_str = f"{id}_{className}_{self.tileDictionary[tl]['x']}x_{self.tileDictionary[tl]['y']}y_{self.tileDictionary[tl]['height']}tilesize"
-                if tissueLevelThreshold:
-                    name_str = f"{name_str}_{round(self.tileDictionary[tl]['tissueLevel']*1000)}tissue"
-                if foregroundLevelThreshold:
-                    name_str = f"{name_str}_{round(self.tileDictionary[tl]['foregroundLevel']*10)}foreground"
-                if otsuLevelThreshold:
-                    name_str = f"{name_str}_{round(self.tileDictionary[tl]['otsuLevel']*1000)}otsu"
-                if triangleLevelThreshold:
-                    name_str = f"{name_str}_{round(self.tileDictionary[tl]['triangleLevel']*1000)}triangle"
-                name_str = name_str + ".jpg"
+        with TileWriter(numWorkers=numWorkers) as writer:
+            for dir, num in zip(outputDir, numTilesToExtract):
+                # Create empty class tile directories
+                if (len(tissueTileAddresses) > 0) and (not shardWriter):
+                    try:
+                        os.makedirs(os.path.join(dir, className, id), exist_ok=True)
+                    except:
+                        raise ValueError(os.path.join(dir, className, id)+' is not a valid path')
+
+                # Extract the desired number of unannotated tiles, reading, encoding and writing them concurrently
+                for tl in tissueTilesToExtract[tileCounter:tileCounter+num]:
+                    name_str = f"{id}_{className}_{self.tileDictionary[tl]['x']}x_{self.tileDictionary[tl]['y']}y_{self.tileDictionary[tl]['height']}tilesize"
+                    if tissueLevelThreshold:
+                        name_str = f"{name_str}_{round(self.tileDictionary[tl]['tissueLevel']*1000)}tissue"
+                    if foregroundLevelThreshold:
+                        name_str = f"{name_str}_{round(self.tileDictionary[tl]['foregroundLevel']*10)}foreground"
+                    if otsuLevelThreshold:
+                        name_str = f"{name_str}_{round(self.tileDictionary[tl]['otsuLevel']*1000)}otsu"
+                    if triangleLevelThreshold:
+                        name_str = f"{name_str}_{round(self.tileDictionary[tl]['triangleLevel']*1000)}triangle"
+                    name_str = name_str + ".jpg"
+
+                    writer.submit(self.__extractTile, tl, os.path.join(dir, className, id, name_str), channelStatistics,
+                                  shardWriter=shardWriter, metadata=self.__extractionMetadata(id, tl, className) if shardWriter else None)
+                    tileCounter = tileCounter + 1
 
-                area.write_to_file(os.path.join(dir, className, id, name_str), Q=100)
 
-                tileCounter = tileCounter + 1
-                if returnTileStats:
-                    nparea = self.getTile(tl, writeToNumpy=True)[...,:3] # remove transparency channel
-                    nparea = normalize_to_1max(nparea).numpy() # normalize values from 0-255 to 0-1
-                    local_channel_sums = np.sum(nparea, axis=(1,2))
-                    local_channel_squared_sums = np.sum(np.square(nparea), axis=(1,2))
-
-                    channel_sums = np.add(channel_sums, local_channel_sums)
-                    channel_squared_sums = np.add(channel_squared_sums, local_channel_squared_sums)
-        
         self.extractedTiles = tissueTilesToExtract
 
         if returnTileStats:
             if slideName:
                 return {'slide': slideName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
             else:
                 return {'slide': self.slideFileName,
-                        'channel_sums': channel_sums,#np.mean(channel_means_across_tiles, axis=0).tolist(),
-                        'channel_squared_sums': channel_squared_sums,#np.mean(channel_stds_across_tiles, axis=0).tolist(),
-                        'num_tiles': tileCounter}
+                        'channel_sums': channelStatistics.channelSums(),
+                        'channel_squared_sums': channelStatistics.channelSquaredSums(),
+                        'num_tiles': tileCounter,
+                        'channel_statistics': channelStatistics}
         else:
             return True
 
-    def detectTissue(self, tissueDetectionLevel=1, tissueDetectionTileSize=512, tissueDetectionTileOverlap=0, tissueDetectionUpsampleFactor=1, batchSize=20, numWorkers=16, overwriteExistingTissueDetection=False, modelStateDictPath='../pathml/pathml/models/deep-tissue-detector_densenet_state-dict.pt', architecture='densenet', foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, foregroundLevel=2):
+    def detectTissue(self, tissueDetectionLevel=1, tissueDetectionTileSize=512, tissueDetectionTileOverlap=0, tissueDetectionUpsampleFactor=1, batchSize=20, numWorkers=16, overwriteExistingTissueDetection=False, modelStateDictPath='../pathml/pathml/models/deep-tissue-detector_densenet_state-dict.pt', architecture='densenet', foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, foregroundLevel=2, optimizeTissueDetector=False, quantizeTissueDetector=False):
         """A function to apply PathML's built-in deep tissue detector to assign
         artifact, background, and tissue probabilities that sum to one to each tile
         in the tile dictionary. The raw tissue detection map for a WSI is saved into
@@ -1698,6 +1833,8 @@ class Slide:
             overwriteExistingTissueDetection (Bool, optional): whether to overwrite any existing deep tissue detector predictions if they are already present in the tile dictionary. Default is False.
             modelStateDictPath (str, optional): the path to the state dictionary of the deep tissue detector; it must be a 3-class classifier, with the class order as follows: background, artifact, tissue. Default is the path to the state dict of the deep tissue detector build into PathML.
             architecture (str, optional): the name of the architecture that the state dict belongs to. Currently supported architectures include resnet18, inceptionv3, vgg16, vgg16_bn, vgg19, vgg19_bn, densenet, alexnet, and squeezenet. Default is "densenet", which is the architecture of PathML's built-in deep tissue detector.
+            optimizeTissueDetector (Bool, optional): whether to infer with a variant of the tissue detector optimized for CPU inference (see :func:`tissueDetector <pathml.models.tissuedetector.tissueDetector>`). The tissue detector is loaded from disk once per process either way. Default is False.
+            quantizeTissueDetector (Bool or str, optional): whether to infer with an int8-quantized copy of the tissue detector on CPU; True or 'static' quantizes weights and activations, calibrated on a handful of tiles of the slide, and 'dynamic' only quantizes the weights of linear layers (see :func:`quantizeModel <pathml.utils.torch.quantization.quantizeModel>`). The rate at which the quantized detector agrees with the float32 detector on other tiles of the slide is printed and kept in the Slide's tissueDetectorQuantizationAgreement attribute. Takes precedence over optimizeTissueDetector. Default is False.
 
         Example:
             pathml_slide.detectTissue()
@@ -1710,12 +1847,10 @@ class Slide:
             raise Warning('Tissue detection has already been performed. Use overwriteExistingTissueDetection if you wish to write over it')
         
 
-        if tissueDetectionLevel==self.level & tissueDetectionTileSize==self.tileSize & tissueDetectionTileOverlap==self.tileOverlap:
-            tissueForegroundSlide = self
-        else:
-            if tissueDetectionTileOverlap != 0 or self.tileOverlap != 0:
-                print('Warning: Having tileOverlap!=0 in either tissue detection or PathML slide can result in inaccuracies and is therefore not recommended!')
-            tissueForegroundSlide = Slide(self.slideFilePath, level=tissueDetectionLevel).setTileProperties(tileSize=tissueDetectionTileSize, tileOverlap=tissueDetectionTileOverlap) # tile size and overlap for tissue detector, not final tiles
+        if tissueDetectionTileOverlap != 0 or self.tileOverlap != 0:
+            print('Warning: Having tileOverlap!=0 in either tissue detection or PathML slide can result in inaccuracies and is therefore not recommended!')
+        # tile size and overlap for tissue detector, not final tiles; the view reuses this Slide's open pyramid
+        tissueForegroundSlide = self.tilingView(tissueDetectionLevel, tissueDetectionTileSize, tissueDetectionTileOverlap)
         if foregroundLevelThreshold or otsuLevelThreshold or triangleLevelThreshold:
             with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
                 self.foreground = tissueForegroundSlide.detectForeground(level=foregroundLevel, mode=np.array(['foreground','otsu','triangle'])[[bool(foregroundLevelThreshold),bool(otsuLevelThreshold),bool(triangleLevelThreshold)]], foreground=self.foreground)
@@ -1727,22 +1862,23 @@ class Slide:
             print("Inferring tissue detection model using CPU")
 
         tmpProcessor = Processor(tissueForegroundSlide)
-        tissueForegroundSlide = tmpProcessor.applyModel(tissueDetector(modelStateDictPath=modelStateDictPath, architecture=architecture), batch_size=batchSize, predictionKey='tissue_detector', numWorkers=numWorkers, foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold)#.adoptKeyFromTileDictionary(upsampleFactor=tissueDetectionUpsampleFactor)
+        tissueForegroundSlide = tmpProcessor.applyModel(tissueDetector(modelStateDictPath=modelStateDictPath, architecture=architecture, optimize=optimizeTissueDetector and not quantizeTissueDetector), batch_size=batchSize, predictionKey='tissue_detector', numWorkers=numWorkers, foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, quantize=quantizeTissueDetector)#.adoptKeyFromTileDictionary(upsampleFactor=tissueDetectionUpsampleFactor)
+        if hasattr(tmpProcessor, 'quantizationAgreement'):
+            self.tissueDetectorQuantizationAgreement = tmpProcessor.quantizationAgreement
 
         predictionMap = np.zeros([tissueForegroundSlide.numTilesInY, tissueForegroundSlide.numTilesInX,3])
-        for address in tissueForegroundSlide.iterateTiles():
-            if 'tissue_detector' in tissueForegroundSlide.tileDictionary[address]:
-                predictionMap[address[1], address[0], :] = tissueForegroundSlide.tileDictionary[address]['tissue_detector']
+        if tissueForegroundSlide.tileDictionary.hasColumn('tissue_detector'):
+            predicted = tissueForegroundSlide.tileDictionary.getMask('tissue_detector')
+            predictionMap[predicted] = tissueForegroundSlide.tileDictionary.getColumn('tissue_detector')[predicted]
 
         predictionMap1res = self.resizePredMap(predictionMap, tissueForegroundSlide, self)
 
         self.rawTissueDetectionMap = {'map': predictionMap, 'level': tissueDetectionLevel, 'tileSize': tissueDetectionTileSize, 'tileOverlap': tissueDetectionTileOverlap}
         self.resizedTissueDetectionMap = predictionMap1res
 
-        for address in self.iterateTiles():
-            self.tileDictionary[address].update({'artifactLevel': predictionMap1res[address[1], address[0]][0]})
-            self.tileDictionary[address].update({'backgroundLevel': predictionMap1res[address[1], address[0]][1]})
-            self.tileDictionary[address].update({'tissueLevel': predictionMap1res[address[1], address[0]][2]})
+        self.tileDictionary.setColumn('artifactLevel', predictionMap1res[:, :, 0])
+        self.tileDictionary.setColumn('backgroundLevel', predictionMap1res[:, :, 1])
+        self.tileDictionary.setColumn('tissueLevel', predictionMap1res[:, :, 2])
        
 
     def detectTissueFromRawTissueDetectionMap(self, rawTissueDetectionMap, overwriteExistingTissueDetection=False):
@@ -1763,17 +1899,16 @@ class Slide:
         if hasattr(self, 'rawTissueDetectionMap') and (not overwriteExistingTissueDetection):
             raise Warning('Tissue detection has already been performed. Use overwriteExistingTissueDetection if you wish to write over it')
 
-        tmpSlide = Slide(self.slideFilePath, level=rawTissueDetectionMap['level']).setTileProperties(tileSize=rawTissueDetectionMap['tileSize'], tileOverlap=rawTissueDetectionMap['tileOverlap'])
+        tissueDetectionView = self.tilingView(rawTissueDetectionMap['level'], rawTissueDetectionMap['tileSize'], rawTissueDetectionMap['tileOverlap'])
 
-        predictionMap1res = self.resizePredMap(rawTissueDetectionMap['level'], tmpSlide, self)
+        predictionMap1res = self.resizePredMap(rawTissueDetectionMap['map'], tissueDetectionView, self)
 
         self.rawTissueDetectionMap = rawTissueDetectionMap
         self.resizedTissueDetectionMap = predictionMap1res
 
-        for address in self.iterateTiles():
-            self.tileDictionary[address].update({'artifactLevel': predictionMap1res[address[1], address[0]][0]})
-            self.tileDictionary[address].update({'backgroundLevel': predictionMap1res[address[1], address[0]][1]})
-            self.tileDictionary[address].update({'tissueLevel': predictionMap1res[address[1], address[0]][2]})
+        self.tileDictionary.setColumn('artifactLevel', predictionMap1res[:, :, 0])
+        self.tileDictionary.setColumn('backgroundLevel', predictionMap1res[:, :, 1])
+        self.tileDictionary.setColumn('tissueLevel', predictionMap1res[:, :, 2])
 
     def detectForeground(self, level=4, mode=['foreground','otsu','triangle'], overwriteExistingForegroundDetection=False, foreground=False):
         """A function to implement traditional foreground filtering methods on the
@@ -1790,7 +1925,7 @@ class Slide:
         if not self.hasTileDictionary():
             raise PermissionError(
                 'setTileProperties must be called before foreground detection')
-        if not overwriteExistingForegroundDetection and 'foregroundLevel' in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+        if not overwriteExistingForegroundDetection and 'foregroundLevel' in self.tileDictionary[next(iter(self.tileDictionary))]:
             raise Warning('Foreground already detected. Use overwriteExistingForegroundDetection to over-write old detections.')
 
         print(f"Detecting foreground of {self.slideFileName}")
@@ -1807,7 +1942,9 @@ class Slide:
             mode = [mode]
         for m in mode:
             mask[mode_dict[m]] = True
-        self.readPredMap(self.foreground.map[:,:,mask], (1, 1, self.foreground.level), np.array(['foregroundLevel','otsuLevel','triangleLevel'])[mask])
+        levels, valid = self.foreground.tileLevels(self, mode=list(np.array(['foreground','otsu','triangle'])[mask]))
+        for i, key in enumerate(np.array(['foregroundLevel','otsuLevel','triangleLevel'])[mask]):
+            self.tileDictionary.setColumn(str(key), levels[:, :, i], mask=valid)
 
         return self.foreground
 
@@ -1816,7 +1953,7 @@ class Slide:
         if not self.hasTileDictionary():
             raise PermissionError(
                 'setTileProperties must be called before readMask()')
-        if not overwriteExistingMask and 'maskLevel' in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+        if not overwriteExistingMask and 'maskLevel' in self.tileDictionary[next(iter(self.tileDictionary))]:
             raise Warning('Mask already detected. Use overwriteExistingMask to overwrite it.')
         
         # load mask
@@ -1829,22 +1966,43 @@ class Slide:
     def readPredMap(self, map, scale, keys, func=None):
         # scale: tuple of (y_scale, x_scale, level)
         # keys: list of keys in the correct order
+        # The NaN-ignoring mean of the map under every tile is taken from
+        # summed-area tables of the values and of the non-NaN counts
 
         y_scale, x_scale, level = scale
 
         y_scale = y_scale*self.levels[level].height/self.slide.height
         x_scale = x_scale*self.levels[level].width/self.slide.width
-        
-        for tileAddress in self.iterateTiles():
-            tileXPos1 = round(self.tileDictionary[tileAddress]['x'] * x_scale)
-            tileYPos1 = round(self.tileDictionary[tileAddress]['y'] * y_scale)
-            tileXPos2 = round((self.tileDictionary[tileAddress]['x'] + self.tileDictionary[tileAddress]['width']) * x_scale)
-            tileYPos2 = round((self.tileDictionary[tileAddress]['y'] + self.tileDictionary[tileAddress]['height']) * y_scale)
-            for a, key in enumerate(keys):
-                if not np.isnan(np.nanmean(map[tileYPos1:tileYPos2, tileXPos1:tileXPos2, a])):
-                    self.tileDictionary[tileAddress].update({key: np.nanmean(map[tileYPos1:tileYPos2, tileXPos1:tileXPos2, a])})
-                    if func:
-                        func(tileAddress)
+
+        if map.ndim == 2:
+            map = map[:, :, np.newaxis]
+        if map.ndim != 3:
+            raise ValueError('map must be a 2D or 3D array')
+        if len(keys) > map.shape[2]:
+            raise ValueError('map has '+str(map.shape[2])+' channels but '+str(len(keys))+' keys were given')
+
+        x = self.tileDictionary.getColumn('x')
+        y = self.tileDictionary.getColumn('y')
+        tileXPos1 = np.clip(np.round(x * x_scale).astype(np.int64), 0, map.shape[1])
+        tileYPos1 = np.clip(np.round(y * y_scale).astype(np.int64), 0, map.shape[0])
+        tileXPos2 = np.clip(np.round((x + self.tileDictionary.getColumn('width')) * x_scale).astype(np.int64), tileXPos1, map.shape[1])
+        tileYPos2 = np.clip(np.round((y + self.tileDictionary.getColumn('height')) * y_scale).astype(np.int64), tileYPos1, map.shape[0])
+
+        def tileSums(values):
+            integral = np.zeros((values.shape[0]+1, values.shape[1]+1), dtype=values.dtype)
+            np.cumsum(np.cumsum(values, axis=0), axis=1, out=integral[1:, 1:])
+            return integral[tileYPos2, tileXPos2] - integral[tileYPos1, tileXPos2] - integral[tileYPos2, tileXPos1] + integral[tileYPos1, tileXPos1]
+
+        for a, key in enumerate(keys):
+            values = map[:, :, a].astype(np.float64)
+            notNan = ~np.isnan(values)
+            counts = tileSums(notNan.astype(np.int64))
+            valid = counts > 0
+            means = np.divide(tileSums(np.where(notNan, values, 0)), counts, out=np.zeros(counts.shape), where=valid)
+            self.tileDictionary.setColumn(str(key), means, mask=valid)
+            if func:
+                for tileAddress in self.tileDictionary.addresses(valid):
+                    func(tileAddress)
 
     def resizePredMap(self, predictionMap, oldSlide, newSlide, scale=1/16):
         
@@ -1988,17 +2146,18 @@ class Slide:
         ourNewImg = self.thumbnail(level=level)
         classMask = np.zeros((self.numTilesInY, self.numTilesInX))
 
-        foundPrediction = False
-        for tileAddress, tileEntry in self.tileDictionary.items():
-            if key in tileEntry:
-                if classToVisualize in tileEntry[key]:
-                    if key == 'segmenterInferencePrediction':
-                        classMask[tileAddress[1],tileAddress[0]] = np.mean(tileEntry['segmenterInferencePrediction'][classToVisualize])
-                    else:
-                        classMask[tileAddress[1],tileAddress[0]] = tileEntry[key][classToVisualize]
-                    foundPrediction = True
-                else:
+        predicted = self.tileDictionary.getMask(key)
+        foundPrediction = bool(predicted.any())
+        if key == 'segmenterInferencePrediction' and not self.tileDictionary.hasColumn('segmenterInferenceIndex'): # pixel-wise predictions saved by older versions of PathML
+            for tileAddress in self.tileDictionary.addresses(predicted):
+                tileEntry = self.tileDictionary[tileAddress]
+                if classToVisualize not in tileEntry[key]:
                     raise ValueError(classToVisualize+' not in '+key)
+                classMask[tileAddress[1],tileAddress[0]] = np.mean(tileEntry['segmenterInferencePrediction'][classToVisualize])
+        elif foundPrediction:
+            if not self.tileDictionary.getMask(key, classToVisualize)[predicted].all():
+                raise ValueError(classToVisualize+' not in '+key)
+            classMask[predicted] = self.tileDictionary.getColumn(key, classToVisualize)[predicted]
 
         if not foundPrediction:
             raise ValueError('No predictions found in slide. Use inferClassifier() or inferSegmentor() to generate them.')
@@ -2065,18 +2224,17 @@ class Slide:
         if not self.hasTileDictionary():
             raise PermissionError(
                 'setTileProperties must be called before inferring a classifier')
-        if 'foregroundLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+        if 'foregroundLevel' not in self.tileDictionary[next(iter(self.tileDictionary))]:
             raise PermissionError('Foreground detection must be performed with detectForeground() before tissueLevelThreshold can be defined')
 
         foregroundMask = np.zeros((self.numTilesInY, self.numTilesInX), dtype=bool)
 
-        for tileAddress, tileEntry in self.tileDictionary.items():
-            if mode == 'otsu' and tileEntry['otsuLevel'] >= threshold:
-                foregroundMask[tileAddress[1],tileAddress[0]] = True
-            elif mode == 'triangle' and tileEntry['triangleLevel'] >= threshold:
-                foregroundMask[tileAddress[1],tileAddress[0]] = True
-            elif mode == 'foreground' and tileEntry['foregroundLevel'] < threshold:
-                    foregroundMask[tileAddress[1],tileAddress[0]] = True
+        if mode == 'otsu':
+            foregroundMask = self.tileDictionary.getMask('otsuLevel') & (self.tileDictionary.getColumn('otsuLevel') >= threshold)
+        elif mode == 'triangle':
+            foregroundMask = self.tileDictionary.getMask('triangleLevel') & (self.tileDictionary.getColumn('triangleLevel') >= threshold)
+        elif mode == 'foreground':
+            foregroundMask = self.tileDictionary.getMask('foregroundLevel') & (self.tileDictionary.getColumn('foregroundLevel') < threshold)
         self.visualizeDetection(foregroundMask, label=mode+"_foregrounddetection", colors=colors, fileName=fileName, folder=folder)
 
     def visualizeMask(self, maskLevelThreshold=0, fileName=False, folder=os.getcwd(), colors=['#04F900', '#0000FE']):
@@ -2098,14 +2256,10 @@ class Slide:
             raise PermissionError(
                 'setTileProperties must be called before inferring a classifier')
         if maskLevelThreshold:
-            if 'maskLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+            if 'maskLevel' not in self.tileDictionary[next(iter(self.tileDictionary))]:
                 raise PermissionError('Mask must be defined with readMask() before maskLevelThreshold can be defined')
 
-        mask = np.zeros((self.numTilesInY, self.numTilesInX), dtype=bool)
-
-        for tileAddress, tileEntry in self.tileDictionary.items():
-            if tileEntry['maskLevel'] > maskLevelThreshold:
-                mask[tileAddress[1],tileAddress[0]] = True
+        mask = self.tileDictionary.getMask('maskLevel') & (self.tileDictionary.getColumn('maskLevel') > maskLevelThreshold)
 
         self.visualizeDetection(mask, label="mask", colors=colors, fileName=fileName, folder=folder)
 
@@ -2148,7 +2302,7 @@ class Slide:
         self.overlayInference('segmenterInferencePrediction', classToVisualize, label='segmentation', fileName=fileName, folder=folder, level=level, probabilityThreshold=probabilityThreshold)
 
 
-    def inferClassifier(self, trainedModel, classNames, dataTransforms=None, batchSize=30, numWorkers=16, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, maskLevelThreshold=False, overwriteExistingClassifications=False):
+    def inferClassifier(self, trainedModel, classNames, dataTransforms=None, batchSize=30, numWorkers=16, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, maskLevelThreshold=False, overwriteExistingClassifications=False, quantize=False, numCalibrationTiles=32):
         """A function to infer a trained classifier on a Slide object using
         PyTorch.
 
@@ -2157,10 +2311,12 @@ class Slide:
             classNames (list of str): an alphabetized list of class names.
             dataTransforms (torchvision.transforms.Compose): a PyTorch torchvision.Compose object with the desired data transformations.
             batchSize (int, optional): the number of tiles to use in each inference minibatch.
-            numWorkers (int, optional): the number of workers to use when inferring the model on the WSI. Default is 16.
+            numWorkers (int, optional): the number of threads reading and transforming tiles while the model is inferred on the WSI. Default is 16.
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only infers trainedModel on tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only infers on Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (Bool, optional): if defined, only infers trainedModel on tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
             overwriteExistingClassifications (Bool, optional): whether to overwrite any existing classification inferences if they are already present in the tile dictionary. Default is False.
+            quantize (Bool or str, optional): whether to infer an int8-quantized copy of trainedModel on CPU; True or 'static' quantizes weights and activations, calibrated on numCalibrationTiles tiles of the slide, and 'dynamic' only quantizes the weights of linear layers (see :func:`quantizeModel <pathml.utils.torch.quantization.quantizeModel>`). The rate at which the quantized model agrees with the float32 model on numCalibrationTiles other tiles of the slide is printed and kept in the Slide's classifierQuantizationAgreement attribute. Default is False.
+            numCalibrationTiles (int, optional): the number of tiles to calibrate and to validate the quantized model on. Default is 32.
         """
 
         if not self.hasTileDictionary():
@@ -2170,10 +2326,10 @@ class Slide:
             if not self.hasTissueDetection():
                 raise PermissionError('Deep tissue detection must be performed with detectTissue() before tissueLevelThreshold can be defined')
         if foregroundLevelThreshold:
-            if 'foregroundLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+            if 'foregroundLevel' not in self.tileDictionary[next(iter(self.tileDictionary))]:
                 raise PermissionError('Foreground detection must be performed with detectForeground() before tissueLevelThreshold can be defined')
         if maskLevelThreshold:
-            if 'maskLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+            if 'maskLevel' not in self.tileDictionary[next(iter(self.tileDictionary))]:
                 raise PermissionError('Mask must be defined with readMask() before maskLevelThreshold can be defined')
         if type(classNames) != list:
             raise ValueError('classes must be a list if defined')
@@ -2188,42 +2344,47 @@ class Slide:
             trainedModel = torch.nn.DataParallel(trainedModel)
         trainedModel.to(device).eval()
 
-        pathSlideDataset = WholeSlideImageDataset(self, tissueLevelThreshold=tissueLevelThreshold,
-            foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold, transform=dataTransforms)
+        inferenceEngine = StreamingInferenceEngine(self, transform=dataTransforms, batchSize=batchSize, numWorkers=numWorkers, tissueLevelThreshold=tissueLevelThreshold,
+            foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold)
 
-        if 'classifierInferencePrediction' in self.tileDictionary[pathSlideDataset.suitableTileAddresses[0]]:
+        if len(inferenceEngine.suitableTileAddresses) > 0 and 'classifierInferencePrediction' in self.tileDictionary[inferenceEngine.suitableTileAddresses[0]]:
             if not overwriteExistingClassifications:
                 raise PermissionError('Classification predictions are already present in the tile dictionary. Set overwriteExistingClassifications to True to overwrite them.')
 
-        pathSlideDataloader = torch.utils.data.DataLoader(pathSlideDataset, batch_size=batchSize, shuffle=False, num_workers=numWorkers)
-        classifierPredictionTileAddresses = []
-        for inputs in tqdm(pathSlideDataloader):
-            inputTile = inputs['image'].to(device)
-            output = trainedModel(inputTile)
-            output = output.to(device)
+        if quantize:
+            trainedModel, self.classifierQuantizationAgreement = quantizeForSlide(trainedModel, inferenceEngine, mode='static' if quantize is True else quantize,
+                numCalibrationTiles=numCalibrationTiles, numValidationTiles=numCalibrationTiles, device=device)
+            device = torch.device('cpu')
 
+        # Collect the predictions into one array per class and write them to the tile dictionary at once
+        predictions = np.zeros((len(classNames),)+self.tileDictionary.shape, dtype=np.float64)
+        predictionMask = np.zeros(self.tileDictionary.shape, dtype=bool)
+        classifierPredictionTileAddresses = []
+        for tileAddresses, output in tqdm(inferenceEngine.infer(trainedModel, device), total=len(inferenceEngine)):
             batch_prediction = torch.nn.functional.softmax(
-                output, dim=1).cpu().data.numpy()
-
-            for index in range(len(inputTile)):
-                tileAddress = (inputs['tileAddress'][0][index].item(),
-                               inputs['tileAddress'][1][index].item())
-                preds = batch_prediction[index, ...].tolist()
-                if len(preds) != len(classNames):
-                    raise ValueError('Model has '+str(len(preds))+' classes but only '+str(len(classNames))+' class names were provided in the classes argument')
-                prediction = {}
-                for i, pred in enumerate(preds):
-                    prediction[classNames[i]] = pred
-                self.appendTag(tileAddress, 'classifierInferencePrediction', prediction)
-                classifierPredictionTileAddresses.append(tileAddress)
+                output, dim=1).cpu().numpy()
+            if batch_prediction.shape[1] != len(classNames):
+                raise ValueError('Model has '+str(batch_prediction.shape[1])+' classes but only '+str(len(classNames))+' class names were provided in the classes argument')
+
+            xs, ys = np.array(tileAddresses).T
+            predictions[:, ys, xs] = batch_prediction.T
+            predictionMask[ys, xs] = True
+            classifierPredictionTileAddresses.extend(tileAddresses)
         if len(classifierPredictionTileAddresses) > 0:
+            self.tileDictionary.setColumn('classifierInferencePrediction', {className: predictions[i] for i, className in enumerate(classNames)}, mask=predictionMask)
             self.classifierPredictionTileAddresses = classifierPredictionTileAddresses
         else:
             raise Warning('No suitable tiles found at current tissueLevelThreshold and foregroundLevelThreshold')
 
-    def inferSegmenter(self, trainedModel, classNames, dataTransforms=None, dtype='int', batchSize=1, numWorkers=16, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, maskLevelThreshold=False, overwriteExistingSegmentations=False):#, saveInChunksAtFolder=False):
+    def inferSegmenter(self, trainedModel, classNames, dataTransforms=None, dtype='int', batchSize=1, numWorkers=16, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, tissueLevelThreshold=False, maskLevelThreshold=False, overwriteExistingSegmentations=False, predictionStoreFolder=False):
         """A function to infer a trained segmentation model on a Slide object using
-        PyTorch.
+        PyTorch. The pixel-wise predictions are written to a chunked, compressed
+        :class:`PredictionStore <pathml.predictionstore.PredictionStore>` on disk
+        (kept as the segmenterPredictionStore attribute and copied into the .pml
+        by :meth:`Slide.save() <pathml.slide.Slide.save>`); the tile dictionary holds each tile's
+        'segmenterInferenceIndex' into the store and, as 'segmenterInferencePrediction',
+        its 0-1 mean probability per class. Use :meth:`Slide.getSegmenterPrediction() <pathml.slide.Slide.getSegmenterPrediction>`
+        to read the predictions of a tile.
 
         Args:
             trainedModel (torchvision.models): A PyTorch segmentation model that has been trained for the segmentation task desired for inference.
@@ -2231,10 +2392,11 @@ class Slide:
             dataTransforms (torchvision.transforms.Compose): a PyTorch torchvision.Compose object with the desired data transformations.
             dtype (str, optional): if 'float', saves the pixel probabilities as 0-1 numpy.float32 values; if 'int', saves the pixel probabilities as 0-255 numpy.uint8 values (these make for much more memory efficient Slide objects). Default is 'int'.
             batchSize (int, optional): the number of tiles to use in each inference minibatch.
-            numWorkers (int, optional): the number of workers to use when inferring the model on the WSI
+            numWorkers (int, optional): the number of threads reading and transforming tiles while the model is inferred on the WSI. Default is 16.
             foregroundLevelThreshold (str or int or float, optional): if defined as an int, only infers trainedModel on tiles with a 0-100 foregroundLevel value less or equal to than the set value (0 is a black tile, 100 is a white tile). Only infers on Otsu's method-passing tiles if set to 'otsu', or triangle algorithm-passing tiles if set to 'triangle'. Default is not to filter on foreground at all.
             tissueLevelThreshold (Bool, optional): if defined, only infers trainedModel on tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
             overwriteExistingSegmentations (Bool, optional): whether to overwrite any existing segmentation inferences if they are already present in the tile dictionary. Default is False.
+            predictionStoreFolder (str, optional): the directory to create the prediction store in, which must not already hold one. Default is a new temporary directory, which is deleted once :meth:`Slide.save() <pathml.slide.Slide.save>` has copied the store into the .pml or a later inference replaces the store; a Slide that is never saved leaves it behind in the system's temporary directory.
 
         Example:
             pathml_slide.inferSegmenter(trained_model, classNames=class_names, batchSize=6, tissueLevelThreshold=0.995)
@@ -2247,10 +2409,10 @@ class Slide:
             if not self.hasTissueDetection():
                 raise PermissionError('Deep tissue detection must be performed with detectTissue() before tissueLevelThreshold can be defined')
         if foregroundLevelThreshold:
-            if 'foregroundLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+            if 'foregroundLevel' not in self.tileDictionary[next(iter(self.tileDictionary))]:
                 raise PermissionError('Foreground detection must be performed with detectForeground() before tissueLevelThreshold can be defined')
         if maskLevelThreshold:
-            if 'maskLevel' not in self.tileDictionary[list(self.tileDictionary.keys())[0]]:
+            if 'maskLevel' not in self.tileDictionary[next(iter(self.tileDictionary))]:
                 raise PermissionError('Mask must be defined with readMask() before maskLevelThreshold can be defined')
         if type(classNames) != list:
             raise ValueError('classes must be a list if defined')
@@ -2268,160 +2430,152 @@ class Slide:
         if trainedModel.n_classes != len(classNames):
             raise ValueError('Model has '+str(trainedModel.n_classes)+' classes but only '+str(len(classNames))+' class names were provided in the classes argument')
 
-        pathSlideDataset = WholeSlideImageDataset(self, tissueLevelThreshold=tissueLevelThreshold,
-            foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold, transform=dataTransforms, segmenting=True)
+        inferenceEngine = StreamingInferenceEngine(self, transform=dataTransforms, segmenting=True, batchSize=batchSize, numWorkers=numWorkers, tissueLevelThreshold=tissueLevelThreshold,
+            foregroundLevelThreshold=foregroundLevelThreshold, otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold, maskLevelThreshold=maskLevelThreshold)
 
-        if 'segmenterInferencePrediction' in self.tileDictionary[pathSlideDataset.suitableTileAddresses[0]]:
+        if len(inferenceEngine.suitableTileAddresses) > 0 and 'segmenterInferencePrediction' in self.tileDictionary[inferenceEngine.suitableTileAddresses[0]]:
             if not overwriteExistingSegmentations:
                 raise PermissionError('Segmentation predictions are already present in the tile dictionary. Set overwriteExistingSegmentations to True to overwrite them.')
 
-        pathSlideDataloader = torch.utils.data.DataLoader(pathSlideDataset, batch_size=batchSize, shuffle=False, num_workers=numWorkers)
-        segmenterPredictionTileAddresses = []
-        counter = 0
-        for inputs in tqdm(pathSlideDataloader):
-            inputTile = inputs['image'].to(device)
+        if dtype not in ['int', 'float']:
+            raise ValueError("'dtype' must be 'float' or 'int'")
+        if predictionStoreFolder and os.path.isfile(os.path.join(predictionStoreFolder, 'index.json')):
+            raise ValueError(predictionStoreFolder+' already holds a prediction store')
 
-            # input into net
-            output = trainedModel(inputTile)
-            output = output.to(device)
+        # the pixel-wise predictions go to a disk-backed store; the tile dictionary only keeps
+        # each tile's index into the store and its mean probability per class
+        store = None
+        storeIndices = np.full(self.tileDictionary.shape, -1, dtype=np.int64)
+        meanProbabilities = {className: np.zeros(self.tileDictionary.shape) for className in classNames}
+        predicted = np.zeros(self.tileDictionary.shape, dtype=bool)
 
-            if trainedModel.n_classes > 1:
-                batch_probs = torch.sigmoid(output) # F.softmax(output, dim=1) #vllt Problem
+        segmenterPredictionTileAddresses = []
+        for tileAddresses, output in tqdm(inferenceEngine.infer(trainedModel, device), total=len(inferenceEngine)):
+            # post-process the whole batch on the device, with a single transfer of its masks to the host
+            batch_probs = torch.sigmoid(output) # F.softmax(output, dim=1) #vllt Problem
+            if batch_probs.dim() == 3: # (batch, height, width) output of a one-class model
+                batch_probs = batch_probs.unsqueeze(1)
+            if batch_probs.shape[1] != len(classNames):
+                raise ValueError('Model has '+str(batch_probs.shape[1])+' output classes but '+str(len(classNames))+' class names were provided in the classes argument')
+            if tuple(batch_probs.shape[2:]) != (self.tileSize, self.tileSize):
+                batch_probs = F.interpolate(batch_probs, size=(self.tileSize, self.tileSize))
+            means = batch_probs.mean(dim=(2, 3)).cpu().numpy()
+            if dtype == 'int':
+                batch_masks = (batch_probs * 255).to(torch.uint8).cpu().numpy()
             else:
-                batch_probs = torch.sigmoid(output)
-
-            for index in range(len(inputTile)):
-                tileAddress = (inputs['tileAddress'][0][index].item(),
-                               inputs['tileAddress'][1][index].item())
-
-                tile_probs = batch_probs[index, ...]
-
-                tile_probs = tile_probs.squeeze(0)
-
-                def resize(x):
-                    return F.interpolate(x, pathSlideDataset.tileSize)
-
-                tf = transforms.Compose([
-                    #transforms.ToTensor(), # converts from HWC to CWH and divides by 255
-                    transforms.Lambda(resize)
-                ])
-
-                tile_probs = tf(tile_probs.cpu())
-                full_mask = tile_probs.squeeze().cpu().numpy()
-
-                if (len(full_mask.shape) == 2 and len(classNames) == 1):
-                    pass
-                elif (len(full_mask.shape) == 2 and len(classNames) != 1):
-                    raise ValueError('Model has 1 output class but '+str(len(classNames))+' class names were provided in the classes argument')
-                elif full_mask.shape[0] != len(classNames):
-                    raise ValueError('Model has '+str(full_mask.shape[-1])+' output classes but only '+str(len(classNames))+' class names were provided in the classes argument')
-
-                segmentation_masks = {}
-
-                if len(full_mask.shape) == 2: # only one output class
-                    if dtype == 'int':
-                        segmentation_masks[classNames[0]] = (full_mask * 255).astype(np.uint8)
-                    elif dtype == 'float':
-                        segmentation_masks[classNames[0]] = full_mask
-                    else:
-                        raise ValueError("'dtype' must be 'float' or 'int'")
-                else: # multiple output classes
-                    for class_index in range(len(classNames)):
-                        if dtype == 'int':
-                            segmentation_masks[classNames[class_index]] = (full_mask[class_index,...] * 255).astype(np.uint8)
-                        elif dtype == 'float':
-                            segmentation_masks[classNames[class_index]] = full_mask[class_index,...]
-                        else:
-                            raise ValueError("'dtype' must be 'float' or 'int'")
-
-                self.appendTag(tileAddress, 'segmenterInferencePrediction', segmentation_masks)
-                segmenterPredictionTileAddresses.append(tileAddress)
+                batch_masks = batch_probs.float().cpu().numpy()
+
+            if store is None:
+                storeFolder = predictionStoreFolder if predictionStoreFolder else tempfile.mkdtemp(prefix='pathml-predictions-')
+                store = PredictionStore(storeFolder, classNames=classNames, tileShape=batch_masks.shape[2:], dtype='uint8' if dtype == 'int' else 'float32')
+            indices = store.write(batch_masks)
+            xs = np.array([tileAddress[0] for tileAddress in tileAddresses])
+            ys = np.array([tileAddress[1] for tileAddress in tileAddresses])
+            storeIndices[ys, xs] = indices
+            predicted[ys, xs] = True
+            for class_index, className in enumerate(classNames):
+                meanProbabilities[className][ys, xs] = means[:, class_index]
+            segmenterPredictionTileAddresses.extend(tileAddresses)
+
+        if store is not None:
+            store.flush()
+            # predictions of an earlier inference outside of the tiles inferred on now would point into the wrong store
+            self.tileDictionary.removeColumn('segmenterInferencePrediction')
+            self.tileDictionary.removeColumn('segmenterInferenceIndex')
+            self.tileDictionary.setColumn('segmenterInferenceIndex', storeIndices, mask=predicted)
+            self.tileDictionary.setColumn('segmenterInferencePrediction', meanProbabilities, mask=predicted)
+            self.segmenterPredictionStore = store
+            self.__removeTemporaryPredictionStore()
+            self.__temporaryPredictionStore = None if predictionStoreFolder else storeFolder
 
         if len(segmenterPredictionTileAddresses) > 0:
             self.segmenterPredictionTileAddresses = segmenterPredictionTileAddresses
         else:
             raise Warning('No suitable tiles found at current tissueLevelThreshold and foregroundLevelThreshold')
 
-    def getNonOverlappingSegmentationInferenceArray(self, className, aggregationMethod='mean', probabilityThreshold=None, dtype='int', folder=os.getcwd(), verbose=False):#, fillUninferredPixelsWithZeros=True):
+    def getSegmenterPrediction(self, tileAddress, className):
+        """A function that returns the pixel-wise segmentation prediction of one
+        tile and class from :meth:`Slide.inferSegmenter() <pathml.slide.Slide.inferSegmenter>`, read from the Slide's
+        prediction store (or from the tile dictionary of Slides saved by older
+        versions of PathML).
+
+        Args:
+            tileAddress (Tuple[int, int]): the tile dictionary address of the tile
+            className (str): the class to return the prediction of
+
+        Returns:
+            np.ndarray: the (tile height, tile width) prediction, as 0-255 numpy.uint8 or 0-1 numpy.float32 values depending on the dtype inferSegmenter() was called with
+
+        Example:
+            tumor_prediction = pathml_slide.getSegmenterPrediction((10, 12), 'tumor')
+        """
+
+        if not self.tileDictionary.hasValue(tileAddress, 'segmenterInferencePrediction'):
+            raise ValueError('No segmentation prediction exists at tile '+str(tileAddress)+'. Run inferSegmenter() to add them.')
+        if className not in self.tileDictionary[tileAddress]['segmenterInferencePrediction']:
+            raise ValueError(className+' not present in segmentation predictions.')
+        if self.tileDictionary.hasValue(tileAddress, 'segmenterInferenceIndex'):
+            if not hasattr(self, 'segmenterPredictionStore'):
+                raise PermissionError('The prediction store of the segmentation predictions of this Slide is missing')
+            store = self.segmenterPredictionStore
+            return store.read(self.tileDictionary[tileAddress]['segmenterInferenceIndex'])[store.classNames.index(className)]
+        return self.tileDictionary[tileAddress]['segmenterInferencePrediction'][className]
+
+    def getNonOverlappingSegmentationInferenceArray(self, className, aggregationMethod='mean', probabilityThreshold=None, dtype='int', folder=os.getcwd(), verbose=False, level=False, outputFormats=['npz'], stitchingFolder=False, chunkSize=1024):#, fillUninferredPixelsWithZeros=True):
         """A function to extract the pixel-wise inference result
-        (from :meth:`Slide.inferClassifier() <pathml.slide.Slide.inferClassifier>`) of a Slide. Tile overlap is "stitched
-        together" to produce one mask with the same pixel dimensions as the WSI.
-        The resulting mask will be saved to a .npz file as a scipy.sparse.lil_matrix.
+        (from :meth:`Slide.inferSegmenter() <pathml.slide.Slide.inferSegmenter>`) of a Slide. Tile overlap is "stitched
+        together" to produce one mask covering the WSI at the pyramid level
+        requested, with a :class:`SegmentationStitcher <pathml.stitcher.SegmentationStitcher>` that accumulates the
+        tiles in disk-backed memory-mapped arrays in spatial order, so that even
+        level 0 masks are stitched in bounded memory. The resulting mask is
+        streamed to <slide id>.npz (holding the mask as 'inference' and its
+        downsample relative to the Slide's level as 'downsample') and/or to a
+        tiled pyramidal 8-bit TIFF <slide id>.tif.
 
         Args:
-            className (str): the name of the class to extract the binary mask for. Must be present in the tile dictionary from :meth:`Slide.inferClassifier() <pathml.slide.Slide.inferClassifier>`.
-            aggregationMethod (str, optional): the method used to combine inference results on a pixel when two inference tiles overlap on that pixel. Default is 'mean' and no other options are currently supported.
+            className (str): the name of the class to extract the binary mask for. Must be present in the tile dictionary from :meth:`Slide.inferSegmenter() <pathml.slide.Slide.inferSegmenter>`.
+            aggregationMethod (str, optional): the method used to combine inference results on a pixel when two inference tiles overlap on that pixel: 'mean', 'max', or 'gaussian' for a mean weighted towards the centers of the tiles. Default is 'mean'.
             probabilityThreshold (float, optional): if defined, this is used as the cutoff above which a pixel is considered part of the class className. This will result in a binary mask of Trues and Falses being created. Default is to return a mask of 0-255 int predictions.
-            dtype (str, optional): the data type to store in the output matrix. Options are 'int' for numpy.uint8 (the default), 'float' for numpy.float32. To get a Boolean output using a probability threshold, set a value for probabilityThreshold.
-            folder (str, optional): the path to the directory where the scipy.sparse.lil_matrix will be saved. Default is the current working directory.
+            dtype (str, optional): the data type to store in the output .npz file. Options are 'int' for numpy.uint8 (the default), 'float' for numpy.float32. To get a Boolean output using a probability threshold, set a value for probabilityThreshold.
+            folder (str, optional): the path to the directory where the mask will be saved. Default is the current working directory.
             verbose (Bool, optional): whether to output verbose messages. Default is False.
+            level (int, optional): the level of the WSI pyramid to stitch the mask at. Default is the level of the Slide.
+            outputFormats (list of str, optional): the files to write: 'npz' and/or 'tiff'. Default is ['npz'].
+            stitchingFolder (str, optional): the directory to keep the memory-mapped stitching arrays in, which must have room for two float32 arrays the size of the mask. Default is a temporary directory.
+            chunkSize (int, optional): the number of rows of the mask written at a time. Default is 1024.
 
         Example:
-            pathml_slide.getNonOverlappingSegmentationInferenceArray('metastasis', folder='path/to/folder')
+            pathml_slide.getNonOverlappingSegmentationInferenceArray('metastasis', folder='path/to/folder', level=1, outputFormats=['npz', 'tiff'])
         """
 
-        if dtype == 'int':
-            inference_array = sps.lil_matrix((self.slide.height, self.slide.width), dtype=np.uint8)
-        elif dtype == 'float':
-            inference_array = sps.lil_matrix((self.slide.height, self.slide.width), dtype=np.float32)
-        else:
+        if dtype not in ['int', 'float']:
             raise ValueError("dtype must be 'int' or 'float'")
-
-        # count number of times each pixel in inference tiles
-        inference_pixel_counts_array = sps.lil_matrix((self.slide.height, self.slide.width), dtype=np.uint8)
-
-        num_merged_tiles = 0
-
-        for tileAddress in self.iterateTiles():
-            if 'segmenterInferencePrediction' in self.tileDictionary[tileAddress]:
-                if className in self.tileDictionary[tileAddress]['segmenterInferencePrediction']:
-                    tile_x = self.tileDictionary[tileAddress]['x']
-                    tile_y = self.tileDictionary[tileAddress]['y']
-
-                    tile_prediction = self.tileDictionary[tileAddress]['segmenterInferencePrediction'][className]
-
-                    if dtype == 'int':
-                        if np.max(tile_prediction) <= 1:
-                            tile_prediction = tile_prediction * 255
-                            tile_prediction = tile_prediction.astype(np.uint8)
-                    if dtype == 'float':
-                        if np.max(tile_prediction) > 1:
-                            tile_prediction = tile_prediction / 255
-
-                    inference_subarray = inference_array[tile_y:tile_y+self.tileSize, tile_x:tile_x+self.tileSize]
-                    inference_subarray = inference_subarray.toarray()
-
-                    if aggregationMethod == 'mean':
-                        new_inference_subarray = inference_subarray + tile_prediction
-                    else:
-                        raise ValueError("aggregationMethod must be 'mean'")
-
-                    new_inference_subarray[inference_subarray == 0] = tile_prediction[inference_subarray == 0]
-                    new_inference_subarray = new_inference_subarray.astype(np.uint8)
-
-                    inference_array[tile_y:tile_y+self.tileSize, tile_x:tile_x+self.tileSize] = new_inference_subarray
-                    inference_pixel_counts_array[tile_y:tile_y+self.tileSize, tile_x:tile_x+self.tileSize] = inference_pixel_counts_array[tile_y:tile_y+self.tileSize, tile_x:tile_x+self.tileSize].toarray() + 1
-
-                    num_merged_tiles = num_merged_tiles + 1
-                    if verbose: print('Number of tiles merged:', num_merged_tiles)
-                else:
-                    raise ValueError(className+' not present in segmentation predictions.')
-
-        # Now take the average of each pixel for how many times it appeared
-        inference_array = sps.lil_matrix(inference_array / inference_pixel_counts_array, dtype=np.uint8)
-
-        if num_merged_tiles == 0:
+        if type(outputFormats) == str:
+            outputFormats = [outputFormats]
+        for outputFormat in outputFormats:
+            if outputFormat not in ['npz', 'tiff']:
+                raise ValueError("outputFormats must contain only 'npz' or 'tiff'")
+        if level is False:
+            level = self.level
+        downsample = self.slide.width / self.levels[level].width
+
+        predictionTileAddresses = self.tileDictionary.addresses(self.tileDictionary.getMask('segmenterInferencePrediction'))
+        if len(predictionTileAddresses) == 0:
             raise ValueError('No tiles found with segmentation predictions. Run inferSegmenter() to add them.')
 
-        if probabilityThreshold:
-            # note: this gets rid of NaN and turns them into False
-            with np.errstate(invalid='ignore'):
-                if dtype == 'int':
-                    inference_array = inference_array > (probabilityThreshold * 255)
-                else:
-                    inference_array = inference_array > probabilityThreshold
+        with SegmentationStitcher(self.slide.height, self.slide.width, downsample=downsample, aggregationMethod=aggregationMethod, folder=stitchingFolder, chunkSize=chunkSize) as stitcher:
+            # tile addresses are in row-major order, so the memory-mapped arrays are filled in spatial order
+            for tileAddress in predictionTileAddresses:
+                tile_prediction = self.getSegmenterPrediction(tileAddress, className)
+                if np.issubdtype(tile_prediction.dtype, np.integer):
+                    tile_prediction = tile_prediction / 255
+                stitcher.add(self.tileDictionary[tileAddress]['x'], self.tileDictionary[tileAddress]['y'], tile_prediction)
+                if verbose: print('Number of tiles merged:', stitcher.numTiles)
 
-        sps.save_npz(os.path.join(folder, self.slideFileId+'.npz'), inference_array)
+            if 'npz' in outputFormats:
+                stitcher.save(os.path.join(folder, self.slideFileId+'.npz'), dtype=dtype, probabilityThreshold=probabilityThreshold)
+            if 'tiff' in outputFormats:
+                stitcher.saveTiff(os.path.join(folder, self.slideFileId+'.tif'), probabilityThreshold=probabilityThreshold)
 
     def getTileDiceScore(self, tileAddress, className, pixelBinarizationThreshold=0.5):
         """A function that returns the Dice coefficient by comparing the tile's
@@ -2448,43 +2602,31 @@ class Slide:
         if className not in self.tileDictionary[tileAddress]['segmenterInferencePrediction']:
             raise PermissionError(className+' is not a class present in segmenterInferencePrediction.')
 
-        binarized_prediction_mask = (torch.from_numpy(self.tileDictionary[tileAddress]['segmenterInferencePrediction'][className]) > pixelBinarizationThreshold).float()
+        tile_prediction = self.getSegmenterPrediction(tileAddress, className)
+        if np.issubdtype(tile_prediction.dtype, np.integer):
+            tile_prediction = tile_prediction / 255
+        binarized_prediction_mask = (torch.from_numpy(tile_prediction) > pixelBinarizationThreshold).float()
         # we set acceptTilesWithoutClass to True so that we will get blank masks for negative slides
-        ground_truth_mask = torch.from_numpy(self.getAnnotationTileMask(tileAddress, className, writeToNumpy=True, acceptTilesWithoutClass=True)).float()
-        if np.max(ground_truth_mask) > 1:
-            ground_truth_mask = ground_truth_mask / 255
-        ground_truth_mask = torch.div(ground_truth_mask, 255) # getAnnotationTileMask outputs 0-255 arrays, so we need to normalize to be 0-1 range
+        # getAnnotationTileMask outputs 0-255 arrays (or 0-1 blank masks), so any positive pixel is ground truth positive
+        ground_truth_mask = torch.from_numpy(self.getAnnotationTileMask(tileAddress, className, writeToNumpy=True, acceptTilesWithoutClass=True) > 0).float()
 
-        return dice_coeff(binarized_prediction_mask, ground_truth_mask).item()
+        return dice_coeff(binarized_prediction_mask.unsqueeze(0), ground_truth_mask.unsqueeze(0)).item()
 
     def slideLevelClassPrediction(self, classes, classWeights=None, method='avg'):
         # classes: list of str
         # classWeights: list of float in the order of classes
         
-        foundPrediction = False
-        classPredictions={}
-        for c in classes:
-            classPredictions[c]=0
-        #evalTileCount = 0
-        for tileAddress, tileEntry in self.tileDictionary.items():
-            if 'classifierInferencePrediction' in tileEntry:
-                #evalTileCount+=1
-                tilePrediction={}
-                for c in classes:
-                    if c in tileEntry['classifierInferencePrediction']:
-                        tilePrediction[c] = tileEntry['classifierInferencePrediction'][c]
-                        foundPrediction = True
-                    else:
-                        raise ValueError(c+' not in classifierInferencePrediction')
-                if method=='max':
-                    c = max(tilePrediction, key=tilePrediction.get)
-                    classPredictions[c] += 1
-                if method=='avg':
-                    for c in classes:
-                        classPredictions[c] += tilePrediction[c]
+        tilePredictions = self._classifierPredictionArray(classes)
 
-        if not foundPrediction:
-            raise ValueError('No predictions found in slide. Use inferClassifier() to generate them.')
+        classPredictions={}
+        if method=='max':
+            counts = np.bincount(np.argmax(tilePredictions, axis=1), minlength=len(classes))
+            classPredictions = {c: int(count) for c, count in zip(classes, counts)}
+        elif method=='avg':
+            sums = tilePredictions.sum(axis=0)
+            classPredictions = {c: float(sm) for c, sm in zip(classes, sums)}
+        else:
+            classPredictions = {c: 0 for c in classes}
         
         if classWeights:
             for c, w in zip(classes,classWeights):
@@ -2497,43 +2639,25 @@ class Slide:
     def patchLevelMaxClassPrediction(self, classes):
         # classes: list of str
         # classWeights: list of float in the order of classes
-        foundPrediction = False
-        pred=[]
-        for tileAddress, tileEntry in self.tileDictionary.items():
-            if 'classifierInferencePrediction' in tileEntry:
-                tilePrediction={}
-                for c in classes:
-                    if c in tileEntry['classifierInferencePrediction']:
-                        tilePrediction[c] = tileEntry['classifierInferencePrediction'][c]
-                        foundPrediction = True
-                    else:
-                        raise ValueError(c+' not in classifierInferencePrediction')
-                c = max(tilePrediction, key=tilePrediction.get)
-                pred.append(c)
-
-        if not foundPrediction:
-            raise ValueError('No predictions found in slide. Use inferClassifier() to generate them.')
-
-        return pred
+        tilePredictions = self._classifierPredictionArray(classes)
+        return [classes[i] for i in np.argmax(tilePredictions, axis=1)]
 
     def patchLevelOneClassPrediction(self, oneClass):
         # classes: list of str
         # classWeights: list of float in the order of classes
-        foundPrediction = False
-        pred=[]
-        for tileAddress, tileEntry in self.tileDictionary.items():
-            if 'classifierInferencePrediction' in tileEntry:
-                if oneClass in tileEntry['classifierInferencePrediction']:    
-                    tilePrediction=tileEntry['classifierInferencePrediction'][oneClass]
-                    foundPrediction = True
-                else:
-                    raise ValueError(oneClass+' not in classifierInferencePrediction')
-                pred.append(tilePrediction)
+        return self._classifierPredictionArray([oneClass])[:, 0].tolist()
 
-        if not foundPrediction:
+    # Returns an (n tiles, n classes) array of the classifier predictions of all tiles with predictions, in tile dictionary order
+    def _classifierPredictionArray(self, classes):
+        predicted = self.tileDictionary.getMask('classifierInferencePrediction')
+        if not predicted.any():
             raise ValueError('No predictions found in slide. Use inferClassifier() to generate them.')
-
-        return pred
+        tilePredictions = np.zeros((int(predicted.sum()), len(classes)))
+        for i, c in enumerate(classes):
+            if not self.tileDictionary.getMask('classifierInferencePrediction', c)[predicted].all():
+                raise ValueError(c+' not in classifierInferencePrediction')
+            tilePredictions[:, i] = self.tileDictionary.getColumn('classifierInferencePrediction', c)[predicted]
+        return tilePredictions
 
     def numTilesAboveClassPredictionThreshold(self, classToThreshold, probabilityThresholds):
         """A function to return the number of tiles at or above one or a list of
@@ -2551,18 +2675,6 @@ class Slide:
             pathml_slide.numTilesAboveClassPredictionThreshold('tumor', [0.85, 0.9, 0.95])
         """
 
-        if not hasattr(self, 'classifierPredictionTileAddresses'):
-            foundPrediction = False
-            classifierPredictionTileAddresses = []
-            for tileAddress, tileEntry in self.tileDictionary.items():
-                if 'classifierInferencePrediction' in tileEntry:
-                    classifierPredictionTileAddresses.append(tileAddress)
-                    foundPrediction = True
-            if foundPrediction:
-                self.classifierPredictionTileAddresses = classifierPredictionTileAddresses
-            else:
-                raise ValueError('No predictions found in slide. Use inferClassifier() to generate them.')
-
         if type(probabilityThresholds) in [float, int]:
             pT = [probabilityThresholds]
         elif type(probabilityThresholds) == list:
@@ -2570,15 +2682,7 @@ class Slide:
         else:
             raise ValueError('probabilityThresholds must be an int, float, or list of ints or floats')
 
-        numTilesAboveProbThreshList = []
-        for probabilityThreshold in pT:
-            numTilesAboveProbThresh = 0
-            for addr in self.classifierPredictionTileAddresses:
-                if classToThreshold not in self.tileDictionary[addr]['classifierInferencePrediction']:
-                    raise ValueError(classToVisualize+' not in classifierInferencePrediction at tile '+str(addr))
-                if self.tileDictionary[addr]['classifierInferencePrediction'][classToThreshold] >= probabilityThreshold:
-                    numTilesAboveProbThresh = numTilesAboveProbThresh + 1
-            numTilesAboveProbThreshList.append(numTilesAboveProbThresh)
+        numTilesAboveProbThreshList = ThresholdSweep(self._classifierPredictionArray([classToThreshold])[:, 0]).numAtOrAbove(pT).tolist()
 
         if len(numTilesAboveProbThreshList) > 1:
             return numTilesAboveProbThreshList
@@ -2594,7 +2698,8 @@ class Slide:
         to each tile in the tile dictionary by addAnnotations(). Class probability
         labels are expected to have been added to each tile in the tile dictionary
         by :meth:`Slide.inferClassifier() <pathml.slide.Slide.inferClassifier>`. Metrics include 'accuracy', 'balanced_accuracy',
-        'f1', 'precision', or 'recall'.
+        'f1', 'precision', or 'recall'. All thresholds are evaluated in one pass
+        over the sorted predictions (see :meth:`Slide.classifierThresholdSweep() <pathml.slide.Slide.classifierThresholdSweep>`).
 
         Args:
             classToThreshold (str): the class to threshold the tiles by. The class must be already present in the tile dictionary from :meth:`Slide.inferClassifier() <pathml.slide.Slide.inferClassifier>`.
@@ -2610,21 +2715,8 @@ class Slide:
             pathml_slide.classifierMetricAtThreshold('tumor', [0.85, 0.9, 0.95], metric='balanced_accuracy')
         """
 
-        if not hasattr(self, 'classifierPredictionTileAddresses'):
-            foundPrediction = False
-            classifierPredictionTileAddresses = []
-            for tileAddress, tileEntry in self.tileDictionary.items():
-                if 'classifierInferencePrediction' in tileEntry:
-                    classifierPredictionTileAddresses.append(tileAddress)
-                    foundPrediction = True
-            if foundPrediction:
-                self.classifierPredictionTileAddresses = classifierPredictionTileAddresses
-            else:
-                raise ValueError('No classification predictions found in Slide. Use inferClassifier() to generate them.')
-
-        if not self.hasAnnotations():
-            print('Warning: no annotations found in Slide. All tiles in Slide will be assumed to be negative for '+classToThreshold+". Run addAnnotations() if there should be annotations in this Slide.")
-
+        if metric not in ['accuracy', 'balanced_accuracy', 'f1', 'precision', 'recall']:
+            raise ValueError("metric must be one of: 'accuracy', 'balanced_accuracy', 'f1', 'precision', or 'recall'")
         if type(probabilityThresholds) in [float, int]:
             pT = [probabilityThresholds]
         elif type(probabilityThresholds) == list:
@@ -2632,49 +2724,53 @@ class Slide:
         else:
             raise ValueError('probabilityThresholds must be an int, float, or list of ints or floats')
 
-        metrics = []
-
-        for probabilityThreshold in pT:
-            ground_truths = []
-            predictions = []
-            for predictionTileAddress in self.classifierPredictionTileAddresses:
-
-                if classToThreshold+'Overlap' not in self.tileDictionary[predictionTileAddress]:
-                    if assignZeroToTilesWithoutAnnotationOverlap:
-                        ground_truths.append(0)
-                    else:
-                        raise ValueError(classToThreshold+' not found at tile '+str(predictionTileAddress))
-                elif self.tileDictionary[predictionTileAddress][classToThreshold+'Overlap'] >= tileAnnotationOverlapThreshold:
-                    ground_truths.append(1)
-                else:
-                    ground_truths.append(0)
-
-                if classToThreshold not in self.tileDictionary[predictionTileAddress]['classifierInferencePrediction']:
-                    raise ValueError(classToVisualize+' not in classifierInferencePrediction at tile '+str(predictionTileAddress))
-                if self.tileDictionary[predictionTileAddress]['classifierInferencePrediction'][classToThreshold] >= probabilityThreshold:
-                    predictions.append(1)
-                else:
-                    predictions.append(0)
-
-            if metric == "accuracy":
-                metrics.append(accuracy_score(ground_truths, predictions))
-            elif metric == "balanced_accuracy":
-                metrics.append(balanced_accuracy_score(ground_truths, predictions))
-            elif metric == "f1":
-                metrics.append(f1_score(ground_truths, predictions))
-            elif metric == "precision":
-                metrics.append(precision_score(ground_truths, predictions))
-            elif metric == "recall":
-                metrics.append(recall_score(ground_truths, predictions))
-            else:
-                raise ValueError("metric must be one of: 'accuracy', 'balanced_accuracy', 'f1', 'precision', or 'recall'")
+        metrics = self.classifierThresholdSweep(classToThreshold, tileAnnotationOverlapThreshold=tileAnnotationOverlapThreshold,
+            assignZeroToTilesWithoutAnnotationOverlap=assignZeroToTilesWithoutAnnotationOverlap).metric(metric, pT).tolist()
 
         if len(metrics) > 1:
             return metrics
         else:
             return metrics[0]
 
-    def segmenterMetricAtThreshold(self, classToThreshold, probabilityThresholds, metric="dice_coeff"):
+    def classifierThresholdSweep(self, classToThreshold, tileAnnotationOverlapThreshold=0.5, assignZeroToTilesWithoutAnnotationOverlap=True):
+        """A function that returns the classification predictions of a class
+        from :meth:`Slide.inferClassifier() <pathml.slide.Slide.inferClassifier>` and their ground truth from addAnnotations(),
+        where a tile with ground truth annotation overlap greater than or equal
+        to tileAnnotationOverlapThreshold is considered to be ground truth
+        positive for that class, as a :class:`ThresholdSweep <pathml.thresholdsweep.ThresholdSweep>`. The sweep
+        gives the classifier's metrics at any number of thresholds, its ROC and
+        precision-recall curves, and can be combined with the sweeps of other
+        Slides to evaluate the classifier across a dataset.
+
+        Args:
+            classToThreshold (str): the class to threshold the tiles by. The class must be already present in the tile dictionary from :meth:`Slide.inferClassifier() <pathml.slide.Slide.inferClassifier>`.
+            tileAnnotationOverlapThreshold (float, optional): the class annotation overlap threshold at or above which a tile is considered ground truth positive for that class. Default is 0.5.
+            assignZeroToTilesWithoutAnnotationOverlap (Bool, optional): whether to consider tiles that lack an overlap with classToThreshold in the ground truth annotations ground truth negative (or else throw an error). Default is True.
+
+        Returns:
+            pathml.thresholdsweep.ThresholdSweep: the sweep of the Slide's tiles with classification predictions
+
+        Example:
+            sweep = ThresholdSweep.combine([pathml_slide.classifierThresholdSweep('tumor') for pathml_slide in pathml_slides])
+        """
+
+        if not self.hasAnnotations():
+            print('Warning: no annotations found in Slide. All tiles in Slide will be assumed to be negative for '+classToThreshold+". Run addAnnotations() if there should be annotations in this Slide.")
+
+        predicted = self.tileDictionary.getMask('classifierInferencePrediction')
+        scores = self._classifierPredictionArray([classToThreshold])[:, 0]
+
+        overlapKey = classToThreshold+'Overlap'
+        hasOverlap = self.tileDictionary.getMask(overlapKey)[predicted]
+        if not hasOverlap.all() and not assignZeroToTilesWithoutAnnotationOverlap:
+            raise ValueError(classToThreshold+' not found at tile '+str(self.tileDictionary.addresses(predicted)[int(np.argmin(hasOverlap))]))
+        labels = np.zeros(len(scores), dtype=bool)
+        if hasOverlap.any():
+            labels[hasOverlap] = self.tileDictionary.getColumn(overlapKey)[predicted][hasOverlap] >= tileAnnotationOverlapThreshold
+
+        return ThresholdSweep(scores, labels)
+
+    def segmenterMetricAtThreshold(self, classToThreshold, probabilityThresholds, metric="dice_coeff", pooled=False):
         """A function to return the pixel-level metric of a class probability
         threshold (or list of thresholds) compared to the ground truth, where a
         pixel with ground truth annotation overlap greater than or equal to
@@ -2682,32 +2778,33 @@ class Slide:
         for that class. Ground truth annotations are expected to have been added
         to each tile in the tile dictionary by addAnnotations(). Class probability
         labels are expected to have been added to each tile in the tile dictionary
-        by inferSegmenter(). The only metric currently available is the Dice
-        coefficient. The metric will be applied to all tiles with predictions
+        by inferSegmenter(). Metrics include the Dice coefficient ('dice_coeff'),
+        'iou', 'precision', or 'recall'. The metric will be applied to all tiles with predictions
         added by :meth:`Slide.inferSegmenter() <pathml.slide.Slide.inferSegmenter>` and the average of that metric across those
         tiles will be returned to give one metric per slide per threshold in
-        probabilityThresholds.
+        probabilityThresholds. Each tile is read once and evaluated at every
+        threshold with a :class:`PixelThresholdSweep <pathml.pixelthresholdsweep.PixelThresholdSweep>`, in memory that does not
+        grow with the number of tiles.
 
         Args:
             classToThreshold (str): the class to threshold the pixels by. The class must be already present in the tile dictionary from :meth:`Slide.inferSegmenter() <pathml.slide.Slide.inferSegmenter>`.
             probabilityThresholds (float or list of floats): the probability threshold or list of probability thresholds (in the range 0 to 1) to check. If a float is provided, just that probability threshold will be used, and a float of the accuracy of the segmenter using that threshold as when the model considered a pixel positive for the class will be returned. If a list of floats is provided, a list of floats of accuracies for those thresholds will be returned in respective order the inputted threshold list will be returned.
-            metric (str, optional): which metric to compute. The only option currently available is 'dice_coeff'. Default is 'dice_coeff'.
+            metric (str, optional): which metric to compute. Options are 'dice_coeff', 'iou', 'precision', or 'recall'. Default is 'dice_coeff'.
+            pooled (Bool, optional): whether to compute the metric from the pixels of all tiles pooled together rather than averaging the metric of each tile. Default is False.
 
         Returns:
-            float: The Dice coefficient performance of the Slide's tiles at the specified threshold; if several thresholds are provided, a list of performance values corresponding to the inputted list of thresholds will be returned instead
+            float: The metric performance of the Slide's tiles at the specified threshold; if several thresholds are provided, a list of performance values corresponding to the inputted list of thresholds will be returned instead
 
         Example:
             pathml_slide.segmenterMetricAtThreshold('tumor', [0.85, 0.9, 0.95])
         """
 
+        if metric not in ['dice_coeff', 'iou', 'precision', 'recall']:
+            raise ValueError("metric must be one of: 'dice_coeff', 'iou', 'precision', or 'recall'")
+
         if not hasattr(self, 'segmenterPredictionTileAddresses'):
-            foundPrediction = False
-            segmenterPredictionTileAddresses = []
-            for tileAddress, tileEntry in self.tileDictionary.items():
-                if 'segmenterInferencePrediction' in tileEntry:
-                    segmenterPredictionTileAddresses.append(tileAddress)
-                    foundPrediction = True
-            if foundPrediction:
+            segmenterPredictionTileAddresses = self.tileDictionary.addresses(self.tileDictionary.getMask('segmenterInferencePrediction'))
+            if len(segmenterPredictionTileAddresses) > 0:
                 self.segmenterPredictionTileAddresses = segmenterPredictionTileAddresses
             else:
                 raise ValueError('No segmentation predictions found in Slide. Use inferSegmenter() to generate them.')
@@ -2722,73 +2819,48 @@ class Slide:
         else:
             raise ValueError('probabilityThresholds must be an int, float, or list of ints or floats')
 
-        metrics = []
-        ground_truth_masks_np = []
-
-        if metric == 'dice_coeff':
-            for predictionTileAddress in self.segmenterPredictionTileAddresses:
-                ground_truth_masks_np.append(self.getAnnotationTileMask(predictionTileAddress, classToThreshold, writeToNumpy=True, acceptTilesWithoutClass=True))
-
-            for probabilityThreshold in pT:
-                dice_scores_at_threshold = []
-                for i, predictionTileAddress in enumerate(self.segmenterPredictionTileAddresses):
-                    inf_tile = self.tileDictionary[predictionTileAddress]['segmenterInferencePrediction'][classToThreshold]
-                    if np.max(inf_tile) > 1:
-                        inf_tile = inf_tile / 255
-                    binarized_prediction_mask = (torch.from_numpy(inf_tile) > probabilityThreshold).float()
-                    ground_truth_mask_torch = torch.div(torch.from_numpy(ground_truth_masks_np[i]).float(), 255)
-                    dice_scores_at_threshold.append(dice_coeff(binarized_prediction_mask, ground_truth_mask_torch).item())
-
-                print("Mean Dice score at threshold "+str(probabilityThreshold)+":", np.mean(dice_scores_at_threshold))
-                metrics.append(np.mean(dice_scores_at_threshold))
+        sweep = PixelThresholdSweep(pT)
+        for predictionTileAddress in self.segmenterPredictionTileAddresses:
+            sweep.add(self.getSegmenterPrediction(predictionTileAddress, classToThreshold),
+                      self.getAnnotationTileMask(predictionTileAddress, classToThreshold, writeToNumpy=True, acceptTilesWithoutClass=True))
+        metrics = sweep.metric(metric, pooled=pooled).tolist()
 
-        else:
-            raise ValueError("metric must be one of: 'dice_coeff'")
+        for probabilityThreshold, value in zip(pT, metrics):
+            print(("Pooled " if pooled else "Mean ")+metric+" at threshold "+str(probabilityThreshold)+":", value)
 
         if len(metrics) > 1:
             return metrics
         else:
             return metrics[0]
 
-    def checkTissueDetection(self, tissueLevelThreshold, tissueDetectionLevel=1, batchSize=20, numWorkers=16, modelStateDictPath='../pathml/pathml/models/deep-tissue-detector_densenet_state-dict.pt', architecture='densenet'):
+    def checkTissueDetection(self, tissueLevelThreshold, tissueDetectionLevel=1, batchSize=20, numWorkers=16, modelStateDictPath='../pathml/pathml/models/deep-tissue-detector_densenet_state-dict.pt', architecture='densenet', optimizeTissueDetector=False, quantizeTissueDetector=False):
         #example: pathml_slide.checkTissueDetection(tissueLevelThreshold, numWorkers=numWorkers, tissueDetectionLevel=tissueLevel, batchSize=batchSize)
         #import copy
 
         scale = self.slide.width/self.levels[tissueDetectionLevel].width
         tileSize = round(self.tileSize*scale)
-        tissueForegroundSlide = Slide(self.slideFilePath, level=self.level).setTileProperties(tileSize=self.tileSize, tileOverlap=self.tileOverlap/self.tileSize)#(tileSize-self.tileSize)/tileSize)
-        tissueForegroundSlide.levels =self.levels
-        for tileAddress in tissueForegroundSlide.iterateTiles():
-            tissueForegroundSlide.tileDictionary[tileAddress]['tissueLevel'] = self.tileDictionary[tileAddress]['tissueLevel']
-            tissueForegroundSlide.tileDictionary[tileAddress]['width'] = tileSize
-            tissueForegroundSlide.tileDictionary[tileAddress]['height'] = tileSize
-            new_x = round(tissueForegroundSlide.tileDictionary[tileAddress]['x']-(tileSize-self.tileSize)/2)
-            if new_x>=0:
-                if (new_x+tileSize)<=tissueForegroundSlide.slide.width:
-                    tissueForegroundSlide.tileDictionary[tileAddress]['x'] = new_x
-                else:
-                    tissueForegroundSlide.tileDictionary[tileAddress]['x'] = tissueForegroundSlide.slide.width-tileSize
-            new_y = round(tissueForegroundSlide.tileDictionary[tileAddress]['y']-(tileSize-self.tileSize)/2)
-            if new_y>=0:
-                if (new_y+tileSize)<=tissueForegroundSlide.slide.height:
-                    tissueForegroundSlide.tileDictionary[tileAddress]['y'] = new_y
-                else:
-                    tissueForegroundSlide.tileDictionary[tileAddress]['y'] = tissueForegroundSlide.slide.height-tileSize
+        # A view of this Slide's own tile grid whose tiles are enlarged around their centers to the field of view of tissueDetectionLevel
+        tissueForegroundSlide = self.tilingView(self.level, self.tileSize, self.tileOverlap/self.tileSize)
+        tileDictionary = tissueForegroundSlide.tileDictionary
+        shift = (tileSize-self.tileSize)/2
+        x = np.round(tileDictionary.getColumn('x')-shift).astype(np.int64)
+        y = np.round(tileDictionary.getColumn('y')-shift).astype(np.int64)
+        tileDictionary.setColumn('x', np.where(x >= 0, np.minimum(x, tissueForegroundSlide.slide.width-tileSize), tileDictionary.getColumn('x')))
+        tileDictionary.setColumn('y', np.where(y >= 0, np.minimum(y, tissueForegroundSlide.slide.height-tileSize), tileDictionary.getColumn('y')))
+        tileDictionary.setColumn('width', np.full(tileDictionary.shape, tileSize))
+        tileDictionary.setColumn('height', np.full(tileDictionary.shape, tileSize))
+        tileDictionary.setColumn('tissueLevel', self.tileDictionary.getColumn('tissueLevel'), mask=self.tileDictionary.getMask('tissueLevel'))
         tmpProcessor = Processor(tissueForegroundSlide)
-        tissueForegroundSlide = tmpProcessor.applyModel(tissueDetector(modelStateDictPath=modelStateDictPath, architecture=architecture), batch_size=batchSize, predictionKey='tissue_detector', numWorkers=numWorkers, tissueLevelThreshold=tissueLevelThreshold)#.adoptKeyFromTileDictionary(upsampleFactor=1)
+        tissueForegroundSlide = tmpProcessor.applyModel(tissueDetector(modelStateDictPath=modelStateDictPath, architecture=architecture, optimize=optimizeTissueDetector and not quantizeTissueDetector), batch_size=batchSize, predictionKey='tissue_detector', numWorkers=numWorkers, tissueLevelThreshold=tissueLevelThreshold, quantize=quantizeTissueDetector)#.adoptKeyFromTileDictionary(upsampleFactor=1)
 
-        n = 0
         map = np.zeros([self.numTilesInY, self.numTilesInX, 3])
-        #resize(self.rawTissueDetectionMap, np.zeros([self.numTilesInY, self.numTilesInX]).shape, order=0, anti_aliasing=False)
-
-        for address in tissueForegroundSlide.iterateTiles():
-            if 'tissue_detector' in tissueForegroundSlide.tileDictionary[address]:
-                if tissueForegroundSlide.tileDictionary[address]['tissue_detector'][2]<tissueLevelThreshold:
-                    #print(f"tile {address}: {tissueForegroundSlide.tileDictionary[address]['tissue_detector'][2]}<{tissueLevelThreshold}")
-                    n+=1
-                    map[address[1], address[0], 0] = 1#(tissueLevelThreshold-tissueForegroundSlide.tileDictionary[address]['tissue_detector'][2])/tissueLevelThreshold
-                else:
-                    map[address[1], address[0], 1] = 1.0
+        predicted = tileDictionary.getMask('tissue_detector')
+        errors = np.zeros(predicted.shape, dtype=bool)
+        if predicted.any():
+            errors = predicted & (tileDictionary.getColumn('tissue_detector')[:, :, 2] < tissueLevelThreshold)
+        map[:, :, 0][errors] = 1
+        map[:, :, 1][predicted & ~errors] = 1.0
+        n = int(errors.sum())
         from skimage.morphology import square, dilation
         map[:, :, 0] = dilation(map[:, :, 0], square(11))
         plt.figure()
@@ -2837,7 +2909,19 @@ class Slide:
     #    self.readPredMap(predictionMap, scale, out_keys)
 
 class Foreground:
-    
+    """A streaming foreground detector. The WSI pyramid level is read in
+    strips of stripHeight rows and converted to CIE lightness (the L channel
+    of rgb2lab) in float32, while a histogram of the lightness is built up
+    incrementally to find the Otsu and triangle thresholds. Per-tile
+    foreground levels are then computed with :meth:`Foreground.tileLevels()`,
+    so peak memory is bounded by the strip size rather than the level size.
+
+    Args:
+        slide (pathml.slide.Slide): the Slide to detect foreground on
+        level (int): the level of the WSI pyramid to detect foreground on
+        stripHeight (int, optional): the number of rows of the level to read at a time. Default is 256.
+    """
+
     __format_to_dtype = {
         'uchar': np.uint8,
         'char': np.int8,
@@ -2864,18 +2948,153 @@ class Foreground:
         'complex128': 'dpcomplex',
     }
 
-    def __init__(self, slide, level):
+    # sRGB to CIE XYZ luminance coefficients (D65), as used by skimage.color.rgb2lab
+    __luminanceCoefficients = np.array([0.212671, 0.715160, 0.072169], dtype=np.float32)
+    # linearized sRGB value of every 8-bit channel value
+    __linearTable = np.where(np.arange(256) / 255 > 0.04045, ((np.arange(256) / 255 + 0.055) / 1.055) ** 2.4, np.arange(256) / 255 / 12.92).astype(np.float32)
+    # number of histogram bins in [0, 100) used to accumulate lightness values
+    __histogramBins = 2**16
+
+    def __init__(self, slide, level, stripHeight=256):
+        if (type(stripHeight) != int) or (stripHeight <= 0):
+            raise ValueError('stripHeight must be an integer greater than 0')
         self.level = level
+        self.stripHeight = stripHeight
         # get low-level magnification
-        map = slide.levels[self.level]
-        map = np.ndarray(buffer=map.write_to_memory(),
-                        dtype=self.__format_to_dtype[map.format],
-                        shape=[map.height, map.width, map.bands])
-        map = rgb2lab(map[:, :, 0:3])[:, :, 0] #rgb2gray(map[:, :, 0:3]
-
-        self.thresholdLevelOtsu = float(threshold_otsu(map[map < 100]))  # Ignores all blank areas introduced by certain scanners
-        self.thresholdLevelTriangle = float(threshold_triangle(map[map < 100]))  # Ignores all blank areas introduced by certain scanners
-        otsuMap = map <= self.thresholdLevelOtsu
-        triangleMap = map <= self.thresholdLevelTriangle
-
-        self.map = np.stack((map,otsuMap,triangleMap), axis=2)
\ No newline at end of file
+        self.image = slide.levels[self.level]
+
+        histogram = np.zeros(self.__histogramBins, dtype=np.int64)
+        for top, lightness in self.__strips():
+            lightness = lightness[lightness < 100] # Ignores all blank areas introduced by certain scanners
+            histogram += np.bincount((lightness * (self.__histogramBins / 100)).astype(np.int64), minlength=self.__histogramBins)[:self.__histogramBins]
+        if not histogram.any():
+            raise ValueError('No pixels darker than pure white found at level '+str(level))
+
+        counts, binCenters = self.__rebin(histogram)
+        self.thresholdLevelOtsu = float(threshold_otsu(hist=(counts, binCenters)))
+        self.thresholdLevelTriangle = float(self.__thresholdTriangle(counts, binCenters))
+
+    def __luminance(self, rgb):
+        # Fused float32 version of rgb2lab(rgb)[..., 0]
+        if rgb.dtype == np.uint8:
+            table = self.__linearTable
+            luminance = table[rgb[..., 0]] * self.__luminanceCoefficients[0]
+            luminance += table[rgb[..., 1]] * self.__luminanceCoefficients[1]
+            luminance += table[rgb[..., 2]] * self.__luminanceCoefficients[2]
+        else:
+            values = rgb.astype(np.float32)
+            if np.issubdtype(rgb.dtype, np.integer):
+                values /= np.iinfo(rgb.dtype).max
+            values = np.where(values > 0.04045, ((values + 0.055) / 1.055) ** 2.4, values / 12.92)
+            luminance = values @ self.__luminanceCoefficients
+        return np.where(luminance > 0.008856, 116 * np.cbrt(luminance) - 16, 903.3 * luminance).astype(np.float32)
+
+    def __strips(self):
+        # Yields (top row, lightness strip) pairs covering the whole level
+        for top in range(0, self.image.height, self.stripHeight):
+            height = min(self.stripHeight, self.image.height - top)
+            strip = self.image.crop(0, top, self.image.width, height)
+            strip = np.ndarray(buffer=strip.write_to_memory(),
+                               dtype=self.__format_to_dtype[strip.format],
+                               shape=[strip.height, strip.width, strip.bands])
+            yield top, self.__luminance(strip[:, :, 0:3])
+
+    def __rebin(self, histogram):
+        # Reduces the fine lightness histogram to the 256 bins spanning the
+        # data range that skimage's threshold functions would use
+        binWidth = 100 / self.__histogramBins
+        fineCenters = (np.arange(self.__histogramBins) + 0.5) * binWidth
+        low, high = fineCenters[np.flatnonzero(histogram)[[0, -1]]]
+        if low == high:
+            return histogram[histogram > 0], np.array([low])
+        edges = np.linspace(low, high, 257)
+        coarse = np.clip(np.searchsorted(edges, fineCenters, side='right') - 1, 0, 255)
+        counts = np.bincount(coarse[histogram > 0], weights=histogram[histogram > 0], minlength=256).astype(np.int64)
+        return counts, (edges[:-1] + edges[1:]) / 2
+
+    @staticmethod
+    def __thresholdTriangle(hist, binCenters):
+        # The triangle algorithm of skimage.filters.threshold_triangle on a precomputed histogram
+        nbins = len(hist)
+        argPeakHeight = np.argmax(hist)
+        peakHeight = hist[argPeakHeight]
+        argLowLevel, argHighLevel = np.flatnonzero(hist)[[0, -1]]
+        if argLowLevel == argHighLevel:
+            return binCenters[argLowLevel]
+
+        flip = argPeakHeight - argLowLevel < argHighLevel - argPeakHeight
+        if flip:
+            hist = hist[::-1]
+            argLowLevel = nbins - argHighLevel - 1
+            argPeakHeight = nbins - argPeakHeight - 1
+
+        width = argPeakHeight - argLowLevel
+        x1 = np.arange(width)
+        y1 = hist[x1 + argLowLevel]
+        norm = np.sqrt(peakHeight**2 + width**2)
+        length = (peakHeight / norm) * x1 - (width / norm) * y1
+        argLevel = np.argmax(length) + argLowLevel
+        if flip:
+            argLevel = nbins - argLevel - 1
+        return binCenters[argLevel]
+
+    def tileLevels(self, slide, mode=['foreground', 'otsu', 'triangle']):
+        """A function to compute the foreground levels of every tile of a Slide
+        in one more streaming pass over the level: the mean lightness of each
+        tile ('foreground', 0 is black and 100 is white) and the fractions of
+        each tile at or below the Otsu ('otsu') and triangle ('triangle')
+        thresholds. The tile sums are taken from integral images of each strip,
+        so tiles may overlap and need not align with the strips.
+
+        Args:
+            slide (pathml.slide.Slide): the Slide whose tile dictionary defines the tiles; it must be of the same WSI as the Slide the Foreground was made from
+            mode (list of str, optional): the levels to compute, in order. Default is all of 'foreground', 'otsu' and 'triangle'.
+
+        Returns:
+            tuple of numpy.ndarray: the (numTilesInY, numTilesInX, len(mode)) array of levels, and the (numTilesInY, numTilesInX) boolean mask of tiles that overlap the level at all
+
+        Example:
+            levels, valid = pathml_slide.foreground.tileLevels(pathml_slide, mode=['otsu'])
+        """
+
+        if type(mode) == str:
+            mode = [mode]
+        for m in mode:
+            if m not in ['foreground', 'otsu', 'triangle']:
+                raise ValueError("mode must contain only 'foreground', 'otsu' or 'triangle'")
+
+        tileDictionary = slide.tileDictionary
+        xScale = self.image.width/slide.slide.width
+        yScale = self.image.height/slide.slide.height
+        x = tileDictionary.getColumn('x')
+        y = tileDictionary.getColumn('y')
+        x1 = np.minimum(np.round(x * xScale).astype(np.int64), self.image.width)
+        y1 = np.minimum(np.round(y * yScale).astype(np.int64), self.image.height)
+        x2 = np.minimum(np.round((x + tileDictionary.getColumn('width')) * xScale).astype(np.int64), self.image.width)
+        y2 = np.minimum(np.round((y + tileDictionary.getColumn('height')) * yScale).astype(np.int64), self.image.height)
+        area = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+
+        sums = np.zeros(area.shape+(len(mode),), dtype=np.float64)
+        for top, lightness in self.__strips():
+            bottom = top + lightness.shape[0]
+            rowStart = np.clip(y1, top, bottom) - top
+            rowEnd = np.clip(y2, top, bottom) - top
+            inStrip = (rowEnd > rowStart) & (x2 > x1)
+            if not inStrip.any():
+                continue
+            r1, r2, c1, c2 = rowStart[inStrip], rowEnd[inStrip], x1[inStrip], x2[inStrip]
+            for i, m in enumerate(mode):
+                if m == 'foreground':
+                    values = lightness.astype(np.float64)
+                elif m == 'otsu':
+                    values = (lightness <= self.thresholdLevelOtsu).astype(np.int64)
+                else:
+                    values = (lightness <= self.thresholdLevelTriangle).astype(np.int64)
+                integral = np.zeros((values.shape[0]+1, values.shape[1]+1), dtype=values.dtype)
+                np.cumsum(np.cumsum(values, axis=0), axis=1, out=integral[1:, 1:])
+                sums[inStrip, i] += integral[r2, c2] - integral[r1, c2] - integral[r2, c1] + integral[r1, c1]
+
+        valid = area > 0
+        levels = np.full(sums.shape, np.nan)
+        levels[valid] = sums[valid] / area[valid][:, None]
+        return levels, valid
@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+import zipfile
+import numpy as np
+import pyvips as pv
+from skimage.transform import resize_local_mean
+
+
+class SegmentationStitcher:
+    """A stitching engine combining the segmentation predictions of
+    (possibly overlapping) tiles into one slide-sized probability map. The map
+    is accumulated in disk-backed memory-mapped arrays at a configurable
+    downsample of the coordinates tiles are added in, so the memory used is
+    bounded by the operating system's page cache rather than by the size of the
+    slide; adding tiles in spatial (row-major) order keeps the pages touched
+    close together. The finished map is written in strips of chunkSize rows,
+    to a .npz file and/or to a tiled pyramidal TIFF via pyvips, without ever
+    being loaded into memory whole.
+
+    Overlapping predictions are combined by their mean ('mean'), their maximum
+    ('max'), or a mean weighted by a Gaussian window centered on each tile
+    ('gaussian'), which favours the predictions of tile centers over those of
+    tile borders.
+
+    Args:
+        height (int): the height of the slide in the coordinates tiles are added in
+        width (int): the width of the slide in the coordinates tiles are added in
+        downsample (float, optional): the factor by which the map is smaller than the slide. Default is 1.
+        aggregationMethod (str, optional): 'mean', 'max' or 'gaussian'. Default is 'mean'.
+        gaussianSigma (float, optional): the standard deviation of the Gaussian window as a fraction of the tile's edge length. Default is 0.125.
+        folder (str, optional): the directory to keep the memory-mapped arrays in while stitching. Default is a new temporary directory, deleted by close().
+        chunkSize (int, optional): the number of rows of the map processed at a time when writing the output. Default is 1024.
+
+    Example:
+        with SegmentationStitcher(slide_height, slide_width, downsample=4, aggregationMethod='gaussian') as stitcher:
+            for x, y, prediction in tile_predictions:
+                stitcher.add(x, y, prediction)
+            stitcher.save('/path/to/map.npz')
+            stitcher.saveTiff('/path/to/map.tif')
+    """
+
+    def __init__(self, height, width, downsample=1, aggregationMethod='mean', gaussianSigma=0.125, folder=False, chunkSize=1024):
+        if aggregationMethod not in ['mean', 'max', 'gaussian']:
+            raise ValueError("aggregationMethod must be 'mean', 'max' or 'gaussian'")
+        if downsample <= 0:
+            raise ValueError('downsample must be greater than 0')
+        if (type(chunkSize) != int) or (chunkSize <= 0):
+            raise ValueError('chunkSize must be an integer greater than 0')
+        self.downsample = downsample
+        self.aggregationMethod = aggregationMethod
+        self.gaussianSigma = gaussianSigma
+        self.chunkSize = chunkSize
+        self.height = max(int(round(height / downsample)), 1)
+        self.width = max(int(round(width / downsample)), 1)
+        self.numTiles = 0
+        self._temporaryFolder = not folder
+        self.folder = tempfile.mkdtemp(prefix='pathml-stitch-') if not folder else folder
+        os.makedirs(self.folder, exist_ok=True)
+        self._values = np.memmap(os.path.join(self.folder, 'values.f32'), dtype=np.float32, mode='w+', shape=(self.height, self.width))
+        if aggregationMethod == 'max':
+            self._weights = None
+        else:
+            self._weights = np.memmap(os.path.join(self.folder, 'weights.f32'), dtype=np.float32, mode='w+', shape=(self.height, self.width))
+        self._windows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self.close()
+        return False
+
+    def _window(self, shape):
+        # The Gaussian weights of a tile of the given output shape, never quite reaching zero at its borders
+        if shape not in self._windows:
+            axes = [np.exp(-0.5 * ((np.arange(n) + 0.5 - n / 2) / max(self.gaussianSigma * n, 1e-6))**2) for n in shape]
+            self._windows[shape] = np.maximum(np.outer(axes[0], axes[1]), 1e-6).astype(np.float32)
+        return self._windows[shape]
+
+    def add(self, x, y, prediction):
+        """A function to add the prediction of one tile to the map.
+
+        Args:
+            x (int): the x coordinate of the top left corner of the tile, in the coordinates of height and width
+            y (int): the y coordinate of the top left corner of the tile, in the coordinates of height and width
+            prediction (np.ndarray): the tile's (tile height, tile width) array of 0-1 probabilities
+        """
+
+        prediction = np.asarray(prediction, dtype=np.float32)
+        x1, y1 = int(round(x / self.downsample)), int(round(y / self.downsample))
+        x2 = int(round((x + prediction.shape[1]) / self.downsample))
+        y2 = int(round((y + prediction.shape[0]) / self.downsample))
+        if (x2 <= x1) or (y2 <= y1):
+            return
+        if prediction.shape != (y2 - y1, x2 - x1):
+            prediction = resize_local_mean(prediction, (y2 - y1, x2 - x1), grid_mode=True).astype(np.float32)
+
+        # Clip the tile to the map
+        top, left = max(-y1, 0), max(-x1, 0)
+        bottom, right = prediction.shape[0] - max(y2 - self.height, 0), prediction.shape[1] - max(x2 - self.width, 0)
+        if (bottom <= top) or (right <= left):
+            return
+        area = (slice(y1 + top, y1 + bottom), slice(x1 + left, x1 + right))
+        prediction = prediction[top:bottom, left:right]
+
+        if self.aggregationMethod == 'max':
+            np.maximum(self._values[area], prediction, out=self._values[area])
+        elif self.aggregationMethod == 'mean':
+            self._values[area] += prediction
+            self._weights[area] += 1
+        else:
+            window = self._window((y2 - y1, x2 - x1))[top:bottom, left:right]
+            self._values[area] += prediction * window
+            self._weights[area] += window
+        self.numTiles = self.numTiles + 1
+
+    def strips(self, dtype='int', probabilityThreshold=None):
+        """A generator yielding the finished map in strips of chunkSize rows.
+        Pixels no tile was added to are 0.
+
+        Args:
+            dtype (str, optional): 'int' for 0-255 numpy.uint8 values, or 'float' for 0-1 numpy.float32 values. Default is 'int'.
+            probabilityThreshold (float, optional): if defined, the map is binarized to Booleans of whether each probability is above this 0-1 threshold. Default is not to binarize.
+
+        Returns:
+            tuple: the first row of the strip and the strip as a np.ndarray
+        """
+
+        if dtype not in ['int', 'float']:
+            raise ValueError("dtype must be 'int' or 'float'")
+        for top in range(0, self.height, self.chunkSize):
+            values = np.array(self._values[top:top+self.chunkSize])
+            if self._weights is not None:
+                weights = self._weights[top:top+self.chunkSize]
+                values = np.divide(values, weights, out=np.zeros_like(values), where=weights > 0)
+            if probabilityThreshold is not None:
+                yield top, values > probabilityThreshold
+            elif dtype == 'int':
+                yield top, np.round(np.clip(values, 0, 1) * 255).astype(np.uint8)
+            else:
+                yield top, values
+
+    def toArray(self, dtype='int', probabilityThreshold=None):
+        """A function that returns the finished map as one in-memory array;
+        only suitable for maps that fit in memory. See strips() for the
+        arguments.
+
+        Returns:
+            np.ndarray: the (height, width) map
+        """
+
+        return np.concatenate([strip for top, strip in self.strips(dtype=dtype, probabilityThreshold=probabilityThreshold)])
+
+    def save(self, filePath, dtype='int', probabilityThreshold=None):
+        """A function to stream the finished map into a .npz file holding it
+        as 'inference', alongside its 'downsample'. The file can be read with
+        numpy.load(). See strips() for the other arguments.
+
+        Args:
+            filePath (str): the path of the .npz file to write
+        """
+
+        strips = self.strips(dtype=dtype, probabilityThreshold=probabilityThreshold)
+        top, strip = next(strips)
+        header = {'descr': np.lib.format.dtype_to_descr(strip.dtype), 'fortran_order': False, 'shape': (self.height, self.width)}
+        with zipfile.ZipFile(filePath, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as npz:
+            with npz.open('inference.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array_header_2_0(f, header)
+                f.write(strip.tobytes())
+                for top, strip in strips:
+                    f.write(strip.tobytes())
+            with npz.open('downsample.npy', 'w') as f:
+                np.lib.format.write_array(f, np.array(self.downsample))
+
+    def saveTiff(self, filePath, probabilityThreshold=None, tileSize=256, compression='deflate'):
+        """A function to stream the finished map into a tiled pyramidal 8-bit
+        TIFF, with 0-255 probabilities (or 0 and 255 if binarized with
+        probabilityThreshold), which can be viewed alongside the slide.
+
+        Args:
+            filePath (str): the path of the TIFF file to write
+            probabilityThreshold (float, optional): if defined, the map is binarized at this 0-1 threshold. Default is not to binarize.
+            tileSize (int, optional): the edge length of the TIFF's tiles. Default is 256.
+            compression (str, optional): the pyvips TIFF compression. Default is 'deflate'.
+        """
+
+        rawPath = os.path.join(self.folder, 'map.u8')
+        result = np.memmap(rawPath, dtype=np.uint8, mode='w+', shape=(self.height, self.width))
+        for top, strip in self.strips(dtype='int', probabilityThreshold=probabilityThreshold):
+            result[top:top+strip.shape[0]] = strip.astype(np.uint8) * 255 if strip.dtype == bool else strip
+        result.flush()
+        del result
+        image = pv.Image.rawload(rawPath, self.width, self.height, 1)
+        image.tiffsave(filePath, tile=True, tile_width=tileSize, tile_height=tileSize, pyramid=True, compression=compression, bigtiff=True)
+        os.remove(rawPath)
+
+    def close(self):
+        """A function to release the memory-mapped arrays, deleting them if
+        they were kept in a temporary directory."""
+
+        self._values = None
+        self._weights = None
+        if self._temporaryFolder and os.path.isdir(self.folder):
+            shutil.rmtree(self.folder, ignore_errors=True)
+        else:
+            for fileName in ['values.f32', 'weights.f32']:
+                if os.path.exists(os.path.join(self.folder, fileName)):
+                    os.remove(os.path.join(self.folder, fileName))
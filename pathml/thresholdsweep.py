@@ -0,0 +1,152 @@
+import numpy as np
+
+metricNames = ['accuracy', 'balanced_accuracy', 'f1', 'precision', 'recall']
+
+
+class ThresholdSweep:
+    """A binary classifier's confusion counts at every probability threshold
+    at once. The scores are sorted once, alongside the cumulative number of
+    ground truth positives, so the true positive, false positive, true
+    negative and false negative counts at any number of thresholds (a tile is
+    predicted positive when its score is at or above the threshold) are
+    found by binary search in O(n log n) overall, instead of rescanning the
+    tiles for every threshold. Sweeps of several slides can be combined to
+    evaluate a classifier across a whole dataset.
+
+    Args:
+        scores (np.ndarray): the 0-1 class probabilities of the tiles
+        labels (np.ndarray, optional): the ground truth of the tiles, 1 or True for positive. Default is to only count the tiles at or above thresholds (see numAtOrAbove()).
+
+    Example:
+        sweep = ThresholdSweep.combine([pathml_slide.classifierThresholdSweep('tumor') for pathml_slide in pathml_slides])
+        f1_scores = sweep.metric('f1', [0.5, 0.75, 0.9])
+        fpr, tpr, thresholds = sweep.rocCurve()
+    """
+
+    def __init__(self, scores, labels=None):
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        if labels is not None:
+            labels = np.asarray(labels).ravel().astype(bool)
+            if labels.shape != scores.shape:
+                raise ValueError('scores and labels must have the same length')
+        order = np.argsort(scores, kind='stable')
+        self.scores = scores[order]
+        self.labels = labels[order] if labels is not None else None
+        # cumulativePositives[i] is the number of positives among the i lowest scores
+        self._cumulativePositives = np.concatenate([[0], np.cumsum(self.labels)]) if labels is not None else None
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def combine(cls, sweeps):
+        """A function that pools the tiles of several sweeps, e.g. of all the
+        Slides of a dataset, into one sweep.
+
+        Args:
+            sweeps (list of ThresholdSweep): the sweeps to combine, all with or all without labels
+
+        Returns:
+            ThresholdSweep: the combined sweep
+        """
+
+        if len(sweeps) == 0:
+            raise ValueError('sweeps must contain at least one ThresholdSweep')
+        if len(set(sweep.labels is None for sweep in sweeps)) > 1:
+            raise ValueError('sweeps must either all have labels or all lack them')
+        scores = np.concatenate([sweep.scores for sweep in sweeps])
+        labels = np.concatenate([sweep.labels for sweep in sweeps]) if sweeps[0].labels is not None else None
+        return cls(scores, labels)
+
+    def numAtOrAbove(self, thresholds):
+        """A function that returns the number of tiles with a score at or
+        above each threshold.
+
+        Args:
+            thresholds (float or list of floats): the 0-1 probability thresholds
+
+        Returns:
+            np.ndarray: the number of tiles at or above each threshold
+        """
+
+        return len(self.scores) - np.searchsorted(self.scores, np.atleast_1d(np.asarray(thresholds, dtype=np.float64)), side='left')
+
+    def counts(self, thresholds):
+        """A function that returns the confusion counts at each threshold.
+
+        Args:
+            thresholds (float or list of floats): the 0-1 probability thresholds
+
+        Returns:
+            dict: np.ndarrays of the 'tp', 'fp', 'tn' and 'fn' counts at each threshold
+        """
+
+        if self.labels is None:
+            raise ValueError('Confusion counts require the labels of the tiles')
+        below = np.searchsorted(self.scores, np.atleast_1d(np.asarray(thresholds, dtype=np.float64)), side='left')
+        positives = self._cumulativePositives[-1]
+        negatives = len(self.scores) - positives
+        fn = self._cumulativePositives[below]
+        tn = below - fn
+        return {'tp': positives - fn, 'fp': negatives - tn, 'tn': tn, 'fn': fn}
+
+    def metric(self, metric, thresholds):
+        """A function that returns a metric of the classifier at each
+        threshold. Ill-defined precisions, recalls and F1 scores (of zero
+        predicted or ground truth positives) are 0, and the balanced accuracy
+        of a single ground truth class is the recall of that class, as with
+        scikit-learn.
+
+        Args:
+            metric (str): 'accuracy', 'balanced_accuracy', 'f1', 'precision', or 'recall'
+            thresholds (float or list of floats): the 0-1 probability thresholds
+
+        Returns:
+            np.ndarray: the metric at each threshold
+        """
+
+        if metric not in metricNames:
+            raise ValueError("metric must be one of: 'accuracy', 'balanced_accuracy', 'f1', 'precision', or 'recall'")
+        counts = self.counts(thresholds)
+        tp, fp, tn, fn = [counts[key].astype(np.float64) for key in ['tp', 'fp', 'tn', 'fn']]
+        if metric == 'accuracy':
+            return (tp + tn) / len(self.scores)
+        if metric == 'precision':
+            return _divide(tp, tp + fp)
+        if metric == 'recall':
+            return _divide(tp, tp + fn)
+        if metric == 'f1':
+            return _divide(2 * tp, 2 * tp + fp + fn)
+        recalls = np.stack([np.divide(tp, tp + fn, out=np.full_like(tp, np.nan), where=tp + fn > 0),
+                            np.divide(tn, tn + fp, out=np.full_like(tn, np.nan), where=tn + fp > 0)])
+        return np.nanmean(recalls, axis=0) if len(self.scores) > 0 else np.full(tp.shape, np.nan)
+
+    def rocCurve(self):
+        """A function that returns the receiver operating characteristic curve,
+        with one point per distinct score plus a first point at (0, 0).
+
+        Returns:
+            tuple: np.ndarrays of the false positive rates, true positive rates and decreasing thresholds
+        """
+
+        thresholds = np.concatenate([[np.inf], np.unique(self.scores)[::-1]])
+        counts = self.counts(thresholds)
+        return (_divide(counts['fp'], counts['fp'] + counts['tn']),
+                _divide(counts['tp'], counts['tp'] + counts['fn']),
+                thresholds)
+
+    def precisionRecallCurve(self):
+        """A function that returns the precision-recall curve, with one point
+        per distinct score.
+
+        Returns:
+            tuple: np.ndarrays of the precisions, recalls and decreasing thresholds
+        """
+
+        thresholds = np.unique(self.scores)[::-1]
+        return self.metric('precision', thresholds), self.metric('recall', thresholds), thresholds
+
+
+def _divide(numerator, denominator):
+    numerator, denominator = np.asarray(numerator, dtype=np.float64), np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
@@ -0,0 +1,546 @@
+import numpy as np
+from collections.abc import Mapping, MutableMapping
+
+
+class TileDictionary(MutableMapping):
+    """A columnar store of per-tile data on the numTilesInY x numTilesInX tile
+    grid of a Slide. Every key is held in its own NumPy array (plus a Boolean
+    array marking the tiles at which the key is present) instead of in one
+    Python dict per tile, which keeps large slides small in memory and allows
+    whole-slide operations to run as array operations.
+
+    The object behaves like the dict of per-tile dicts it replaces: it is keyed
+    by (x, y) tile address tuples in row-major order, and indexing it returns a
+    dict-like view of that tile's keys which can be read, updated and deleted
+    from as before. Numeric scalars, fixed-length numeric vectors and dicts of
+    numeric scalars (such as classifier predictions) are stored as arrays; any
+    other value falls back to a NumPy object array.
+
+    Args:
+        numTilesInX (int): the number of tiles along the width of the grid
+        numTilesInY (int): the number of tiles along the height of the grid
+    """
+
+    def __init__(self, numTilesInX, numTilesInY):
+        self.numTilesInX = int(numTilesInX)
+        self.numTilesInY = int(numTilesInY)
+        self._columns = _ColumnStore()
+        self._masks = {}
+        self._kinds = {}
+        self._subMasks = {}
+        self._versions = {}
+        self._writeCount = 0
+
+    @classmethod
+    def fromGrid(cls, numTilesInX, numTilesInY, tileSize, tileOverlap=0):
+        """A function to create a tile dictionary of square tiles laid out on a
+        regular grid, with the 'x', 'y', 'width' and 'height' keys of every
+        tile filled in.
+
+        Args:
+            numTilesInX (int): the number of tiles along the width of the grid
+            numTilesInY (int): the number of tiles along the height of the grid
+            tileSize (int): the edge length of each square tile in pixels
+            tileOverlap (int, optional): the number of pixels by which neighbouring tiles overlap. Default is 0.
+
+        Returns:
+            TileDictionary: the new tile dictionary
+        """
+
+        tileDictionary = cls(numTilesInX, numTilesInY)
+        stride = tileSize - tileOverlap
+        xs, ys = np.meshgrid(np.arange(numTilesInX, dtype=np.int64) * stride,
+                             np.arange(numTilesInY, dtype=np.int64) * stride)
+        tileDictionary.setColumn('x', xs)
+        tileDictionary.setColumn('y', ys)
+        tileDictionary.setColumn('width', np.full(tileDictionary.shape, tileSize, dtype=np.int64))
+        tileDictionary.setColumn('height', np.full(tileDictionary.shape, tileSize, dtype=np.int64))
+        return tileDictionary
+
+    @classmethod
+    def fromDict(cls, tileDictionary):
+        """A function to convert a plain dict of per-tile dicts (as stored in
+        .pml files written by older versions of PathML) into a TileDictionary.
+
+        Args:
+            tileDictionary (dict): a dict with (x, y) tile address keys and dict values
+
+        Returns:
+            TileDictionary: the converted tile dictionary
+        """
+
+        if isinstance(tileDictionary, cls):
+            return tileDictionary
+        numTilesInX = max(address[0] for address in tileDictionary) + 1
+        numTilesInY = max(address[1] for address in tileDictionary) + 1
+        newTileDictionary = cls(numTilesInX, numTilesInY)
+        for address, entry in tileDictionary.items():
+            for key, val in entry.items():
+                newTileDictionary.setValue(address, key, val)
+        return newTileDictionary
+
+    def toDict(self):
+        """A function to return the contents of the tile dictionary as a plain
+        dict of per-tile dicts.
+
+        Returns:
+            dict: a dict with (x, y) tile address keys and dict values
+        """
+
+        return {address: dict(self[address]) for address in self}
+
+    @property
+    def shape(self):
+        return (self.numTilesInY, self.numTilesInX)
+
+    # Mapping interface over tile addresses
+
+    def __getitem__(self, tileAddress):
+        if tileAddress not in self:
+            raise KeyError(tileAddress)
+        return TileView(self, tileAddress)
+
+    def __setitem__(self, tileAddress, entry):
+        if tileAddress not in self:
+            raise KeyError(tileAddress)
+        for key in list(self[tileAddress]):
+            if key not in entry:
+                self.deleteValue(tileAddress, key)
+        for key, val in entry.items():
+            self.setValue(tileAddress, key, val)
+
+    def __delitem__(self, tileAddress):
+        raise TypeError('Tiles cannot be removed from a TileDictionary; delete individual keys instead')
+
+    def __contains__(self, tileAddress):
+        try:
+            x, y = tileAddress
+        except (TypeError, ValueError):
+            return False
+        return 0 <= x < self.numTilesInX and 0 <= y < self.numTilesInY
+
+    def __iter__(self):
+        for y in range(self.numTilesInY):
+            for x in range(self.numTilesInX):
+                yield (x, y)
+
+    def __len__(self):
+        return self.numTilesInX * self.numTilesInY
+
+    def __repr__(self):
+        return 'TileDictionary(numTilesInX='+str(self.numTilesInX)+', numTilesInY='+str(self.numTilesInY)+', keys='+str(self.columns())+')'
+
+    # Column interface
+
+    def columns(self):
+        """A function that returns the keys present at one or more tiles.
+
+        Returns:
+            list of str: the keys stored in the tile dictionary
+        """
+
+        return list(self._columns.keys())
+
+    def hasColumn(self, key):
+        """A function that returns whether a key is present at any tile.
+
+        Args:
+            key (str): the key to look for
+
+        Returns:
+            Bool: whether the key is present in the tile dictionary
+        """
+
+        return key in self._columns
+
+    def getColumn(self, key, subkey=None):
+        """A function that returns the array holding a key for every tile of the
+        grid. Scalar keys are returned with shape (numTilesInY, numTilesInX),
+        vector keys with shape (numTilesInY, numTilesInX, length). Values at
+        tiles where the key is absent are undefined; use
+        :meth:`TileDictionary.getMask() <pathml.tiledictionary.TileDictionary.getMask>` to find them.
+
+        Args:
+            key (str): the key to return
+            subkey (str, optional): for keys holding dicts of numbers (such as classifierInferencePrediction), the dict entry to return. Default is to return a dict of arrays, one per entry.
+
+        Returns:
+            np.ndarray: the array holding the key (not a copy)
+
+        Example:
+            tissue_levels = pathml_slide.tileDictionary.getColumn('tissueLevel')
+        """
+
+        if key not in self._columns:
+            raise KeyError(key)
+        if self._kinds[key] == 'record':
+            if subkey is None:
+                return self._columns[key]
+            return self._columns[key][subkey]
+        if subkey is not None:
+            raise ValueError(key+' does not hold a dict of numbers')
+        return self._columns[key]
+
+    def getMask(self, key, subkey=None):
+        """A function that returns a Boolean array marking the tiles where a key
+        is present.
+
+        Args:
+            key (str): the key to look for
+            subkey (str, optional): for keys holding dicts of numbers, the dict entry to look for. Default is to look for the key itself.
+
+        Returns:
+            np.ndarray: a (numTilesInY, numTilesInX) Boolean array (not a copy)
+        """
+
+        if key not in self._columns:
+            return np.zeros(self.shape, dtype=bool)
+        if subkey is not None:
+            if self._kinds[key] != 'record' or subkey not in self._subMasks[key]:
+                return np.zeros(self.shape, dtype=bool)
+            return self._subMasks[key][subkey]
+        return self._masks[key]
+
+    def setColumn(self, key, values, mask=None):
+        """A function to write a key at many tiles at once. Tiles outside of
+        mask keep their previous value (or continue to lack the key).
+
+        Args:
+            key (str): the key to write
+            values (np.ndarray or dict): an array of shape (numTilesInY, numTilesInX) or (numTilesInY, numTilesInX, length), or a dict of such 2D arrays for keys holding dicts of numbers
+            mask (np.ndarray, optional): a (numTilesInY, numTilesInX) Boolean array of the tiles to write. Default is to write every tile.
+
+        Example:
+            pathml_slide.tileDictionary.setColumn('tissueLevel', tissue_map, mask=tissue_map_is_valid)
+        """
+
+        if mask is None:
+            mask = np.ones(self.shape, dtype=bool)
+        else:
+            mask = np.asarray(mask, dtype=bool)
+            if mask.shape != self.shape:
+                raise ValueError('mask must have shape '+str(self.shape))
+
+        if isinstance(values, Mapping):
+            if key in self._columns and self._kinds[key] != 'record':
+                self._toObject(key)
+            if key not in self._columns:
+                self._columns[key] = {}
+                self._subMasks[key] = {}
+                self._masks[key] = np.zeros(self.shape, dtype=bool)
+                self._kinds[key] = 'record'
+            if self._kinds[key] == 'record':
+                for subkey, subvalues in values.items():
+                    self._writeSubcolumn(key, subkey, np.asarray(subvalues, dtype=np.float64), mask)
+            else:
+                for y, x in zip(*np.nonzero(mask)):
+                    self._columns[key][y, x] = {subkey: subvalues[y, x] for subkey, subvalues in values.items()}
+            self._masks[key] |= mask
+            self._touch(key)
+            return
+
+        values = np.asarray(values)
+        if values.shape[:2] != self.shape or values.ndim > 3:
+            raise ValueError('values must have shape '+str(self.shape)+' or '+str(self.shape)+' + (length,)')
+        if key not in self._columns:
+            if values.dtype == object:
+                kind = 'object'
+            else:
+                kind = 'vector' if values.ndim == 3 else 'scalar'
+            self._columns[key] = np.zeros(values.shape, dtype=values.dtype) if kind != 'object' else np.empty(self.shape, dtype=object)
+            self._masks[key] = np.zeros(self.shape, dtype=bool)
+            self._kinds[key] = kind
+        elif self._kinds[key] in ['scalar', 'vector']:
+            column = self._columns[key]
+            if values.dtype == object or column.shape[2:] != values.shape[2:]:
+                self._toObject(key)
+            else:
+                self._promote(key, values.dtype)
+        elif self._kinds[key] == 'record':
+            self._toObject(key)
+
+        if self._kinds[key] == 'object' and values.ndim == 3:
+            for y, x in zip(*np.nonzero(mask)):
+                self._columns[key][y, x] = values[y, x]
+        else:
+            self._columns[key][mask] = values[mask]
+        self._masks[key] |= mask
+        self._touch(key)
+
+    def removeColumn(self, key):
+        """A function to delete a key from every tile of the tile dictionary.
+
+        Args:
+            key (str): the key to delete
+        """
+
+        if key in self._columns:
+            if self._kinds[key] == 'record':
+                del self._subMasks[key]
+            del self._columns[key]
+            del self._masks[key]
+            del self._kinds[key]
+            self._touch(key)
+
+    def getVersion(self, key):
+        """A function that returns a number which changes every time a key is
+        written to or deleted from any tile, so that results derived from the
+        key can be cached until it changes. Arrays returned by
+        :meth:`TileDictionary.getColumn() <pathml.tiledictionary.TileDictionary.getColumn>`
+        should not be modified in place, as such writes are not tracked.
+
+        Args:
+            key (str): the key to return the version of
+
+        Returns:
+            int: the version of the key; 0 if the key has never been written
+        """
+
+        return self._versions.get(key, 0)
+
+    def addresses(self, mask=None):
+        """A function that returns the tile addresses marked by a Boolean array,
+        in the same row-major order in which the tile dictionary is iterated.
+
+        Args:
+            mask (np.ndarray, optional): a (numTilesInY, numTilesInX) Boolean array. Default is to return every tile address.
+
+        Returns:
+            list: List of tile addresses (tuples of integers)
+        """
+
+        if mask is None:
+            return list(self)
+        ys, xs = np.nonzero(mask)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def exportColumn(self, key):
+        """A function that returns the arrays holding a key, for writing it to
+        disk. The arrays are not copies.
+
+        Args:
+            key (str): the key to export
+
+        Returns:
+            dict: the 'kind' of the key ('scalar', 'vector', 'record' or 'object'), its 'mask', and its 'values' (for records, a dict of arrays per dict entry, with their masks in 'subMasks')
+        """
+
+        if key not in self._columns:
+            raise KeyError(key)
+        column = {'kind': self._kinds[key], 'mask': self._masks[key], 'values': self._columns[key]}
+        if self._kinds[key] == 'record':
+            column['subMasks'] = self._subMasks[key]
+        return column
+
+    def importColumn(self, key, column):
+        """A function to add a key from arrays as returned by
+        :meth:`TileDictionary.exportColumn() <pathml.tiledictionary.TileDictionary.exportColumn>`,
+        replacing any existing key of that name. The arrays are used as they
+        are rather than copied, so they may be memory-mapped; memory maps must
+        be opened copy-on-write if the key is to be written to later. The
+        values may also be given as :class:`DeferredValues <pathml.tiledictionary.DeferredValues>`,
+        in which case they are only read the first time the key is used.
+
+        Args:
+            key (str): the key to add
+            column (dict): the 'kind', 'mask', 'values' (and for records 'subMasks') of the key
+        """
+
+        if column['kind'] not in ['scalar', 'vector', 'record', 'object']:
+            raise ValueError("kind must be 'scalar', 'vector', 'record' or 'object'")
+        if column['mask'].shape != self.shape:
+            raise ValueError('mask must have shape '+str(self.shape))
+        self.removeColumn(key)
+        self._kinds[key] = column['kind']
+        self._masks[key] = column['mask']
+        self._columns[key] = column['values']
+        if column['kind'] == 'record':
+            self._subMasks[key] = column['subMasks']
+        self._touch(key)
+
+    # Per-tile interface used by TileView
+
+    def getValue(self, tileAddress, key):
+        x, y = tileAddress
+        if key not in self._columns or not self._masks[key][y, x]:
+            raise KeyError(key)
+        kind = self._kinds[key]
+        if kind == 'scalar':
+            return self._columns[key][y, x].item()
+        elif kind == 'vector':
+            return self._columns[key][y, x].copy()
+        elif kind == 'record':
+            subMasks = self._subMasks[key]
+            return {subkey: subcolumn[y, x].item() for subkey, subcolumn in self._columns[key].items() if subMasks[subkey][y, x]}
+        return self._columns[key][y, x]
+
+    def setValue(self, tileAddress, key, val):
+        x, y = tileAddress
+        if key not in self._columns:
+            self._createColumn(key, val)
+        kind = self._kinds[key]
+
+        if kind == 'scalar' and _isNumber(val):
+            self._promote(key, np.asarray(val).dtype)
+            self._columns[key][y, x] = val
+        elif kind == 'vector' and _isNumericVector(val) and np.shape(val) == self._columns[key].shape[2:]:
+            self._promote(key, np.asarray(val).dtype)
+            self._columns[key][y, x] = val
+        elif kind == 'record' and _isNumberDict(val):
+            subMasks = self._subMasks[key]
+            for subMask in subMasks.values():
+                subMask[y, x] = False
+            for subkey, subval in val.items():
+                if subkey not in subMasks:
+                    self._columns[key][subkey] = np.zeros(self.shape, dtype=np.float64)
+                    subMasks[subkey] = np.zeros(self.shape, dtype=bool)
+                self._columns[key][subkey][y, x] = subval
+                subMasks[subkey][y, x] = True
+        else:
+            if kind != 'object':
+                self._toObject(key)
+            self._columns[key][y, x] = val
+        self._masks[key][y, x] = True
+        self._touch(key)
+
+    def deleteValue(self, tileAddress, key):
+        x, y = tileAddress
+        if key not in self._columns or not self._masks[key][y, x]:
+            raise KeyError(key)
+        self._masks[key][y, x] = False
+        if self._kinds[key] == 'object':
+            self._columns[key][y, x] = None
+        self._touch(key)
+
+    def hasValue(self, tileAddress, key):
+        x, y = tileAddress
+        return key in self._columns and bool(self._masks[key][y, x])
+
+    def tileKeys(self, tileAddress):
+        x, y = tileAddress
+        return [key for key in self._columns if self._masks[key][y, x]]
+
+    # Column storage helpers
+
+    def _touch(self, key):
+        self._writeCount += 1
+        self._versions[key] = self._writeCount
+
+    def _createColumn(self, key, val):
+        if _isNumber(val):
+            self._columns[key] = np.zeros(self.shape, dtype=np.asarray(val).dtype)
+            self._kinds[key] = 'scalar'
+        elif _isNumericVector(val):
+            val = np.asarray(val)
+            self._columns[key] = np.zeros(self.shape+val.shape, dtype=val.dtype)
+            self._kinds[key] = 'vector'
+        elif _isNumberDict(val):
+            self._columns[key] = {}
+            self._subMasks[key] = {}
+            self._kinds[key] = 'record'
+        else:
+            self._columns[key] = np.empty(self.shape, dtype=object)
+            self._kinds[key] = 'object'
+        self._masks[key] = np.zeros(self.shape, dtype=bool)
+
+    def _writeSubcolumn(self, key, subkey, subvalues, mask):
+        if subkey not in self._columns[key]:
+            self._columns[key][subkey] = np.zeros(self.shape, dtype=np.float64)
+            self._subMasks[key][subkey] = np.zeros(self.shape, dtype=bool)
+        self._columns[key][subkey][mask] = subvalues[mask]
+        self._subMasks[key][subkey] |= mask
+
+    def _promote(self, key, dtype):
+        column = self._columns[key]
+        newDtype = np.promote_types(column.dtype, dtype)
+        if newDtype != column.dtype:
+            self._columns[key] = column.astype(newDtype)
+
+    def _toObject(self, key):
+        objects = np.empty(self.shape, dtype=object)
+        for y, x in zip(*np.nonzero(self._masks[key])):
+            objects[y, x] = self.getValue((x, y), key)
+        if self._kinds[key] == 'record':
+            del self._subMasks[key]
+        self._columns[key] = objects
+        self._kinds[key] = 'object'
+
+
+class DeferredValues:
+    """Placeholder for the values of a tile dictionary key that are read from
+    disk only when the key is first used.
+
+    Args:
+        load (callable): a function without arguments returning the values
+    """
+
+    __slots__ = ('load',)
+
+    def __init__(self, load):
+        self.load = load
+
+
+class _ColumnStore(dict):
+    # A dict of column values that resolves DeferredValues on first access
+
+    def __getitem__(self, key):
+        values = dict.__getitem__(self, key)
+        if isinstance(values, DeferredValues):
+            values = values.load()
+            dict.__setitem__(self, key, values)
+        return values
+
+    def __reduce__(self):
+        return (_ColumnStore, (), None, None, ((key, self[key]) for key in list(self.keys())))
+
+
+class TileView(MutableMapping):
+    """A dict-like view of the keys of one tile of a TileDictionary. Reads and
+    writes go straight to the columns of the parent tile dictionary.
+
+    Args:
+        tileDictionary (TileDictionary): the parent tile dictionary
+        tileAddress (Tuple[int, int]): the (x, y) address of the tile
+    """
+
+    __slots__ = ('_tileDictionary', '_tileAddress')
+
+    def __init__(self, tileDictionary, tileAddress):
+        self._tileDictionary = tileDictionary
+        self._tileAddress = tileAddress
+
+    def __getitem__(self, key):
+        return self._tileDictionary.getValue(self._tileAddress, key)
+
+    def __setitem__(self, key, val):
+        self._tileDictionary.setValue(self._tileAddress, key, val)
+
+    def __delitem__(self, key):
+        self._tileDictionary.deleteValue(self._tileAddress, key)
+
+    def __contains__(self, key):
+        return self._tileDictionary.hasValue(self._tileAddress, key)
+
+    def __iter__(self):
+        return iter(self._tileDictionary.tileKeys(self._tileAddress))
+
+    def __len__(self):
+        return len(self._tileDictionary.tileKeys(self._tileAddress))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        return dict(self)
+
+
+def _isNumber(val):
+    return isinstance(val, (bool, int, float, np.bool_, np.integer, np.floating))
+
+
+def _isNumericVector(val):
+    return isinstance(val, np.ndarray) and val.ndim == 1 and (np.issubdtype(val.dtype, np.number) or val.dtype == bool)
+
+
+def _isNumberDict(val):
+    return isinstance(val, dict) and len(val) > 0 and all(_isNumber(v) for v in val.values())
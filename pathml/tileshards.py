@@ -0,0 +1,161 @@
+import glob
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+
+# Tile shards are plain tar files holding the entries of one extracted tile
+# after another under the same key, e.g. <key>.jpg, <key>.mask.gif and
+# <key>.json (the tile's metadata), so they can be read sequentially and with
+# standard tools. Each ShardWriter also writes a <prefix>.index.json listing
+# its finished shards with their number of tiles, and the classes they hold.
+indexSuffix = '.index.json'
+
+
+class ShardWriter:
+    """A writer packing extracted tiles, their masks and their metadata into
+    large tar shard files instead of one file per tile. It can be passed to the
+    extract*Tiles() functions of any number of Slides, and write() can be
+    called from several threads at once. A shard is written to a temporary
+    file and only gets its final name once it is full or the writer is closed,
+    so finished shards are never partially written.
+
+    Args:
+        folder (str): the directory to write the shards and the index to
+        prefix (str, optional): the start of the shard file names, which are <prefix>-<shard number>.tar. Writers writing to the same folder concurrently must use different prefixes. Default is 'tiles'.
+        maxTilesPerShard (int, optional): the number of tiles after which a new shard is started. Default is 10000.
+        maxShardSize (int, optional): the size in bytes after which a new shard is started. Default is 1 GiB.
+
+    Example:
+        with ShardWriter('/path/to/shards') as shardWriter:
+            for pathml_slide in pathml_slides:
+                pathml_slide.extractAnnotationTiles('/path/to/shards', shardWriter=shardWriter)
+    """
+
+    def __init__(self, folder, prefix='tiles', maxTilesPerShard=10000, maxShardSize=1 << 30):
+        if (type(maxTilesPerShard) != int) or (maxTilesPerShard <= 0):
+            raise ValueError('maxTilesPerShard must be an integer greater than 0')
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.prefix = prefix
+        self.maxTilesPerShard = maxTilesPerShard
+        self.maxShardSize = maxShardSize
+        self.shards = []
+        self.classes = set()
+        self._lock = threading.Lock()
+        self._tar = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self.close()
+        return False
+
+    def write(self, key, entries, metadata=None):
+        """A function to add one tile to the current shard.
+
+        Args:
+            key (str): the unique name of the tile, without dots
+            entries (dict): the encoded files of the tile, with their extension (e.g. 'jpg' or 'mask.gif') as keys and their contents (bytes) as values
+            metadata (dict, optional): JSON-serializable information about the tile, stored as its 'json' entry; its 'class' value is recorded in the index
+        """
+
+        if '.' in key:
+            raise ValueError('Shard keys cannot contain dots')
+        if metadata is not None:
+            entries = dict(entries, json=json.dumps(metadata).encode('utf-8'))
+        with self._lock:
+            if self._tar is None:
+                self._openShard()
+            for extension, data in entries.items():
+                tarInfo = tarfile.TarInfo(key+'.'+extension)
+                tarInfo.size = len(data)
+                tarInfo.mtime = time.time()
+                self._tar.addfile(tarInfo, io.BytesIO(data))
+            self._numTiles = self._numTiles + 1
+            if (metadata is not None) and ('class' in metadata):
+                self.classes.add(metadata['class'])
+            if (self._numTiles >= self.maxTilesPerShard) or (self._tar.fileobj.tell() >= self.maxShardSize):
+                self._closeShard()
+
+    def close(self):
+        """A function to finish the current shard and write the index."""
+
+        with self._lock:
+            if self._tar is not None:
+                self._closeShard()
+            self._writeIndex()
+
+    def _openShard(self):
+        self._shardFileName = self.prefix+'-'+str(len(self.shards)).zfill(6)+'.tar'
+        self._tar = tarfile.open(os.path.join(self.folder, self._shardFileName+'.tmp'), 'w')
+        self._numTiles = 0
+
+    def _closeShard(self):
+        self._tar.close()
+        temporaryPath = os.path.join(self.folder, self._shardFileName+'.tmp')
+        size = os.path.getsize(temporaryPath)
+        os.replace(temporaryPath, os.path.join(self.folder, self._shardFileName))
+        self.shards.append({'file': self._shardFileName, 'numTiles': self._numTiles, 'size': size})
+        self._tar = None
+        self._writeIndex()
+
+    def _writeIndex(self):
+        index = {'format': 'pathml-shards',
+                 'shards': self.shards,
+                 'numTiles': sum(shard['numTiles'] for shard in self.shards),
+                 'classes': sorted(self.classes)}
+        temporaryPath = os.path.join(self.folder, self.prefix+indexSuffix+'.tmp')
+        with open(temporaryPath, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(temporaryPath, os.path.join(self.folder, self.prefix+indexSuffix))
+
+
+def readShardIndex(folder):
+    """A function to read the indices of all shards written to a folder by
+    :class:`ShardWriter <pathml.tileshards.ShardWriter>` objects.
+
+    Args:
+        folder (str): the directory holding the shards
+
+    Returns:
+        dict: the 'shards' (list of shard paths), their 'numTiles' (list of int) and the sorted 'classes' found across all indices
+    """
+
+    shards, numTiles, classes = [], [], set()
+    for indexPath in sorted(glob.glob(os.path.join(folder, '*'+indexSuffix))):
+        with open(indexPath) as f:
+            index = json.load(f)
+        for shard in index['shards']:
+            shards.append(os.path.join(folder, shard['file']))
+            numTiles.append(shard['numTiles'])
+        classes.update(index['classes'])
+    return {'shards': shards, 'numTiles': numTiles, 'classes': sorted(classes)}
+
+
+def iterateShard(shardPath):
+    """A generator reading a shard sequentially, yielding the key of each tile
+    and a dict of its entries (extension to bytes, with the metadata decoded
+    under 'json').
+
+    Args:
+        shardPath (str): the path to the shard
+    """
+
+    key, entries = None, {}
+    with tarfile.open(shardPath, 'r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            memberKey, extension = member.name.split('.', 1)
+            if (key is not None) and (memberKey != key):
+                yield key, entries
+                entries = {}
+            key = memberKey
+            data = tar.extractfile(member).read()
+            entries[extension] = json.loads(data) if extension == 'json' else data
+    if key is not None:
+        yield key, entries
@@ -0,0 +1,86 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TileWriter:
+    """A pool of threads that runs tile extraction jobs (reading a tile,
+    encoding it and writing it to disk) concurrently, with at most maxInFlight
+    jobs submitted but not yet finished at a time so that memory stays bounded
+    however many tiles are extracted. libvips, Pillow and NumPy release the GIL
+    while decoding, encoding and writing, so the jobs spread over the cores
+    instead of queueing behind the calling thread. Results are returned in the
+    order the jobs were submitted, and the first exception raised by a job is
+    raised again in the calling thread.
+
+    Args:
+        numWorkers (int, optional): the number of threads. Default is 4.
+        maxInFlight (int, optional): the maximum number of unfinished jobs; submit() waits for the oldest job to finish beyond this. Default is four times numWorkers.
+
+    Example:
+        with TileWriter(numWorkers=8) as writer:
+            for tileAddress in tileAddresses:
+                writer.submit(pathml_slide.saveTile, tileAddress, str(tileAddress)+'.jpg', folder='/path/to/tiles')
+        results = writer.results()
+    """
+
+    def __init__(self, numWorkers=4, maxInFlight=False):
+        if (type(numWorkers) != int) or (numWorkers <= 0):
+            raise ValueError('numWorkers must be an integer greater than 0')
+        self.numWorkers = numWorkers
+        self.maxInFlight = maxInFlight if maxInFlight else 4 * numWorkers
+        self._executor = ThreadPoolExecutor(max_workers=numWorkers)
+        self._inFlight = collections.deque()
+        self._results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        if exceptionType is None:
+            self.close()
+        else:
+            self._cancel()
+        return False
+
+    def submit(self, function, *args, **kwargs):
+        """A function to queue a job, waiting for the oldest unfinished job
+        first if maxInFlight jobs are already queued.
+
+        Args:
+            function (callable): the job to run
+            *args, **kwargs: the arguments to call function with
+        """
+
+        while len(self._inFlight) >= self.maxInFlight:
+            self._results.append(self._inFlight.popleft().result())
+        self._inFlight.append(self._executor.submit(function, *args, **kwargs))
+
+    def close(self):
+        """A function to wait for all queued jobs to finish and stop the
+        threads.
+        """
+
+        try:
+            while len(self._inFlight) > 0:
+                self._results.append(self._inFlight.popleft().result())
+        finally:
+            self._cancel()
+
+    def _cancel(self):
+        # Drop the jobs that have not started yet (after a failed job) and stop the threads once the running ones finish
+        for future in self._inFlight:
+            future.cancel()
+        self._inFlight.clear()
+        self._executor.shutdown(wait=True)
+
+    def results(self):
+        """A function that waits for all queued jobs to finish and returns
+        their results.
+
+        Returns:
+            list: the return value of each job, in the order the jobs were submitted
+        """
+
+        while len(self._inFlight) > 0:
+            self._results.append(self._inFlight.popleft().result())
+        return self._results
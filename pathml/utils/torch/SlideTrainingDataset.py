@@ -0,0 +1,241 @@
+import os
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from pathml.slide import Slide
+
+
+# Used to train directly on the tiles of Slides, without extracting them first
+class SlideTrainingDataset(IterableDataset):
+    """An iterable dataset sampling training tiles on the fly from the
+    whole-slide images of several Slides. Each tile is assigned the class it
+    overlaps most among the classes whose annotation overlap ('<class>Overlap'
+    in the tile dictionary) reaches tileAnnotationOverlapThreshold, after the
+    tissueLevel, foregroundLevel, otsuLevel and triangleLevel filters of
+    :meth:`Slide.suitableTileAddresses() <pathml.slide.Slide.suitableTileAddresses>`
+    are applied. Every epoch, numTilesPerClass tiles of each class are drawn
+    without replacement and split between DataLoader workers (and between
+    distributed processes, if torch.distributed is initialized), so no tile is
+    read twice per epoch. Slides given as .pml paths are opened lazily, and each
+    worker keeps at most slideCacheSize of them open; a worker visits its
+    slides in groups of slideCacheSize, so every slide is opened once per
+    worker and epoch. Like torchvision.datasets.ImageFolder, the dataset yields
+    (image, label) pairs, with labels indexing classNames.
+
+    Args:
+        slides (list of str or pathml.slide.Slide): the .pml files saved with Slide.save(), or Slides (which stay in memory)
+        classNames (list of str, optional): the classes to sample, in label order. Default is all classes annotated in the slides, sorted.
+        unannotatedClassName (str, optional): if defined, tiles overlapping no annotation at all are sampled as an additional class with this name, labelled after classNames. Default is False.
+        tileAnnotationOverlapThreshold (float or dict, optional): a number greater than 0 and less than or equal to 1, or a dictionary of such values with a key for each class, specifying the minimum fraction of a tile's area that must overlap a class's annotations for the tile to be sampled as that class. Default is 0.5.
+        numTilesPerClass (str or int or dict, optional): how many tiles of each class to sample per epoch; 'balanced' samples as many tiles of every class as the rarest class has, 'all' samples every tile, an int or a dictionary with class names as keys sets the number directly (capped at the number of tiles available). Default is 'balanced'.
+        tissueLevelThreshold (float, optional): if defined, only samples tiles with a 0 to 1 tissueLevel probability greater than or equal to the set value. Default is False.
+        foregroundLevelThreshold (str or int or float, optional): if defined as an int, only samples tiles with a 0-100 foregroundLevel value less than the set value (0 is a black tile, 100 is a white tile). Default is False.
+        otsuLevelThreshold (float, optional): if defined, only samples tiles with an otsuLevel greater than or equal to the set value. Default is False.
+        triangleLevelThreshold (float, optional): if defined, only samples tiles with a triangleLevel greater than or equal to the set value. Default is False.
+        transform (callable, optional): the transforms to apply to each PIL image. Default is no transforms.
+        returnMasks (Bool, optional): whether to yield (image, mask, label) triplets, with the mask a (number of annotated classes, height, width) uint8 tensor of the annotations of classNames generated for each tile with Slide.getAnnotationTileMask(). Default is False.
+        slideCacheSize (int, optional): the number of slides each worker keeps open at once. Default is 4.
+        seed (int, optional): the random seed of the sampling, combined with the epoch set by set_epoch(). Default is 0.
+
+    Example:
+        dataset = SlideTrainingDataset(['/path/to/slide1.pml', '/path/to/slide2.pml'], tissueLevelThreshold=0.995, transform=data_transforms)
+        loader = torch.utils.data.DataLoader(dataset, batch_size=64, num_workers=8)
+    """
+
+    def __init__(self, slides, classNames=False, unannotatedClassName=False, tileAnnotationOverlapThreshold=0.5, numTilesPerClass='balanced',
+        tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False,
+        transform=None, returnMasks=False, slideCacheSize=4, seed=0):
+        slides = list(slides)
+        if len(slides) == 0:
+            raise ValueError('No slides given')
+        if (type(slideCacheSize) != int) or (slideCacheSize <= 0):
+            raise ValueError('slideCacheSize must be an integer greater than 0')
+        self.slides = slides
+        self.transform = transform
+        self.returnMasks = returnMasks
+        self.slideCacheSize = slideCacheSize
+        self.seed = seed
+        self.epoch = 0
+        self._slideCache = OrderedDict()
+        self._cachePid = os.getpid()
+
+        openedSlides = [Slide(slide) if isinstance(slide, str) else slide for slide in slides]
+        for openedSlide in openedSlides:
+            if not openedSlide.hasTileDictionary():
+                raise PermissionError('setTileProperties must be called before sampling tiles')
+
+        annotatedClassNames = sorted(set(key[:-len('Overlap')] for openedSlide in openedSlides
+                                         for key in openedSlide.tileDictionary.columns() if key.endswith('Overlap')))
+        if classNames:
+            if type(classNames) == str:
+                classNames = [classNames]
+            for className in classNames:
+                if className not in annotatedClassNames:
+                    raise ValueError(className+'Overlap not found in the tile dictionary of any slide')
+            self.maskClassNames = list(classNames)
+        else:
+            self.maskClassNames = annotatedClassNames
+        self.classNames = self.maskClassNames + ([unannotatedClassName] if unannotatedClassName else [])
+        if len(self.classNames) == 0:
+            raise ValueError('No classes to sample; add annotations to the slides or define unannotatedClassName')
+        if returnMasks and len(self.maskClassNames) == 0:
+            raise ValueError('returnMasks requires annotated classes to make masks of')
+        self.classToIndex = {className: i for i, className in enumerate(self.classNames)}
+
+        if type(tileAnnotationOverlapThreshold) in [int, float]:
+            if (tileAnnotationOverlapThreshold <= 0) or (tileAnnotationOverlapThreshold > 1):
+                raise ValueError('tileAnnotationOverlapThreshold must be greater than 0 and less than or equal to 1')
+            overlapThresholds = {className: tileAnnotationOverlapThreshold for className in self.maskClassNames}
+        elif type(tileAnnotationOverlapThreshold) == dict:
+            for className in self.maskClassNames:
+                if className not in tileAnnotationOverlapThreshold:
+                    raise ValueError('Class '+str(className)+' not present as a key in tileAnnotationOverlapThreshold')
+                taot = tileAnnotationOverlapThreshold[className]
+                if (type(taot) not in [int, float]) or (taot <= 0) or (taot > 1):
+                    raise ValueError('Tile annotation overlap threshold of class '+str(className)+' must be a number greater than zero and less than or equal to 1')
+            overlapThresholds = tileAnnotationOverlapThreshold
+        else:
+            raise ValueError('tileAnnotationOverlapThreshold must be a dictionary or number greater than 0 and less than or equal to 1')
+
+        # One row per sampleable tile of all slides: its slide, address and label
+        sampleSlides, sampleAddresses, sampleLabels = [], [], []
+        for slideIndex, openedSlide in enumerate(openedSlides):
+            addresses = np.array(openedSlide.suitableTileAddresses(tissueLevelThreshold=tissueLevelThreshold, foregroundLevelThreshold=foregroundLevelThreshold,
+                otsuLevelThreshold=otsuLevelThreshold, triangleLevelThreshold=triangleLevelThreshold), dtype=np.int32).reshape(-1, 2)
+            overlaps = np.zeros((len(addresses), len(self.maskClassNames)))
+            qualifies = np.zeros((len(addresses), len(self.maskClassNames)), dtype=bool)
+            unannotated = np.ones(len(addresses), dtype=bool)
+            for key in openedSlide.tileDictionary.columns():
+                if not key.endswith('Overlap'):
+                    continue
+                present = openedSlide.tileDictionary.getMask(key)[addresses[:, 1], addresses[:, 0]]
+                overlap = np.where(present, openedSlide.tileDictionary.getColumn(key)[addresses[:, 1], addresses[:, 0]], 0).astype(np.float64)
+                unannotated &= overlap == 0
+                className = key[:-len('Overlap')]
+                if className in self.maskClassNames:
+                    i = self.maskClassNames.index(className)
+                    overlaps[:, i] = overlap
+                    qualifies[:, i] = overlap >= overlapThresholds[className]
+
+            labels = np.full(len(addresses), -1, dtype=np.int64)
+            if len(self.maskClassNames) > 0:
+                labels = np.where(qualifies.any(axis=1), np.argmax(np.where(qualifies, overlaps, -1), axis=1), -1)
+            if unannotatedClassName:
+                labels[unannotated] = self.classToIndex[unannotatedClassName]
+            keep = labels >= 0
+            sampleSlides.append(np.full(keep.sum(), slideIndex, dtype=np.int32))
+            sampleAddresses.append(addresses[keep])
+            sampleLabels.append(labels[keep])
+        self.sampleSlides = np.concatenate(sampleSlides)
+        self.sampleAddresses = np.concatenate(sampleAddresses)
+        self.sampleLabels = np.concatenate(sampleLabels)
+        self.classSamples = [np.flatnonzero(self.sampleLabels == i) for i in range(len(self.classNames))]
+
+        numAvailable = {className: len(self.classSamples[i]) for i, className in enumerate(self.classNames)}
+        if numTilesPerClass == 'balanced':
+            self.numTilesPerClass = {className: min(numAvailable.values()) for className in self.classNames}
+        elif numTilesPerClass == 'all':
+            self.numTilesPerClass = numAvailable
+        elif type(numTilesPerClass) in [int, dict]:
+            requested = numTilesPerClass if type(numTilesPerClass) == dict else {className: numTilesPerClass for className in self.classNames}
+            self.numTilesPerClass = {}
+            for className in self.classNames:
+                if className not in requested:
+                    raise ValueError('Class '+str(className)+' not present as a key in numTilesPerClass')
+                if (type(requested[className]) != int) or (requested[className] < 0):
+                    raise ValueError('numTilesPerClass must be non-negative integers')
+                if requested[className] > numAvailable[className]:
+                    print('Warning: '+str(requested[className])+' tiles of class '+className+' requested, but only '+str(numAvailable[className])+' are available; sampling all of them')
+                self.numTilesPerClass[className] = min(requested[className], numAvailable[className])
+        else:
+            raise ValueError("numTilesPerClass must be 'balanced', 'all', an integer, or a dictionary")
+
+        # Slides given as paths are only kept open by the workers
+        del openedSlides
+
+    def __len__(self):
+        # The number of tiles this process reads per epoch, summed over its DataLoader workers
+        numTiles = sum(self.numTilesPerClass.values())
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            return len(range(torch.distributed.get_rank(), numTiles, torch.distributed.get_world_size()))
+        return numTiles
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_slideCache'] = OrderedDict()
+        return state
+
+    def set_epoch(self, epoch):
+        """A function to set the epoch, which changes the tiles sampled and
+        their order in the next iteration.
+
+        Args:
+            epoch (int): the epoch number
+        """
+
+        self.epoch = epoch
+
+    def epochSamples(self):
+        """A function that returns the samples of the current epoch read by
+        this worker, in reading order.
+
+        Returns:
+            np.ndarray: indices into sampleSlides, sampleAddresses and sampleLabels
+        """
+
+        rng = np.random.default_rng([self.seed, self.epoch])
+        samples = np.concatenate([rng.choice(self.classSamples[i], size=self.numTilesPerClass[className], replace=False)
+                                  for i, className in enumerate(self.classNames)]).astype(np.int64)
+        samples = samples[rng.permutation(len(samples))]
+
+        # Split the samples between processes first, then between the DataLoader workers of each process, so __len__ needs no worker count
+        reader = 0
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            reader = torch.distributed.get_rank()
+            samples = samples[reader::torch.distributed.get_world_size()]
+        workerInfo = get_worker_info()
+        if workerInfo is not None:
+            reader = reader * workerInfo.num_workers + workerInfo.id
+            samples = samples[workerInfo.id::workerInfo.num_workers]
+
+        # Visit the slides in random groups of slideCacheSize, shuffling the tiles within each group
+        readerRng = np.random.default_rng([self.seed, self.epoch, reader])
+        slideRank = np.empty(len(self.slides), dtype=np.int64)
+        slideRank[readerRng.permutation(len(self.slides))] = np.arange(len(self.slides))
+        groups = slideRank[self.sampleSlides[samples]] // self.slideCacheSize
+        return samples[np.lexsort((readerRng.random(len(samples)), groups))]
+
+    def __slide(self, slideIndex):
+        slide = self.slides[slideIndex]
+        if not isinstance(slide, str):
+            return slide
+        if os.getpid() != self._cachePid:
+            self._slideCache = OrderedDict()
+            self._cachePid = os.getpid()
+        if slideIndex in self._slideCache:
+            self._slideCache.move_to_end(slideIndex)
+            return self._slideCache[slideIndex]
+        openedSlide = Slide(slide)
+        self._slideCache[slideIndex] = openedSlide
+        while len(self._slideCache) > self.slideCacheSize:
+            self._slideCache.popitem(last=False)
+        return openedSlide
+
+    def __getSample(self, sample):
+        slide = self.__slide(self.sampleSlides[sample])
+        tileAddress = tuple(self.sampleAddresses[sample].tolist())
+        img = Image.fromarray(slide.getTile(tileAddress, writeToNumpy=True, useFetch=True)[..., :3]).convert('RGB')
+        if self.transform is not None:
+            img = self.transform(img)
+        label = int(self.sampleLabels[sample])
+        if not self.returnMasks:
+            return img, label
+        mask = np.stack([np.asarray(slide.getAnnotationTileMask(tileAddress, className, writeToNumpy=True, acceptTilesWithoutClass=True)).astype(bool)
+                         for className in self.maskClassNames]).astype(np.uint8)
+        return img, torch.from_numpy(mask), label
+
+    def __iter__(self):
+        for sample in self.epochSamples():
+            yield self.__getSample(sample)
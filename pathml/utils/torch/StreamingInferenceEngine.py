@@ -0,0 +1,133 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import torch
+from torchvision import transforms
+
+# torchvision transforms that work on a whole (N, C, H, W) batch tensor as well as on a single image
+_batchableTransforms = (transforms.Resize, transforms.CenterCrop, transforms.Normalize, transforms.ConvertImageDtype)
+
+
+# Used for Slide.inferClassifier(), Slide.inferSegmenter() and Processor.applyModel()
+class StreamingInferenceEngine:
+    """A streaming engine that feeds the suitable tiles of a Slide to a model
+    in batches. A pool of reader threads fetches each batch with
+    :meth:`Slide.getTiles() <pathml.slide.Slide.getTiles>` and transforms it
+    while the model runs on the previous batch, with at most prefetchBatches
+    batches in flight at a time. Where the transforms allow it (ToTensor,
+    Resize, CenterCrop, Normalize and ConvertImageDtype), they are applied to
+    the whole batch tensor at once instead of to one PIL image at a time; other
+    transforms fall back to per-tile application in the reader threads.
+
+    Args:
+        slideClass (pathml.slide.Slide): the Slide to infer on
+        transform (torchvision.transforms.Compose, optional): the transforms to apply to each tile. Default is to convert tiles to 0-1 float tensors.
+        segmenting (Bool, optional): whether tiles are prepared for a segmentation model, as in WholeSlideImageDataset. Default is False.
+        batchSize (int, optional): the number of tiles per batch. Default is 30.
+        numWorkers (int, optional): the number of reader threads. Default is 4.
+        prefetchBatches (int, optional): the maximum number of batches read ahead of the model. Default is twice numWorkers.
+        tissueLevelThreshold, foregroundLevelThreshold, otsuLevelThreshold, triangleLevelThreshold, maskLevelThreshold (optional): the tile filters passed to :meth:`Slide.suitableTileAddresses() <pathml.slide.Slide.suitableTileAddresses>`.
+
+    Example:
+        engine = StreamingInferenceEngine(pathml_slide, transform=data_transforms, batchSize=64, tissueLevelThreshold=0.995)
+        for tileAddresses, outputs in engine.infer(model, device): print(outputs.shape)
+    """
+
+    def __init__(self, slideClass, transform=None, segmenting=False, batchSize=30, numWorkers=4, prefetchBatches=False,
+                 tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, maskLevelThreshold=False):
+        if (type(batchSize) != int) or (batchSize <= 0):
+            raise ValueError('batchSize must be an integer greater than 0')
+        self.slideClass = slideClass
+        self.transform = transform
+        self.segmenting = segmenting
+        self.batchSize = batchSize
+        self.numWorkers = max(int(numWorkers), 1)
+        self.prefetchBatches = prefetchBatches if prefetchBatches else 2 * self.numWorkers
+        self.suitableTileAddresses = self.slideClass.suitableTileAddresses(tissueLevelThreshold=tissueLevelThreshold,
+                                                                            foregroundLevelThreshold=foregroundLevelThreshold,
+                                                                            otsuLevelThreshold=otsuLevelThreshold,
+                                                                            triangleLevelThreshold=triangleLevelThreshold,
+                                                                            maskLevelThreshold=maskLevelThreshold)
+        self._batchTransforms = self._getBatchTransforms(transform, segmenting)
+
+    def __len__(self):
+        return (len(self.suitableTileAddresses) + self.batchSize - 1) // self.batchSize
+
+    @staticmethod
+    def _getBatchTransforms(transform, segmenting):
+        # Returns the list of transforms to apply to a uint8 NCHW batch tensor, or None if they cannot be applied batch-wise
+        if transform is None:
+            return [transforms.ToTensor()]
+        if segmenting:
+            return None
+        transformList = transform.transforms if isinstance(transform, transforms.Compose) else [transform]
+        for t in transformList:
+            if not isinstance(t, (transforms.ToTensor,) + _batchableTransforms):
+                return None
+            if isinstance(t, transforms.Resize) and not hasattr(t, 'antialias'):
+                return None # torchvision versions that cannot antialias tensors would not resize like PIL
+        return transformList
+
+    def _prepareBatch(self, tileAddresses):
+        tiles = self.slideClass.getTiles(tileAddresses)[..., :3] # clip off the transparency channel
+
+        if self._batchTransforms is not None:
+            batch = torch.from_numpy(np.ascontiguousarray(tiles)).permute(0, 3, 1, 2)
+            for t in self._batchTransforms:
+                if isinstance(t, transforms.ToTensor):
+                    batch = batch.float().div_(255)
+                elif isinstance(t, transforms.Resize):
+                    # PIL always antialiases, whatever the transform's default for tensors is
+                    batch = transforms.functional.resize(batch, t.size, t.interpolation, t.max_size, antialias=True)
+                else:
+                    batch = t(batch)
+            return batch.contiguous()
+
+        # Fall back to transforming tile by tile as WholeSlideImageDataset does
+        samples = []
+        for tile in tiles:
+            if self.segmenting:
+                img = self.transform(tile)
+                img = img.transpose((2, 0, 1))
+                if img.max() > 1:
+                    img = img / 255
+                samples.append(torch.from_numpy(img).type(torch.FloatTensor))
+            else:
+                samples.append(self.transform(Image.fromarray(tile).convert('RGB')))
+        return torch.stack(samples)
+
+    def __iter__(self):
+        """A generator yielding (list of tile addresses, input batch tensor)
+        pairs in tile dictionary order, with the following batches being read
+        and transformed in the background.
+        """
+
+        batches = [self.suitableTileAddresses[i:i+self.batchSize] for i in range(0, len(self.suitableTileAddresses), self.batchSize)]
+        with ThreadPoolExecutor(max_workers=self.numWorkers) as executor:
+            inFlight = collections.deque()
+            nextBatch = 0
+            while nextBatch < len(batches) or len(inFlight) > 0:
+                while nextBatch < len(batches) and len(inFlight) < self.prefetchBatches:
+                    inFlight.append((batches[nextBatch], executor.submit(self._prepareBatch, batches[nextBatch])))
+                    nextBatch = nextBatch + 1
+                tileAddresses, future = inFlight.popleft()
+                yield tileAddresses, future.result()
+
+    def infer(self, model, device):
+        """A generator running a model on every batch, yielding (list of tile
+        addresses, model output tensor on device) pairs. The model is run
+        without gradient tracking while the next batches are prepared.
+
+        Args:
+            model (torch.nn.Module): the model to infer, already on device and in eval mode
+            device (torch.device): the device to run the model on
+        """
+
+        nonBlocking = torch.device(device).type == 'cuda'
+        for tileAddresses, inputs in self:
+            if nonBlocking:
+                inputs = inputs.pin_memory()
+            with torch.no_grad():
+                outputs = model(inputs.to(device, non_blocking=nonBlocking))
+            yield tileAddresses, outputs
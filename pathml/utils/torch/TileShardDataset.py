@@ -0,0 +1,125 @@
+import io
+import os
+import random
+import numpy as np
+from PIL import Image
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from pathml.tileshards import iterateShard, readShardIndex
+
+
+# Used to train on tiles extracted with a pathml.tileshards.ShardWriter
+class TileShardDataset(IterableDataset):
+    """An iterable dataset streaming the tiles of tar shards written by
+    :class:`ShardWriter <pathml.tileshards.ShardWriter>`. Each shard is read
+    sequentially from start to end; randomness comes from shuffling the order
+    of the shards every epoch and from passing the tiles through a shuffle
+    buffer of shuffleBufferSize tiles. The shards are split between DataLoader
+    workers (and between distributed processes, if torch.distributed is
+    initialized), so every tile is read once per epoch. Like
+    torchvision.datasets.ImageFolder, the dataset yields (image, label) pairs,
+    with labels indexing the alphabetically sorted class names (-1 for tiles
+    stored without a class, such as those of multi-class segmentation).
+
+    Args:
+        shards (str or list of str): the directory the ShardWriter wrote to, or a list of shard paths
+        transform (callable, optional): the transforms to apply to each PIL image. Default is no transforms.
+        classNames (list of str, optional): the classes in label order. Default is the sorted classes of the shard indices.
+        shuffleBufferSize (int, optional): the number of tiles to shuffle among; set to 0 or 1 to read the tiles in shard order. Default is 1000.
+        shuffleShards (Bool, optional): whether to read the shards in a different random order every epoch. Default is True.
+        returnMasks (Bool, optional): whether to yield (image, mask, label) triplets, with the mask stored with each tile as a numpy array. Default is False.
+        seed (int, optional): the random seed of the shard order and shuffle buffer, combined with the epoch set by set_epoch(). Default is 0.
+
+    Example:
+        dataset = TileShardDataset('/path/to/shards', transform=data_transforms)
+        loader = torch.utils.data.DataLoader(dataset, batch_size=64, num_workers=8)
+    """
+
+    def __init__(self, shards, transform=None, classNames=None, shuffleBufferSize=1000, shuffleShards=True, returnMasks=False, seed=0):
+        if isinstance(shards, str):
+            if not os.path.isdir(shards):
+                raise ValueError(shards+' is not a directory')
+            index = readShardIndex(shards)
+            self.shards = index['shards']
+            self.shardNumTiles = dict(zip(self.shards, index['numTiles']))
+            self.classNames = classNames if classNames else index['classes']
+        else:
+            self.shards = list(shards)
+            self.shardNumTiles = None
+            self.classNames = classNames if classNames else []
+        if len(self.shards) == 0:
+            raise ValueError('No shards found')
+        self.transform = transform
+        self.shuffleBufferSize = shuffleBufferSize
+        self.shuffleShards = shuffleShards
+        self.returnMasks = returnMasks
+        self.seed = seed
+        self.epoch = 0
+        self.classToIndex = {className: i for i, className in enumerate(self.classNames)}
+
+    def __len__(self):
+        # The number of tiles this process reads in the current epoch, summed over its DataLoader workers
+        if self.shardNumTiles is None:
+            raise TypeError('The length of a TileShardDataset is only known when it is made from a shard directory')
+        return sum(self.shardNumTiles[shard] for shard in self.__rankShards()[0])
+
+    def set_epoch(self, epoch):
+        """A function to set the epoch, which changes the shard order and
+        shuffling of the next iteration.
+
+        Args:
+            epoch (int): the epoch number
+        """
+
+        self.epoch = epoch
+
+    def __rankShards(self):
+        shards = list(self.shards)
+        if self.shuffleShards:
+            random.Random(self.seed * 1000003 + self.epoch).shuffle(shards)
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            rank = torch.distributed.get_rank()
+            return shards[rank::torch.distributed.get_world_size()], rank
+        return shards, 0
+
+    def __workerShards(self):
+        # Split the shards between processes first, then between the DataLoader workers of each process
+        shards, reader = self.__rankShards()
+        workerInfo = get_worker_info()
+        if workerInfo is not None:
+            shards, reader = shards[workerInfo.id::workerInfo.num_workers], reader * workerInfo.num_workers + workerInfo.id
+        return shards, reader
+
+    def __decode(self, entries):
+        img = Image.open(io.BytesIO(entries['jpg'])).convert('RGB')
+        if self.transform is not None:
+            img = self.transform(img)
+        metadata = entries.get('json', {})
+        label = self.classToIndex.get(metadata.get('class'), -1)
+        if not self.returnMasks:
+            return img, label
+        if 'mask.npy' in entries:
+            mask = np.load(io.BytesIO(entries['mask.npy']))
+        else:
+            maskEntry = next(extension for extension in entries if extension.startswith('mask.'))
+            mask = np.array(Image.open(io.BytesIO(entries[maskEntry])))
+        return img, torch.from_numpy(mask.astype(np.uint8)), label
+
+    def __iter__(self):
+        shards, reader = self.__workerShards()
+        rng = random.Random((self.seed * 1000003 + self.epoch) * 1009 + reader)
+        buffer = []
+        for shard in shards:
+            for key, entries in iterateShard(shard):
+                if self.shuffleBufferSize <= 1:
+                    yield self.__decode(entries)
+                    continue
+                if len(buffer) < self.shuffleBufferSize:
+                    buffer.append(entries)
+                    continue
+                i = rng.randrange(len(buffer))
+                buffer[i], entries = entries, buffer[i]
+                yield self.__decode(entries)
+        rng.shuffle(buffer)
+        for entries in buffer:
+            yield self.__decode(entries)
@@ -1,45 +1,128 @@
-# Authored by https://github.com/milesial at
+# Originally authored by https://github.com/milesial at
 # https://github.com/milesial/Pytorch-UNet/blob/master/dice_loss.py
+#
+# Every sample and class is reduced at once with plain tensor operations, so
+# autograd differentiates the Dice coefficient directly.
 
 import torch
-from torch.autograd import Function
+import torch.nn as nn
+import torch.nn.functional as F
 
 
-class DiceCoeff(Function):
-    """Dice coeff for individual examples"""
+def dice_scores(input, target, eps=0.0001):
+    """A function that returns the (soft) Dice coefficient of every sample and
+    class of a batch in one reduction over the pixels.
+
+    Args:
+        input (torch.Tensor): the (batch, classes, ...) predicted probabilities (or binary masks)
+        target (torch.Tensor): the ground truth, either of the same shape as input, or as (batch, ...) integer class indices
+        eps (float, optional): the smoothing term, so that a sample and class with neither predicted nor ground truth pixels scores 1. Default is 0.0001.
+
+    Returns:
+        torch.Tensor: the (batch, classes) Dice coefficients
+    """
+
+    if target.dim() == input.dim() - 1 and not torch.is_floating_point(target):
+        target = F.one_hot(target.long(), input.shape[1]).movedim(-1, 1)
+    if target.shape != input.shape:
+        raise ValueError('target must have the shape of input, or of input without its class dimension')
+    target = target.to(input.dtype)
+    input, target = input.flatten(2), target.flatten(2)
+    intersection = (input * target).sum(2)
+    union = input.sum(2) + target.sum(2)
+    return (2 * intersection + eps) / (union + eps)
+
+
+def dice_coeff(input, target, eps=0.0001):
+    """A function that returns the mean Dice coefficient of the samples of a
+    batch, each computed over all of its remaining dimensions.
+
+    Args:
+        input (torch.Tensor): the (batch, ...) predicted probabilities (or binary masks)
+        target (torch.Tensor): the (batch, ...) ground truth
+        eps (float, optional): the smoothing term. Default is 0.0001.
+
+    Returns:
+        torch.Tensor: the mean Dice coefficient, as a 0-dimensional tensor
+    """
+
+    return dice_scores(input.reshape(input.shape[0], 1, -1), target.reshape(target.shape[0], 1, -1), eps=eps).mean()
 
-    def forward(self, input, target):
-        self.save_for_backward(input, target)
-        eps = 0.0001
-        self.inter = torch.dot(input.view(-1), target.view(-1))
-        self.union = torch.sum(input) + torch.sum(target) + eps
 
-        t = (2 * self.inter.float() + eps) / self.union.float()
-        return t
+def dice_at_thresholds(input, target, thresholds, eps=0.0001):
+    """A function to score stacked tiles at several probability thresholds at
+    once, without tracking gradients: a pixel is predicted positive when its
+    probability is above the threshold.
 
-    # This function has only a single output, so it gets only one gradient
-    def backward(self, grad_output):
+    Args:
+        input (torch.Tensor): the (batch, classes, ...) 0-1 predicted probabilities
+        target (torch.Tensor): the ground truth, as in :func:`dice_scores`
+        thresholds (float or list of floats): the 0-1 probability thresholds
+        eps (float, optional): the smoothing term. Default is 0.0001.
 
-        input, target = self.saved_variables
-        grad_input = grad_target = None
+    Returns:
+        torch.Tensor: the (thresholds, batch, classes) Dice coefficients
 
-        if self.needs_input_grad[0]:
-            grad_input = grad_output * 2 * (target * self.union - self.inter) \
-                         / (self.union * self.union)
-        if self.needs_input_grad[1]:
-            grad_target = None
+    Example:
+        dice = dice_at_thresholds(torch.sigmoid(model(tiles)), masks, [0.5, 0.75, 0.9]).mean(dim=1)
+    """
 
-        return grad_input, grad_target
+    with torch.no_grad():
+        thresholds = torch.as_tensor(thresholds, dtype=input.dtype, device=input.device).reshape(-1, *([1] * input.dim()))
+        binarized = (input.unsqueeze(0) > thresholds).to(input.dtype)
+        numThresholds = binarized.shape[0]
+        target = target.unsqueeze(0).expand(numThresholds, *target.shape).flatten(0, 1)
+        scores = dice_scores(binarized.flatten(0, 1), target, eps=eps)
+        return scores.reshape(numThresholds, input.shape[0], -1)
 
 
-def dice_coeff(input, target):
-    """Dice coeff for batches"""
-    if input.is_cuda:
-        s = torch.FloatTensor(1).cuda().zero_()
-    else:
-        s = torch.FloatTensor(1).zero_()
+class DiceCoeff(nn.Module):
+    """The Dice coefficient of an individual example, over all of its
+    dimensions.
 
-    for i, c in enumerate(zip(input, target)):
-        s = s + DiceCoeff().forward(c[0], c[1])
+    Args:
+        eps (float, optional): the smoothing term. Default is 0.0001.
+    """
 
-    return s / (i + 1)
+    def __init__(self, eps=0.0001):
+        super().__init__()
+        self.eps = eps
+
+    def forward(self, input, target):
+        return dice_coeff(input.unsqueeze(0), target.unsqueeze(0), eps=self.eps)
+
+
+class DiceLoss(nn.Module):
+    """The soft Dice loss of multi-class segmentation: 1 minus the Dice
+    coefficient of the predicted probabilities, averaged over samples and
+    classes.
+
+    Args:
+        activation (str, optional): applied to the model's output first: 'sigmoid' for multi-label outputs, 'softmax' for mutually exclusive classes, or None if the output already holds probabilities. Default is 'sigmoid'.
+        eps (float, optional): the smoothing term, which also keeps the gradient defined for empty classes. Default is 1.
+        classWeights (list of float, optional): the weight of each class in the average. Default is to weigh classes equally.
+
+    Example:
+        criterion = DiceLoss(activation='softmax')
+        loss = criterion(model(tiles), masks)
+        loss.backward()
+    """
+
+    def __init__(self, activation='sigmoid', eps=1.0, classWeights=None):
+        super().__init__()
+        if activation not in ['sigmoid', 'softmax', None]:
+            raise ValueError("activation must be 'sigmoid', 'softmax' or None")
+        self.activation = activation
+        self.eps = eps
+        self.register_buffer('classWeights', torch.as_tensor(classWeights, dtype=torch.float32) if classWeights is not None else None)
+
+    def forward(self, input, target):
+        if self.activation == 'sigmoid':
+            input = torch.sigmoid(input)
+        elif self.activation == 'softmax':
+            input = torch.softmax(input, dim=1)
+        scores = dice_scores(input, target, eps=self.eps)
+        if self.classWeights is None:
+            return 1 - scores.mean()
+        weights = self.classWeights.to(scores.dtype)
+        return 1 - (scores * weights).sum(1).mean() / weights.sum()
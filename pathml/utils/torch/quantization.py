@@ -0,0 +1,115 @@
+import copy
+import random
+import torch
+import torch.nn as nn
+
+
+# Used for int8 CPU inference in Slide.inferClassifier(), Slide.detectTissue() and Processor.applyModel()
+def quantizeModel(model, calibrationInputs=None, mode='static'):
+    """A function that returns an int8-quantized copy of a model for CPU
+    inference. Static quantization (FX graph mode, with the default qconfig of
+    the active quantized engine) quantizes the weights and activations of every
+    layer and requires calibration inputs to observe the activation ranges;
+    dynamic quantization only quantizes the weights of linear layers and needs
+    no calibration, but gains little on convolutional networks. Quantizing
+    requires torch 1.13 or later.
+
+    Args:
+        model (torch.nn.Module): the float32 model; it is not modified
+        calibrationInputs (list of torch.Tensor, optional): input batches to calibrate static quantization on, such as a handful of transformed tiles of the slide to infer on
+        mode (str, optional): 'static' or 'dynamic'. Default is 'static'.
+
+    Returns:
+        torch.nn.Module: the quantized model, on CPU and in eval mode
+
+    Example:
+        quantized_model = quantizeModel(model, [batch1, batch2])
+    """
+
+    # imported here so that pathml still imports with the older torch versions it supports
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+    if any(isinstance(module, torch.jit.ScriptModule) for module in model.modules()):
+        raise ValueError('TorchScript models, such as tissue detectors loaded with optimize=True, cannot be quantized; quantize the unoptimized model instead')
+    model = copy.deepcopy(model).cpu().eval()
+    if mode == 'dynamic':
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8).eval()
+    if mode != 'static':
+        raise ValueError("mode must be 'static' or 'dynamic'")
+    if not calibrationInputs:
+        raise ValueError('Static quantization requires calibration inputs')
+
+    qconfigMapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    prepared = prepare_fx(model, qconfigMapping, (calibrationInputs[0][:1].cpu(),))
+    with torch.no_grad():
+        for inputs in calibrationInputs:
+            prepared(inputs.cpu())
+    return convert_fx(prepared).eval()
+
+
+def agreementRate(model, quantizedModel, inputs, device=torch.device('cpu')):
+    """A function that compares the predictions of a quantized model with those
+    of the float32 model it was made from.
+
+    Args:
+        model (torch.nn.Module): the float32 model, on device
+        quantizedModel (torch.nn.Module): the quantized model, on CPU
+        inputs (list of torch.Tensor): the input batches to compare the models on
+        device (torch.device, optional): the device of the float32 model. Default is CPU.
+
+    Returns:
+        dict: the 'numTiles' compared, the fraction of them whose top class agrees ('agreement'), and the mean and maximum absolute differences between the softmax probabilities ('meanProbabilityDifference', 'maxProbabilityDifference')
+    """
+
+    numTiles, numAgreeing, sumDifference, maxDifference = 0, 0, 0.0, 0.0
+    with torch.no_grad():
+        for batch in inputs:
+            floatProbabilities = torch.softmax(model(batch.to(device)).float().cpu(), dim=1)
+            quantizedProbabilities = torch.softmax(quantizedModel(batch.cpu()).float(), dim=1)
+            difference = (floatProbabilities - quantizedProbabilities).abs()
+            numTiles = numTiles + batch.shape[0]
+            numAgreeing = numAgreeing + int((floatProbabilities.argmax(dim=1) == quantizedProbabilities.argmax(dim=1)).sum())
+            sumDifference = sumDifference + float(difference.mean(dim=1).sum())
+            maxDifference = max(maxDifference, float(difference.max())) if difference.numel() > 0 else maxDifference
+    return {'numTiles': numTiles,
+            'agreement': numAgreeing / numTiles if numTiles > 0 else float('nan'),
+            'meanProbabilityDifference': sumDifference / numTiles if numTiles > 0 else float('nan'),
+            'maxProbabilityDifference': maxDifference}
+
+
+def quantizeForSlide(model, inferenceEngine, mode='static', numCalibrationTiles=32, numValidationTiles=32, device=torch.device('cpu'), seed=0):
+    """A function that quantizes a model with calibration tiles drawn at random
+    from the suitable tiles of a Slide, and reports how often the quantized
+    model agrees with the float32 model on a disjoint set of validation tiles
+    of the same Slide (or on the calibration tiles, if the Slide has too few
+    tiles for both).
+
+    Args:
+        model (torch.nn.Module): the float32 model, on device and in eval mode
+        inferenceEngine (pathml.utils.torch.StreamingInferenceEngine.StreamingInferenceEngine): the engine that will infer on the Slide, which selects and transforms the tiles
+        mode (str, optional): 'static' or 'dynamic' (see :func:`quantizeModel`). Default is 'static'.
+        numCalibrationTiles (int, optional): the number of tiles to calibrate on. Default is 32.
+        numValidationTiles (int, optional): the number of tiles to compare the models on. Default is 32.
+        device (torch.device, optional): the device of the float32 model. Default is CPU.
+        seed (int, optional): the random seed of the tile selection. Default is 0.
+
+    Returns:
+        tuple: the quantized model and the dict returned by :func:`agreementRate`
+    """
+
+    addresses = list(inferenceEngine.suitableTileAddresses)
+    sample = random.Random(seed).sample(addresses, min(len(addresses), numCalibrationTiles+numValidationTiles))
+    calibrationAddresses = sample[:numCalibrationTiles]
+    validationAddresses = sample[numCalibrationTiles:] if len(sample) > numCalibrationTiles else calibrationAddresses
+
+    def batches(tileAddresses):
+        batchSize = inferenceEngine.batchSize
+        return [inferenceEngine._prepareBatch(tileAddresses[i:i+batchSize]) for i in range(0, len(tileAddresses), batchSize)]
+
+    quantizedModel = quantizeModel(model, batches(calibrationAddresses) if mode == 'static' else None, mode=mode)
+    agreement = agreementRate(model, quantizedModel, batches(validationAddresses), device=device)
+    print('Int8 model agrees with float32 model on '+str(round(100*agreement['agreement'], 1))+'% of '+str(agreement['numTiles'])+' tiles')
+    return quantizedModel, agreement
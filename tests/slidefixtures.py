@@ -0,0 +1,13 @@
+import numpy as np
+import pyvips as pv
+
+from pathml.slide import Slide
+
+rng = np.random.default_rng(0)
+levelImages = [rng.integers(0, 256, size=(96 // 2**level, 128 // 2**level, 4), dtype=np.uint8) for level in range(3)]
+
+
+def makeSlide(tileSize=16, tileOverlap=0, level=0):
+    # A Slide over an in-memory three-level pyramid of random RGBA pixels, tiled as setTileProperties() would
+    slide = Slide._fromPyramid('test.svs', [pv.Image.new_from_array(image) for image in levelImages], level=level)
+    return slide.setTileProperties(tileSize=tileSize, tileOverlap=tileOverlap)
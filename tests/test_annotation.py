@@ -1,10 +1,141 @@
-import sys
-sys.path.append('/home/gehrun01/Desktop/pathml')
-from pathml.slide import Slide
-from pathml.annotation import Annotation
+import json
+import os
+import tempfile
+import unittest
 
-heSlide = Slide('/media/gehrun01/archive-storage/BEST2/BEST2_CAM_0012/BEST2_CAM_0012_HE_1.svs')
+import numpy as np
+import shapely
+from shapely import geometry
+from shapely.ops import unary_union
 
-tissueTypeAnnotations = Annotation(heSlide)
-tissueTypeAnnotations.loadAnnotationFile('/home/gehrun01/Desktop/cytosponge-decision-support/data/annotations/best2-he-qc-annotations/BEST2_CAM_0012_HE_1.xml', fileType='asap')
-print(tissueTypeAnnotations.annotations)
+from pathml.annotation import Annotation, annotationCacheSuffix
+from tests.slidefixtures import makeSlide
+
+
+def writeAsapXml(path, annotations):
+    xml = '<?xml version="1.0"?><ASAP_Annotations><Annotations>'
+    for i, (group, coordinates) in enumerate(annotations):
+        xml += '<Annotation Name="Annotation '+str(i)+'" Type="Polygon" PartOfGroup="'+group+'"><Coordinates>'
+        for order, (x, y) in enumerate(coordinates):
+            xml += '<Coordinate Order="'+str(order)+'" X="'+str(x)+'" Y="'+str(y)+'"/>'
+        xml += '</Coordinates></Annotation>'
+    xml += '</Annotations><AnnotationGroups><Group Name="tumor" PartOfGroup="None"/></AnnotationGroups></ASAP_Annotations>'
+    with open(path, 'w') as f:
+        f.write(xml)
+
+
+class TestAnnotation(unittest.TestCase):
+
+    def test_asap_xml(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.xml')
+            writeAsapXml(path, [('tumor', [(0, 0), (100, 0), (100, 50), (0, 50)]), ('stroma', [(200, 200), (300, 200), (250, 300)])])
+            annotations = Annotation(path)
+
+            self.assertEqual(annotations.fileType, 'asap')
+            self.assertEqual(annotations.classNames.tolist(), ['tumor', 'stroma'])
+            self.assertEqual(annotations.coordinates.shape, (7, 2))
+            polygons = annotations.polygons(scalingFactor=0.5, slideHeight=1000)
+            self.assertEqual(shapely.area(polygons).tolist(), [1250.0, 1250.0])
+            self.assertEqual(polygons[1].bounds, (100.0, 850.0, 150.0, 900.0), "y should point up from the bottom of the slide")
+
+    def test_qupath_geojson(self):
+        square = [[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]]
+        hole = [[40, 40], [60, 40], [60, 60], [40, 60], [40, 40]]
+        features = [{'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [square, hole]}, 'properties': {'classification': {'name': 'tumor'}}},
+                    {'type': 'Feature', 'geometry': {'type': 'MultiPolygon', 'coordinates': [[square], [hole]]}, 'properties': {'classification': {'name': 'stroma'}}}]
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.geojson')
+            with open(path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            annotations = Annotation(path)
+
+            self.assertEqual(annotations.fileType, 'qupath')
+            self.assertEqual(annotations.multiPolygon.tolist(), [False, True])
+            self.assertEqual(list(annotations.annotationRings(1)), [2, 3])
+            self.assertEqual(shapely.area(annotations.polygons()).tolist(), [10000.0, 400.0, 10000.0, 400.0])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.xml')
+            writeAsapXml(path, [('tumor', [(0, 0), (100, 0), (100, 50)])])
+            Annotation(path)
+            self.assertTrue(os.path.isfile(path+annotationCacheSuffix))
+
+            # a cache of the same contents is used even after the file is touched
+            with open(path+annotationCacheSuffix, 'rb') as f:
+                cacheBytes = f.read()
+            os.utime(path, (1, 1))
+            self.assertEqual(Annotation(path).classNames.tolist(), ['tumor'])
+
+            # an edited file is parsed again
+            writeAsapXml(path, [('stroma', [(0, 0), (100, 0), (100, 50)])])
+            os.utime(path, (1, 1))
+            self.assertEqual(Annotation(path).classNames.tolist(), ['stroma'])
+            with open(path+annotationCacheSuffix, 'rb') as f:
+                self.assertNotEqual(f.read(), cacheBytes)
+
+    def test_short_ring(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.xml')
+            writeAsapXml(path, [('dot', [(5, 5)]), ('tumor', [(0, 0), (100, 0), (100, 50)])])
+            polygons = Annotation(path, cache=False).polygons()
+            self.assertIsNone(polygons[0])
+            self.assertEqual(polygons[1].area, 2500.0)
+            self.assertFalse(os.path.exists(path+annotationCacheSuffix))
+
+
+class TestAnnotationOverlap(unittest.TestCase):
+
+    def test_matches_tile_intersection(self):
+        annotations = [('tumor', [(18, 18), (28, 18), (18, 28)]), # inside a single tile
+                       ('tumor', [(40, 8), (90, 8), (90, 60), (40, 60)]), # covering whole tiles and crossing tile boundaries
+                       ('tumor', [(60, 70), (100, 70), (100, 90), (60, 90)]), # two annotations of the same class overlapping each other
+                       ('tumor', [(80, 66), (120, 66), (120, 94), (80, 94)]),
+                       ('stroma', [(2, 70), (30, 70), (30, 90), (2, 90)])] # disjoint from tumor
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.xml')
+            writeAsapXml(path, annotations)
+            for tileOverlap in [0, 0.25]:
+                for merge in [True, False]:
+                    slide = makeSlide(tileOverlap=tileOverlap)
+                    slide.addAnnotations(path, mergeOverlappingAnnotationsOfSameClass=merge, cacheAnnotations=False)
+                    slideHeight = slide.slideProperties['height']
+                    for className in ['tumor', 'stroma']:
+                        # the per-tile intersection addAnnotations used to compute, over the union of the class's annotations
+                        classMultiPolygon = unary_union(slide.annotationClassMultiPolygons[className])
+                        expected = np.zeros(slide.tileDictionary.shape)
+                        for (x, y), tile in slide.tileDictionary.items():
+                            box = geometry.box(tile['x'], slideHeight-tile['y']-tile['height'], tile['x']+tile['height'], slideHeight-tile['y'])
+                            expected[y, x] = box.intersection(classMultiPolygon).area / box.area
+                        overlap = slide.tileDictionary.getColumn(className+'Overlap')
+                        self.assertTrue(np.allclose(overlap, expected), className+' overlap differs with tileOverlap='+str(tileOverlap)+' and merging '+str(merge))
+                        self.assertLessEqual(overlap.max(), 1.0)
+                    self.assertTrue((slide.tileDictionary.getColumn('tumorOverlap') == 1).any())
+
+    def test_edge_cases(self):
+        annotations = [('tumor', [(16, 16), (48, 16), (48, 32), (16, 32)]), # exactly on tile boundaries
+                       ('tumor', [(120, 90), (140, 90), (140, 110), (120, 110)]), # past the corner of the slide
+                       ('tumor', [(0, 48), (64, 48), (64, 96), (0, 96)]),
+                       ('negative', [(16, 64), (40, 64), (40, 96), (16, 96)]),
+                       ('stroma', [(20, 68), (36, 68), (36, 92), (20, 92)])] # left empty by the negative annotation
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.xml')
+            writeAsapXml(path, annotations)
+            slide = makeSlide()
+            slide.addAnnotations(path, negativeClass='negative', cacheAnnotations=False)
+
+        expected = np.zeros((6, 8))
+        expected[1, 1:3] = 1 # tiles only touching the edges of the annotation get 0
+        expected[5, 7] = 6 * 8 / 256
+        expected[3:6, 0:4] = 1
+        expected[4:6, 1] = 0 # under the negative annotation
+        expected[4:6, 2] = 0.5
+        self.assertTrue(np.array_equal(slide.tileDictionary.getColumn('tumorOverlap'), expected))
+        self.assertTrue(slide.annotationClassMultiPolygons['stroma'].is_empty)
+        self.assertTrue(np.array_equal(slide.tileDictionary.getColumn('stromaOverlap'), np.zeros((6, 8))), "An empty class should overlap no tile")
+        self.assertTrue(slide.tileDictionary.getMask('stromaOverlap').all())
+
+
+if __name__ == '__main__':
+    unittest.main()
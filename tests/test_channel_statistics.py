@@ -0,0 +1,47 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from pathml.channelstatistics import ChannelStatistics
+
+
+class TestChannelStatistics(unittest.TestCase):
+
+    def test_matches_float_statistics(self):
+        rng = np.random.default_rng(0)
+        tiles = rng.integers(0, 256, size=(5, 32, 32, 4), dtype=np.uint8)
+        channelStatistics = ChannelStatistics()
+        channelStatistics.update(tiles[:2])
+        for tile in tiles[2:]:
+            channelStatistics.update(tile)
+
+        normalized = tiles[..., :3].astype(np.float64) / 255
+        self.assertEqual(channelStatistics.numTiles, 5)
+        self.assertEqual(channelStatistics.numPixels(), 5 * 32 * 32)
+        self.assertTrue(np.allclose(channelStatistics.channelSums(), normalized.sum(axis=(0, 1, 2))))
+        self.assertTrue(np.allclose(channelStatistics.channelSquaredSums(), np.square(normalized).sum(axis=(0, 1, 2))))
+        self.assertTrue(np.allclose(channelStatistics.mean(), normalized.mean(axis=(0, 1, 2))))
+        self.assertTrue(np.allclose(channelStatistics.std(), normalized.std(axis=(0, 1, 2))))
+
+    def test_merge(self):
+        rng = np.random.default_rng(1)
+        tiles = rng.integers(0, 256, size=(6, 16, 16, 3), dtype=np.uint8)
+        whole, first, second = ChannelStatistics(), ChannelStatistics(), ChannelStatistics()
+        whole.update(tiles)
+        first.update(tiles[:4])
+        second.update(tiles[4:])
+
+        merged = pickle.loads(pickle.dumps(first)) + second
+        self.assertTrue(np.array_equal(merged.histogram, whole.histogram), "Merging should be exact")
+        self.assertEqual(merged.numTiles, 6)
+        self.assertEqual(first.numTiles, 4, "Adding should not modify the operands")
+
+        with self.assertRaises(ValueError):
+            first.merge(ChannelStatistics(numChannels=1))
+        with self.assertRaises(ValueError):
+            first.update(tiles.astype(np.float32))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+import torch
+
+from pathml.utils.torch.dice_loss import DiceCoeff, DiceLoss, dice_at_thresholds, dice_coeff, dice_scores
+
+
+def loopedDice(input, target, eps=0.0001):
+    intersection = torch.dot(input.reshape(-1), target.reshape(-1))
+    return (2 * intersection + eps) / (input.sum() + target.sum() + eps)
+
+
+class TestDiceLoss(unittest.TestCase):
+
+    def test_scores_match_per_sample_loop(self):
+        torch.manual_seed(0)
+        input = torch.rand(4, 3, 8, 8)
+        target = (torch.rand(4, 3, 8, 8) > 0.5).float()
+        scores = dice_scores(input, target)
+        self.assertEqual(tuple(scores.shape), (4, 3))
+        for sample in range(4):
+            for c in range(3):
+                self.assertAlmostEqual(scores[sample, c].item(), loopedDice(input[sample, c], target[sample, c]).item(), places=5)
+
+        self.assertAlmostEqual(dice_coeff(input, target).item(), torch.stack([loopedDice(input[i], target[i]) for i in range(4)]).mean().item(), places=5)
+        self.assertAlmostEqual(DiceCoeff()(input[0], target[0]).item(), loopedDice(input[0], target[0]).item(), places=5)
+        self.assertEqual(dice_coeff(torch.zeros(2, 5, 5), torch.zeros(2, 5, 5)).item(), 1.0)
+
+        labels = torch.randint(0, 3, (4, 8, 8))
+        oneHot = torch.stack([labels == c for c in range(3)], dim=1).float()
+        self.assertTrue(torch.allclose(dice_scores(input, labels), dice_scores(input, oneHot)))
+        with self.assertRaises(ValueError):
+            dice_scores(input, target[:, :2])
+
+    def test_loss_gradient(self):
+        torch.manual_seed(1)
+        logits = torch.randn(2, 3, 6, 6, requires_grad=True)
+        labels = torch.randint(0, 3, (2, 6, 6))
+        loss = DiceLoss(activation='softmax', classWeights=[0.5, 1, 1])(logits, labels)
+        loss.backward()
+        self.assertTrue(torch.isfinite(logits.grad).all())
+
+        probabilities = torch.rand(2, 3, 6, 6, dtype=torch.float64, requires_grad=True)
+        target = torch.rand(2, 3, 6, 6, dtype=torch.float64)
+        self.assertTrue(torch.autograd.gradcheck(lambda x: DiceLoss(activation=None)(x, target), (probabilities,)))
+
+    def test_thresholds(self):
+        torch.manual_seed(2)
+        input = torch.rand(5, 2, 8, 8)
+        target = (torch.rand(5, 2, 8, 8) > 0.5).float()
+        scores = dice_at_thresholds(input, target, [0.25, 0.5, 0.9])
+        self.assertEqual(tuple(scores.shape), (3, 5, 2))
+        for i, threshold in enumerate([0.25, 0.5, 0.9]):
+            self.assertTrue(torch.allclose(scores[i], dice_scores((input > threshold).float(), target)))
+
+
+if __name__ == '__main__':
+    unittest.main()
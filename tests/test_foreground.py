@@ -0,0 +1,41 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import pyvips as pv
+from skimage.color import rgb2lab
+from skimage.filters import threshold_otsu, threshold_triangle
+
+from pathml.slide import Foreground
+from pathml.tiledictionary import TileDictionary
+
+rng = np.random.default_rng(0)
+testImage = np.full((90, 120, 3), 240, dtype=np.uint8)
+testImage[20:70, 10:80] = rng.integers(60, 200, size=(50, 70, 3))
+testSlide = SimpleNamespace(levels=[pv.Image.new_from_array(testImage)],
+                            tileDictionary=TileDictionary.fromGrid(numTilesInX=5, numTilesInY=4, tileSize=30, tileOverlap=5))
+testSlide.slide = testSlide.levels[0]
+
+
+class TestForeground(unittest.TestCase):
+
+    def test_foreground_thresholds(self):
+        lightness = rgb2lab(testImage)[:, :, 0]
+        foreground = Foreground(testSlide, 0, stripHeight=16)
+        self.assertAlmostEqual(foreground.thresholdLevelOtsu, threshold_otsu(lightness[lightness < 100]), places=2)
+        self.assertAlmostEqual(foreground.thresholdLevelTriangle, threshold_triangle(lightness[lightness < 100]), places=2)
+
+    def test_foreground_tile_levels(self):
+        lightness = rgb2lab(testImage)[:, :, 0]
+        foreground = Foreground(testSlide, 0, stripHeight=16)
+        levels, valid = foreground.tileLevels(testSlide, mode=['foreground', 'otsu'])
+        self.assertTrue(valid.all())
+        for x, y in testSlide.tileDictionary:
+            tile = testSlide.tileDictionary[(x, y)]
+            area = lightness[tile['y']:tile['y']+tile['height'], tile['x']:tile['x']+tile['width']]
+            self.assertAlmostEqual(levels[y, x, 0], area.mean(), places=3)
+            self.assertAlmostEqual(levels[y, x, 1], (area <= foreground.thresholdLevelOtsu).mean(), places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+
+from pathml.slide import Slide
+from tests.slidefixtures import levelImages, makeSlide
+
+rng = np.random.default_rng(0)
+
+
+def countFetches(slide):
+    # Wraps the Slide's region fetches to record the width of every region read
+    fetchTile = slide.fetchTile
+    widths = []
+
+    def countingFetchTile(width, height, x, y):
+        widths.append(width)
+        return fetchTile(width, height, x, y)
+
+    slide.fetchTile = countingFetchTile
+    return widths
+
+
+class TestGetTiles(unittest.TestCase):
+
+    def assertMatchesGetTile(self, slide, tileAddresses, **kwargs):
+        tiles = slide.getTiles(tileAddresses, **kwargs)
+        expected = np.stack([slide.getTile(tileAddress, writeToNumpy=True) for tileAddress in tileAddresses])
+        self.assertEqual(tiles.shape, expected.shape)
+        self.assertEqual(tiles.dtype, expected.dtype)
+        self.assertTrue(np.array_equal(tiles, expected), str(tileAddresses))
+
+    def test_matches_get_tile(self):
+        slide = makeSlide()
+        allAddresses = list(slide.iterateTiles())
+        self.assertMatchesGetTile(slide, [(0, 0), (1, 0), (2, 0)]) # one run
+        self.assertMatchesGetTile(slide, [(0, 1), (2, 1), (3, 1), (7, 1)]) # gapped
+        self.assertMatchesGetTile(slide, [(5, 0), (5, 1), (6, 1), (0, 4), (1, 5)]) # several rows
+        self.assertMatchesGetTile(slide, [(3, 2), (3, 2), (4, 2)]) # repeated
+        shuffled = [allAddresses[i] for i in rng.permutation(len(allAddresses))]
+        self.assertMatchesGetTile(slide, shuffled)
+        self.assertEqual(slide.getTiles([]).shape, (0, 16, 16, 4))
+
+    def test_overlapping_grid(self):
+        slide = makeSlide(tileSize=16, tileOverlap=0.25)
+        allAddresses = list(slide.iterateTiles())
+        self.assertMatchesGetTile(slide, allAddresses)
+        self.assertMatchesGetTile(slide, [allAddresses[i] for i in rng.permutation(len(allAddresses))[:20]])
+
+        view = makeSlide().tilingView(1, 8, tileOverlap=0.5)
+        self.assertMatchesGetTile(view, [(0, 0), (1, 0), (2, 0), (4, 0), (3, 3), (14, 10)])
+
+    def test_max_tiles_per_read(self):
+        slide = makeSlide()
+        row = [(x, 2) for x in range(8)]
+        widths = countFetches(slide)
+        tiles = slide.getTiles(row[::-1], maxTilesPerRead=3)
+        self.assertEqual(widths, [48, 48, 32], "A row of 8 neighbouring tiles should be read in 3 regions of at most 3 tiles")
+        self.assertTrue(np.array_equal(tiles, np.stack([slide.getTile(tileAddress, writeToNumpy=True) for tileAddress in row[::-1]])))
+
+        del widths[:]
+        slide.getTiles([(0, 2), (1, 2), (3, 2), (0, 3)], maxTilesPerRead=16)
+        self.assertEqual(widths, [32, 16, 16], "Gaps and row changes should start new regions")
+
+        for maxTilesPerRead in [0, 1.5]:
+            with self.assertRaises(ValueError):
+                slide.getTiles(row, maxTilesPerRead=maxTilesPerRead)
+
+    def test_tiles_hold_slide_pixels(self):
+        slide = makeSlide(tileSize=16, tileOverlap=0.25)
+        tileAddresses = [(2, 0), (1, 0), (0, 0), (8, 6), (3, 4)]
+        tiles = slide.getTiles(tileAddresses)
+        self.assertEqual(tiles.shape, (5, 16, 16, 4))
+        for tileAddress, tile in zip(tileAddresses, tiles):
+            x, y = tileAddress[0] * 12, tileAddress[1] * 12 # overlapping tiles are 12 pixels apart
+            self.assertEqual((slide.tileDictionary[tileAddress]['x'], slide.tileDictionary[tileAddress]['y']), (x, y))
+            self.assertTrue(np.array_equal(tile, levelImages[0][y:y+16, x:x+16]), str(tileAddress))
+
+        view = makeSlide().tilingView(2, 8)
+        self.assertTrue(np.array_equal(view.getTiles([(3, 2)])[0], levelImages[2][16:24, 24:32]), "Views should read their own level")
+
+    def test_invalid_addresses(self):
+        slide = makeSlide()
+        for tileAddresses in [[(8, 0)], [(0, 6)], [(-1, 0)], [(0, 0), (1, 2, 3)], [5], [(0, 0), None]]:
+            with self.assertRaises(ValueError, msg=str(tileAddresses)):
+                slide.getTiles(tileAddresses)
+
+        slide.tileDictionary.setColumn('width', np.where(np.arange(8) == 7, 8, 16) * np.ones((6, 1), dtype=int))
+        with self.assertRaises(ValueError):
+            slide.getTiles([(6, 0), (7, 0)])
+        self.assertEqual(slide.getTiles([(5, 0), (6, 0)]).shape, (2, 16, 16, 4), "Tiles of the same size should still be read together")
+
+        with self.assertRaises(PermissionError):
+            Slide._fromPyramid('test.svs', [slide.slide]).getTiles([(0, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from shapely import geometry
+
+from pathml.labelraster import LabelRaster
+from tests.slidefixtures import makeSlide
+from tests.test_annotation import writeAsapXml
+
+# Annotation coordinates have their y axis pointing up from the bottom of the slide (height 1000)
+testClassMultiPolygons = {
+    'tumor': geometry.MultiPolygon([geometry.box(100, 500, 700, 900).difference(geometry.box(300, 600, 400, 700))]),
+    'normal': geometry.MultiPolygon([geometry.box(800, 0, 1200, 300)]),
+}
+
+
+class TestLabelRaster(unittest.TestCase):
+
+    def test_label_raster_labels(self):
+        labelRaster = LabelRaster.fromMultiPolygons(testClassMultiPolygons, 1200, 1000, blockSize=128)
+        labels = labelRaster.read(0, 0, 1200, 1000)
+        self.assertEqual(labels.shape, (1000, 1200))
+        self.assertTrue((labels[150:450, 150:250] == 1).all(), "Pixels inside the tumor box should have the first label")
+        self.assertTrue((labels[320:380, 320:380] == 0).all(), "Holes in annotations should be left unlabelled")
+        self.assertTrue((labels[750:950, 850:1150] == 2).all())
+        self.assertEqual(labels[50, 50], 0)
+        self.assertAlmostEqual((labels == 1).sum() / testClassMultiPolygons['tumor'].area, 1, delta=0.01)
+
+    def test_label_raster_class_mask(self):
+        labelRaster = LabelRaster.fromMultiPolygons(testClassMultiPolygons, 1200, 1000, blockSize=128)
+        mask = labelRaster.classMask(1100, 900, 200, 200, ['tumor', 'normal'])
+        self.assertEqual(mask.shape, (200, 200))
+        self.assertTrue(mask[:100, :100].all())
+        self.assertFalse(mask[100:, :].any(), "Pixels outside the raster should be 0")
+        self.assertFalse(labelRaster.classMask(0, 0, 64, 64, 'unknown').any())
+
+        downsampled = LabelRaster.fromMultiPolygons(testClassMultiPolygons, 1200, 1000, downsample=4, blockSize=128)
+        self.assertEqual((downsampled.width, downsampled.height), (300, 250))
+        self.assertTrue(downsampled.classMask(30, 30, 40, 40, 'tumor').all())
+
+
+class TestAnnotationTileMasks(unittest.TestCase):
+
+    def slideMasks(self, path, rasterize, **kwargs):
+        # The mask of each class over the whole slide, assembled from the tile masks of getAnnotationTileMask()
+        slide = makeSlide()
+        slide.addAnnotations(path, cacheAnnotations=False, rasterize=rasterize, **kwargs)
+        if rasterize:
+            slide.rasterizeAnnotations(blockSize=24) # blocks that do not line up with the tiles
+        masks = {}
+        for className in slide.annotationClassMultiPolygons:
+            masks[className] = np.zeros((96, 128), dtype=bool)
+            for (x, y), tile in slide.tileDictionary.items():
+                mask = slide.getAnnotationTileMask((x, y), className, writeToNumpy=True)
+                self.assertEqual((mask.shape, mask.dtype), ((16, 16), np.bool_))
+                masks[className][tile['y']:tile['y']+16, tile['x']:tile['x']+16] = mask
+        return masks
+
+    def test_raster_and_polygon_masks_match(self):
+        annotations = [('tumor', [(20, 30), (70, 30), (70, 60), (20, 60)]),
+                       ('tumor', [(85.5, 10.2), (120.7, 40.4), (90.3, 70.9), (100.1, 40.6)]), # not rectangular, with fractional vertices
+                       ('stroma', [(5, 70), (60, 70), (60, 92), (5, 92)]),
+                       ('stroma', [(40, 65), (70, 65), (70, 80), (40, 80)]), # overlaps the other stroma annotation
+                       ('negative', [(30, 75), (45, 75), (45, 85), (30, 85)])] # a hole in stroma
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'annotations.xml')
+            writeAsapXml(path, annotations)
+            # negativeClass can only cut holes into merged annotations
+            for kwargs in [{'negativeClass': 'negative'}, {'classesToAdd': ['tumor', 'stroma'], 'mergeOverlappingAnnotationsOfSameClass': False}]:
+                merge = 'negativeClass' in kwargs
+                polygonMasks = self.slideMasks(path, False, **kwargs)
+                rasterMasks = self.slideMasks(path, True, **kwargs)
+                for className in ['tumor', 'stroma']:
+                    self.assertTrue(np.array_equal(polygonMasks[className], rasterMasks[className]),
+                                    className+' masks differ in '+str((polygonMasks[className] != rasterMasks[className]).sum())+' pixels with merging '+str(merge))
+
+                tumor, stroma = polygonMasks['tumor'], polygonMasks['stroma']
+                self.assertEqual(tumor[:, :80].sum(), 50 * 30, "A box should cover the pixels whose centers lie inside it")
+                self.assertTrue(tumor[30:60, 20:70].all())
+                self.assertEqual(stroma[75:85, 30:45].any(), not merge, "Holes left by negativeClass should be left out")
+                self.assertTrue(stroma[70:92, 5:30].all() and stroma[65:75, 46:70].all())
+
+
+if __name__ == '__main__':
+    unittest.main()
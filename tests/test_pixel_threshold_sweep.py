@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from pathml.pixelthresholdsweep import PixelThresholdSweep
+from tests.test_prediction_store import SegmentationModel
+from tests.slidefixtures import makeSlide
+
+rng = np.random.default_rng(0)
+thresholds = [0, 0.2, 0.5, 100 / 255, 0.9, 1.0]
+
+
+def bruteForce(tiles, threshold, eps=0.0001):
+    dice, iou, tps, fps, fns = [], [], 0, 0, 0
+    for prediction, groundTruth in tiles:
+        probabilities = prediction / 255 if prediction.dtype == np.uint8 else prediction
+        predicted, groundTruth = probabilities > threshold, groundTruth > 0
+        tp, fp, fn = int((predicted & groundTruth).sum()), int((predicted & ~groundTruth).sum()), int((~predicted & groundTruth).sum())
+        dice.append((2 * tp + eps) / (2 * tp + fp + fn + eps))
+        iou.append((tp + eps) / (tp + fp + fn + eps))
+        tps, fps, fns = tps + tp, fps + fp, fns + fn
+    return np.mean(dice), np.mean(iou), 2 * tps / (2 * tps + fps + fns) if tps + fps + fns > 0 else 1.0
+
+
+class TestPixelThresholdSweep(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        for dtype in [np.uint8, np.float32]:
+            tiles = []
+            for i in range(5):
+                groundTruth = (rng.random((12, 12)) < 0.3) * 255
+                prediction = rng.integers(0, 256, size=(12, 12), dtype=np.uint8) if dtype == np.uint8 else rng.random((12, 12)).astype(np.float32)
+                tiles.append((prediction, groundTruth))
+            tiles.append((tiles[0][0], np.zeros((12, 12))))
+
+            sweep = PixelThresholdSweep(thresholds)
+            for prediction, groundTruth in tiles:
+                sweep.add(prediction, groundTruth)
+            expected = np.array([bruteForce(tiles, threshold) for threshold in thresholds])
+            self.assertTrue(np.allclose(sweep.metric('dice_coeff'), expected[:, 0]), dtype)
+            self.assertTrue(np.allclose(sweep.metric('iou'), expected[:, 1]), dtype)
+            self.assertTrue(np.allclose(sweep.metric('dice_coeff', pooled=True), expected[:, 2]), dtype)
+            self.assertEqual(sweep.counts['tp'][-1] + sweep.counts['fp'][-1], 0)
+
+        with self.assertRaises(ValueError):
+            sweep.metric('accuracy')
+        with self.assertRaises(ValueError):
+            PixelThresholdSweep(0.5).metric()
+
+    def test_slide_metric(self):
+        torch.manual_seed(0)
+        slide = makeSlide()
+        with tempfile.TemporaryDirectory() as folder:
+            slide.inferSegmenter(SegmentationModel(), ['normal', 'tumor'], dataTransforms=lambda tile: tile, batchSize=8, numWorkers=1,
+                                 predictionStoreFolder=os.path.join(folder, 'predictions'))
+            tiles = [(slide.getSegmenterPrediction(tileAddress, 'tumor'), np.zeros((16, 16))) for tileAddress in slide.segmenterPredictionTileAddresses]
+            dice = slide.segmenterMetricAtThreshold('tumor', [0.3, 0.6])
+            self.assertTrue(np.allclose(dice, [bruteForce(tiles, 0.3)[0], bruteForce(tiles, 0.6)[0]]))
+            self.assertAlmostEqual(slide.segmenterMetricAtThreshold('tumor', 0.3, metric='recall', pooled=True), 1.0, msg="Recall without ground truth positives is 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+from shapely import geometry
+
+from pathml.pmlfile import compactPml, isPmlDirectory, loadPml, readManifest, savePml
+from pathml.tiledictionary import TileDictionary
+from tests.slidefixtures import makeSlide
+
+
+def makeContents():
+    tileDictionary = TileDictionary.fromGrid(numTilesInX=4, numTilesInY=3, tileSize=100)
+    tileDictionary.setColumn('tissueLevel', np.linspace(0, 1, 12).reshape(3, 4))
+    tileDictionary[(1, 2)]['classifierInferencePrediction'] = {'normal': 0.25, 'tumor': 0.75}
+    tileDictionary[(3, 0)]['segmenterInferencePrediction'] = {'tumor': np.ones((100, 100), dtype=np.uint8)}
+    return {'slideFilePath': '/path/to/slide.svs', 'level': 0, 'tileSize': 100, 'tileOverlap': 0,
+            'tileDictionary': tileDictionary,
+            'annotationClassMultiPolygons': {'tumor': geometry.MultiPolygon([geometry.box(0, 0, 150, 150)])}}
+
+
+class TestPmlFile(unittest.TestCase):
+
+    def test_pml_round_trip(self):
+        contents = makeContents()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'slide.pml')
+            savePml(path, contents)
+            self.assertTrue(isPmlDirectory(path))
+            loaded = loadPml(path)
+
+            self.assertEqual(loaded['tileSize'], 100)
+            self.assertEqual(loaded['tileDictionary'][(1, 2)]['classifierInferencePrediction'], {'normal': 0.25, 'tumor': 0.75})
+            self.assertTrue(np.array_equal(loaded['tileDictionary'].getColumn('tissueLevel'), contents['tileDictionary'].getColumn('tissueLevel')))
+            self.assertEqual(loaded['tileDictionary'][(3, 0)]['segmenterInferencePrediction']['tumor'].shape, (100, 100))
+            self.assertTrue(loaded['annotationClassMultiPolygons']['tumor'].equals(contents['annotationClassMultiPolygons']['tumor']))
+
+            # memory-mapped columns are copy-on-write and can be saved back to the same .pml
+            loaded['tileDictionary'][(0, 0)]['tissueLevel'] = 0.5
+            self.assertEqual(loadPml(path)['tileDictionary'][(0, 0)]['tissueLevel'], 0.0, "Writes should not reach the file before saving")
+            savePml(path, loaded)
+            self.assertEqual(loadPml(path)['tileDictionary'][(0, 0)]['tissueLevel'], 0.5)
+
+    def test_pml_incremental_save(self):
+        contents = makeContents()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'slide.pml')
+            savePml(path, contents)
+            tissueLevelFile = readManifest(path)['columns']['tissueLevel']['values']
+
+            contents['tileDictionary'].setColumn('foregroundLevel', np.full((3, 4), 50.0))
+            contents['tileDictionary'][(0, 0)]['tissueLevel'] = 1.0
+            savePml(path, contents, columns=['foregroundLevel'])
+            manifest = readManifest(path)
+            self.assertEqual(manifest['columns']['tissueLevel']['values'], tissueLevelFile, "Keys not listed should keep their saved files")
+            loaded = loadPml(path)
+            self.assertEqual(loaded['tileDictionary'][(3, 2)]['foregroundLevel'], 50.0)
+            self.assertEqual(loaded['tileDictionary'][(0, 0)]['tissueLevel'], 0.0)
+
+            savePml(path, contents, columns=['tissueLevel'])
+            self.assertTrue(os.path.exists(os.path.join(path, tissueLevelFile)), "Superseded files should be kept until compaction")
+            self.assertGreater(compactPml(path), 0)
+            self.assertFalse(os.path.exists(os.path.join(path, tissueLevelFile)))
+            self.assertEqual(loadPml(path)['tileDictionary'][(0, 0)]['tissueLevel'], 1.0)
+
+    def test_incremental_save_keeps_unchanged_tissue_detection_map(self):
+        contents = makeContents()
+        contents['rawTissueDetectionMap'] = {'map': np.linspace(0, 1, 36).reshape(3, 4, 3), 'level': 1, 'tileSize': 8, 'tileOverlap': 0}
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'slide.pml')
+            savePml(path, contents)
+            mapFile = readManifest(path)['rawTissueDetectionMap']['map']
+
+            contents['tileDictionary'].setColumn('foregroundLevel', np.full((3, 4), 50.0))
+            files = set(os.listdir(path))
+            savePml(path, contents, columns=['foregroundLevel'])
+            manifest = readManifest(path)
+            self.assertEqual(manifest['rawTissueDetectionMap']['map'], mapFile, "An unchanged map should keep its saved file")
+            self.assertEqual(set(os.listdir(path)) - files - {'manifest.json'}, set(manifest['columns']['foregroundLevel'].values()) & set(os.listdir(path)),
+                             "Only the foregroundLevel column should be written")
+
+            contents['rawTissueDetectionMap']['map'] = contents['rawTissueDetectionMap']['map'].astype(np.float32)
+            savePml(path, contents, columns=[])
+            self.assertNotEqual(readManifest(path)['rawTissueDetectionMap']['map'], mapFile, "A map of another dtype should be written again")
+            mapFile = readManifest(path)['rawTissueDetectionMap']['map']
+            contents['rawTissueDetectionMap']['map'][0, 0, 0] = 0.5
+            savePml(path, contents, columns=[])
+            self.assertNotEqual(readManifest(path)['rawTissueDetectionMap']['map'], mapFile, "A changed map should be written again")
+            self.assertTrue(np.array_equal(loadPml(path)['rawTissueDetectionMap']['map'], contents['rawTissueDetectionMap']['map']))
+
+    def test_pickled_pml(self):
+        contents = makeContents()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'slide.pml')
+            with open(path, 'wb') as f:
+                pickle.dump({'slideFilePath': contents['slideFilePath'], 'level': 0, 'tileDictionary': contents['tileDictionary'].toDict()}, f)
+            loaded = loadPml(path)
+            self.assertEqual(loaded['tileDictionary'][(2, 1)]['tissueLevel'], contents['tileDictionary'][(2, 1)]['tissueLevel'])
+
+            with self.assertRaises(KeyError):
+                savePml(path, loaded) # lacks the tileSize and tileOverlap
+            self.assertTrue(os.path.isfile(path), "A failed save should keep the pickled .pml file")
+            self.assertEqual(os.listdir(folder), ['slide.pml'], "A failed save should not leave a temporary directory behind")
+
+            savePml(path, dict(loaded, tileSize=100, tileOverlap=0))
+            self.assertTrue(isPmlDirectory(path), "Saving should replace a pickled .pml file with a .pml directory")
+            self.assertEqual(os.listdir(folder), ['slide.pml'])
+
+    def test_save_tile_dictionary(self):
+        slide = makeSlide()
+        slide.tileDictionary.setColumn('tissueLevel', np.linspace(0, 1, 48).reshape(6, 8))
+        with tempfile.TemporaryDirectory() as folder:
+            slide.saveTileDictionary(fileName='tiles', folder=folder)
+            with open(os.path.join(folder, 'tiles.pml'), 'rb') as f:
+                tileDictionary = pickle.load(f)
+        self.assertIs(type(tileDictionary), dict, "The tile dictionary should be pickled as a plain dict")
+        self.assertEqual(tileDictionary, slide.tileDictionary.toDict())
+        self.assertEqual(tileDictionary[(7, 5)]['tissueLevel'], 1.0)
+
+    def test_save_into_existing_directory(self):
+        contents = makeContents()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'slide.pml')
+            os.makedirs(os.path.join(path, 'other.store'))
+            for fileName in ['other.npy', 'other.pkl', 'other.wkb']:
+                with open(os.path.join(path, fileName), 'wb') as f:
+                    f.write(b'data')
+            savePml(path, contents)
+            self.assertEqual(sorted(fileName for fileName in os.listdir(path) if fileName.startswith('other')), ['other.npy', 'other.pkl', 'other.store', 'other.wkb'],
+                             "Files of a directory that was not a .pml should not be removed")
+            self.assertEqual(loadPml(path)['tileSize'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
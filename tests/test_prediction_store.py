@@ -0,0 +1,160 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from pathml.pmlfile import compactPml, loadPml, readManifest, savePml
+from pathml.predictionstore import PredictionStore
+from tests.test_pml_file import makeContents
+from tests.slidefixtures import makeSlide
+
+rng = np.random.default_rng(0)
+
+
+class SegmentationModel(nn.Module):
+    n_classes = 2
+
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 2, 1)
+
+    def forward(self, x):
+        return self.conv(x)
+
+
+class DownsamplingSegmentationModel(nn.Module):
+    n_classes = 1
+
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 1, 2, stride=2)
+
+    def forward(self, x):
+        return self.conv(x)[:, 0]
+
+
+class TestPredictionStore(unittest.TestCase):
+
+    def test_write_and_read(self):
+        predictions = rng.integers(0, 256, size=(10, 2, 8, 6), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as folder:
+            store = PredictionStore(os.path.join(folder, 'predictions.store'), classNames=['normal', 'tumor'], tileShape=(8, 6), tilesPerChunk=4, cacheChunks=1)
+            self.assertTrue(np.array_equal(store.write(predictions[:7]), np.arange(7)))
+            self.assertTrue(np.array_equal(store.read(6), predictions[6]), "Buffered tiles should be readable before they are flushed")
+            store.write(predictions[7:])
+            store.flush()
+            self.assertEqual([chunk['numTiles'] for chunk in store.chunks], [4, 4, 2])
+            for index in [9, 0, 5, 1]:
+                self.assertTrue(np.array_equal(store.read(index), predictions[index]))
+
+            reopened = pickle.loads(pickle.dumps(store))
+            self.assertEqual((len(reopened), reopened.classNames, reopened.dtype), (10, ['normal', 'tumor'], np.uint8))
+            self.assertTrue(np.array_equal(reopened.read(8), predictions[8]))
+
+            with self.assertRaises(IndexError):
+                store.read(10)
+            with self.assertRaises(ValueError):
+                store.write(predictions[:, :1])
+
+    def test_reads_do_not_share_the_cache(self):
+        predictions = rng.integers(0, 256, size=(6, 2, 8, 6), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as folder:
+            store = PredictionStore(os.path.join(folder, 'predictions.store'), classNames=['normal', 'tumor'], tileShape=(8, 6), tilesPerChunk=4)
+            store.write(predictions)
+            for index in [1, 5]: # a cached chunk and the write buffer
+                tile = store.read(index)
+                tile[:] = 0
+                self.assertTrue(np.array_equal(store.read(index), predictions[index]), "Modifying a read tile should not change the store")
+
+    def test_pml_keeps_store(self):
+        contents = makeContents()
+        with tempfile.TemporaryDirectory() as folder:
+            contents['segmenterPredictionStore'] = PredictionStore(os.path.join(folder, 'predictions'), classNames=['tumor'], tileShape=(4, 4), dtype='float32')
+            contents['segmenterPredictionStore'].write(np.full((3, 1, 4, 4), 0.5))
+            path = os.path.join(folder, 'slide.pml')
+            savePml(path, contents)
+            storeName = readManifest(path)['segmenterPredictionStore']
+            self.assertTrue(storeName.endswith('.store'))
+
+            loaded = loadPml(path)
+            self.assertEqual(os.path.dirname(loaded['segmenterPredictionStore'].path), os.path.abspath(path))
+            self.assertTrue(np.array_equal(loaded['segmenterPredictionStore'].read(2), np.full((1, 4, 4), 0.5, dtype=np.float32)))
+            savePml(path, loaded)
+            self.assertEqual(readManifest(path)['segmenterPredictionStore'], storeName, "A store already in the .pml should not be copied again")
+
+            contents['segmenterPredictionStore'] = PredictionStore(os.path.join(folder, 'newPredictions'), classNames=['tumor'], tileShape=(4, 4))
+            savePml(path, contents, columns=[])
+            self.assertTrue(os.path.isdir(os.path.join(path, storeName)), "Incremental saves should keep superseded stores")
+            self.assertGreater(compactPml(path), 0)
+            self.assertFalse(os.path.isdir(os.path.join(path, storeName)))
+
+    def test_slide_segmentation_reads_from_store(self):
+        slide = makeSlide()
+        with tempfile.TemporaryDirectory() as folder:
+            slide.inferSegmenter(SegmentationModel(), ['normal', 'tumor'], dataTransforms=lambda tile: tile, batchSize=5, numWorkers=1,
+                                 predictionStoreFolder=os.path.join(folder, 'predictions'))
+            self.assertEqual(len(slide.segmenterPredictionStore), 48)
+            self.assertEqual(slide.tileDictionary.exportColumn('segmenterInferencePrediction')['kind'], 'record')
+
+            prediction = slide.getSegmenterPrediction((1, 2), 'tumor')
+            self.assertEqual((prediction.shape, prediction.dtype), ((16, 16), np.uint8))
+            self.assertAlmostEqual(slide.tileDictionary[(1, 2)]['segmenterInferencePrediction']['tumor'], prediction.mean() / 255, delta=1 / 255)
+
+            slide.getNonOverlappingSegmentationInferenceArray('tumor', folder=folder)
+            inference = np.load(os.path.join(folder, 'test.npz'))['inference']
+            self.assertTrue(np.array_equal(inference[32:48, 16:32], prediction))
+
+            slide.save(folder=folder)
+            self.assertEqual(os.path.dirname(slide.segmenterPredictionStore.path), os.path.join(folder, 'test.pml'))
+            self.assertTrue(np.array_equal(slide.getSegmenterPrediction((1, 2), 'tumor'), prediction))
+
+            with self.assertRaises(ValueError):
+                slide.getSegmenterPrediction((1, 2), 'stroma')
+
+    def test_temporary_store_is_removed(self):
+        slide = makeSlide()
+        slide.inferSegmenter(SegmentationModel(), ['normal', 'tumor'], dataTransforms=lambda tile: tile, batchSize=8, numWorkers=1)
+        firstPath = slide.segmenterPredictionStore.path
+        self.assertTrue(os.path.isdir(firstPath))
+
+        slide.inferSegmenter(SegmentationModel(), ['normal', 'tumor'], dataTransforms=lambda tile: tile, batchSize=8, numWorkers=1, overwriteExistingSegmentations=True)
+        secondPath = slide.segmenterPredictionStore.path
+        self.assertFalse(os.path.exists(firstPath), "A replaced temporary store should be deleted")
+        prediction = slide.getSegmenterPrediction((2, 1), 'tumor')
+
+        with tempfile.TemporaryDirectory() as folder:
+            slide.save(folder=folder)
+            self.assertFalse(os.path.exists(secondPath), "A temporary store should be deleted once it is copied into the .pml")
+            self.assertTrue(np.array_equal(slide.getSegmenterPrediction((2, 1), 'tumor'), prediction))
+
+            storeFolder = os.path.join(folder, 'predictions')
+            slide.inferSegmenter(SegmentationModel(), ['normal', 'tumor'], dataTransforms=lambda tile: tile, batchSize=8, numWorkers=1, overwriteExistingSegmentations=True,
+                                 predictionStoreFolder=storeFolder)
+            slide.save(folder=folder)
+            self.assertTrue(os.path.isdir(storeFolder), "A store in a user-defined folder should be kept")
+
+    def test_batch_post_processing(self):
+        slide = makeSlide()
+        model = DownsamplingSegmentationModel()
+        with tempfile.TemporaryDirectory() as folder:
+            slide.inferSegmenter(model, ['tumor'], dataTransforms=lambda tile: tile, dtype='float', batchSize=4, numWorkers=1,
+                                 predictionStoreFolder=os.path.join(folder, 'predictions'))
+            prediction = slide.getSegmenterPrediction((3, 1), 'tumor')
+            self.assertEqual((prediction.shape, prediction.dtype), ((16, 16), np.float32))
+
+            tile = torch.from_numpy(slide.getTiles([(3, 1)])[..., :3] / 255).permute(0, 3, 1, 2).float()
+            with torch.no_grad():
+                expected = torch.sigmoid(model(tile))[0].numpy()
+            self.assertTrue(np.allclose(prediction[::2, ::2], expected, atol=1e-6), "Outputs should be upsampled to the tile size")
+            self.assertAlmostEqual(slide.tileDictionary[(3, 1)]['segmenterInferencePrediction']['tumor'], float(expected.mean()), places=5)
+
+            with self.assertRaises(ValueError):
+                slide.inferSegmenter(model, ['normal', 'tumor'], dataTransforms=lambda tile: tile, overwriteExistingSegmentations=True, numWorkers=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from types import SimpleNamespace
+
+import torch
+import torch.nn as nn
+
+from pathml.utils.torch.quantization import agreementRate, quantizeForSlide, quantizeModel
+
+
+def makeModel():
+    torch.manual_seed(0)
+    model = nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.BatchNorm2d(8), nn.ReLU(),
+                          nn.Conv2d(8, 16, 3, stride=2, padding=1), nn.ReLU(),
+                          nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(16, 3))
+    return model.eval()
+
+
+class TestQuantization(unittest.TestCase):
+
+    def test_static_and_dynamic_quantization(self):
+        model = makeModel()
+        inputs = [torch.rand(8, 3, 32, 32) for i in range(4)]
+        quantizedModel = quantizeModel(model, inputs[:2])
+        self.assertTrue(any(isinstance(module, torch.ao.nn.quantized.Conv2d) for module in quantizedModel.modules()))
+        self.assertFalse(any(isinstance(module, torch.ao.nn.quantized.Conv2d) for module in model.modules()), "The float32 model should not be modified")
+
+        agreement = agreementRate(model, quantizedModel, inputs[2:])
+        self.assertEqual(agreement['numTiles'], 16)
+        self.assertGreaterEqual(agreement['agreement'], 0.75)
+        self.assertLess(agreement['meanProbabilityDifference'], 0.05)
+
+        dynamicModel = quantizeModel(model, mode='dynamic')
+        self.assertTrue(any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in dynamicModel.modules()))
+        self.assertEqual(agreementRate(model, dynamicModel, inputs)['numTiles'], 32)
+
+        with self.assertRaises(ValueError):
+            quantizeModel(model)
+        with self.assertRaises(ValueError):
+            quantizeModel(model, inputs, mode='float16')
+
+    def test_quantize_for_slide(self):
+        torch.manual_seed(1)
+        tiles = {(x, y): torch.rand(3, 32, 32) for x in range(4) for y in range(3)}
+        inferenceEngine = SimpleNamespace(suitableTileAddresses=list(tiles), batchSize=4,
+                                          _prepareBatch=lambda tileAddresses: torch.stack([tiles[tileAddress] for tileAddress in tileAddresses]))
+        quantizedModel, agreement = quantizeForSlide(makeModel(), inferenceEngine, numCalibrationTiles=8, numValidationTiles=8)
+        self.assertEqual(agreement['numTiles'], 4, "Validation tiles should not overlap the calibration tiles")
+        self.assertEqual(tuple(quantizedModel(torch.rand(2, 3, 32, 32)).shape), (2, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
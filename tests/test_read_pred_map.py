@@ -0,0 +1,92 @@
+import unittest
+import warnings
+
+import numpy as np
+
+from tests.slidefixtures import makeSlide
+
+rng = np.random.default_rng(0)
+
+
+def perTilePredMap(slide, map, scale, keys):
+    # The per-tile np.nanmean loop readPredMap used before summed-area tables
+    y_scale, x_scale, level = scale
+    y_scale = y_scale*slide.levels[level].height/slide.slide.height
+    x_scale = x_scale*slide.levels[level].width/slide.slide.width
+    values, calls = {key: {} for key in keys}, []
+    for tileAddress in slide.iterateTiles():
+        tileXPos1 = round(slide.tileDictionary[tileAddress]['x'] * x_scale)
+        tileYPos1 = round(slide.tileDictionary[tileAddress]['y'] * y_scale)
+        tileXPos2 = round((slide.tileDictionary[tileAddress]['x'] + slide.tileDictionary[tileAddress]['width']) * x_scale)
+        tileYPos2 = round((slide.tileDictionary[tileAddress]['y'] + slide.tileDictionary[tileAddress]['height']) * y_scale)
+        for a, key in enumerate(keys):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning) # the mean of an all-NaN slice
+                mean = np.nanmean(map[tileYPos1:tileYPos2, tileXPos1:tileXPos2, a])
+            if not np.isnan(mean):
+                values[key][tileAddress] = mean
+                calls.append(tileAddress)
+    return values, calls
+
+
+class TestReadPredMap(unittest.TestCase):
+
+    def test_matches_per_tile_means(self):
+        predictionMap = rng.random((13, 17, 2))
+        predictionMap[rng.random(predictionMap.shape) < 0.2] = np.nan
+        predictionMap[:5, :6, :] = np.nan # tiles under it get no value at all
+        predictionMap[6:, 9:, 1] = np.nan # only the second key is missing here
+        keys = ['artifactLevel', 'tissueLevel']
+
+        for scale in [(0.27, 0.2718, 1), (0.1, 0.1, 0), (13/48, 17/64, 1)]:
+            slide = makeSlide(tileOverlap=0.25)
+            calls = []
+            slide.readPredMap(predictionMap, scale, keys, func=calls.append)
+            expected, expectedCalls = perTilePredMap(slide, predictionMap, scale, keys)
+
+            for key in keys:
+                self.assertGreater(len(expected[key]), 0)
+                self.assertLess(len(expected[key]), len(slide.tileDictionary), "Some tiles should only cover NaNs")
+                for tileAddress in slide.iterateTiles():
+                    if tileAddress in expected[key]:
+                        self.assertAlmostEqual(slide.tileDictionary[tileAddress][key], expected[key][tileAddress], places=10)
+                    else:
+                        self.assertNotIn(key, slide.tileDictionary[tileAddress], "Tiles under NaNs only should not get a value")
+            self.assertEqual(sorted(calls), sorted(expectedCalls), "func should be called once per tile and key given a value")
+
+    def test_two_dimensional_maps(self):
+        slide = makeSlide()
+        predictionMap = rng.random((12, 16))
+        predictionMap[0, 0] = np.nan # one of the four cells under tile (0, 0)
+        predictionMap[10:, 14:] = np.nan # every cell under tile (7, 5)
+        slide.readPredMap(predictionMap, (1/8, 1/8, 0), ['tissueLevel'])
+        blocks = predictionMap.reshape(6, 2, 8, 2).transpose(0, 2, 1, 3).reshape(6, 8, 4) # each tile covers a 2 by 2 block of cells
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning) # the mean of an all-NaN block
+            blockMeans = np.nanmean(blocks, axis=2)
+        self.assertAlmostEqual(slide.tileDictionary[(0, 0)]['tissueLevel'], np.mean(predictionMap[:2, :2].ravel()[1:]))
+        mask = np.ones((6, 8), dtype=bool)
+        mask[5, 7] = False
+        self.assertTrue(np.array_equal(slide.tileDictionary.getMask('tissueLevel'), mask))
+        self.assertTrue(np.allclose(slide.tileDictionary.getColumn('tissueLevel')[mask], blockMeans[mask]))
+
+        # a map covering only the top left of the slide
+        slide = makeSlide()
+        slide.readPredMap(np.arange(6.0).reshape(2, 3), (1/16, 1/16, 0), ['maskLevel'])
+        self.assertEqual(slide.tileDictionary.addresses(slide.tileDictionary.getMask('maskLevel')), [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                         "Tiles off the map should not get a value")
+        self.assertEqual([slide.tileDictionary[(x, 1)]['maskLevel'] for x in range(3)], [3.0, 4.0, 5.0])
+
+    def test_invalid_maps(self):
+        slide = makeSlide()
+        with self.assertRaises(ValueError):
+            slide.readPredMap(rng.random((6, 8, 2)), (1/16, 1/16, 0), ['artifactLevel', 'tissueLevel', 'maskLevel'])
+        with self.assertRaises(ValueError):
+            slide.readPredMap(rng.random((6, 8)), (1/16, 1/16, 0), ['artifactLevel', 'tissueLevel'])
+        with self.assertRaises(ValueError):
+            slide.readPredMap(rng.random(8), (1/16, 1/16, 0), ['tissueLevel'])
+        self.assertFalse(slide.tileDictionary.hasColumn('artifactLevel'), "Invalid maps should not be partially read")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import pyvips as pv
+
+from pathml.regionpool import RegionPool
+from tests.slidefixtures import levelImages
+
+newRegion = pv.Region.new
+
+
+class TrackingRegion:
+    # A pyvips Region that records how many fetches are made through it at once
+
+    def __init__(self, image, tracker):
+        self.region = newRegion(image)
+        self.tracker = tracker
+        self.inUse = 0
+
+    def fetch(self, left, top, width, height):
+        with self.tracker['lock']:
+            self.inUse = self.inUse + 1
+            self.tracker['maxPerRegion'] = max(self.tracker['maxPerRegion'], self.inUse)
+            self.tracker['active'] = self.tracker['active'] + 1
+            self.tracker['maxActive'] = max(self.tracker['maxActive'], self.tracker['active'])
+        try:
+            if self.tracker['barrier'] is not None:
+                self.tracker['barrier'].wait(timeout=10)
+            time.sleep(self.tracker['delay'])
+            return self.region.fetch(left, top, width, height)
+        finally:
+            with self.tracker['lock']:
+                self.inUse = self.inUse - 1
+                self.tracker['active'] = self.tracker['active'] - 1
+
+
+def trackRegions(barrier=None, delay=0.0):
+    tracker = {'lock': threading.Lock(), 'barrier': barrier, 'delay': delay, 'active': 0, 'maxActive': 0, 'maxPerRegion': 0}
+    return tracker, mock.patch('pathml.regionpool.pv.Region.new', side_effect=lambda image: TrackingRegion(image, tracker))
+
+
+def runThreads(numThreads, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(numThreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestRegionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pixels = levelImages[0]
+        self.image = pv.Image.new_from_array(self.pixels)
+
+    def expectedBytes(self, left, top, width, height):
+        return self.pixels[top:top+height, left:left+width].tobytes()
+
+    def test_fetch(self):
+        pool = RegionPool(self.image)
+        self.assertEqual(pool.fetch(5, 7, 16, 9), self.expectedBytes(5, 7, 16, 9))
+        self.assertEqual(pool.fetch(100, 80, 28, 16), self.expectedBytes(100, 80, 28, 16))
+        self.assertEqual(pool.numReaders(), 1, "Serial reads should reuse one Region")
+        for maxReaders in [0, 1.5]:
+            with self.assertRaises(ValueError):
+                RegionPool(self.image, maxReaders=maxReaders)
+
+    def test_region_per_concurrent_reader(self):
+        pool = RegionPool(self.image)
+        tracker, patch = trackRegions(barrier=threading.Barrier(4))
+        results = {}
+        with patch:
+            # every fetch waits at the barrier until all four are in progress at once
+            runThreads(4, lambda i: results.update({i: pool.fetch(i * 16, i * 8, 16, 16)}))
+        self.assertEqual(pool.numReaders(), 4)
+        self.assertEqual(tracker['maxActive'], 4)
+        self.assertEqual(tracker['maxPerRegion'], 1, "A Region should never be used by two reads at once")
+        for i in range(4):
+            self.assertEqual(results[i], self.expectedBytes(i * 16, i * 8, 16, 16))
+
+    def test_max_readers(self):
+        pool = RegionPool(self.image, maxReaders=2)
+        tracker, patch = trackRegions(delay=0.002)
+        results = {}
+
+        def read(i):
+            results[i] = [pool.fetch((i + j) % 7 * 16, j * 8, 16, 16) for j in range(5)]
+
+        with patch:
+            runThreads(6, read)
+        self.assertEqual(pool.numReaders(), 2)
+        self.assertLessEqual(tracker['maxActive'], 2)
+        self.assertEqual(tracker['maxPerRegion'], 1)
+        for i in range(6):
+            self.assertEqual(results[i], [self.expectedBytes((i + j) % 7 * 16, j * 8, 16, 16) for j in range(5)])
+
+        statistics = pool.statistics()
+        self.assertEqual([reader['reader'] for reader in statistics], [0, 1])
+        self.assertEqual(sum(reader['reads'] for reader in statistics), 30)
+        for reader in statistics:
+            self.assertGreater(reader['seconds'], 0)
+            self.assertAlmostEqual(reader['readsPerSecond'], reader['reads'] / reader['seconds'])
+
+    def test_reset_after_fork(self):
+        pool = RegionPool(self.image)
+        tracker, patch = trackRegions(barrier=threading.Barrier(3))
+        with patch:
+            runThreads(3, lambda i: pool.fetch(0, 0, 16, 16))
+        self.assertEqual((pool.numReaders(), len(pool.statistics())), (3, 3))
+
+        pool._pid = -1 # as seen from a forked child process
+        self.assertEqual(pool.fetch(16, 16, 8, 8), self.expectedBytes(16, 16, 8, 8))
+        self.assertEqual(pool.numReaders(), 1, "A forked process should build its own Regions")
+        self.assertEqual([reader['reads'] for reader in pool.statistics()], [1], "A forked process should start its own statistics")
+
+    def test_failed_fetch_returns_region(self):
+        pool = RegionPool(self.image, maxReaders=1)
+        with self.assertRaises(pv.Error):
+            pool.fetch(120, 90, 16, 16) # past the bottom right corner of the image
+        results = {}
+        reader = threading.Thread(target=lambda: results.update({0: pool.fetch(0, 0, 8, 8)}))
+        reader.start()
+        reader.join(timeout=10)
+        self.assertFalse(reader.is_alive(), "A failed read should hand its Region back to the pool")
+        self.assertEqual(results[0], self.expectedBytes(0, 0, 8, 8))
+        self.assertEqual(pool.numReaders(), 1)
+        self.assertEqual([reader['reads'] for reader in pool.statistics()], [1], "Failed reads should not be counted")
+
+    def test_pickle(self):
+        pool = RegionPool(self.image, maxReaders=3)
+        pool.fetch(0, 0, 8, 8)
+        unpickled = RegionPool.__new__(RegionPool)
+        unpickled.__setstate__(pool.__getstate__()) # the in-memory test image itself cannot be pickled
+        self.assertEqual((unpickled.maxReaders, unpickled.numReaders(), unpickled.statistics()), (3, 0, []), "Regions should not be pickled")
+        self.assertEqual(unpickled.fetch(40, 24, 16, 8), self.expectedBytes(40, 24, 16, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import torch
+
+from pathml.tiledictionary import TileDictionary
+from pathml.utils.torch.SlideTrainingDataset import SlideTrainingDataset
+
+
+class FakeSlide:
+    """A stand-in for a Slide whose tiles are filled with their slide index and
+    tile address, so samples can be traced back to the tile they were read from."""
+
+    def __init__(self, slideIndex, overlaps, tissueLevel):
+        self.slideIndex = slideIndex
+        self.tileDictionary = TileDictionary.fromGrid(numTilesInX=4, numTilesInY=3, tileSize=8)
+        for className, overlap in overlaps.items():
+            self.tileDictionary.setColumn(className+'Overlap', overlap)
+        self.tileDictionary.setColumn('tissueLevel', tissueLevel)
+
+    def hasTileDictionary(self):
+        return True
+
+    def suitableTileAddresses(self, tissueLevelThreshold=False, **kwargs):
+        suitable = np.ones(self.tileDictionary.shape, dtype=bool)
+        if tissueLevelThreshold:
+            suitable &= self.tileDictionary.getColumn('tissueLevel') >= tissueLevelThreshold
+        return self.tileDictionary.addresses(suitable)
+
+    def getTile(self, tileAddress, writeToNumpy=False, useFetch=False):
+        tile = np.zeros((8, 8, 4), dtype=np.uint8)
+        tile[..., 0], tile[..., 1], tile[..., 2] = self.slideIndex, tileAddress[0], tileAddress[1]
+        return tile
+
+    def getAnnotationTileMask(self, tileAddress, maskClass, writeToNumpy=False, acceptTilesWithoutClass=False):
+        return np.full((8, 8), self.tileDictionary.getColumn(maskClass+'Overlap')[tileAddress[1], tileAddress[0]] > 0)
+
+
+def makeSlides():
+    rng = np.random.default_rng(0)
+    slides = []
+    for slideIndex in range(3):
+        tumor = np.where(rng.random((3, 4)) < 0.4, 0.8, 0.0)
+        stroma = np.where(rng.random((3, 4)) < 0.5, 0.6, 0.0)
+        slides.append(FakeSlide(slideIndex, {'tumor': tumor, 'stroma': stroma}, np.full((3, 4), 1.0)))
+    return slides
+
+
+def readSamples(dataset):
+    return [(int(img.getpixel((0, 0))[0]), int(img.getpixel((0, 0))[1]), int(img.getpixel((0, 0))[2]), label) for img, label in dataset]
+
+
+class TestSlideTrainingDataset(unittest.TestCase):
+
+    def test_labels_and_balance(self):
+        slides = makeSlides()
+        dataset = SlideTrainingDataset(slides, unannotatedClassName='unannotated', slideCacheSize=2, seed=3)
+        self.assertEqual(dataset.classNames, ['stroma', 'tumor', 'unannotated'])
+
+        expected = {}
+        for slide in slides:
+            tumor, stroma = slide.tileDictionary.getColumn('tumorOverlap'), slide.tileDictionary.getColumn('stromaOverlap')
+            for x, y in slide.tileDictionary:
+                if tumor[y, x] >= 0.5 or stroma[y, x] >= 0.5:
+                    expected[(slide.slideIndex, x, y)] = 1 if tumor[y, x] > stroma[y, x] else 0
+                else:
+                    expected[(slide.slideIndex, x, y)] = 2
+
+        samples = readSamples(dataset)
+        self.assertEqual(len(samples), len(dataset))
+        self.assertEqual(len(set(sample[:3] for sample in samples)), len(samples), "No tile should be read twice per epoch")
+        for sample in samples:
+            self.assertEqual(sample[3], expected[sample[:3]])
+        counts = np.bincount([sample[3] for sample in samples], minlength=3)
+        self.assertEqual(len(set(counts.tolist())), 1, "Classes should be balanced")
+        self.assertEqual(counts[0], min(np.bincount(list(expected.values()), minlength=3)))
+
+        dataset.set_epoch(1)
+        self.assertNotEqual(samples, readSamples(dataset))
+
+    def test_workers_read_disjoint_tiles(self):
+        dataset = SlideTrainingDataset(makeSlides(), numTilesPerClass='all', tissueLevelThreshold=0.5)
+        loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=2,
+                                             collate_fn=lambda sample: (tuple(np.array(sample[0])[0, 0, :3].tolist()), sample[1]))
+        samples = [tile for tile, label in loader]
+        self.assertEqual(len(samples), len(dataset))
+        self.assertEqual(len(set(samples)), len(samples))
+
+    def test_length_per_rank(self):
+        dataset = SlideTrainingDataset(makeSlides(), numTilesPerClass='all')
+        numTiles = len(dataset)
+        ranks = []
+        for rank in range(3):
+            with mock.patch('torch.distributed.is_initialized', return_value=True), \
+                 mock.patch('torch.distributed.get_world_size', return_value=3), \
+                 mock.patch('torch.distributed.get_rank', return_value=rank):
+                rankSamples = list(dataset.epochSamples())
+                self.assertEqual(len(dataset), len(rankSamples), "__len__ should count the tiles of this rank")
+                workerSamples = []
+                for workerId in range(2):
+                    with mock.patch('pathml.utils.torch.SlideTrainingDataset.get_worker_info', return_value=SimpleNamespace(num_workers=2, id=workerId)):
+                        workerSamples.extend(dataset.epochSamples())
+                self.assertEqual(sorted(workerSamples), sorted(rankSamples), "The workers of a rank should read that rank's tiles")
+            ranks.append(rankSamples)
+        self.assertEqual(sorted(np.concatenate(ranks).tolist()), sorted(dataset.epochSamples().tolist()))
+        self.assertEqual(sum(len(rankSamples) for rankSamples in ranks), numTiles)
+
+    def test_slides_visited_in_groups(self):
+        dataset = SlideTrainingDataset(makeSlides(), numTilesPerClass='all', slideCacheSize=1)
+        slideOrder = dataset.sampleSlides[dataset.epochSamples()]
+        self.assertEqual(np.count_nonzero(np.diff(slideOrder)), 2, "Each slide should be opened once per epoch")
+
+    def test_masks(self):
+        dataset = SlideTrainingDataset(makeSlides(), classNames=['tumor', 'stroma'], numTilesPerClass=2, returnMasks=True)
+        samples = list(dataset)
+        self.assertEqual(len(samples), 4)
+        for img, mask, label in samples:
+            self.assertEqual(tuple(mask.shape), (2, 8, 8))
+            self.assertEqual(mask.dtype, torch.uint8)
+            self.assertEqual(int(mask[label, 0, 0]), 1)
+
+        with self.assertRaises(ValueError):
+            SlideTrainingDataset(makeSlides(), classNames=['necrosis'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyvips as pv
+
+from pathml.stitcher import SegmentationStitcher
+
+rng = np.random.default_rng(0)
+tileSize, step = 16, 12
+tiles = [(x, y, rng.random((tileSize, tileSize)).astype(np.float32)) for y in range(0, 40, step) for x in range(0, 52, step)]
+
+
+def naiveStitch(height, width, method):
+    values = np.zeros((height, width))
+    counts = np.zeros((height, width))
+    for x, y, prediction in tiles:
+        area = values[y:y+tileSize, x:x+tileSize]
+        clipped = prediction[:area.shape[0], :area.shape[1]]
+        if method == 'max':
+            values[y:y+tileSize, x:x+tileSize] = np.maximum(area, clipped)
+        else:
+            values[y:y+tileSize, x:x+tileSize] += clipped
+        counts[y:y+tileSize, x:x+tileSize] += 1
+    if method == 'max':
+        return values
+    return np.divide(values, counts, out=np.zeros_like(values), where=counts > 0)
+
+
+class TestSegmentationStitcher(unittest.TestCase):
+
+    def test_mean_and_max(self):
+        for method in ['mean', 'max']:
+            with SegmentationStitcher(50, 60, aggregationMethod=method, chunkSize=7) as stitcher:
+                for x, y, prediction in tiles:
+                    stitcher.add(x, y, prediction)
+                self.assertEqual(stitcher.numTiles, len(tiles))
+                self.assertTrue(np.allclose(stitcher.toArray(dtype='float'), naiveStitch(50, 60, method), atol=1e-6))
+                self.assertTrue(np.array_equal(stitcher.toArray(probabilityThreshold=0.5), naiveStitch(50, 60, method) > 0.5))
+                folder = stitcher.folder
+            self.assertFalse(os.path.exists(folder), "The temporary stitching arrays should be deleted")
+
+    def test_gaussian_favours_tile_centers(self):
+        with SegmentationStitcher(40, 40, aggregationMethod='gaussian') as stitcher:
+            stitcher.add(0, 0, np.zeros((24, 24)))
+            stitcher.add(16, 0, np.ones((24, 24)))
+            stitched = stitcher.toArray(dtype='float')
+        self.assertLess(stitched[12, 17], 0.5, "The center of the first tile should outweigh the border of the second")
+        self.assertGreater(stitched[12, 23], 0.5)
+        self.assertEqual(stitched[30, 5], 0)
+
+    def test_downsampled_outputs(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with SegmentationStitcher(50, 60, downsample=2, chunkSize=4, folder=os.path.join(folder, 'stitching')) as stitcher:
+                for x, y, prediction in tiles:
+                    stitcher.add(x, y, prediction)
+                stitcher.save(os.path.join(folder, 'map.npz'))
+                stitcher.saveTiff(os.path.join(folder, 'map.tif'), tileSize=16)
+                expected = stitcher.toArray()
+
+            self.assertEqual(expected.shape, (25, 30))
+            npz = np.load(os.path.join(folder, 'map.npz'))
+            self.assertTrue(np.array_equal(npz['inference'], expected))
+            self.assertEqual(float(npz['downsample']), 2)
+            reference = naiveStitch(50, 60, 'mean').reshape(25, 2, 30, 2).mean(axis=(1, 3))
+            self.assertLess(np.abs(expected[:18, :24] / 255 - reference[:18, :24]).max(), 0.01)
+
+            tiff = pv.Image.new_from_file(os.path.join(folder, 'map.tif'))
+            self.assertTrue(np.array_equal(tiff.numpy(), expected))
+            self.assertEqual(pv.Image.new_from_file(os.path.join(folder, 'map.tif'), page=1).width, 15)
+            self.assertEqual(os.listdir(os.path.join(folder, 'stitching')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+from pathml.processor import Processor
+from pathml.utils.torch.StreamingInferenceEngine import StreamingInferenceEngine
+from tests.slidefixtures import makeSlide
+
+rng = np.random.default_rng(0)
+
+
+class Classifier(nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 4, 3)
+        self.fc = nn.Linear(4, 3)
+
+    def forward(self, x):
+        return self.fc(self.conv(x).mean(dim=(2, 3)))
+
+
+def perTileBatch(slide, tileAddresses, transform):
+    # The per-tile PIL path of WholeSlideImageDataset
+    return torch.stack([transform(Image.fromarray(tile[..., :3]).convert('RGB')) for tile in slide.getTiles(tileAddresses)])
+
+
+class TestStreamingInferenceEngine(unittest.TestCase):
+
+    def test_batched_transforms_match_per_tile(self):
+        slide = makeSlide()
+        normalize = transforms.Normalize([0.5, 0.4, 0.3], [0.2, 0.25, 0.3])
+        for transform, tolerance in [(None, 0),
+                                     (transforms.Compose([transforms.ToTensor(), normalize]), 1e-6),
+                                     (transforms.Compose([transforms.Resize(12), transforms.CenterCrop(10), transforms.ToTensor(), normalize]), 1.01 / 255 / 0.2),
+                                     (transforms.Compose([transforms.Resize(24), transforms.ToTensor()]), 1.01 / 255),
+                                     (transforms.Compose([transforms.CenterCrop(8), transforms.ToTensor()]), 0)]:
+            engine = StreamingInferenceEngine(slide, transform=transform, batchSize=7, numWorkers=2)
+            self.assertIsNotNone(engine._batchTransforms, "These transforms should be applied to whole batches")
+            for tileAddresses, batch in engine:
+                expected = perTileBatch(slide, tileAddresses, transform if transform else transforms.ToTensor())
+                self.assertEqual(batch.shape, expected.shape)
+                self.assertEqual(batch.dtype, torch.float32)
+                self.assertLessEqual(float((batch - expected).abs().max()), tolerance + 1e-6, str(transform))
+
+    def test_fallback_transforms(self):
+        slide = makeSlide()
+        transform = transforms.Compose([transforms.Grayscale(num_output_channels=3), transforms.ToTensor(), transforms.Lambda(lambda img: img * 2)])
+        engine = StreamingInferenceEngine(slide, transform=transform, batchSize=5, numWorkers=2)
+        self.assertIsNone(engine._batchTransforms, "Other transforms should fall back to per-tile application")
+        batches = list(engine)
+        self.assertEqual(sum(len(tileAddresses) for tileAddresses, batch in batches), len(slide.tileDictionary))
+        for tileAddresses, batch in batches:
+            self.assertTrue(torch.equal(batch, perTileBatch(slide, tileAddresses, transform)))
+
+        segmentationEngine = StreamingInferenceEngine(slide, transform=lambda tile: tile, segmenting=True, batchSize=5, numWorkers=2)
+        self.assertIsNone(segmentationEngine._batchTransforms)
+        tileAddresses, batch = next(iter(segmentationEngine))
+        expected = torch.from_numpy(slide.getTiles(tileAddresses)[..., :3].transpose(0, 3, 1, 2) / 255).float()
+        self.assertTrue(torch.equal(batch, expected))
+
+    def test_ordering_under_prefetch(self):
+        slide = makeSlide()
+        getTiles = slide.getTiles
+        lock = threading.Lock()
+        state = {'started': 0, 'yielded': 0, 'maxAhead': 0}
+
+        def slowGetTiles(tileAddresses):
+            with lock:
+                state['started'] = state['started'] + 1
+                state['maxAhead'] = max(state['maxAhead'], state['started'] - state['yielded'])
+            time.sleep(rng.random() * 0.01) # finish batches out of order
+            return getTiles(tileAddresses)
+
+        slide.getTiles = slowGetTiles
+        engine = StreamingInferenceEngine(slide, batchSize=5, numWorkers=4, prefetchBatches=3)
+        batches = []
+        for tileAddresses, batch in engine:
+            with lock:
+                state['yielded'] = state['yielded'] + 1
+            batches.append((tileAddresses, batch))
+        slide.getTiles = getTiles
+
+        self.assertEqual(state['yielded'], len(engine))
+        self.assertLessEqual(state['maxAhead'], 3, "At most prefetchBatches batches should be read ahead")
+        self.assertEqual([tileAddress for tileAddresses, batch in batches for tileAddress in tileAddresses], slide.suitableTileAddresses(),
+                         "Batches should be yielded in tile dictionary order")
+        for tileAddresses, batch in batches:
+            self.assertTrue(torch.equal(batch, perTileBatch(slide, tileAddresses, transforms.ToTensor())))
+
+    def test_classifier_write_back(self):
+        torch.manual_seed(0)
+        slide = makeSlide()
+        predictionMap = rng.random((6, 8, 3))
+        predictionMap /= predictionMap.sum(axis=2, keepdims=True)
+        slide.detectTissueFromRawTissueDetectionMap({'map': predictionMap, 'level': 1, 'tileSize': 8, 'tileOverlap': 0})
+        model = Classifier().eval()
+        transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize([0.5, 0.5, 0.5], [0.25, 0.25, 0.25])])
+        slide.inferClassifier(model, ['a', 'b', 'c'], dataTransforms=transform, batchSize=4, numWorkers=2, tissueLevelThreshold=0.3)
+
+        suitable = slide.suitableTileAddresses(tissueLevelThreshold=0.3)
+        self.assertLess(len(suitable), len(slide.tileDictionary))
+        self.assertEqual(slide.classifierPredictionTileAddresses, suitable)
+        with torch.no_grad():
+            expected = torch.softmax(model(perTileBatch(slide, suitable, transform)), dim=1).numpy()
+        for tileAddress, probabilities in zip(suitable, expected):
+            prediction = slide.tileDictionary[tileAddress]['classifierInferencePrediction']
+            self.assertEqual(list(prediction), ['a', 'b', 'c'])
+            self.assertTrue(np.allclose([prediction[className] for className in ['a', 'b', 'c']], probabilities, atol=1e-6))
+        for tileAddress in slide.iterateTiles():
+            if tileAddress not in suitable:
+                self.assertNotIn('classifierInferencePrediction', slide.tileDictionary[tileAddress], "Unsuitable tiles should not get a prediction")
+
+    def test_inference_on_disjoint_tiles_merges(self):
+        torch.manual_seed(0)
+        slide = makeSlide()
+        predictionMap = np.zeros((6, 8, 3))
+        predictionMap[:, :4, 2] = 1 # tissue on the left half of the slide
+        predictionMap[:, 4:, 1] = 1
+        slide.detectTissueFromRawTissueDetectionMap({'map': predictionMap, 'level': 1, 'tileSize': 8, 'tileOverlap': 0})
+        slide.tileDictionary.setColumn('maskLevel', 1 - slide.tileDictionary.getColumn('tissueLevel')) # the right half
+        left = slide.suitableTileAddresses(tissueLevelThreshold=0.5)
+        right = slide.suitableTileAddresses(maskLevelThreshold=0.5)
+        self.assertEqual(len(left) + len(right), len(slide.tileDictionary))
+        self.assertEqual(set(left) & set(right), set())
+        model = Classifier().eval()
+        with torch.no_grad():
+            expected = dict(zip(slide.iterateTiles(), torch.softmax(model(perTileBatch(slide, list(slide.iterateTiles()), transforms.ToTensor())), dim=1).numpy()))
+
+        slide.inferClassifier(model, ['a', 'b', 'c'], batchSize=4, numWorkers=2, tissueLevelThreshold=0.5)
+        slide.inferClassifier(model, ['a', 'b', 'c'], batchSize=4, numWorkers=2, maskLevelThreshold=0.5)
+        self.assertEqual(slide.classifierPredictionTileAddresses, right)
+        self.assertTrue(slide.tileDictionary.getMask('classifierInferencePrediction').all(), "The second run should keep the first run's predictions")
+        for tileAddress in slide.iterateTiles():
+            prediction = slide.tileDictionary[tileAddress]['classifierInferencePrediction']
+            self.assertTrue(np.allclose([prediction[className] for className in ['a', 'b', 'c']], expected[tileAddress], atol=1e-6), str(tileAddress))
+
+        processor = Processor(slide)
+        processor.applyModel((torch.device('cpu'), model, transforms.ToTensor()), 4, numWorkers=2, maskLevelThreshold=0.5)
+        self.assertTrue(np.array_equal(slide.tileDictionary.getMask('prediction'), slide.tileDictionary.getColumn('maskLevel') >= 0.5))
+        processor.applyModel((torch.device('cpu'), model, transforms.ToTensor()), 4, numWorkers=2, tissueLevelThreshold=0.5)
+        self.assertTrue(slide.tileDictionary.getMask('prediction').all(), "The second run should keep the first run's predictions")
+        for tileAddress in slide.iterateTiles():
+            self.assertTrue(np.allclose(slide.tileDictionary[tileAddress]['prediction'], expected[tileAddress], atol=1e-6), str(tileAddress))
+
+    def test_batches_and_errors(self):
+        slide = makeSlide()
+        for batchSize in [0, 2.5]:
+            with self.assertRaises(ValueError):
+                StreamingInferenceEngine(slide, batchSize=batchSize)
+
+        engine = StreamingInferenceEngine(slide, batchSize=20, numWorkers=2)
+        self.assertEqual(len(engine), 3)
+        self.assertEqual([len(tileAddresses) for tileAddresses, batch in engine], [20, 20, 8], "The last batch should hold the remaining tiles")
+        outputs = [output for tileAddresses, output in engine.infer(Classifier().train(), torch.device('cpu'))]
+        self.assertEqual([tuple(output.shape) for output in outputs], [(20, 3), (20, 3), (8, 3)])
+        self.assertFalse(any(output.requires_grad for output in outputs), "Models should be run without gradient tracking")
+
+        slide.tileDictionary.setColumn('maskLevel', np.zeros(slide.tileDictionary.shape))
+        empty = StreamingInferenceEngine(slide, maskLevelThreshold='mask')
+        self.assertEqual((len(empty), list(empty)), (0, []))
+        with self.assertRaises(Warning):
+            slide.inferClassifier(Classifier().eval(), ['a', 'b', 'c'], batchSize=4, numWorkers=2, maskLevelThreshold='mask')
+        self.assertFalse(slide.tileDictionary.hasColumn('classifierInferencePrediction'))
+
+        def failingGetTiles(tileAddresses):
+            if (7, 2) in tileAddresses:
+                raise OSError('unreadable region')
+            return getTiles(tileAddresses)
+
+        getTiles = slide.getTiles
+        slide.getTiles = failingGetTiles
+        batches = []
+        with self.assertRaises(OSError):
+            for tileAddresses, batch in StreamingInferenceEngine(slide, batchSize=8, numWorkers=3):
+                batches.append(tileAddresses)
+        self.assertEqual(len(batches), 2, "Batches before the failing one should still be yielded in order")
+
+
+if __name__ == '__main__':
+    unittest.main()
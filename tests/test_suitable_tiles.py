@@ -0,0 +1,172 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from tests.slidefixtures import makeSlide
+
+rng = np.random.default_rng(0)
+
+
+def perTileSuitableTiles(slide, tissueLevelThreshold=False, foregroundLevelThreshold=False, otsuLevelThreshold=False, triangleLevelThreshold=False, maskLevelThreshold=False):
+    # The per-tile filter suitableTileAddresses used before its mask was vectorized and cached
+    suitableTileAddresses = []
+    for tA in slide.iterateTiles():
+        suitable = True
+        if tissueLevelThreshold:
+            if (slide.tileDictionary[tA]['tissueLevel'] < tissueLevelThreshold):
+                suitable = False
+        if foregroundLevelThreshold:
+            if foregroundLevelThreshold in ['otsu', 'triangle']:
+                if not slide.tileDictionary[tA][foregroundLevelThreshold+'Level']:
+                    suitable = False
+            elif (slide.tileDictionary[tA]['foregroundLevel'] >= foregroundLevelThreshold):
+                suitable = False
+        if otsuLevelThreshold:
+            if (slide.tileDictionary[tA]['otsuLevel'] < otsuLevelThreshold):
+                suitable = False
+        if triangleLevelThreshold:
+            if (slide.tileDictionary[tA]['triangleLevel'] < triangleLevelThreshold):
+                suitable = False
+        if maskLevelThreshold:
+            if maskLevelThreshold == 'mask':
+                if not slide.tileDictionary[tA]['maskLevel']:
+                    suitable = False
+            else:
+                if (slide.tileDictionary[tA]['maskLevel'] < maskLevelThreshold):
+                    suitable = False
+        if suitable:
+            suitableTileAddresses.append(tA)
+    return suitableTileAddresses
+
+
+def makeFilteredSlide():
+    slide = makeSlide()
+    shape = slide.tileDictionary.shape
+    slide.tileDictionary.setColumn('tissueLevel', rng.random(shape))
+    slide.tileDictionary.setColumn('foregroundLevel', rng.random(shape) * 100)
+    slide.tileDictionary.setColumn('otsuLevel', rng.integers(0, 2, size=shape).astype(float))
+    slide.tileDictionary.setColumn('triangleLevel', rng.integers(0, 2, size=shape).astype(float))
+    slide.tileDictionary.setColumn('maskLevel', rng.random(shape) * (rng.random(shape) > 0.3))
+    return slide
+
+
+class TestSuitableTiles(unittest.TestCase):
+
+    def test_matches_per_tile_filter(self):
+        slide = makeFilteredSlide()
+        for thresholds in [{},
+                           {'tissueLevelThreshold': 0.5},
+                           {'foregroundLevelThreshold': 60},
+                           {'otsuLevelThreshold': 1, 'triangleLevelThreshold': 1},
+                           {'maskLevelThreshold': 0.25},
+                           {'maskLevelThreshold': 'mask', 'tissueLevelThreshold': 0.2, 'foregroundLevelThreshold': 80.5},
+                           {'foregroundLevelThreshold': 'otsu'},
+                           {'foregroundLevelThreshold': 'triangle', 'tissueLevelThreshold': 0.3}]:
+            expected = perTileSuitableTiles(slide, **thresholds)
+            self.assertEqual(slide.suitableTileAddresses(**thresholds), expected, str(thresholds))
+            self.assertEqual(slide.getTileCount(**{key: value for key, value in thresholds.items() if key != 'maskLevelThreshold'}),
+                             len(perTileSuitableTiles(slide, **{key: value for key, value in thresholds.items() if key != 'maskLevelThreshold'})))
+
+    def test_repeated_calls_hit_cache(self):
+        slide = makeFilteredSlide()
+        mask, addresses = slide._suitableTiles(tissueLevelThreshold=0.5, foregroundLevelThreshold=60)
+        cachedMask, cachedAddresses = slide._suitableTiles(tissueLevelThreshold=0.5, foregroundLevelThreshold=60)
+        self.assertIs(cachedMask, mask)
+        self.assertIs(cachedAddresses, addresses)
+        self.assertIsNot(slide._suitableTiles(tissueLevelThreshold=0.6, foregroundLevelThreshold=60)[0], mask, "Other thresholds should be cached separately")
+
+        slide.tileDictionary.setColumn('classifierInferencePrediction', np.zeros(slide.tileDictionary.shape))
+        self.assertIs(slide._suitableTiles(tissueLevelThreshold=0.5, foregroundLevelThreshold=60)[0], mask, "Writes to other keys should keep the cache")
+        returned = slide.suitableTileAddresses(tissueLevelThreshold=0.5, foregroundLevelThreshold=60)
+        returned.clear()
+        self.assertEqual(slide.suitableTileAddresses(tissueLevelThreshold=0.5, foregroundLevelThreshold=60), addresses, "Callers should not be able to modify the cached addresses")
+
+    def test_writes_invalidate_cache(self):
+        slide = makeFilteredSlide()
+
+        # appendTag
+        addresses = slide.suitableTileAddresses(tissueLevelThreshold=0.5)
+        slide.appendTag(addresses[0], 'tissueLevel', 0.0)
+        self.assertEqual(slide.suitableTileAddresses(tissueLevelThreshold=0.5), addresses[1:])
+
+        # detectForeground
+        before = slide.suitableTileAddresses(foregroundLevelThreshold=60)
+        slide.detectForeground(level=1, overwriteExistingForegroundDetection=True)
+        self.assertEqual(slide.suitableTileAddresses(foregroundLevelThreshold=60), perTileSuitableTiles(slide, foregroundLevelThreshold=60))
+        self.assertNotEqual(slide.suitableTileAddresses(foregroundLevelThreshold=60), before)
+
+        # tissue detection
+        predictionMap = np.zeros((6, 8, 3))
+        predictionMap[:, :4, 2] = 1 # tissue on the left half of the slide
+        predictionMap[:, 4:, 1] = 1
+        slide.detectTissueFromRawTissueDetectionMap({'map': predictionMap, 'level': 1, 'tileSize': 8, 'tileOverlap': 0}, overwriteExistingTissueDetection=True)
+        self.assertEqual(slide.suitableTileAddresses(tissueLevelThreshold=0.5), perTileSuitableTiles(slide, tissueLevelThreshold=0.5))
+
+        # readMask
+        before = slide.suitableTileAddresses(maskLevelThreshold=0.5)
+        with tempfile.TemporaryDirectory() as folder:
+            maskPath = os.path.join(folder, 'mask.png')
+            mask = np.zeros((96, 128), dtype=np.uint8)
+            mask[:48] = 255
+            Image.fromarray(mask).save(maskPath)
+            slide.readMask(maskPath, overwriteExistingMask=True)
+        self.assertEqual(slide.suitableTileAddresses(maskLevelThreshold=0.5), [(x, y) for y in range(3) for x in range(8)])
+        self.assertNotEqual(slide.suitableTileAddresses(maskLevelThreshold=0.5), before)
+
+    def test_partial_columns(self):
+        slide = makeSlide()
+        tissueLevel = np.tile(np.linspace(0, 1, 8), (6, 1))
+        measured = np.zeros(slide.tileDictionary.shape, dtype=bool)
+        measured[1:4] = True
+        slide.tileDictionary.setColumn('tissueLevel', tissueLevel, mask=measured)
+        self.assertEqual(slide.suitableTileAddresses(tissueLevelThreshold=0.5), [(x, y) for y in range(1, 4) for x in range(4, 8)],
+                         "Tiles without a tissueLevel should not be suitable")
+
+        # overwriting part of the column keeps the rest and invalidates the cached mask
+        rewritten = np.zeros(slide.tileDictionary.shape, dtype=bool)
+        rewritten[2, :2] = True
+        rewritten[5, 0] = True
+        slide.tileDictionary.setColumn('tissueLevel', np.ones(slide.tileDictionary.shape), mask=rewritten)
+        self.assertEqual(slide.suitableTileAddresses(tissueLevelThreshold=0.5),
+                         [(x, 1) for x in range(4, 8)] + [(0, 2), (1, 2)] + [(x, 2) for x in range(4, 8)] + [(x, 3) for x in range(4, 8)] + [(0, 5)])
+        self.assertEqual(slide.getTileCount(tissueLevelThreshold=0.5), 15)
+
+        slide.tileDictionary.removeColumn('tissueLevel')
+        with self.assertRaises(PermissionError):
+            slide.suitableTileAddresses(tissueLevelThreshold=0.5)
+
+    def test_mask_from_read_mask(self):
+        slide = makeSlide()
+        with tempfile.TemporaryDirectory() as folder:
+            maskPath = os.path.join(folder, 'mask.png')
+            mask = np.zeros((96, 128), dtype=np.uint8)
+            mask[10:30, 40:44] = 255 # slivers of tiles (2, 0) and (2, 1)
+            mask[80:, 120:] = 255 # a corner of tile (7, 5)
+            Image.fromarray(mask).save(maskPath)
+            slide.readMask(maskPath)
+        self.assertFalse(slide.tileDictionary.hasColumn('mask'))
+        self.assertEqual(slide.suitableTileAddresses(maskLevelThreshold='mask'), [(2, 0), (2, 1), (7, 5)], "'mask' should keep every tile overlapping the mask")
+        self.assertEqual(slide.suitableTileAddresses(maskLevelThreshold=0.3), [(7, 5)])
+
+    def test_invalid_thresholds(self):
+        slide = makeSlide()
+        for thresholds in [{'tissueLevelThreshold': 0.5}, {'foregroundLevelThreshold': 50}, {'foregroundLevelThreshold': 'otsu'},
+                           {'otsuLevelThreshold': 1}, {'triangleLevelThreshold': 1}, {'maskLevelThreshold': 0.5}, {'maskLevelThreshold': 'mask'}]:
+            with self.assertRaises(PermissionError, msg=str(thresholds)):
+                slide.suitableTileAddresses(**thresholds)
+
+        slide = makeFilteredSlide()
+        slide.tileDictionary.removeColumn('triangleLevel')
+        with self.assertRaises(PermissionError):
+            slide.suitableTileAddresses(foregroundLevelThreshold='triangle')
+        for thresholds in [{'tissueLevelThreshold': 'otsu'}, {'foregroundLevelThreshold': 'mask'}, {'foregroundLevelThreshold': [50]},
+                           {'otsuLevelThreshold': 'otsu'}, {'triangleLevelThreshold': 'triangle'}, {'maskLevelThreshold': 'otsu'}]:
+            with self.assertRaises(ValueError, msg=str(thresholds)):
+                slide.suitableTileAddresses(**thresholds)
+
+
+if __name__ == '__main__':
+    unittest.main()
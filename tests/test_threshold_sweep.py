@@ -0,0 +1,76 @@
+import unittest
+import warnings
+
+import numpy as np
+from sklearn.metrics import accuracy_score, balanced_accuracy_score, f1_score, precision_score, recall_score, roc_curve
+
+from pathml.thresholdsweep import ThresholdSweep
+from tests.slidefixtures import makeSlide
+
+rng = np.random.default_rng(0)
+scores = np.round(rng.random(200), 2) # rounded so that some tiles share scores
+labels = rng.random(200) < scores
+thresholds = [0, 0.1, 0.35, 0.5, 0.5, 0.9, 1.0, 1.5]
+scorers = {'accuracy': accuracy_score, 'balanced_accuracy': balanced_accuracy_score, 'f1': f1_score, 'precision': precision_score, 'recall': recall_score}
+
+
+class TestThresholdSweep(unittest.TestCase):
+
+    def test_metrics_match_sklearn(self):
+        sweep = ThresholdSweep(scores, labels)
+        for metric, scorer in scorers.items():
+            expected = [scorer(labels, scores >= threshold, zero_division=0) if metric in ['f1', 'precision', 'recall'] else scorer(labels, scores >= threshold) for threshold in thresholds]
+            self.assertTrue(np.allclose(sweep.metric(metric, thresholds), expected), metric)
+        self.assertEqual(sweep.numAtOrAbove(thresholds).tolist(), [int((scores >= threshold).sum()) for threshold in thresholds])
+
+        with self.assertRaises(ValueError):
+            sweep.metric('dice_coeff', thresholds)
+        with self.assertRaises(ValueError):
+            ThresholdSweep(scores).counts(thresholds)
+
+    def test_single_class_ground_truth(self):
+        sweep = ThresholdSweep(scores, np.zeros(200, dtype=bool))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore') # sklearn warns about the class missing from the ground truth
+            expected = [balanced_accuracy_score(np.zeros(200), scores >= threshold) for threshold in thresholds]
+        self.assertTrue(np.allclose(sweep.metric('balanced_accuracy', thresholds), expected))
+
+    def test_curves_and_combining(self):
+        sweep = ThresholdSweep.combine([ThresholdSweep(scores[:80], labels[:80]), ThresholdSweep(scores[80:], labels[80:])])
+        self.assertEqual(len(sweep), 200)
+        fpr, tpr, curveThresholds = sweep.rocCurve()
+        expectedFpr, expectedTpr, expectedThresholds = roc_curve(labels, scores, drop_intermediate=False)
+        self.assertTrue(np.allclose(fpr, expectedFpr))
+        self.assertTrue(np.allclose(tpr, expectedTpr))
+        self.assertTrue(np.array_equal(curveThresholds[1:], expectedThresholds[1:]))
+
+        precision, recall, curveThresholds = sweep.precisionRecallCurve()
+        self.assertTrue(np.allclose(precision, [precision_score(labels, scores >= threshold) for threshold in curveThresholds]))
+        self.assertTrue(np.all(np.diff(recall) >= 0))
+
+        with self.assertRaises(ValueError):
+            ThresholdSweep.combine([sweep, ThresholdSweep(scores)])
+
+    def test_slide_metrics(self):
+        slide = makeSlide() # 8 x 6 tiles
+        predicted = np.zeros((6, 8), dtype=bool)
+        predicted[1:5] = True
+        slide.tileDictionary.setColumn('classifierInferencePrediction', {'tumor': scores[:48].reshape(6, 8), 'normal': 1 - scores[:48].reshape(6, 8)}, mask=predicted)
+        overlap = rng.random((6, 8))
+        slide.tileDictionary.setColumn('tumorOverlap', overlap)
+
+        tileLabels = overlap[predicted] >= 0.5
+        tileScores = scores[:48].reshape(6, 8)[predicted]
+        self.assertAlmostEqual(slide.classifierMetricAtThreshold('tumor', 0.5, metric='f1'), f1_score(tileLabels, tileScores >= 0.5))
+        self.assertTrue(np.allclose(slide.classifierMetricAtThreshold('tumor', [0.2, 0.6], metric='balanced_accuracy'),
+                                    [balanced_accuracy_score(tileLabels, tileScores >= threshold) for threshold in [0.2, 0.6]]))
+        self.assertEqual(slide.numTilesAboveClassPredictionThreshold('tumor', [0.2, 0.6]), [int((tileScores >= 0.2).sum()), int((tileScores >= 0.6).sum())])
+
+        slide.tileDictionary.removeColumn('tumorOverlap')
+        self.assertEqual(slide.classifierThresholdSweep('tumor').counts(0.0)['fn'].tolist(), [0], "Tiles without overlap should be negative")
+        with self.assertRaises(ValueError):
+            slide.classifierMetricAtThreshold('tumor', 0.5, assignZeroToTilesWithoutAnnotationOverlap=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
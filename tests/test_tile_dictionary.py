@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from pathml.tiledictionary import TileDictionary
+
+testTileDictionary = TileDictionary.fromGrid(numTilesInX=4, numTilesInY=3, tileSize=100, tileOverlap=20)
+
+
+class TestTileDictionary(unittest.TestCase):
+
+    def test_tile_dictionary_grid(self):
+        self.assertEqual(len(testTileDictionary), 12, "A 4x3 grid should contain 12 tiles")
+        self.assertEqual(list(testTileDictionary)[:2], [(0, 0), (1, 0)],
+                         "Tiles should be iterated in row-major order")
+        self.assertEqual(dict(testTileDictionary[(3, 2)]), {'x': 240, 'y': 160, 'width': 100, 'height': 100},
+                         "Tile coordinates should step by tileSize minus tileOverlap")
+        self.assertNotIn((4, 0), testTileDictionary, "Out of grid addresses should not be in the tile dictionary")
+
+    def test_tile_dictionary_values(self):
+        tileDictionary = TileDictionary.fromGrid(2, 2, 10)
+        tileDictionary[(1, 0)]['tissueLevel'] = 0.75
+        tileDictionary[(1, 0)]['tissue_detector'] = np.array([0.1, 0.2, 0.7])
+        tileDictionary[(1, 0)]['classifierInferencePrediction'] = {'normal': 0.4, 'tumor': 0.6}
+        tileDictionary[(1, 1)]['segmenterInferencePrediction'] = {'tumor': np.zeros((10, 10))}
+
+        self.assertEqual(tileDictionary[(1, 0)]['tissueLevel'], 0.75)
+        self.assertNotIn('tissueLevel', tileDictionary[(0, 0)], "Keys should only be present at tiles where they were set")
+        self.assertTrue(np.allclose(tileDictionary[(1, 0)]['tissue_detector'], [0.1, 0.2, 0.7]))
+        self.assertEqual(tileDictionary[(1, 0)]['classifierInferencePrediction'], {'normal': 0.4, 'tumor': 0.6})
+        self.assertEqual(tileDictionary.getColumn('classifierInferencePrediction', 'tumor')[0, 1], 0.6)
+        self.assertEqual(tileDictionary[(1, 1)]['segmenterInferencePrediction']['tumor'].shape, (10, 10))
+
+        del tileDictionary[(1, 0)]['tissueLevel']
+        self.assertNotIn('tissueLevel', tileDictionary[(1, 0)])
+
+    def test_tile_dictionary_columns(self):
+        tileDictionary = TileDictionary.fromGrid(3, 2, 10)
+        values = np.arange(6, dtype=float).reshape(2, 3)
+        mask = values > 2
+        tileDictionary.setColumn('foregroundLevel', values, mask=mask)
+
+        self.assertTrue(np.array_equal(tileDictionary.getMask('foregroundLevel'), mask))
+        self.assertEqual(tileDictionary.addresses(mask), [(0, 1), (1, 1), (2, 1)])
+        self.assertEqual(tileDictionary[(2, 1)]['foregroundLevel'], 5.0)
+
+        converted = TileDictionary.fromDict(tileDictionary.toDict())
+        self.assertEqual(converted.toDict(), tileDictionary.toDict(), "Round-tripping through a plain dict should not change the contents")
+
+
+if __name__ == '__main__':
+    unittest.main()
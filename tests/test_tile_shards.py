@@ -0,0 +1,92 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from pathml.tileshards import ShardWriter, iterateShard, readShardIndex
+from pathml.utils.torch.TileShardDataset import TileShardDataset
+from tests.slidefixtures import makeSlide
+
+
+def encodeTile(value):
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((8, 8, 3), value, dtype=np.uint8)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class TestTileShards(unittest.TestCase):
+
+    def test_write_and_read_shards(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with ShardWriter(folder, maxTilesPerShard=4) as shardWriter:
+                for i in range(10):
+                    shardWriter.write('tile'+str(i), {'jpg': encodeTile(i * 20), 'mask.npy': b'mask'+bytes([i])},
+                                      {'slide': 'slide', 'x': i, 'class': 'tumor' if i % 2 else 'normal'})
+                with self.assertRaises(ValueError):
+                    shardWriter.write('tile.1', {'jpg': b''})
+
+            index = readShardIndex(folder)
+            self.assertEqual(index['numTiles'], [4, 4, 2])
+            self.assertEqual(index['classes'], ['normal', 'tumor'])
+            self.assertFalse(any(f.endswith('.tmp') for f in os.listdir(folder)))
+
+            samples = [sample for shard in index['shards'] for sample in iterateShard(shard)]
+            self.assertEqual([key for key, entries in samples], ['tile'+str(i) for i in range(10)])
+            self.assertEqual(samples[3][1]['json']['x'], 3)
+            self.assertEqual(samples[3][1]['mask.npy'], b'mask\x03')
+
+    def test_dataset(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with ShardWriter(folder, maxTilesPerShard=3) as shardWriter:
+                for i in range(10):
+                    shardWriter.write('tile'+str(i), {'jpg': encodeTile(i * 20)}, {'class': 'tumor' if i % 2 else 'normal'})
+
+            dataset = TileShardDataset(folder, shuffleBufferSize=4, seed=1)
+            self.assertEqual(len(dataset), 10)
+            firstEpoch = [(np.array(img)[0, 0, 0], label) for img, label in dataset]
+            self.assertEqual(sorted(firstEpoch), sorted((np.array(Image.open(io.BytesIO(encodeTile(i * 20))))[0, 0, 0], i % 2) for i in range(10)))
+            dataset.set_epoch(1)
+            secondEpoch = [(np.array(img)[0, 0, 0], label) for img, label in dataset]
+            self.assertNotEqual(firstEpoch, secondEpoch, "Each epoch should be shuffled differently")
+            self.assertEqual(sorted(firstEpoch), sorted(secondEpoch))
+
+    def test_length_per_rank(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with ShardWriter(folder, maxTilesPerShard=3) as shardWriter:
+                for i in range(10):
+                    shardWriter.write('tile'+str(i), {'jpg': encodeTile(i * 20)}, {'class': 'tumor' if i % 2 else 'normal'})
+
+            dataset = TileShardDataset(folder, shuffleBufferSize=4, seed=1)
+            for epoch in range(3):
+                dataset.set_epoch(epoch)
+                lengths = []
+                for rank in range(2):
+                    with mock.patch('torch.distributed.is_initialized', return_value=True), \
+                         mock.patch('torch.distributed.get_world_size', return_value=2), \
+                         mock.patch('torch.distributed.get_rank', return_value=rank):
+                        lengths.append(len(dataset))
+                        self.assertEqual(len(dataset), len(list(dataset)), "__len__ should count the tiles of this rank")
+                self.assertEqual(sum(lengths), 10)
+                self.assertEqual(sorted(lengths), [4, 6], "Each rank should read two of the shards of 3, 3, 3 and 1 tiles")
+
+            with self.assertRaises(TypeError):
+                len(TileShardDataset(readShardIndex(folder)['shards']))
+
+    def test_extract_into_shards(self):
+        slide = makeSlide()
+        with tempfile.TemporaryDirectory() as folder:
+            with ShardWriter(folder) as shardWriter:
+                with self.assertRaises(ValueError):
+                    slide.extractRandomTissueTiles([os.path.join(folder, 'train'), os.path.join(folder, 'val')], numTilesToExtract=[3, 2],
+                                                   seed=1, numWorkers=1, shardWriter=shardWriter)
+                slide.extractRandomTissueTiles(os.path.join(folder, 'train'), numTilesToExtract=3, className='tumor', seed=1, numWorkers=1, shardWriter=shardWriter)
+            self.assertEqual(sum(readShardIndex(folder)['numTiles']), 3)
+            self.assertFalse(os.path.exists(os.path.join(folder, 'train')), "Tiles should only be written to the shards")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pathml.tilewriter import TileWriter
+from tests.slidefixtures import makeSlide
+
+
+class TestTileWriter(unittest.TestCase):
+
+    def test_results_in_submission_order(self):
+        with TileWriter(numWorkers=4) as writer:
+            for i in range(50):
+                writer.submit(lambda i: time.sleep(0.001 * (i % 3)) or i * i, i)
+        self.assertEqual(writer.results(), [i * i for i in range(50)])
+
+    def test_bounded_in_flight(self):
+        lock = threading.Lock()
+        release = threading.Event()
+        running = [0]
+        maxRunning = [0]
+
+        def job(i):
+            with lock:
+                running[0] = running[0] + 1
+                maxRunning[0] = max(maxRunning[0], running[0])
+            release.wait(5)
+            with lock:
+                running[0] = running[0] - 1
+            return i
+
+        # more threads than maxInFlight, so only maxInFlight can bound the jobs running at once
+        writer = TileWriter(numWorkers=8, maxInFlight=3)
+        submitter = threading.Thread(target=lambda: [writer.submit(job, i) for i in range(10)])
+        submitter.start()
+        deadline = time.time() + 5
+        while running[0] < 3 and time.time() < deadline:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        self.assertEqual(running[0], 3, "submit() should block while maxInFlight jobs are unfinished")
+        release.set()
+        submitter.join()
+        writer.close()
+        self.assertEqual(maxRunning[0], 3)
+        self.assertEqual(writer.results(), list(range(10)))
+
+    def test_matches_serial_extraction(self):
+        slide = makeSlide()
+        with tempfile.TemporaryDirectory() as folder:
+            for numWorkers in [1, 4]:
+                slide.extractRandomTissueTiles(os.path.join(folder, str(numWorkers)), numTilesToExtract=20, seed=1, numWorkers=numWorkers)
+            serialFiles = sorted(os.path.relpath(os.path.join(root, f), os.path.join(folder, '1')) for root, dirs, files in os.walk(os.path.join(folder, '1')) for f in files)
+            parallelFiles = sorted(os.path.relpath(os.path.join(root, f), os.path.join(folder, '4')) for root, dirs, files in os.walk(os.path.join(folder, '4')) for f in files)
+            self.assertEqual(len(serialFiles), 20)
+            self.assertEqual(parallelFiles, serialFiles)
+            for fileName in serialFiles:
+                with open(os.path.join(folder, '1', fileName), 'rb') as serial, open(os.path.join(folder, '4', fileName), 'rb') as parallel:
+                    self.assertEqual(parallel.read(), serial.read(), fileName)
+
+    def test_exception_is_raised(self):
+        def job(i):
+            if i == 5:
+                raise ValueError('bad tile')
+            return i
+
+        with self.assertRaises(ValueError):
+            with TileWriter(numWorkers=2) as writer:
+                for i in range(10):
+                    writer.submit(job, i)
+
+    def test_pending_jobs_are_cancelled(self):
+        started = []
+
+        def job(i):
+            started.append(i)
+            if i == 0:
+                raise ValueError('bad tile')
+            time.sleep(0.05)
+
+        with self.assertRaises(ValueError):
+            with TileWriter(numWorkers=1, maxInFlight=4) as writer:
+                for i in range(10):
+                    writer.submit(job, i)
+        self.assertLess(len(started), 4, "Jobs queued behind the failed one should not run")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from tests.slidefixtures import levelImages, makeSlide
+
+rng = np.random.default_rng(0)
+
+
+class TestTilingView(unittest.TestCase):
+
+    def test_view_shares_pyramid(self):
+        slide = makeSlide()
+        view = slide.tilingView(1, 8, tileOverlap=0.5)
+        self.assertIs(view.levels, slide.levels)
+        self.assertIs(view.slide, slide.levels[1])
+        self.assertEqual(view.slideProperties['width'], 64)
+        self.assertEqual((view.tileSize, view.tileOverlap), (8, 4))
+        self.assertEqual((view.numTilesInX, view.numTilesInY), (15, 11))
+        self.assertEqual(view.tileDictionary.columns(), ['x', 'y', 'width', 'height'])
+        self.assertEqual(sorted(vars(view)), sorted(vars(slide)), "Views should be set up like any other Slide")
+
+        tiles = view.getTiles([(0, 0), (3, 2), (14, 10)])
+        self.assertTrue(np.array_equal(tiles[1], levelImages[1][8:16, 12:20]))
+        self.assertTrue(np.array_equal(tiles[2], levelImages[1][40:48, 56:64]))
+
+        with self.assertRaises(ValueError):
+            slide.tilingView(3, 8)
+
+    def test_detect_tissue_from_raw_tissue_detection_map(self):
+        slide = makeSlide()
+        predictionMap = rng.random((6, 8, 3))
+        predictionMap /= predictionMap.sum(axis=2, keepdims=True)
+        rawTissueDetectionMap = {'map': predictionMap, 'level': 1, 'tileSize': 8, 'tileOverlap': 0}
+        slide.detectTissueFromRawTissueDetectionMap(rawTissueDetectionMap)
+
+        expected = slide.resizePredMap(predictionMap, slide.tilingView(1, 8), slide)
+        self.assertTrue(np.allclose(slide.tileDictionary.getColumn('tissueLevel'), expected[:, :, 2]))
+        self.assertTrue(np.allclose(slide.tileDictionary.getColumn('artifactLevel'), expected[:, :, 0]))
+        self.assertIs(slide.rawTissueDetectionMap, rawTissueDetectionMap)
+
+
+if __name__ == '__main__':
+    unittest.main()
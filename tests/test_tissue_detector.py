@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+from pathml.models.tissuedetector import clearTissueDetectorCache, tissueDetector
+from pathml.utils.torch.quantization import quantizeModel
+
+
+def saveStateDict(path, seed):
+    torch.manual_seed(seed)
+    model = models.squeezenet1_1(weights=None)
+    model.classifier[1] = nn.Conv2d(512, 3, kernel_size=(1, 1), stride=(1, 1))
+    torch.save(model.state_dict(), path)
+
+
+class TestTissueDetector(unittest.TestCase):
+
+    def tearDown(self):
+        clearTissueDetectorCache()
+
+    def test_models_are_loaded_once(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'squeezenet.pt')
+            saveStateDict(path, 0)
+            with mock.patch('torch.load', side_effect=torch.load) as load:
+                device, model, data_transforms = tissueDetector(path, architecture='squeezenet')
+                tissueDetector(path, architecture='squeezenet')
+                self.assertEqual(load.call_count, 1, "The state dict should be loaded from disk once")
+                tissueDetector(path, architecture='squeezenet', cache=False)
+                self.assertEqual(load.call_count, 2)
+
+                saveStateDict(path, 1)
+                os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+                tissueDetector(path, architecture='squeezenet')
+                self.assertEqual(load.call_count, 3, "A changed state dict should be reloaded")
+
+                clearTissueDetectorCache()
+                tissueDetector(path, architecture='squeezenet')
+                self.assertEqual(load.call_count, 4)
+
+    def test_callers_get_their_own_model(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'squeezenet.pt')
+            saveStateDict(path, 0)
+            inputs = torch.rand(2, 3, 224, 224)
+            device, model, data_transforms = tissueDetector(path, architecture='squeezenet')
+            with torch.no_grad():
+                expected = model(inputs)
+            model.train().half()
+            with torch.no_grad():
+                model.classifier[1].weight.zero_()
+
+            device, otherModel, data_transforms = tissueDetector(path, architecture='squeezenet')
+            self.assertIsNot(otherModel, model)
+            self.assertFalse(otherModel.training, "Later callers should get the model in eval mode")
+            self.assertEqual(next(otherModel.parameters()).dtype, torch.float32)
+            with torch.no_grad():
+                self.assertTrue(torch.equal(otherModel(inputs), expected), "Changes to one caller's model should not reach the others")
+
+    def test_optimized_model_cannot_be_quantized(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'squeezenet.pt')
+            saveStateDict(path, 0)
+            optimizedModel = tissueDetector(path, architecture='squeezenet', optimize=True)[1]
+            for mode in ['static', 'dynamic']:
+                with self.assertRaises(ValueError):
+                    quantizeModel(optimizedModel, [torch.rand(2, 3, 224, 224)], mode=mode)
+
+    def test_optimized_model_matches(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'squeezenet.pt')
+            saveStateDict(path, 0)
+            device, model, data_transforms = tissueDetector(path, architecture='squeezenet')
+            optimizedModel = tissueDetector(path, architecture='squeezenet', optimize=True)[1]
+            self.assertIsNot(optimizedModel, model)
+
+            inputs = torch.rand(4, 3, 224, 224)
+            with torch.no_grad():
+                self.assertTrue(torch.allclose(model(inputs), optimizedModel(inputs), atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()